@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import time
+import argparse
+import numpy as np
+from scipy.spatial import KDTree
+
+from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
+from bubble_control.bubble_pose_estimation.far_points_detection import get_far_points_mask_ball, get_far_points_mask_nn, get_far_points_mask_depth
+from mmint_camera_utils.camera_utils import project_depth_image
+
+
+def get_organized_pc(depth_img, K):
+    pc_xyz = project_depth_image(depth_img.squeeze(-1), K) # (w, h, 3)
+    pc_xyz = pc_xyz.reshape(-1, 3)
+    pc = np.concatenate([pc_xyz, np.zeros_like(pc_xyz)], axis=-1) # (w*h, 6)
+    return pc
+
+
+def get_recorded_clouds(dataset, num_samples, camera_name='right'):
+    # returns a list of (reference_pc, deformed_pc) pairs
+    cloud_pairs = []
+    for fc in range(min(num_samples, len(dataset))):
+        dl_line = dataset.dl.iloc[fc]
+        scene_name = dl_line['Scene']
+        undef_fc = int(dl_line['UndeformedFC'])
+        def_fc = int(dl_line['InitialStateFC'])
+        K = dataset._load_camera_info_depth(scene_name=scene_name, camera_name=camera_name, fc=undef_fc)['K']
+        ref_pc = get_organized_pc(dataset._load_depth_img(fc=undef_fc, scene_name=scene_name, camera_name=camera_name), K)
+        def_pc = get_organized_pc(dataset._load_depth_img(fc=def_fc, scene_name=scene_name, camera_name=camera_name), K)
+        cloud_pairs.append((ref_pc, def_pc))
+    return cloud_pairs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Benchmark the far points (contact) detection backends on recorded frames')
+    parser.add_argument('data_name', type=str, help='Path to the drawing data used to load the recorded depth frames')
+    parser.add_argument('--num_samples', type=int, default=20)
+    parser.add_argument('--threshold', type=float, default=0.005)
+    args = parser.parse_args()
+
+    dataset = BubbleDrawingDataset(data_name=args.data_name)
+    cloud_pairs = get_recorded_clouds(dataset, args.num_samples)
+
+    times = {'ball': [], 'nn': [], 'depth': []}
+    agreement = {'nn': [], 'depth': []}
+    for ref_pc, def_pc in cloud_pairs:
+        valid_ref = ref_pc[np.all(np.isfinite(ref_pc[:, :3]), axis=-1)]
+        tree = KDTree(valid_ref[:, :3])
+        start_time = time.time()
+        ball_mask = get_far_points_mask_ball(tree, def_pc, args.threshold)
+        times['ball'].append(time.time() - start_time)
+        start_time = time.time()
+        nn_mask = get_far_points_mask_nn(tree, def_pc, args.threshold)
+        times['nn'].append(time.time() - start_time)
+        start_time = time.time()
+        depth_mask = get_far_points_mask_depth(ref_pc, def_pc, args.threshold)
+        times['depth'].append(time.time() - start_time)
+        agreement['nn'].append(np.mean(nn_mask == ball_mask))
+        agreement['depth'].append(np.mean(depth_mask == ball_mask))
+
+    print('{:<8} {:>14} {:>10} {:>14}'.format('method', 'time [ms]', 'speedup', 'agreement [%]'))
+    ball_time = np.mean(times['ball'])
+    for method, method_times in times.items():
+        method_agreement = 100 * np.mean(agreement[method]) if method in agreement else 100.
+        print('{:<8} {:>14.2f} {:>10.1f} {:>14.2f}'.format(method, 1000 * np.mean(method_times), ball_time / np.mean(method_times), method_agreement))
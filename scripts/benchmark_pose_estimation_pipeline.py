@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import time
+import argparse
+import numpy as np
+
+from bubble_control.aux.tf_table import as_tf_table
+from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
+from bubble_control.bubble_pose_estimation.bubble_pc_reconstruction import BubblePCReconsturctorDepth
+from bubble_control.bubble_pose_estimation.pose_estimation_pipeline import BubblePoseEstimationPipeline
+from bubble_control.bubble_pose_estimation.recorded_frame_parser import RecordedFrameParser
+
+
+def get_frame_matrices(tfs):
+    # all tfs are expressed with respect to the same parent frame
+    return as_tf_table(tfs).to_matrix_dict()
+
+
+def get_recorded_parsers(dataset, num_samples, camera_rate=None, reconstruction_frame='grasp_frame'):
+    parsers = {}
+    for camera_name in ['right', 'left']:
+        optical_frame = 'pico_flexx_{}_optical_frame'.format(camera_name)
+        frames = []
+        camera_info = None
+        transforms = None
+        for fc in range(min(num_samples, len(dataset))):
+            dl_line = dataset.dl.iloc[fc]
+            scene_name = dl_line['Scene']
+            undef_fc = int(dl_line['UndeformedFC'])
+            if camera_info is None:
+                # first frame is the reference (undeformed) one
+                camera_info = dataset._load_camera_info_depth(scene_name=scene_name, camera_name=camera_name, fc=undef_fc)
+                frame_matrices = get_frame_matrices(dataset._load_tfs(undef_fc, scene_name))
+                transforms = {(reconstruction_frame, optical_frame): np.linalg.inv(frame_matrices[reconstruction_frame]) @ frame_matrices[optical_frame]}
+                frames.append({'depth': dataset._load_depth_img(fc=undef_fc, scene_name=scene_name, camera_name=camera_name)})
+            for fc_key in ['InitialStateFC', 'FinalStateFC']:
+                def_fc = int(dl_line[fc_key])
+                frames.append({'depth': dataset._load_depth_img(fc=def_fc, scene_name=scene_name, camera_name=camera_name)})
+        parsers[camera_name] = RecordedFrameParser(frames, camera_info_depth=camera_info, optical_frame=optical_frame, transforms=transforms, rate=camera_rate)
+    return parsers
+
+
+def benchmark_sequential(reconstructor, icp_th, duration):
+    num_poses = 0
+    start_time = time.time()
+    while time.time() - start_time < duration:
+        reconstructor.estimate_pose(threshold=icp_th)
+        num_poses += 1
+    return num_poses / (time.time() - start_time)
+
+
+def benchmark_pipelined(reconstructor, icp_th, duration):
+    pipeline = BubblePoseEstimationPipeline(reconstructor, icp_th=icp_th)
+    pipeline.start()
+    time.sleep(duration)
+    pipeline.finish()
+    return pipeline.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Offline benchmark of the pipelined bubble pose estimation')
+    parser.add_argument('data_name', type=str, help='Path to the drawing data used to replay the recorded depth frames')
+    parser.add_argument('--object_name', type=str, default='marker')
+    parser.add_argument('--num_samples', type=int, default=20)
+    parser.add_argument('--camera_rate', type=float, default=None, help='Emulated camera rate (Hz). None for no limit')
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--imprint_th', type=float, default=0.0053)
+    parser.add_argument('--icp_th', type=float, default=0.005)
+    args = parser.parse_args()
+
+    # Runs offline: recorded frames and no ROS publishers, so no roscore is needed.
+    dataset = BubbleDrawingDataset(data_name=args.data_name)
+    recorded_parsers = get_recorded_parsers(dataset, args.num_samples, camera_rate=args.camera_rate)
+    reconstructor = BubblePCReconsturctorDepth(threshold=args.imprint_th, object_name=args.object_name, estimation_type='icp2d',
+                                               left_parser=recorded_parsers['left'], right_parser=recorded_parsers['right'], publish=False)
+    reconstructor.reference()
+
+    sequential_rate = benchmark_sequential(reconstructor, args.icp_th, args.duration)
+    print('Sequential pose rate: {:.2f} Hz'.format(sequential_rate))
+    print('Pipelined:\n{}'.format(benchmark_pipelined(reconstructor, args.icp_th, args.duration)))
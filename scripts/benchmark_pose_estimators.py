@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+
+from bubble_control.aux.load_confs import load_object_models, load_bubble_reconstruction_params
+from bubble_control.bubble_pose_estimation.synthetic_imprints import SyntheticBubbleLayout, SyntheticImprintGenerator, \
+    pose_error, camera_names, get_optical_frame_name
+from bubble_control.bubble_pose_estimation.pose_estimators import ICP2DPoseEstimator, ICP3DPoseEstimator
+from bubble_control.bubble_pose_estimation.bubble_pc_reconstruction import get_cone_mask
+from bubble_control.bubble_learning.aux.img_trs.block_downsampling_tr import BlockDownSamplingTr
+from bubble_utils.bubble_tools.bubble_pc_tools import get_imprint_pc
+from bubble_utils.bubble_tools.bubble_img_tools import process_bubble_img
+
+
+estimator_names = ['icp2d', 'icp3d', 'icp2d_batched', 'icp_approx']
+batched_estimator_names = ['icp2d_batched', 'icp_approx']
+
+
+def get_imprint_pc_gf(sample, layout, threshold, percentile=None):
+    # imprint points of both bubbles on the grasp frame, as computed by the reconstructors
+    imprints = []
+    for camera_name in camera_names:
+        key = camera_name[0]
+        imprint = get_imprint_pc(sample['undef_depth_{}'.format(key)].squeeze(-1), sample['def_depth_{}'.format(key)].squeeze(-1),
+                                 threshold=threshold, K=layout.Ks[camera_name], percentile=percentile)
+        imprint = imprint[get_cone_mask(imprint)]
+        gf_X_cam = layout.get_transformation_matrix('grasp_frame', get_optical_frame_name(camera_name))
+        imprint[:, :3] = imprint[:, :3] @ gf_X_cam[:3, :3].T + gf_X_cam[:3, 3]
+        imprints.append(imprint)
+    return np.concatenate(imprints, axis=0)
+
+
+def get_batched_sample(samples, downsampling_tr, device):
+    # same format as the controller samples: processed and downsampled imprints, batched depths, cameras and tfs
+    final_imprints = [downsampling_tr._tr(process_bubble_img(np.stack([s['imprint_r'], s['imprint_l']], axis=0))[..., 0]) for s in samples]
+    batch_size = len(samples)
+    batched_sample = {
+        'final_imprint': torch.tensor(np.stack(final_imprints, axis=0), dtype=torch.float32, device=device),
+        'all_tfs': {k: torch.tensor(X, dtype=torch.float32, device=device).unsqueeze(0).repeat_interleave(batch_size, dim=0) for k, X in samples[0]['all_tfs'].items()},
+    }
+    for key in ['r', 'l']:
+        batched_sample['undef_depth_{}'.format(key)] = torch.tensor(np.stack([s['undef_depth_{}'.format(key)] for s in samples], axis=0), dtype=torch.float32, device=device)
+        batched_sample['camera_info_{}'.format(key)] = {'K': torch.tensor(np.stack([s['camera_info_{}'.format(key)]['K'] for s in samples], axis=0), dtype=torch.float32, device=device)}
+    return batched_sample
+
+
+def get_batched_estimator(estimator_name, args, device):
+    from bubble_control.bubble_model_control.model_output_object_pose_estimaton import BatchedModelOutputObjectPoseEstimation, ICPApproximationModelOutputObjectPoseEstimation
+    if estimator_name == 'icp2d_batched':
+        return BatchedModelOutputObjectPoseEstimation(object_name=args.object_name, factor_x=args.downsample_factor, factor_y=args.downsample_factor,
+                                                      method='bilinear', device=device, imprint_selection=args.imprint_selection,
+                                                      imprint_percentile=args.imprint_percentile)
+    elif estimator_name == 'icp_approx':
+        return ICPApproximationModelOutputObjectPoseEstimation(model_name='icp_approximation_model', load_version=args.icp_approx_version,
+                                                               model_data_path=args.model_data_path)
+    raise NotImplementedError('Batched estimator {} not implemented yet. Available options: {}'.format(estimator_name, batched_estimator_names))
+
+
+def run_point_cloud_estimator(pose_estimator, samples, layout, imprint_th, icp_th):
+    # point cloud estimators work one sample at a time
+    target_pcs = [get_imprint_pc_gf(sample, layout, threshold=imprint_th) for sample in samples]
+    estimated_poses = []
+    pose_estimator.threshold = icp_th
+    start_time = time.time()
+    for target_pc in target_pcs:
+        pose_estimator.last_tr = None # samples are independent
+        estimated_poses.append(pose_estimator.estimate_pose(target_pc))
+    elapsed_time = time.time() - start_time
+    return np.stack(estimated_poses, axis=0), elapsed_time
+
+
+def run_batched_estimator(pose_estimator, samples, batch_size, downsampling_tr, device):
+    batched_samples = [get_batched_sample(samples[i:i + batch_size], downsampling_tr, device) for i in range(0, len(samples), batch_size)]
+    pose_estimator.estimate_pose(batched_samples[0]) # warm up
+    estimated_poses = []
+    start_time = time.time()
+    for batched_sample in batched_samples:
+        wf_X_obj = pose_estimator.estimate_pose(batched_sample).matrix
+        wf_X_gf = batched_sample['all_tfs']['grasp_frame'].type(wf_X_obj.dtype)
+        estimated_poses.append(torch.linalg.inv(wf_X_gf) @ wf_X_obj)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    elapsed_time = time.time() - start_time
+    return torch.cat(estimated_poses, dim=0).detach().cpu().numpy(), elapsed_time
+
+
+def get_result_row(estimator_name, batch_size, estimated_poses, gth_poses, elapsed_time):
+    errors = pose_error(estimated_poses, gth_poses, projection_axis=(1, 0, 0))
+    return {
+        'Estimator': estimator_name,
+        'BatchSize': batch_size,
+        'Throughput': len(gth_poses) / elapsed_time, # poses/s
+        'TransError': 1000 * np.mean(errors['trans_error']), # mm
+        'PlaneTransError': 1000 * np.mean(errors['plane_trans_error']), # mm
+        'AngleError': np.rad2deg(np.mean(errors['angle_error'])), # deg
+        'AngleErrorP95': np.rad2deg(np.percentile(errors['angle_error'], 95)), # deg
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Benchmark the speed and accuracy of the pose estimators on synthetic bubble imprints')
+    parser.add_argument('--layout', type=str, default=None, help='camera layout file saved with --save_layout')
+    parser.add_argument('--data_name', type=str, default=None, help='drawing data to read the camera layout from, if no --layout is given')
+    parser.add_argument('--layout_fc', type=int, default=0, help='sample of the drawing data used for the layout')
+    parser.add_argument('--save_layout', type=str, default=None, help='save the camera layout to this file (.npz)')
+    parser.add_argument('--object_name', type=str, default='marker')
+    parser.add_argument('--estimators', type=str, nargs='+', default=['icp2d', 'icp3d', 'icp2d_batched'], help='options: {}'.format(estimator_names))
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--num_samples', type=int, default=128)
+    parser.add_argument('--max_translation', type=float, default=0.005)
+    parser.add_argument('--max_angle', type=float, default=30., help='deg')
+    parser.add_argument('--penetration', type=float, default=0.)
+    parser.add_argument('--noise_std', type=float, default=0.)
+    parser.add_argument('--downsample_factor', type=int, default=7)
+    parser.add_argument('--imprint_selection', type=str, default='threshold')
+    parser.add_argument('--imprint_percentile', type=float, default=0.005)
+    parser.add_argument('--model_data_path', type=str, default=None, help='data path of the icp approximation model')
+    parser.add_argument('--icp_approx_version', type=int, default=0)
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', type=str, default=None, help='save the results to this csv file')
+    args = parser.parse_args()
+
+    if args.layout is not None:
+        layout = SyntheticBubbleLayout.load(args.layout)
+    elif args.data_name is not None:
+        from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
+        layout = SyntheticBubbleLayout.from_dataset(BubbleDrawingDataset(data_name=args.data_name), fc=args.layout_fc)
+    else:
+        raise AttributeError('Either --layout or --data_name must be provided')
+    if args.save_layout is not None:
+        layout.save(args.save_layout)
+
+    rng = np.random.default_rng(args.seed)
+    generator = SyntheticImprintGenerator.from_object_name(layout, args.object_name, penetration=args.penetration, noise_std=args.noise_std)
+    gth_poses = generator.sample_poses(args.num_samples, max_translation=args.max_translation, max_angle=np.deg2rad(args.max_angle), rng=rng)
+    samples = [generator.get_sample(pose, rng=rng) for pose in gth_poses]
+
+    object_params = load_bubble_reconstruction_params()[args.object_name]
+    object_model = load_object_models()[args.object_name]
+    device = torch.device(args.device)
+    downsampling_tr = BlockDownSamplingTr(factor_x=args.downsample_factor, factor_y=args.downsample_factor, reduction='mean')
+    results = []
+    for estimator_name in args.estimators:
+        if estimator_name == 'icp2d':
+            pose_estimator = ICP2DPoseEstimator(obj_model=object_model, projection_axis=(1, 0, 0), max_num_iterations=20)
+        elif estimator_name == 'icp3d':
+            pose_estimator = ICP3DPoseEstimator(obj_model=object_model)
+        elif estimator_name in batched_estimator_names:
+            pose_estimator = get_batched_estimator(estimator_name, args, device)
+        else:
+            raise NotImplementedError('Estimator {} not implemented yet. Available options: {}'.format(estimator_name, estimator_names))
+        if estimator_name in batched_estimator_names:
+            for batch_size in args.batch_sizes:
+                estimated_poses, elapsed_time = run_batched_estimator(pose_estimator, samples, batch_size, downsampling_tr, device)
+                results.append(get_result_row(estimator_name, batch_size, estimated_poses, gth_poses, elapsed_time))
+        else:
+            estimated_poses, elapsed_time = run_point_cloud_estimator(pose_estimator, samples, layout, imprint_th=object_params['imprint_th']['depth'], icp_th=object_params['icp_th'])
+            results.append(get_result_row(estimator_name, 1, estimated_poses, gth_poses, elapsed_time))
+
+    results_df = pd.DataFrame(results)
+    print(results_df.to_string(index=False, float_format='{:.3f}'.format))
+    if args.csv is not None:
+        results_df.to_csv(args.csv, index=False)
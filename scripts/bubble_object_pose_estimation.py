@@ -23,12 +23,15 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser('Bubble Object Pose Estimation')
     parser.add_argument('object_name', type=str, help='Name of the object. Possible values: {}'.format(object_names))
     parser.add_argument('--reconstruction', type=str, default='tree', help='Name of imprint extraction algorithm. Possible values: (tree, depth)')
-    parser.add_argument('--estimation_type', type=str, default='icp2d', help='Name of the algorithm used to estimate the pose from the imprint pc. Possible values: (icp2d, icp3d)')
+    parser.add_argument('--estimation_type', type=str, default='icp2d', help='Name of the algorithm used to estimate the pose from the imprint pc. Possible values: (icp2d, icp2d_tracker, icp3d)')
     parser.add_argument('--rate', type=float, default=5.0, help='Estimated pose publishing rate (upper bound)')
     parser.add_argument('--view', action='store_true')
     parser.add_argument('--verbose', action='store_true')
     parser.add_argument('--imprint_br', action='store_true')
     parser.add_argument('--percentile', type=float, default=None, help='Percentile used for imprint filtering')
+    parser.add_argument('--pipelined', action='store_true', help='Run acquisition, imprint extraction and pose estimation as separate stages')
+    parser.add_argument('--contact_point_plane_frame', type=str, default=None, help='Compute and publish the tool contact point with this plane frame from every pose estimate (replaces the ToolContactPointEstimator node)')
+    parser.add_argument('--report_period', type=float, default=None, help='Seconds between pipeline latency reports (only with --pipelined)')
 
     args = parser.parse_args()
 
@@ -51,7 +54,10 @@ if __name__ == '__main__':
                               broadcast_imprint=args.imprint_br,
                               estimation_type=args.estimation_type,
                               reconstruction=args.reconstruction,
-                              gripper_width=gripper_width)
+                              gripper_width=gripper_width,
+                              pipelined=args.pipelined,
+                              report_period=args.report_period,
+                              contact_point_plane_frame=args.contact_point_plane_frame)
 
 
 
@@ -0,0 +1,23 @@
+#! /usr/bin/env python
+import argparse
+
+from bubble_control.bubble_learning.models.bubble_dynamics_model import BubbleDynamicsModel
+from bubble_control.bubble_learning.models.bubble_linear_dynamics_model import BubbleLinearDynamicsModel
+from bubble_control.bubble_learning.models.object_pose_dynamics_model import ObjectPoseDynamicsModel
+from bubble_control.bubble_learning.models.icp_approximation_model import ICPApproximationModel
+from bubble_control.bubble_learning.aux.load_model import bundle_model_version
+
+
+if __name__ == '__main__':
+    models = [BubbleDynamicsModel, BubbleLinearDynamicsModel, ObjectPoseDynamicsModel, ICPApproximationModel]
+    model_names = [m.get_name() for m in models]
+    parser = argparse.ArgumentParser('Pack a trained model version and its sub-models into a single-file bundle')
+    parser.add_argument('model_data_path', type=str, help='path containing tb_logs/{model_name}/version_{version}/...')
+    parser.add_argument('model_name', type=str, choices=model_names)
+    parser.add_argument('--load_versions', type=int, nargs='+', default=[0])
+    args = parser.parse_args()
+
+    Model = models[model_names.index(args.model_name)]
+    for load_version in args.load_versions:
+        bundle_path = bundle_model_version(Model, args.model_data_path, load_version)
+        print('Model {} version {} bundled at {}'.format(args.model_name, load_version, bundle_path))
@@ -0,0 +1,29 @@
+#! /usr/bin/env python
+import argparse
+import numpy as np
+from functools import partial
+
+from bubble_utils.bubble_datasets.bubble_dataset_base import BubbleDatasetBase
+from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
+from bubble_control.aux.depth_chunk_storage import convert_depth_frames_to_chunks, DEFAULT_DEPTH_SCALE
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Convert the per-filecode bubble depth frames of a drawing dataset into the compressed chunked storage')
+    parser.add_argument('data_name', type=str, help='path to the drawing data')
+    parser.add_argument('--frames_per_chunk', type=int, default=256)
+    parser.add_argument('--depth_scale', type=float, default=DEFAULT_DEPTH_SCALE, help='quantization step [m]')
+    parser.add_argument('--no_verify', action='store_true', help='do not check the stored frames against the original ones')
+    args = parser.parse_args()
+
+    dataset = BubbleDrawingDataset(data_name=args.data_name, wrench_frame='med_base', tf_frame='grasp_frame')
+    load_depth_fn = partial(BubbleDatasetBase._load_depth_img, dataset) # always read the original frames
+    dl = dataset.dl
+    for scene_name in np.unique(dl['Scene'].values):
+        scene_dl = dl[dl['Scene'] == scene_name]
+        fcs = np.unique(scene_dl[['UndeformedFC', 'InitialStateFC', 'FinalStateFC']].values.astype(np.int64).flatten())
+        for camera_name in ['right', 'left']:
+            num_converted = convert_depth_frames_to_chunks(dataset.data_path, scene_name, camera_name, fcs, load_depth_fn,
+                                                           frames_per_chunk=args.frames_per_chunk, depth_scale=args.depth_scale,
+                                                           verify=not args.no_verify)
+            print('Scene {} camera {}: {} frames converted ({} already stored)'.format(scene_name, camera_name, num_converted, len(fcs) - num_converted))
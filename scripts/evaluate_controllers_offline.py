@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+import os
+import argparse
+from functools import partial
+
+from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
+from bubble_control.bubble_envs.replay_drawing_env import ReplayDrawingEnv
+from bubble_control.bubble_model_control.controller_evaluation import ControllerEvaluationHarness, get_evaluation_configs, summarize_evaluations
+
+
+def get_replay_env(config, dataset, max_num_steps, drawing_length_limits, grasp_width_limits):
+    env = ReplayDrawingEnv(dataset, max_num_steps=max_num_steps, seed=config['seed'],
+                           drawing_length_limits=drawing_length_limits, grasp_width_limits=grasp_width_limits)
+    return env
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Evaluate a grid of MPPI controller configurations offline on replayed drawing data')
+    parser.add_argument('data_name', type=str, help='path to the processed drawing data to replay')
+    parser.add_argument('model_data_path', type=str, help='path containing tb_logs/{model_name}/version_{version}/...')
+    parser.add_argument('--model_names', type=str, nargs='+', default=['bubble_dynamics_model'])
+    parser.add_argument('--load_versions', type=int, nargs='+', default=[0])
+    parser.add_argument('--opes', type=str, nargs='+', default=['icp'], help='object pose estimators (icp, icp_approx)')
+    parser.add_argument('--num_samples', type=int, nargs='+', default=[100])
+    parser.add_argument('--horizons', type=int, nargs='+', default=[2])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--max_num_steps', type=int, default=40)
+    parser.add_argument('--num_workers', type=int, default=None, help='number of processes. All cpus by default. 0 runs in the main process')
+    parser.add_argument('--save_path', type=str, default=None, help='csv file to save the per-episode results')
+    args = parser.parse_args()
+
+    dataset = BubbleDrawingDataset(data_name=args.data_name, wrench_frame='med_base', tf_frame='grasp_frame')
+    env_fn = partial(get_replay_env, dataset=dataset, max_num_steps=args.max_num_steps,
+                     drawing_length_limits=(0.01, 0.02), grasp_width_limits=(10, 35))
+    configs = get_evaluation_configs(args.model_names, args.load_versions, args.opes, args.num_samples, args.horizons, args.seeds)
+    harness = ControllerEvaluationHarness(env_fn, args.model_data_path, max_num_steps=args.max_num_steps, num_workers=args.num_workers)
+    evaluations_df = harness.run(configs)
+
+    if args.save_path is not None:
+        save_dir = os.path.dirname(os.path.abspath(args.save_path))
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        evaluations_df.to_csv(args.save_path, index=False)
+        print('Results saved at {}'.format(args.save_path))
+    print(summarize_evaluations(evaluations_df).to_string())
@@ -0,0 +1,24 @@
+#! /usr/bin/env python
+import os
+import argparse
+import numpy as np
+
+from bubble_control.aux.drawing_evaluation_utils import rescore_evaluation_files, score_methods
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser('Re-score saved drawing evaluations (offline, no ROS required)')
+    parser.add_argument('data_path', type=str, help='path to the drawing evaluation data (containing the evaluation_files directory)')
+    parser.add_argument('--methods', type=str, nargs='+', default=score_methods, help='score methods. Possible values: {}'.format(score_methods))
+    parser.add_argument('--img_th', type=int, default=50, help='threshold to consider a pixel drawn')
+    parser.add_argument('--num_workers', type=int, default=None, help='number of processes. All cpus by default')
+    args = parser.parse_args()
+
+    evaluation_files_path = os.path.join(args.data_path, 'evaluation_files')
+    scores = rescore_evaluation_files(evaluation_files_path, methods=args.methods, img_th=args.img_th, num_workers=args.num_workers)
+
+    print(('{:<10}' + ' {:>10}' * len(args.methods)).format('fc', *args.methods))
+    for evaluation_name, evaluation_scores in scores.items():
+        print(('{:<10}' + ' {:>10.3f}' * len(args.methods)).format(evaluation_name, *[evaluation_scores.get(m, np.nan) for m in args.methods]))
+    print('{} evaluations re-scored'.format(len(scores)))
@@ -3,8 +3,11 @@ import numpy as np
 from collections import OrderedDict
 import gym
 import copy
-import tf.transformations as tr
-from bubble_pivoting.pivoting_model_control.aux.pivoting_geometry import get_angle_difference, get_tool_axis
+from bubble_control.aux.lazy_imports import lazy_import, lazy_import_from
+
+# Only needed by the pivoting spaces, so the drawing spaces and the batched sampling do not require ROS tf or bubble_pivoting.
+tr = lazy_import('tf.transformations')
+get_angle_difference, get_tool_axis = lazy_import_from('bubble_pivoting.pivoting_model_control.aux.pivoting_geometry', 'get_angle_difference', 'get_tool_axis')
 
 
 class AxisBiasedDirectionSpace(gym.spaces.Space):
@@ -21,7 +24,13 @@ class AxisBiasedDirectionSpace(gym.spaces.Space):
         self.prob_axis = prob_axis
         super().__init__((), np.float32, seed)
 
-    def sample(self):
+    def sample(self, n=None):
+        if n is not None:
+            # batched sample
+            p_axis_direction = self.np_random.random(n)
+            axis_directions = 0.5 * np.pi * np.random.randint(0, 4, size=n)
+            directions = np.random.uniform(0, 2 * np.pi, size=n)
+            return np.where(p_axis_direction < self.prob_axis, axis_directions, directions)
         p_axis_direction = self.np_random.random() # probability of getting an axis motion
         if p_axis_direction < self.prob_axis:
             direction_i = 0.5 * np.pi * np.random.randint(0, 4) # axis direction (0, pi/2, pi/ 3pi/2)
@@ -157,7 +166,9 @@ class ConstantSpace(gym.spaces.Space):
         self.value = value
         super().__init__((), np.float32, seed)
 
-    def sample(self):
+    def sample(self, n=None):
+        if n is not None:
+            return np.array([self.value] * n)
         return self.value
 
     def contains(self, x):
@@ -185,8 +196,8 @@ class DiscreteElementSpace(gym.spaces.Space):
     def num_elements(self):
         return len(self.elements)
 
-    def sample(self):
-        element_sampled = np.random.choice(self.elements, p=self.probs)
+    def sample(self, n=None):
+        element_sampled = np.random.choice(self.elements, size=n, p=self.probs)
         return element_sampled
 
     def contains(self, value):
@@ -195,4 +206,45 @@ class DiscreteElementSpace(gym.spaces.Space):
     def __eq__(self, other):
         return (
             isinstance(other, DiscreteElementSpace) and self.elements == other.elements
-        )
\ No newline at end of file
+        )
+
+batched_spaces = (AxisBiasedDirectionSpace, ConstantSpace, DiscreteElementSpace)
+
+
+def sample_batch(space, n):
+    """
+    Sample n elements of the space at once.
+    Args:
+        space: gym.spaces.Space. Dict spaces are sampled per key.
+        n: <int> number of samples
+    Returns:
+        - <np.ndarray> of shape (n, *space.shape) or, for Dict spaces, an OrderedDict of them.
+    """
+    if isinstance(space, gym.spaces.Dict):
+        return OrderedDict([(k, sample_batch(space_k, n)) for k, space_k in space.spaces.items()])
+    if isinstance(space, gym.spaces.Box) and space.is_bounded():
+        low = np.broadcast_to(space.low, space.shape)
+        high = np.broadcast_to(space.high, space.shape)
+        samples = low + (high - low) * space.np_random.random((n,) + tuple(space.shape))
+        if np.issubdtype(space.dtype, np.integer):
+            samples = np.floor(samples)
+        return samples.astype(space.dtype)
+    if isinstance(space, batched_spaces):
+        return space.sample(n)
+    # spaces without batched sampling (e.g. the ones depending on the robot state)
+    return np.stack([np.asarray(space.sample()) for i in range(n)], axis=0)
+
+
+def get_batch_element(batch, indx):
+    """
+    Extract the element indx from a batch returned by sample_batch, with the same format as space.sample().
+    """
+    if isinstance(batch, dict):
+        return OrderedDict([(k, get_batch_element(v, indx)) for k, v in batch.items()])
+    return batch[indx]
+
+
+def get_batch_size(batch):
+    if isinstance(batch, dict):
+        return get_batch_size(next(iter(batch.values())))
+    return len(batch)
@@ -0,0 +1,122 @@
+import copy
+import threading
+import queue
+
+
+class AsyncRecorder(object):
+    """
+    Write-behind recorder. Observations are snapshotted in memory by the caller (see snapshot_recorders) and saved by
+    background writer threads, so the robot can keep moving while the data is written to disk.
+    The queue is bounded: record blocks when max_queue_size snapshots are pending (backpressure), which bounds the memory.
+    Use flush() as a barrier (e.g. at the end of an episode) to wait until all the pending snapshots are saved.
+    Threads are used instead of processes since writing is I/O bound and the snapshots (ROS messages, self-saved wrappers)
+    do not need to be pickled.
+    """
+
+    def __init__(self, num_workers=2, max_queue_size=10, verbose=False):
+        """
+        Args:
+            num_workers: <int> number of writer threads
+            max_queue_size: <int> maximum number of pending snapshots before record blocks
+            verbose: <bool>
+        """
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.verbose = verbose
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.alive = True
+        self.errors = []
+        self.num_written = 0
+        self.threads = [threading.Thread(target=self._writing_loop, daemon=True) for _ in range(self.num_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def record(self, snapshot, fc):
+        """
+        Queue a snapshot to be saved with the given filecode.
+        Args:
+            snapshot: object with a save_fc(fc) method (e.g. a DictSelfSavedWrapper)
+            fc: <int> filecode
+        """
+        self.submit(snapshot.save_fc, fc)
+
+    def submit(self, write_fn, *args, **kwargs):
+        """
+        Queue a write job as write_fn(*args, **kwargs). Blocks if the queue is full.
+        """
+        if not self.alive:
+            raise RuntimeError('AsyncRecorder has already finished. No more data can be recorded')
+        self.queue.put((write_fn, args, kwargs))
+
+    def _writing_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            write_fn, args, kwargs = job
+            try:
+                write_fn(*args, **kwargs)
+                with self.lock:
+                    self.num_written += 1
+            except Exception as e:
+                print('Failed to record {}: {}'.format(args, e))
+                with self.lock:
+                    self.errors.append(e)
+            self.queue.task_done()
+
+    def num_pending(self):
+        return self.queue.unfinished_tasks
+
+    def flush(self):
+        """
+        Barrier: wait until all queued snapshots are saved.
+        Raises the first error found while writing since the last flush, so failed recordings are not silently lost.
+        """
+        self.queue.join()
+        with self.lock:
+            errors = self.errors
+            self.errors = []
+        if len(errors) > 0:
+            raise RuntimeError('{} recordings failed. First error: {}'.format(len(errors), errors[0])) from errors[0]
+        if self.verbose:
+            print('All recordings saved ({} in total)'.format(self.num_written))
+
+    def finish(self):
+        with self.lock:
+            if not self.alive:
+                return
+            self.alive = False
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def get_recorders(obj):
+    """
+    Returns:
+        - <dict> {attribute_name: recorder} attributes of obj with a record method (e.g. camera parsers, wrench recorders)
+    """
+    recorders = {}
+    for name, value in vars(obj).items():
+        if not isinstance(value, (type, AsyncRecorder)) and callable(getattr(value, 'record', None)):
+            recorders[name] = value
+    return recorders
+
+
+def snapshot_recorders(obj):
+    """
+    Freeze the recorders of obj so their own record(fc) can run later on a writer thread and still save the current data.
+    The recorders keep the last received data in attributes that their subscriber callbacks replace on every message,
+    so a shallow copy holds the current data while the original recorders keep updating.
+    Args:
+        obj: object owning the recorders (e.g. a data collector)
+    Returns:
+        - shallow copy of obj whose recorders are shallow copies of the original ones
+    """
+    snapshot = copy.copy(obj)
+    for name, recorder in get_recorders(obj).items():
+        setattr(snapshot, name, copy.copy(recorder))
+    return snapshot
@@ -0,0 +1,248 @@
+import os
+import zlib
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+
+# Depth is stored as uint16 in units of depth_scale [m]. With the default 1e-5 m (0.01 mm), the range is [0, 0.655] m,
+# which covers the Pico Flexx bubble depths, and the quantization is far below the sensor noise.
+# The largest uint16 value is reserved for the invalid (NaN) depths.
+DEFAULT_DEPTH_SCALE = 1e-5
+NAN_DEPTH_VALUE = np.iinfo(np.uint16).max
+index_columns = ['FileCode', 'Chunk', 'Offset', 'NumBytes', 'Height', 'Width', 'Channels', 'DepthScale']
+
+
+def get_depth_storage_path(data_path, scene_name, camera_name):
+    return os.path.join(data_path, scene_name, 'depth_chunks', camera_name)
+
+
+def has_depth_storage(data_path, scene_name, camera_name):
+    return os.path.isfile(os.path.join(get_depth_storage_path(data_path, scene_name, camera_name), 'index.csv'))
+
+
+def encode_depth(depth_img, depth_scale=DEFAULT_DEPTH_SCALE, compression_level=1):
+    """
+    Quantize the depth to uint16 and compress it losslessly.
+    Rows are delta encoded (neighboring depth values are similar, so the deltas are small and compress well) and the
+    high and low bytes are stored in separate planes before the zlib compression.
+    Args:
+        depth_img: <np.ndarray> (h, w) or (h, w, c) depth in meters. NaNs (invalid) are kept.
+        depth_scale: <float> quantization step [m]
+        compression_level: <int> zlib level. 1 is the fastest.
+    Returns:
+        - <bytes> compressed frame
+    """
+    depth_img = np.asarray(depth_img, dtype=np.float64)
+    nan_mask = np.isnan(depth_img)
+    quantized_depth = np.round(np.where(nan_mask, 0., depth_img) / depth_scale)
+    if np.any(quantized_depth < 0) or np.any(quantized_depth >= NAN_DEPTH_VALUE):
+        raise ValueError('Depth values out of the storable range [0, {}] m for depth_scale {}'.format((NAN_DEPTH_VALUE - 1) * depth_scale, depth_scale))
+    quantized_depth = quantized_depth.astype(np.uint16)
+    quantized_depth[nan_mask] = NAN_DEPTH_VALUE
+    delta_depth = np.diff(quantized_depth, axis=1, prepend=np.zeros_like(quantized_depth[:, :1])) # uint16 wraps around, so it is exactly invertible
+    byte_planes = delta_depth.astype('<u2').view(np.uint8).reshape(-1, 2).T
+    return zlib.compress(np.ascontiguousarray(byte_planes).tobytes(), compression_level)
+
+
+def decode_depth(frame_bytes, shape, depth_scale=DEFAULT_DEPTH_SCALE):
+    """
+    Inverse of encode_depth.
+    Returns:
+        - <np.ndarray> float32 depth in meters with the given shape, NaN where it was invalid
+    """
+    byte_planes = np.frombuffer(zlib.decompress(frame_bytes), dtype=np.uint8).reshape(2, -1)
+    delta_depth = np.ascontiguousarray(byte_planes.T).view('<u2').reshape(shape)
+    quantized_depth = np.cumsum(delta_depth, axis=1, dtype=np.uint16)
+    depth_img = quantized_depth.astype(np.float32) * np.float32(depth_scale)
+    depth_img[quantized_depth == NAN_DEPTH_VALUE] = np.nan
+    return depth_img
+
+
+class DepthChunkWriter(object):
+    """
+    Append depth frames of a single scene and camera into chunk files of frames_per_chunk compressed frames.
+    An index (index.csv) stores the filecode, chunk, byte offset and shape of each frame. It is appended and flushed
+    after every frame, so the storage stays readable if the collection is interrupted.
+    It is thread safe, so frames can be written from the background recorder threads.
+    """
+
+    def __init__(self, storage_path, frames_per_chunk=256, depth_scale=DEFAULT_DEPTH_SCALE, compression_level=1):
+        self.storage_path = storage_path
+        self.frames_per_chunk = frames_per_chunk
+        self.depth_scale = depth_scale
+        self.compression_level = compression_level
+        self.lock = threading.Lock()
+        if not os.path.exists(self.storage_path):
+            os.makedirs(self.storage_path)
+        self.index_path = os.path.join(self.storage_path, 'index.csv')
+        self.fcs = set()
+        self.chunk_indx = 0
+        self.num_frames_in_chunk = 0
+        if os.path.isfile(self.index_path):
+            # continue an existing storage
+            index_df = pd.read_csv(self.index_path)
+            self.fcs = set(index_df['FileCode'].values.tolist())
+            if len(index_df) > 0:
+                self.chunk_indx = int(index_df['Chunk'].max())
+                self.num_frames_in_chunk = int(np.sum(index_df['Chunk'].values == self.chunk_indx))
+        else:
+            with open(self.index_path, 'w') as f:
+                f.write(','.join(index_columns) + '\n')
+
+    def _get_chunk_path(self, chunk_indx):
+        return os.path.join(self.storage_path, 'chunk_{:06d}.bin'.format(chunk_indx))
+
+    def write(self, fc, depth_img):
+        """
+        Compress and append the depth frame with filecode fc.
+        """
+        depth_img = np.asarray(depth_img)
+        frame_bytes = encode_depth(depth_img.reshape(depth_img.shape[0], -1), depth_scale=self.depth_scale, compression_level=self.compression_level)
+        height, width = depth_img.shape[:2]
+        channels = depth_img.shape[2] if depth_img.ndim > 2 else 0
+        with self.lock:
+            if fc in self.fcs:
+                raise ValueError('Depth frame with filecode {} already stored at {}'.format(fc, self.storage_path))
+            if self.num_frames_in_chunk >= self.frames_per_chunk:
+                self.chunk_indx += 1
+                self.num_frames_in_chunk = 0
+            chunk_path = self._get_chunk_path(self.chunk_indx)
+            with open(chunk_path, 'ab') as f:
+                offset = f.tell()
+                f.write(frame_bytes)
+            with open(self.index_path, 'a') as f:
+                f.write(','.join(str(v) for v in [fc, self.chunk_indx, offset, len(frame_bytes), height, width, channels, repr(self.depth_scale)]) + '\n')
+            self.num_frames_in_chunk += 1
+            self.fcs.add(fc)
+
+
+class DepthChunkReader(object):
+    """
+    Random access to the depth frames stored by a DepthChunkWriter.
+    Frames of the same chunk requested together are read with a single file read.
+    The last max_cached_chunks read byte ranges are kept in memory, so frames of the same chunk read one at a time
+    (e.g. the undeformed, initial and final frames of a sample) do not hit the disk again.
+    """
+
+    def __init__(self, storage_path, max_cached_chunks=4):
+        self.storage_path = storage_path
+        self.max_cached_chunks = max_cached_chunks
+        self.index = self._load_index()
+        self.cached_ranges = OrderedDict()
+
+    def _load_index(self):
+        index_df = pd.read_csv(os.path.join(self.storage_path, 'index.csv'))
+        index = {}
+        for line in index_df.itertuples(index=False):
+            shape = (int(line.Height), int(line.Width)) if int(line.Channels) == 0 else (int(line.Height), int(line.Width), int(line.Channels))
+            index[int(line.FileCode)] = (int(line.Chunk), int(line.Offset), int(line.NumBytes), shape, float(line.DepthScale))
+        return index
+
+    def __contains__(self, fc):
+        return int(fc) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_fcs(self):
+        return sorted(self.index.keys())
+
+    def _get_chunk_path(self, chunk_indx):
+        return os.path.join(self.storage_path, 'chunk_{:06d}.bin'.format(chunk_indx))
+
+    def _get_cached_bytes(self, chunk_indx, offset, num_bytes):
+        for (c_indx, start, end), range_bytes in self.cached_ranges.items():
+            if c_indx == chunk_indx and start <= offset and offset + num_bytes <= end:
+                self.cached_ranges.move_to_end((c_indx, start, end))
+                return range_bytes[offset - start:offset - start + num_bytes]
+        return None
+
+    def _read_range(self, chunk_indx, start, end):
+        with open(self._get_chunk_path(chunk_indx), 'rb') as f:
+            f.seek(start)
+            range_bytes = f.read(end - start)
+        self.cached_ranges[(chunk_indx, start, end)] = range_bytes
+        while len(self.cached_ranges) > self.max_cached_chunks:
+            self.cached_ranges.popitem(last=False)
+        return range_bytes
+
+    def read(self, fc):
+        return self.read_many([fc])[0]
+
+    def read_many(self, fcs):
+        """
+        Read the depth frames with the given filecodes.
+        Returns:
+            - list of <np.ndarray> float32 depth images in meters
+        """
+        fcs = [int(fc) for fc in fcs]
+        missing_fcs = [fc for fc in fcs if fc not in self.index]
+        if len(missing_fcs) > 0:
+            raise KeyError('Depth frames {} not found in {}'.format(missing_fcs, self.storage_path))
+        frame_bytes = {}
+        # group the frames not cached by chunk and read each group with a single read
+        chunk_fcs = {}
+        for fc in set(fcs):
+            chunk_indx, offset, num_bytes, _, _ = self.index[fc]
+            cached_bytes = self._get_cached_bytes(chunk_indx, offset, num_bytes)
+            if cached_bytes is not None:
+                frame_bytes[fc] = cached_bytes
+            else:
+                chunk_fcs.setdefault(chunk_indx, []).append(fc)
+        for chunk_indx, fcs_i in chunk_fcs.items():
+            start = min(self.index[fc][1] for fc in fcs_i)
+            end = max(self.index[fc][1] + self.index[fc][2] for fc in fcs_i)
+            range_bytes = self._read_range(chunk_indx, start, end)
+            for fc in fcs_i:
+                _, offset, num_bytes, _, _ = self.index[fc]
+                frame_bytes[fc] = range_bytes[offset - start:offset - start + num_bytes]
+        depth_imgs = []
+        for fc in fcs:
+            _, _, _, shape, depth_scale = self.index[fc]
+            depth_img = decode_depth(frame_bytes[fc], (shape[0], -1), depth_scale=depth_scale).reshape(shape)
+            depth_imgs.append(depth_img)
+        return depth_imgs
+
+
+def depths_match(depth_img, stored_depth_img, depth_scale=DEFAULT_DEPTH_SCALE):
+    # same shape, NaNs at the same pixels and the other values equal up to the quantization
+    depth_img = np.asarray(depth_img, dtype=np.float64)
+    stored_depth_img = np.asarray(stored_depth_img, dtype=np.float64)
+    if depth_img.shape != stored_depth_img.shape:
+        return False
+    nan_mask = np.isnan(depth_img)
+    if not np.array_equal(nan_mask, np.isnan(stored_depth_img)):
+        return False
+    return np.all(np.abs(depth_img[~nan_mask] - stored_depth_img[~nan_mask]) <= depth_scale)
+
+
+def convert_depth_frames_to_chunks(data_path, scene_name, camera_name, fcs, load_depth_fn, frames_per_chunk=256,
+                                   depth_scale=DEFAULT_DEPTH_SCALE, verify=True):
+    """
+    Convert the per-filecode depth frames of a scene and camera into the chunked storage.
+    Frames already stored are skipped, so the conversion can be resumed.
+    Args:
+        data_path: <str> path containing the scene directories
+        scene_name: <str>
+        camera_name: <str> e.g. 'right' or 'left'
+        fcs: list of filecodes to convert
+        load_depth_fn: function returning the depth frame as load_depth_fn(fc=fc, scene_name=scene_name, camera_name=camera_name)
+        frames_per_chunk: <int>
+        depth_scale: <float> quantization step [m]
+        verify: <bool> check that the stored frames match the original ones up to the quantization, NaNs included
+    Returns:
+        - <int> number of frames converted
+    """
+    writer = DepthChunkWriter(get_depth_storage_path(data_path, scene_name, camera_name), frames_per_chunk=frames_per_chunk, depth_scale=depth_scale)
+    fcs_to_convert = [fc for fc in sorted(set(int(fc) for fc in fcs)) if fc not in writer.fcs]
+    for fc in fcs_to_convert:
+        writer.write(fc, load_depth_fn(fc=fc, scene_name=scene_name, camera_name=camera_name))
+    if verify and len(fcs_to_convert) > 0:
+        reader = DepthChunkReader(writer.storage_path)
+        for fc, stored_depth in zip(fcs_to_convert, reader.read_many(fcs_to_convert)):
+            original_depth = np.asarray(load_depth_fn(fc=fc, scene_name=scene_name, camera_name=camera_name), dtype=np.float64)
+            if not depths_match(original_depth, stored_depth, depth_scale):
+                raise ValueError('Stored depth frame {} of scene {} camera {} does not match the original one'.format(fc, scene_name, camera_name))
+    return len(fcs_to_convert)
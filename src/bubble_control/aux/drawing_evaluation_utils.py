@@ -0,0 +1,165 @@
+import os
+import threading
+import queue
+import numpy as np
+import cv2
+from multiprocessing import Pool
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+score_methods = ['desired', 'actual', 'symmetric', 'chamfer']
+
+
+def get_distance_transform(drawing, img_th=50):
+    """
+    Compute the distance (in pixels) from every pixel of the image to the closest drawn pixel.
+    Args:
+        drawing: <np.ndarray> (h, w) grayscale drawing, where the drawn pixels have values > img_th
+        img_th: <int> threshold to consider a pixel drawn
+    Returns:
+        - <np.ndarray> (h, w) float32 distance transform. None if there are no drawn pixels.
+    """
+    not_drawn = (drawing <= img_th).astype(np.uint8) # distanceTransform computes the distance to the closest zero pixel
+    if np.all(not_drawn):
+        return None
+    distance_transform = cv2.distanceTransform(not_drawn, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    return distance_transform
+
+
+def _mean_distance(distance_transform, drawing, img_th):
+    if distance_transform is None:
+        return np.inf
+    drawn = drawing > img_th
+    if not np.any(drawn):
+        return np.inf
+    return np.mean(distance_transform[drawn])
+
+
+def compute_drawing_score(actual_drawing, desired_drawing, img_th=50, method='desired'):
+    """
+    Score the drawing using the distance transforms of the binarized drawings. Cost is O(pixels).
+    Args:
+        actual_drawing: <np.ndarray> (h, w) binarized drawing (drawn pixels > img_th)
+        desired_drawing: <np.ndarray> (h, w) binarized expected drawing (drawn pixels > img_th)
+        img_th: <int>
+        method: <str> one of:
+            * 'desired': mean distance from the desired pixels to the closest actual pixel (original score)
+            * 'actual': mean distance from the actual pixels to the closest desired pixel
+            * 'symmetric': max of both directed mean distances
+            * 'chamfer': sum of both directed mean distances
+    Returns: score (0, inf).  The lower, the better.
+    """
+    if method not in score_methods:
+        raise NotImplementedError('Score method {} not implemented yet. Available options: {}'.format(method, score_methods))
+    score_desired = 0.
+    score_actual = 0.
+    if method in ['desired', 'symmetric', 'chamfer']:
+        score_desired = _mean_distance(get_distance_transform(actual_drawing, img_th=img_th), desired_drawing, img_th)
+    if method in ['actual', 'symmetric', 'chamfer']:
+        score_actual = _mean_distance(get_distance_transform(desired_drawing, img_th=img_th), actual_drawing, img_th)
+    if method == 'symmetric':
+        return max(score_desired, score_actual)
+    return score_desired + score_actual
+
+
+class FigureWriter(object):
+    """
+    Write image figures on a background thread so the evaluation does not wait for matplotlib rendering.
+    It uses the object oriented matplotlib API (no pyplot global state), which is safe outside of the main thread.
+    """
+
+    def __init__(self, max_queue_size=50):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.alive = True
+        self.thread = threading.Thread(target=self._writing_loop, daemon=True)
+        self.thread.start()
+
+    def save_image(self, img, full_path, dpi=None):
+        # the image is copied so the caller can keep modifying it
+        self.queue.put((np.array(img, copy=True), full_path, dpi))
+
+    def _writing_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            img, full_path, dpi = job
+            try:
+                self._write_figure(img, full_path, dpi)
+            except Exception as e:
+                print('Failed to save figure {}: {}'.format(full_path, e))
+            self.queue.task_done()
+
+    def _write_figure(self, img, full_path, dpi=None):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.imshow(img)
+        fig.savefig(full_path, dpi=dpi)
+
+    def flush(self):
+        # wait until all queued figures are written
+        self.queue.join()
+
+    def finish(self):
+        with self.lock:
+            if not self.alive:
+                return
+            self.alive = False
+        self.queue.put(None)
+        self.thread.join()
+
+
+def save_evaluation_arrays(save_path, actual_drawing, expected_drawing):
+    # Raw arrays needed to re-score the evaluation offline
+    np.save(os.path.join(save_path, 'actual_drawing.npy'), actual_drawing)
+    np.save(os.path.join(save_path, 'expected_drawing.npy'), expected_drawing)
+
+
+def rescore_evaluation_dir(evaluation_path, method='desired', img_th=50):
+    """
+    Re-score a single evaluation directory (evaluation_files/{fc:06d}) saved by the DrawingEvaluator.
+    Returns:
+        - <float> score, or None if the directory does not contain the evaluation arrays.
+    """
+    actual_path = os.path.join(evaluation_path, 'actual_drawing.npy')
+    expected_path = os.path.join(evaluation_path, 'expected_drawing.npy')
+    if not (os.path.isfile(actual_path) and os.path.isfile(expected_path)):
+        return None
+    actual_drawing = np.load(actual_path)
+    expected_drawing = np.load(expected_path)
+    score = compute_drawing_score(actual_drawing, expected_drawing, img_th=img_th, method=method)
+    return score
+
+
+def _rescore_evaluation_dir_args(args):
+    return rescore_evaluation_dir(*args)
+
+
+def rescore_evaluation_files(evaluation_files_path, methods=('desired',), img_th=50, num_workers=None):
+    """
+    Re-score in parallel all the evaluations saved in an evaluation_files directory. No ROS is required.
+    Args:
+        evaluation_files_path: <str> path to the evaluation_files directory containing one directory per evaluation
+        methods: list of score methods to compute
+        img_th: <int>
+        num_workers: <int> number of processes. If None, use all cpus.
+    Returns:
+        - <dict> {evaluation_name: {method: score}}. Directories without evaluation arrays are skipped.
+    """
+    evaluation_names = sorted([d for d in os.listdir(evaluation_files_path) if os.path.isdir(os.path.join(evaluation_files_path, d))])
+    jobs = [(os.path.join(evaluation_files_path, name), method, img_th) for name in evaluation_names for method in methods]
+    with Pool(processes=num_workers) as pool:
+        job_scores = pool.map(_rescore_evaluation_dir_args, jobs)
+    scores = {}
+    for (evaluation_path, method, _), score in zip(jobs, job_scores):
+        if score is None:
+            continue
+        evaluation_name = os.path.basename(evaluation_path)
+        if evaluation_name not in scores:
+            scores[evaluation_name] = {}
+        scores[evaluation_name][method] = score
+    return scores
@@ -6,8 +6,7 @@ import os
 from arc_utilities.tf2wrapper import TF2Wrapper
 from mmint_camera_utils.point_cloud_parsers import RealSensePointCloudParser
 from mmint_camera_utils.camera_utils import project_points_pinhole
-from matplotlib import pyplot as plt
-from scipy.spatial import KDTree
+from bubble_control.aux.drawing_evaluation_utils import compute_drawing_score, FigureWriter, save_evaluation_arrays
 
 from mmint_camera_utils.ros_utils.marker_publisher import MarkerPublisher
 from geometry_msgs.msg import Point
@@ -44,7 +43,7 @@ def invert_img(img):
 
 class DrawingEvaluator(object):
 
-    def __init__(self, camera_indx=1, board_size=(0.56, 0.86), tag_size=0.09, scaling_factor=1000, drawing_topic='expected_drawing', visualize_expected_drawing=False):
+    def __init__(self, camera_indx=1, board_size=(0.56, 0.86), tag_size=0.09, scaling_factor=1000, drawing_topic='expected_drawing', visualize_expected_drawing=False, score_method='desired'):
         self.tag_names = ['tag_5', 'tag_6', 'tag_7']
         self.camera_indx = camera_indx
         self.board_x_size = board_size[0]
@@ -53,6 +52,8 @@ class DrawingEvaluator(object):
         self.scaling_factor = scaling_factor # pixels per meter for unwarped image
         self.drawing_topic = drawing_topic
         self.visualize_expected_drawing = visualize_expected_drawing
+        self.score_method = score_method
+        self.figure_writer = FigureWriter()
         self.tf_listener = TF2Wrapper()
         self.marker_publisher = MarkerPublisher(self.drawing_topic)
         self.camera_parser = RealSensePointCloudParser(camera_indx=camera_indx, verbose=False)
@@ -126,11 +127,7 @@ class DrawingEvaluator(object):
 
     def _compute_score(self, actual_drawing, desired_drawing):
         img_th = 50
-        current_drawing_pixels = np.stack(np.where(actual_drawing > img_th), axis=-1)
-        desired_drawing_pixels = np.stack(np.where(desired_drawing > img_th), axis=-1)
-        tree = KDTree(current_drawing_pixels)
-        min_dists, min_indxs = tree.query(desired_drawing_pixels)
-        score = np.mean(min_dists)
+        score = compute_drawing_score(actual_drawing, desired_drawing, img_th=img_th, method=self.score_method)
         return score
 
     def publish_drawing_coordinates(self, drawing_coordinates, frame='med_base'):
@@ -232,33 +229,22 @@ class DrawingEvaluator(object):
                 print('created: ', save_path)
             file_name='drawing_evaluation_{}.png'
             full_path = os.path.join(save_path, file_name)
-            # original
-            plt.figure(1)
-            plt.imshow(color_img)
-            plt.savefig(full_path.format('original'))
-            # detected
-            plt.figure(2)
-            plt.imshow(detected_color_img_q)
-            plt.savefig(full_path.format('detected'))
-            # unwarped
-            plt.figure(3)
-            plt.imshow(unwarped_img)
-            plt.savefig(full_path.format('unwarped'))
-            # binarized
-            plt.figure(4)
-            plt.imshow(binarized_img)
-            plt.savefig(full_path.format('binarized'), dpi=400)
-            # expected drawing
-            plt.figure(5)
-            plt.imshow(expected_drawing_img)
-            plt.savefig(full_path.format('expected_overlapped'), dpi=400)
-            # expected binarized projected
-            plt.figure(6)
-            plt.imshow(expected_img)
-            plt.savefig(full_path.format('expected_binarized_unwarped'), dpi=400)
+            # figures are rendered on the background
+            self.figure_writer.save_image(color_img, full_path.format('original'))
+            self.figure_writer.save_image(detected_color_img_q, full_path.format('detected'))
+            self.figure_writer.save_image(unwarped_img, full_path.format('unwarped'))
+            self.figure_writer.save_image(binarized_img, full_path.format('binarized'), dpi=400)
+            self.figure_writer.save_image(expected_drawing_img, full_path.format('expected_overlapped'), dpi=400)
+            self.figure_writer.save_image(expected_img, full_path.format('expected_binarized_unwarped'), dpi=400)
+            # save the raw drawings so the evaluation can be re-scored offline
+            save_evaluation_arrays(save_path, binarized_img, expected_img)
 
         return score, binarized_img, expected_img
 
+    def finish(self):
+        # wait for the pending figures to be written
+        self.figure_writer.finish()
+
 
 # DEBUG: --
 
@@ -279,5 +265,6 @@ if __name__ == '__main__':
                                                                       frame='med_base',
                                                                       save_path='/home/mmint/Desktop/eval_test')
     print('SCORE: ', score)
+    evaluator.finish()
 
 
@@ -0,0 +1,76 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module imported on first attribute access.
+    Used for the ROS, visualization and hardware dependencies, so modules that only need them in some methods can be
+    imported (and used) without them.
+    """
+    def __init__(self, module_name):
+        super().__init__(module_name)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # keep the module protocol attributes (e.g. used by inspect or pickle) from triggering the import
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return '<lazy module {} ({})>'.format(self.__name__, 'loaded' if self._module is not None else 'not loaded')
+
+
+class LazyAttribute(object):
+    """
+    Function or class from a module imported on first call or attribute access.
+    NOTE: it can not be used as a base class or in isinstance, since those need the actual class.
+    """
+    def __init__(self, module_name, attr_name):
+        self._module_name = module_name
+        self._attr_name = attr_name
+        self._attr = None
+
+    def _load(self):
+        if self._attr is None:
+            self._attr = getattr(importlib.import_module(self._module_name), self._attr_name)
+        return self._attr
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return '<lazy {}.{}>'.format(self._module_name, self._attr_name)
+
+
+def lazy_import(module_name):
+    """
+    Equivalent to 'import module_name', but the module is imported when first used.
+    """
+    return LazyModule(module_name)
+
+
+def lazy_import_from(module_name, *attr_names):
+    """
+    Equivalent to 'from module_name import attr_name_1, attr_name_2, ...', but the module is imported when first used.
+    Returns:
+        - a LazyAttribute if a single attribute is given, otherwise a tuple of them
+    """
+    lazy_attrs = tuple(LazyAttribute(module_name, attr_name) for attr_name in attr_names)
+    if len(lazy_attrs) == 1:
+        return lazy_attrs[0]
+    return lazy_attrs
@@ -4,7 +4,9 @@ import os
 import numpy as np
 import pandas as pd
 import bubble_utils
-from mmint_camera_utils.point_cloud_utils import pack_o3d_pcd, unpack_o3d_pcd
+from bubble_control.aux.lazy_imports import lazy_import_from
+
+pack_o3d_pcd, unpack_o3d_pcd = lazy_import_from('mmint_camera_utils.point_cloud_utils', 'pack_o3d_pcd', 'unpack_o3d_pcd')
 
 package_path = project_path = os.path.join(os.path.dirname(os.path.abspath(__file__)).split('/bubble_control')[0], 'bubble_control')
 
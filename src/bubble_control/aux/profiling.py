@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import numpy as np
+from bubble_control.aux.lazy_imports import lazy_import
+
+pd = lazy_import('pandas') # only needed for the summary
+
+
+# Set BUBBLE_CONTROL_PROFILE=<trace_path> to profile a whole run and export the Chrome trace when the process exits.
+# '{pid}' in the path is replaced by the process id, so several runs can write to the same directory.
+PROFILE_ENV_VAR = 'BUBBLE_CONTROL_PROFILE'
+
+_profiler = None # active profiler. None when profiling is disabled.
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('profiler', 'name', 'args', 'start_ns')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start_ns = None
+
+    def __enter__(self):
+        if self.profiler.cuda_sync:
+            self.profiler._cuda_synchronize()
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler.cuda_sync:
+            self.profiler._cuda_synchronize()
+        self.profiler.record(self.name, self.start_ns, time.perf_counter_ns(), self.args)
+        return False
+
+
+class SpanProfiler(object):
+    """
+    Records named spans (timed code sections), aggregates their durations per name and exports them as a Chrome trace
+    (chrome://tracing or https://ui.perfetto.dev). Nested spans show as a call stack in the trace.
+    """
+    def __init__(self, max_events=1000000, cuda_sync=False):
+        """
+        Args:
+            max_events: <int> maximum number of events kept for the trace. Durations are aggregated for all of them.
+            cuda_sync: <bool> synchronize cuda at the span boundaries, so the spans include the asynchronous gpu work.
+        """
+        self.max_events = max_events
+        self.cuda_sync = cuda_sync
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.events = [] # [(name, start_ns, duration_ns, thread_id, args)]
+        self.durations = {} # {name: [duration_ns]}
+        self.num_dropped_events = 0
+        self.start_ns = time.perf_counter_ns()
+
+    def span(self, name, **args):
+        return _Span(self, name, args if len(args) > 0 else None)
+
+    def record(self, name, start_ns, end_ns, args=None):
+        duration_ns = end_ns - start_ns
+        with self.lock:
+            self.durations.setdefault(name, []).append(duration_ns)
+            if len(self.events) < self.max_events:
+                self.events.append((name, start_ns, duration_ns, threading.get_ident(), args))
+            else:
+                self.num_dropped_events += 1
+
+    def reset(self):
+        with self.lock:
+            self.events = []
+            self.durations = {}
+            self.num_dropped_events = 0
+            self.start_ns = time.perf_counter_ns()
+
+    def _cuda_synchronize(self):
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    def get_durations(self, name):
+        """
+        Returns:
+            - <np.ndarray> durations [s] of all the spans with the given name
+        """
+        with self.lock:
+            durations = list(self.durations.get(name, []))
+        return np.asarray(durations, dtype=np.float64) * 1e-9
+
+    def get_histogram(self, name, bins=None):
+        """
+        Histogram of the span durations, with log spaced bins by default.
+        Returns:
+            - counts: <np.ndarray> (num_bins,)
+            - bin_edges: <np.ndarray> (num_bins+1,) [s]
+        """
+        durations = self.get_durations(name)
+        if bins is None:
+            bins = np.logspace(-6, 2, 33) # 1us to 100s, 4 bins per decade
+        return np.histogram(durations, bins=bins)
+
+    def summary(self):
+        """
+        Returns:
+            - <pd.DataFrame> span statistics in ms, sorted by total time
+        """
+        with self.lock:
+            names = list(self.durations.keys())
+        rows = []
+        for name in names:
+            durations = self.get_durations(name) * 1e3
+            rows.append({
+                'Name': name,
+                'Count': len(durations),
+                'Total': durations.sum(),
+                'Mean': durations.mean(),
+                'Min': durations.min(),
+                'P50': np.percentile(durations, 50),
+                'P95': np.percentile(durations, 95),
+                'Max': durations.max(),
+            })
+        summary_df = pd.DataFrame(rows, columns=['Name', 'Count', 'Total', 'Mean', 'Min', 'P50', 'P95', 'Max'])
+        return summary_df.sort_values('Total', ascending=False).reset_index(drop=True)
+
+    def get_chrome_trace(self):
+        with self.lock:
+            events = list(self.events)
+        trace_events = []
+        for name, start_ns, duration_ns, thread_id, args in events:
+            event = {
+                'name': name,
+                'cat': name.split('/')[0],
+                'ph': 'X',
+                'ts': (start_ns - self.start_ns) * 1e-3, # [us]
+                'dur': duration_ns * 1e-3, # [us]
+                'pid': self.pid,
+                'tid': thread_id,
+            }
+            if args is not None:
+                event['args'] = {k: v if isinstance(v, (int, float, str, bool)) else str(v) for k, v in args.items()}
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': {'dropped_events': self.num_dropped_events}}
+
+    def export_chrome_trace(self, path):
+        trace_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(trace_dir):
+            os.makedirs(trace_dir)
+        with open(path, 'w') as f:
+            json.dump(self.get_chrome_trace(), f)
+        return path
+
+
+def enable_profiling(max_events=1000000, cuda_sync=False):
+    """
+    Start recording the spans of this process.
+    Returns:
+        - the active SpanProfiler
+    """
+    global _profiler
+    _profiler = SpanProfiler(max_events=max_events, cuda_sync=cuda_sync)
+    return _profiler
+
+
+def disable_profiling():
+    """
+    Stop recording spans.
+    Returns:
+        - the SpanProfiler that was active (or None), to summarize or export its spans
+    """
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    return profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def is_profiling_enabled():
+    return _profiler is not None
+
+
+def span(name, **args):
+    """
+    Context manager timing the enclosed code as the span 'name'. Extra keyword arguments are stored in the trace.
+    When profiling is disabled, it returns a shared no-op context manager.
+    Usage:
+        with span('icp/step'):
+            ...
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _null_span
+    return profiler.span(name, **args)
+
+
+def profiled(name=None):
+    """
+    Decorator timing every call of the function as a span. The span name defaults to the function qualified name.
+    """
+    def decorator(fn):
+        span_name = name if name is not None else fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return fn(*args, **kwargs)
+            with profiler.span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _enable_profiling_from_env():
+    trace_path = os.environ.get(PROFILE_ENV_VAR)
+    if trace_path is None or len(trace_path) == 0:
+        return
+    profiler = enable_profiling()
+
+    def _export_trace():
+        profiler.export_chrome_trace(trace_path.replace('{pid}', str(profiler.pid)))
+    atexit.register(_export_trace)
+
+
+_enable_profiling_from_env()
@@ -0,0 +1,172 @@
+import numpy as np
+import torch
+from bubble_control.aux.lazy_imports import lazy_import, lazy_import_from
+
+pd = lazy_import('pandas')
+Rotation = lazy_import_from('scipy.spatial.transform', 'Rotation')
+
+
+def quaternions_to_matrices(poses):
+    """
+    Vectorized tf.transformations.quaternion_matrix with translation.
+    Args:
+        poses: <np.ndarray> (..., 7) as [x, y, z, qx, qy, qz, qw]
+    Returns:
+        - <np.ndarray> (..., 4, 4) homogeneous transformations
+    """
+    poses = np.asarray(poses, dtype=np.float64)
+    q = poses[..., 3:]
+    n = np.sum(q * q, axis=-1, keepdims=True)
+    is_valid = n > np.finfo(float).eps * 4.0 # quaternion_matrix returns the identity for ~zero quaternions
+    q = q * np.sqrt(2.0 / np.where(is_valid, n, 1.))
+    qx, qy, qz, qw = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    X = np.zeros(poses.shape[:-1] + (4, 4), dtype=np.float64)
+    X[..., 0, 0] = 1.0 - qy * qy - qz * qz
+    X[..., 0, 1] = qx * qy - qz * qw
+    X[..., 0, 2] = qx * qz + qy * qw
+    X[..., 1, 0] = qx * qy + qz * qw
+    X[..., 1, 1] = 1.0 - qx * qx - qz * qz
+    X[..., 1, 2] = qy * qz - qx * qw
+    X[..., 2, 0] = qx * qz - qy * qw
+    X[..., 2, 1] = qy * qz + qx * qw
+    X[..., 2, 2] = 1.0 - qx * qx - qy * qy
+    X[..., :3, :3] = np.where(is_valid[..., None], X[..., :3, :3], np.eye(3))
+    X[..., :3, 3] = poses[..., :3]
+    X[..., 3, 3] = 1.0
+    return X
+
+
+class TfTable(object):
+    """
+    Transforms of several frames with respect to a common parent frame, stored as arrays:
+     - frame_names: list of the child frame names, with a {name: row} index for O(1) lookups
+     - poses: (F, 7) as [x, y, z, qx, qy, qz, qw]
+     - matrices: (F, 4, 4), computed on first access
+    The parent frame is also a valid frame name, with the identity transform.
+    It replaces the tfs DataFrames (columns parent_frame, child_frame, x, y, z, qx, qy, qz, qw). Use as_tf_table to
+    convert stored DataFrames.
+    """
+    pose_columns = ['x', 'y', 'z', 'qx', 'qy', 'qz', 'qw']
+
+    def __init__(self, frame_names, poses, parent_frame='med_base'):
+        self.parent_frame = parent_frame
+        self.frame_names = list(frame_names)
+        self.frame_index = {frame_name: i for i, frame_name in enumerate(self.frame_names)}
+        self.poses = np.asarray(poses, dtype=np.float64).reshape(len(self.frame_names), 7)
+        self._matrices = None
+
+    @classmethod
+    def from_dataframe(cls, tfs_df):
+        parent_frames = np.unique(tfs_df['parent_frame'].values)
+        if len(parent_frames) != 1:
+            raise AttributeError('All tfs must have the same parent frame. Got {}'.format(parent_frames))
+        return cls(tfs_df['child_frame'].values, tfs_df[cls.pose_columns].values, parent_frame=parent_frames[0])
+
+    @classmethod
+    def from_matrices(cls, matrices, parent_frame='med_base'):
+        # matrices: {frame_name: (4, 4) transformation from the parent frame}
+        frame_names = [k for k in matrices.keys() if k != parent_frame]
+        X = np.asarray([np.asarray(matrices[k], dtype=np.float64) for k in frame_names]).reshape(-1, 4, 4)
+        quats = Rotation.from_matrix(X[:, :3, :3]).as_quat() if len(X) > 0 else np.zeros((0, 4)) # [qx, qy, qz, qw]
+        tf_table = cls(frame_names, np.concatenate([X[:, :3, 3], quats], axis=-1), parent_frame=parent_frame)
+        tf_table._matrices = X
+        return tf_table
+
+    def to_dataframe(self):
+        tfs_df = pd.DataFrame(self.poses, columns=self.pose_columns)
+        tfs_df.insert(0, 'child_frame', self.frame_names)
+        tfs_df.insert(0, 'parent_frame', self.parent_frame)
+        return tfs_df
+
+    @property
+    def matrices(self):
+        if self._matrices is None:
+            self._matrices = quaternions_to_matrices(self.poses)
+        return self._matrices
+
+    def __len__(self):
+        return len(self.frame_names)
+
+    def __contains__(self, frame_name):
+        return frame_name in self.frame_index or frame_name == self.parent_frame
+
+    def keys(self):
+        return [self.parent_frame] + self.frame_names
+
+    def get_pose(self, frame_name):
+        """
+        Returns:
+            - <np.ndarray> (7,) view of the frame pose as [x, y, z, qx, qy, qz, qw]
+        """
+        if frame_name == self.parent_frame and frame_name not in self.frame_index:
+            return np.array([0., 0., 0., 0., 0., 0., 1.])
+        return self.poses[self.frame_index[frame_name]]
+
+    def get_position(self, frame_name):
+        return self.get_pose(frame_name)[:3]
+
+    def get_quat(self, frame_name):
+        return self.get_pose(frame_name)[3:]
+
+    def get_matrix(self, frame_name):
+        """
+        Returns:
+            - <np.ndarray> (4, 4) view of the transformation from the parent frame to the frame
+        """
+        if frame_name == self.parent_frame and frame_name not in self.frame_index:
+            return np.eye(4)
+        return self.matrices[self.frame_index[frame_name]]
+
+    def __getitem__(self, frame_name):
+        return self.get_matrix(frame_name)
+
+    def get_transformation_matrix(self, source_frame, target_frame):
+        # sf_X_tf
+        return np.linalg.inv(self.get_matrix(source_frame)) @ self.get_matrix(target_frame)
+
+    def to_matrix_dict(self):
+        """
+        Returns:
+            - <dict> {frame_name: (4, 4) np.ndarray}, views of the matrices (the format used by the controllers)
+        """
+        matrix_dict = {self.parent_frame: np.eye(4)}
+        matrices = self.matrices
+        for i, frame_name in enumerate(self.frame_names):
+            matrix_dict[frame_name] = matrices[i]
+        return matrix_dict
+
+    def get_tensor_matrices(self, dtype=None, device=None):
+        """
+        Returns:
+            - <torch.Tensor> (F, 4, 4). It shares memory with the table when no dtype or device conversion is needed.
+        """
+        matrices_t = torch.from_numpy(self.matrices)
+        if dtype is not None or device is not None:
+            matrices_t = matrices_t.to(dtype=dtype, device=device)
+        return matrices_t
+
+    def to_tensor_dict(self, dtype=None, device=None):
+        # {frame_name: (4, 4) torch.Tensor}, views of get_tensor_matrices
+        matrices_t = self.get_tensor_matrices(dtype=dtype, device=device)
+        tensor_dict = {self.parent_frame: torch.eye(4, dtype=matrices_t.dtype, device=matrices_t.device)}
+        for i, frame_name in enumerate(self.frame_names):
+            tensor_dict[frame_name] = matrices_t[i]
+        return tensor_dict
+
+    def __repr__(self):
+        return 'TfTable(parent_frame={}, frame_names={})'.format(self.parent_frame, self.frame_names)
+
+
+def as_tf_table(tfs, parent_frame='med_base'):
+    """
+    Args:
+        tfs: TfTable, tfs DataFrame (also wrapped, e.g. TFSelfSavedWrapper) or {frame_name: (4, 4) matrix} dict
+        parent_frame: <str> parent frame of the dict matrices
+    Returns:
+        - TfTable
+    """
+    if isinstance(tfs, TfTable):
+        return tfs
+    if isinstance(tfs, dict):
+        return TfTable.from_matrices(tfs, parent_frame=parent_frame)
+    return TfTable.from_dataframe(tfs)
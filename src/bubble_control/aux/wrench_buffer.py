@@ -0,0 +1,245 @@
+import time
+import threading
+import numpy as np
+from bubble_control.aux.lazy_imports import lazy_import
+
+# ROS is only needed by WrenchBufferSubscriber, so the buffer and detectors can be used with synthetic streams.
+rospy = lazy_import('rospy')
+tf2_ros = lazy_import('tf2_ros')
+geometry_msgs = lazy_import('geometry_msgs.msg')
+tr = lazy_import('tf.transformations')
+
+wrench_axes = ['fx', 'fy', 'fz', 'tx', 'ty', 'tz', 'force_norm', 'torque_norm']
+
+
+class WrenchRingBuffer(object):
+    """
+    Fixed size buffer of the last timestamped wrenches [fx, fy, fz, tx, ty, tz], already on the desired frame and
+    calibrated (the calibration wrench is subtracted when they are added).
+    Thread safe: the subscriber adds samples while the motion feedback reads them.
+    """
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.wrenches = np.zeros((capacity, 6), dtype=np.float64)
+        self.calibration = np.zeros(6, dtype=np.float64)
+        self.num_samples = 0 # total number of samples added
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.num_samples, self.capacity)
+
+    def add(self, t, wrench):
+        """
+        Args:
+            t: <float> sample time [s]
+            wrench: (6,) as [fx, fy, fz, tx, ty, tz], not calibrated
+        """
+        with self.lock:
+            indx = self.num_samples % self.capacity
+            self.times[indx] = t
+            self.wrenches[indx] = wrench
+            self.wrenches[indx] -= self.calibration
+            self.num_samples += 1
+
+    def extend(self, times, wrenches):
+        # add several samples at once, e.g. a synthetic wrench stream
+        for t, wrench in zip(times, wrenches):
+            self.add(t, wrench)
+
+    def get_last(self, num_samples=None):
+        """
+        Returns:
+            - times: <np.ndarray> (n,) oldest first
+            - wrenches: <np.ndarray> (n, 6) calibrated
+        """
+        with self.lock:
+            n = len(self) if num_samples is None else min(num_samples, len(self))
+            indxs = np.arange(self.num_samples - n, self.num_samples) % self.capacity
+            return self.times[indxs], self.wrenches[indxs]
+
+    def get_window(self, duration):
+        # samples of the last duration seconds (with respect to the last sample)
+        times, wrenches = self.get_last()
+        if len(times) == 0:
+            return times, wrenches
+        in_window = times >= times[-1] - duration
+        return times[in_window], wrenches[in_window]
+
+    def get_last_time(self):
+        with self.lock:
+            if self.num_samples == 0:
+                return None
+            return self.times[(self.num_samples - 1) % self.capacity]
+
+    def calibrate(self, num_samples=10):
+        """
+        Set the calibration as the mean of the last wrenches, so the following samples (and the buffered ones) are
+        relative to it.
+        Returns:
+            - calibration: <np.ndarray> (6,) on the buffer frame
+        """
+        with self.lock:
+            n = min(num_samples, len(self))
+            if n == 0:
+                return self.calibration.copy()
+            indxs = np.arange(self.num_samples - n, self.num_samples) % self.capacity
+            offset = self.wrenches[indxs].mean(axis=0)
+            self.calibration += offset
+            self.wrenches[:len(self)] -= offset
+            return self.calibration.copy()
+
+
+def get_wrench_component(wrenches, axis):
+    # wrenches: (..., 6). Returns (...,) with the axis component (one of wrench_axes)
+    if axis == 'force_norm':
+        return np.linalg.norm(wrenches[..., :3], axis=-1)
+    if axis == 'torque_norm':
+        return np.linalg.norm(wrenches[..., 3:], axis=-1)
+    if axis not in wrench_axes:
+        raise NotImplementedError('Wrench axis {} not implemented yet. Available options: {}'.format(axis, wrench_axes))
+    return wrenches[..., wrench_axes.index(axis)]
+
+
+class FilteredThresholdDetector(object):
+    """
+    Contact when the mean of the absolute wrench component over the last num_samples reaches the threshold.
+    num_samples=1 is the unfiltered single sample comparison.
+    """
+    def __init__(self, threshold, axis='fz', num_samples=3):
+        self.threshold = threshold
+        self.axis = axis
+        self.num_samples = num_samples
+
+    def __call__(self, wrench_buffer):
+        times, wrenches = wrench_buffer.get_last(self.num_samples)
+        if len(times) < self.num_samples:
+            return False
+        values = np.abs(get_wrench_component(wrenches, self.axis))
+        return bool(values.mean() >= np.abs(self.threshold))
+
+
+class RateOfChangeDetector(object):
+    """
+    Contact when the wrench component changes faster than rate_threshold [N/s or Nm/s], estimated as the least squares
+    slope over the last window [s]. It fires at the beginning of an impact, before the force builds up.
+    """
+    def __init__(self, rate_threshold, axis='fz', window=0.02, min_samples=3):
+        self.rate_threshold = rate_threshold
+        self.axis = axis
+        self.window = window
+        self.min_samples = min_samples
+
+    def get_rate(self, wrench_buffer):
+        times, wrenches = wrench_buffer.get_window(self.window)
+        if len(times) < self.min_samples:
+            return 0.
+        values = get_wrench_component(wrenches, self.axis)
+        dt = times - times.mean()
+        den = np.dot(dt, dt)
+        if den <= 0:
+            return 0.
+        return np.dot(dt, values - values.mean()) / den
+
+    def __call__(self, wrench_buffer):
+        return bool(np.abs(self.get_rate(wrench_buffer)) >= np.abs(self.rate_threshold))
+
+
+def get_detection_time(detector, wrench_buffer, times, wrenches):
+    """
+    Feed a wrench stream to the buffer one sample at a time and evaluate the detector after each one.
+    Args:
+        detector: callable detector(wrench_buffer) -> <bool>
+        wrench_buffer: WrenchRingBuffer (e.g. already calibrated)
+        times: (n,) sample times [s]
+        wrenches: (n, 6)
+    Returns:
+        - detection_time: <float> time of the first sample where the detector fires. None if it never fires.
+        - eval_times: <np.ndarray> (n,) detector evaluation times [s]
+    """
+    detection_time = None
+    eval_times = []
+    for t, wrench in zip(times, wrenches):
+        wrench_buffer.add(t, wrench)
+        start_time = time.perf_counter()
+        detected = detector(wrench_buffer)
+        eval_times.append(time.perf_counter() - start_time)
+        if detected and detection_time is None:
+            detection_time = t
+    return detection_time, np.asarray(eval_times)
+
+
+class WrenchBufferSubscriber(object):
+    """
+    Feeds a WrenchRingBuffer from a WrenchStamped topic. The wrenches are rotated to the buffer frame on arrival, so
+    reading the buffer needs no tf lookups.
+    """
+    def __init__(self, wrench_topic='/med/wrench', frame='med_base', capacity=256, tf_cache_period=0.01):
+        """
+        Args:
+            wrench_topic: <str>
+            frame: <str> frame of the buffered wrenches
+            capacity: <int> number of buffered samples
+            tf_cache_period: <float> [s] the rotation to the buffer frame is looked up at most once per period.
+        """
+        self.wrench_topic = wrench_topic
+        self.frame = frame
+        self.tf_cache_period = tf_cache_period
+        self.buffer = WrenchRingBuffer(capacity=capacity)
+        self.tf_buffer = tf2_ros.Buffer()
+        self.tf_listener = tf2_ros.TransformListener(self.tf_buffer)
+        self._rotation = None # (frame_id, R, lookup_time)
+        self.subscriber = rospy.Subscriber(self.wrench_topic, geometry_msgs.WrenchStamped, self._wrench_callback, queue_size=100)
+
+    def _get_rotation(self, frame_id):
+        if frame_id == self.frame:
+            return None
+        now = time.time()
+        if self._rotation is not None and self._rotation[0] == frame_id and now - self._rotation[2] < self.tf_cache_period:
+            return self._rotation[1]
+        ts = self.tf_buffer.lookup_transform(self.frame, frame_id, rospy.Time(0))
+        q = ts.transform.rotation
+        R = tr.quaternion_matrix([q.x, q.y, q.z, q.w])[:3, :3]
+        self._rotation = (frame_id, R, now)
+        return R
+
+    def _wrench_callback(self, msg):
+        force = msg.wrench.force
+        torque = msg.wrench.torque
+        wrench = np.array([force.x, force.y, force.z, torque.x, torque.y, torque.z])
+        try:
+            R = self._get_rotation(msg.header.frame_id)
+        except (tf2_ros.LookupException, tf2_ros.ConnectivityException, tf2_ros.ExtrapolationException):
+            return
+        if R is not None:
+            wrench = np.concatenate([R @ wrench[:3], R @ wrench[3:]])
+        t = msg.header.stamp.to_sec()
+        if t == 0:
+            t = rospy.get_time()
+        self.buffer.add(t, wrench)
+
+    def finish(self):
+        self.subscriber.unregister()
+
+
+if __name__ == '__main__':
+    # Detection delay and evaluation time on a synthetic wrench stream: noise, then a contact ramping up fz.
+    rate = 500. # [Hz]
+    contact_time = 1.
+    threshold = 5.
+    rng = np.random.default_rng(0)
+    times = np.arange(0, 2., 1 / rate)
+    wrenches = rng.normal(scale=0.5, size=(len(times), 6)) + np.array([0, 0, -3., 0, 0, 0]) # biased sensor
+    wrenches[:, 2] += -np.clip(times - contact_time, 0, None) * 200. # 200 N/s
+    detectors = {
+        'single_sample': FilteredThresholdDetector(threshold, num_samples=1),
+        'filtered_threshold': FilteredThresholdDetector(threshold, num_samples=5),
+        'rate_of_change': RateOfChangeDetector(100., window=0.02),
+    }
+    for name, detector in detectors.items():
+        wrench_buffer = WrenchRingBuffer()
+        wrench_buffer.extend(times[:50], wrenches[:50])
+        wrench_buffer.calibrate(num_samples=50)
+        detection_time, eval_times = get_detection_time(detector, wrench_buffer, times[50:], wrenches[50:])
+        detection_str = 'never' if detection_time is None else '{:.3f}s'.format(detection_time)
+        print('{}: detection at {} (contact at {:.3f}s), evaluation {:.1f}us'.format(name, detection_str, contact_time, 1e6 * np.mean(eval_times)))
@@ -0,0 +1,45 @@
+import numpy as np
+import torch
+
+
+def get_contact_point_plane_frame(pose_pf, tool_axis=(0, 0, 1), plane_normal_axis=(0, 0, 1)):
+    """
+    Point where the tool, considered an infinite line along tool_axis, intersects the plane through the plane frame
+    origin normal to plane_normal_axis.
+    Args:
+        pose_pf: <np.ndarray> (..., 4, 4) tool pose on the plane frame
+        tool_axis: (3,) tool axis on the tool frame
+        plane_normal_axis: (3,) plane normal on the plane frame
+    Returns:
+        - contact_point_pf: <np.ndarray> (..., 3) contact point on the plane frame
+    """
+    pose_pf = np.asarray(pose_pf)
+    plane_normal_axis = np.asarray(plane_normal_axis, dtype=pose_pf.dtype)
+    h = pose_pf[..., :3, 3] @ plane_normal_axis # tool frame height over the plane
+    tool_axis_pf = pose_pf[..., :3, :3] @ np.asarray(tool_axis, dtype=pose_pf.dtype) # in the plane frame
+    cos_angle = tool_axis_pf @ plane_normal_axis
+    dist = -h / cos_angle
+    contact_point_pf = pose_pf[..., :3, 3] + dist[..., None] * tool_axis_pf
+    return contact_point_pf
+
+
+def get_batched_contact_points(tool_poses_pf, tool_axis=None, plane_normal_axis=None):
+    """
+    Batched torch version of get_contact_point_plane_frame, e.g. for the MPPI cost functions.
+    Args:
+        tool_poses_pf: <torch.Tensor> (..., 4, 4) tool poses on the plane frame
+        tool_axis: <torch.Tensor> (3,) tool axis on the tool frame. Default z axis.
+        plane_normal_axis: <torch.Tensor> (3,) plane normal on the plane frame. Default z axis.
+    Returns:
+        - contact_points_pf: <torch.Tensor> (..., 3). nan where the tool is parallel to the plane.
+    """
+    z_axis = torch.tensor([0., 0., 1.], dtype=tool_poses_pf.dtype, device=tool_poses_pf.device)
+    tool_axis = z_axis if tool_axis is None else torch.as_tensor(tool_axis, dtype=tool_poses_pf.dtype, device=tool_poses_pf.device)
+    plane_normal_axis = z_axis if plane_normal_axis is None else torch.as_tensor(plane_normal_axis, dtype=tool_poses_pf.dtype, device=tool_poses_pf.device)
+    position = tool_poses_pf[..., :3, 3]
+    tool_axis_pf = tool_poses_pf[..., :3, :3] @ tool_axis
+    h = position @ plane_normal_axis
+    cos_angle = tool_axis_pf @ plane_normal_axis
+    dist = torch.where(cos_angle.abs() > 1e-9, -h / cos_angle, torch.full_like(h, float('nan')))
+    contact_points_pf = position + dist.unsqueeze(-1) * tool_axis_pf
+    return contact_points_pf
@@ -21,6 +21,7 @@ from control_msgs.msg import FollowJointTrajectoryFeedback
 from visualization_msgs.msg import Marker
 
 from bubble_control.aux.tf_buffer_publisher import TFBufferPublisher
+from bubble_control.bubble_contact_point_estimation.contact_point_geometry import get_contact_point_plane_frame
 
 
 class ToolContactPointEstimator(object):
@@ -28,6 +29,8 @@ class ToolContactPointEstimator(object):
     Estimates the contact point that would result if the tool was an infinite line.
     Broadcasts the frame where it would make contact with the plane z=0 in the med_base frame.
     To run it, simply create an instance of this class. I.e. tcpe = ToolContactPointEstimator()
+    NOTE: BubblePoseEstimator(contact_point_plane_frame=...) computes the same contact point from every pose estimate,
+    without the latency of this loop (see ToolContactPointPublisher).
     """
 
     def __init__(self, object_topic='estimated_object', plane_frame='med_base', rate=10):
@@ -89,13 +92,7 @@ class ToolContactPointEstimator(object):
         # self.tool_contact_point_fake_br.send_tf(translation=parent_frame_pf, quaternion=[0,0,0,1], parent_frame_name=self.plane_frame, child_frame_name='tool_contact_point_fake')
 
     def _get_contact_point_plane_frame(self, pose_pf, tool_axis, plane_normal_axis):
-        h = pose_pf[2, 3]
-        marker_axis_pf = pose_pf[:3, :3] @ tool_axis  # in the plane frame
-        cos_angle = np.dot(marker_axis_pf, plane_normal_axis)
-        angle = np.rad2deg(np.arccos(cos_angle))  # todo: remove (debugging)
-        dist = -h / cos_angle
-        contact_point_pf = pose_pf[:3, 3] + dist * marker_axis_pf
-        return contact_point_pf
+        return get_contact_point_plane_frame(pose_pf, tool_axis, plane_normal_axis)
 
     def estimate_contact_point(self):
         rate = rospy.Rate(self.rate)
@@ -0,0 +1,107 @@
+import numpy as np
+import rospy
+import tf2_ros
+import tf.transformations as tr
+
+from geometry_msgs.msg import PointStamped, TransformStamped
+
+from bubble_control.bubble_contact_point_estimation.contact_point_geometry import get_contact_point_plane_frame
+
+
+class ToolContactPointPublisher(object):
+    """
+    Computes the tool contact point directly from each tool pose estimate, instead of the separate
+    ToolContactPointEstimator loop that reads the estimated_object marker and the tool frame back from TF.
+    For each pose it broadcasts the tool_frame and tool_contact_point frames and publishes the contact point
+    (PointStamped on the plane frame), all with the pose timestamp.
+    The plane frame to pose frame transform is cached and only looked up again when it is older than tf_cache_period
+    with respect to the pose.
+    """
+    def __init__(self, pose_frame, plane_frame='med_base', tool_axis=(0, 0, 1), plane_normal_axis=(0, 0, 1), tf_cache_period=0.1, tf_timeout=0.05, topic_name='tool_contact_point'):
+        """
+        Args:
+            pose_frame: <str> frame of the estimated tool poses (the reconstruction frame)
+            plane_frame: <str> frame of the plane (the plane is z=0 for plane_normal_axis=(0, 0, 1))
+            tool_axis: (3,) tool axis on the tool frame
+            plane_normal_axis: (3,) plane normal on the plane frame
+            tf_cache_period: <float> [s] maximum time between the cached plane transform and the pose. 0 looks it up for every pose.
+            tf_timeout: <float> [s] time to wait for the plane transform at the pose time
+            topic_name: <str> topic for the contact point, also the name of the broadcasted frame
+        """
+        self.pose_frame = pose_frame
+        self.plane_frame = plane_frame
+        self.tool_axis = np.asarray(tool_axis, dtype=np.float64)
+        self.plane_normal_axis = np.asarray(plane_normal_axis, dtype=np.float64)
+        self.tf_cache_period = tf_cache_period
+        self.tf_timeout = tf_timeout
+        self.topic_name = topic_name
+        self.tf_buffer = tf2_ros.Buffer()
+        self.tf_listener = tf2_ros.TransformListener(self.tf_buffer)
+        self.tf_broadcaster = tf2_ros.TransformBroadcaster()
+        self.contact_point_publisher = rospy.Publisher(self.topic_name, PointStamped, queue_size=10)
+        self.plane_tf = None # pf_X_posef
+        self.plane_tf_stamp = None
+        self.last_contact_point = None
+
+    def get_plane_transform(self, stamp):
+        """
+        Returns:
+            - pf_X_posef: <np.ndarray> (4, 4) pose frame on the plane frame at the given stamp (or the cached one).
+                None if the transform is not available yet.
+        """
+        if self.plane_tf is not None and abs((stamp - self.plane_tf_stamp).to_sec()) <= self.tf_cache_period:
+            return self.plane_tf
+        try:
+            ts = self.tf_buffer.lookup_transform(self.plane_frame, self.pose_frame, stamp, rospy.Duration(self.tf_timeout))
+        except (tf2_ros.LookupException, tf2_ros.ConnectivityException, tf2_ros.ExtrapolationException):
+            if self.plane_tf is not None:
+                return self.plane_tf
+            try:
+                # latest available transform
+                ts = self.tf_buffer.lookup_transform(self.plane_frame, self.pose_frame, rospy.Time(0), rospy.Duration(self.tf_timeout))
+            except (tf2_ros.LookupException, tf2_ros.ConnectivityException, tf2_ros.ExtrapolationException):
+                return None
+        t = ts.transform.translation
+        q = ts.transform.rotation
+        self.plane_tf = tr.quaternion_matrix([q.x, q.y, q.z, q.w])
+        self.plane_tf[:3, 3] = [t.x, t.y, t.z]
+        self.plane_tf_stamp = stamp
+        return self.plane_tf
+
+    def publish(self, tool_pose, stamp=None):
+        """
+        Args:
+            tool_pose: <np.ndarray> (4, 4) estimated tool pose on the pose frame
+            stamp: <rospy.Time> time of the pose estimate. If None, now.
+        Returns:
+            - contact_point_pf: <np.ndarray> (3,) contact point on the plane frame. None (and nothing is published) if
+                the plane transform is not available yet.
+        """
+        if stamp is None:
+            stamp = rospy.Time.now()
+        plane_tf = self.get_plane_transform(stamp)
+        if plane_tf is None:
+            rospy.logwarn_throttle(5.0, 'No transform from {} to {} yet. Skipping the tool contact point'.format(self.pose_frame, self.plane_frame))
+            return None
+        tool_pose_pf = plane_tf @ tool_pose
+        contact_point_pf = get_contact_point_plane_frame(tool_pose_pf, self.tool_axis, self.plane_normal_axis)
+        self.tf_broadcaster.sendTransform([
+            self._pack_transform_stamped_msg(tool_pose[:3, 3], tr.quaternion_from_matrix(tool_pose), self.pose_frame, 'tool_frame', stamp),
+            self._pack_transform_stamped_msg(contact_point_pf, [0, 0, 0, 1], self.plane_frame, self.topic_name, stamp),
+        ])
+        point_msg = PointStamped()
+        point_msg.header.stamp = stamp
+        point_msg.header.frame_id = self.plane_frame
+        point_msg.point.x, point_msg.point.y, point_msg.point.z = contact_point_pf
+        self.contact_point_publisher.publish(point_msg)
+        self.last_contact_point = contact_point_pf
+        return contact_point_pf
+
+    def _pack_transform_stamped_msg(self, t, q, parent_frame_id, child_frame_id, stamp):
+        ts_msg = TransformStamped()
+        ts_msg.header.stamp = stamp
+        ts_msg.header.frame_id = parent_frame_id
+        ts_msg.child_frame_id = child_frame_id
+        ts_msg.transform.translation.x, ts_msg.transform.translation.y, ts_msg.transform.translation.z = t
+        ts_msg.transform.rotation.x, ts_msg.transform.rotation.y, ts_msg.transform.rotation.z, ts_msg.transform.rotation.w = q
+        return ts_msg
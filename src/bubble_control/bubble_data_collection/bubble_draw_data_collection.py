@@ -9,17 +9,46 @@ import copy
 from bubble_utils.bubble_data_collection.bubble_data_collection_base import BubbleDataCollectionBase
 from bubble_control.bubble_drawer.bubble_drawer import BubbleDrawer
 from bubble_control.aux.action_spaces import ConstantSpace, AxisBiasedDirectionSpace
+from bubble_control.aux.async_recorder import AsyncRecorder, get_recorders, snapshot_recorders
+from bubble_control.aux.depth_chunk_storage import DepthChunkWriter, get_depth_storage_path
+
+
+depth_storage_options = ['frames', 'both']
 
 
 class BubbleDrawingDataCollectionBase(BubbleDataCollectionBase):
 
-    def __init__(self, *args, impedance_mode=False, reactive=False, force_threshold=5., **kwargs):
+    def __init__(self, *args, impedance_mode=False, reactive=False, force_threshold=5., async_recording=False,
+                 num_recording_workers=2, max_pending_recordings=10, depth_storage='frames', **kwargs):
+        """
+        Args:
+            impedance_mode: <bool>
+            reactive: <bool>
+            force_threshold: <float>
+            async_recording: <bool> if True, the recorders of the base collector are snapshotted in memory and their records
+                run on background threads while the robot moves (write-behind). If False, they are recorded inline.
+            num_recording_workers: <int> number of writer threads when async_recording
+            max_pending_recordings: <int> number of snapshots waiting to be written before recording blocks
+            depth_storage: <str> how the bubble depth frames are saved:
+                * 'frames': one file per filecode, as saved by the camera parsers (default)
+                * 'both': also in the compressed chunked storage (see depth_chunk_storage)
+        """
+        if depth_storage not in depth_storage_options:
+            raise NotImplementedError('Depth storage {} not implemented yet. Available options: {}'.format(depth_storage, depth_storage_options))
         self.impedance_mode = impedance_mode
         self.reactive = reactive
         self.force_threshold = force_threshold
+        self.async_recording = async_recording
+        self.depth_storage = depth_storage
         self.action_space = self._get_action_space()
         super().__init__(*args, **kwargs)
         self.last_undeformed_fc = None
+        self.recorder = None
+        self.depth_writers = None
+        if self.async_recording:
+            self.recorder = AsyncRecorder(num_workers=num_recording_workers, max_queue_size=max_pending_recordings)
+        if self.depth_storage != 'frames':
+            self.depth_writers = {camera_side: DepthChunkWriter(get_depth_storage_path(self.data_path, self.scene_name, camera_side)) for camera_side in ['right', 'left']}
 
     @abc.abstractmethod
     def _get_action_space(self):
@@ -34,6 +63,41 @@ class BubbleDrawingDataCollectionBase(BubbleDataCollectionBase):
         med.connect()
         return med
 
+    def _get_depth_camera_parsers(self):
+        # {camera_side: camera parser} of the bubble cameras among the recorders of the base collector
+        camera_parsers = {}
+        for recorder in get_recorders(self).values():
+            camera_name = getattr(recorder, 'camera_name', None)
+            if camera_name is None or not hasattr(recorder, 'get_image_depth'):
+                continue
+            for camera_side in self.depth_writers:
+                if camera_name.endswith(camera_side):
+                    camera_parsers[camera_side] = recorder
+        return camera_parsers
+
+    def _write_depth_chunks(self, fc):
+        for camera_side, camera_parser in self._get_depth_camera_parsers().items():
+            self.depth_writers[camera_side].write(fc, camera_parser.get_image_depth())
+
+    def _record_inline(self, fc=None):
+        super()._record(fc=fc)
+        if self.depth_writers is not None:
+            self._write_depth_chunks(fc)
+
+    def _record(self, fc=None):
+        if self.recorder is None:
+            return self._record_inline(fc=fc)
+        # write-behind: freeze the recorders now, run their own record on the background threads
+        self.recorder.submit(snapshot_recorders(self)._record_inline, fc)
+
+    def flush_recordings(self):
+        """
+        Barrier: wait until all the pending recordings are written to disk. Called at the end of each sample, so an
+        interrupted session only loses the sample being collected.
+        """
+        if self.recorder is not None:
+            self.recorder.flush()
+
     def _record_gripper_calibration(self):
         self.med.set_grasp_pose()
         _ = input('Press enter to open the gripper and calibrate the bubbles')
@@ -51,7 +115,10 @@ class BubbleDrawingDataCollectionBase(BubbleDataCollectionBase):
     def collect_data(self, num_data):
         print('Calibration undeformed state, please follow the instructions')
         self._record_gripper_calibration()
-        out = super().collect_data(num_data)
+        try:
+            out = super().collect_data(num_data)
+        finally:
+            self.flush_recordings() # make sure all the recorded states are saved before returning
         self.med.home_robot()
         return out
 
@@ -124,6 +191,9 @@ class BubbleDrawingDataCollectionBase(BubbleDataCollectionBase):
 
         self._do_post_action(action_i)
 
+        # end of the sample: its states are on disk before it is added to the datalegend
+        self.flush_recordings()
+
         data_params['initial_fc'] = init_fc
         data_params['final_fc'] = final_fc
         data_params['grasp_force'] = grasp_force_i
@@ -61,6 +61,11 @@ class DrawingEvaluationDataCollection(DataCollectorBase):
         super().__init__(*args, **kwargs)
         self.data_save_params = {'save_path': self.data_path, 'scene_name': self.scene_name}
 
+    def collect_data(self, num_data):
+        out = super().collect_data(num_data)
+        self.evaluator.figure_writer.flush() # make sure all evaluation figures are saved
+        return out
+
     def _get_legend_column_names(self):
         """
         Return a list containing the column names of the datalegend
@@ -12,15 +12,23 @@ from victor_hardware_interface.victor_utils import Stiffness
 from victor_hardware_interface_msgs.msg import ControlMode
 from bubble_utils.bubble_med.bubble_med import BubbleMed
 
-from geometry_msgs.msg import WrenchStamped
+from geometry_msgs.msg import WrenchStamped, PointStamped
 from visualization_msgs.msg import Marker
 
 from bubble_control.bubble_contact_point_estimation.contact_point_marker_publisher import ContactPointMarkerPublisher
+from bubble_control.aux.wrench_buffer import WrenchBufferSubscriber, FilteredThresholdDetector, RateOfChangeDetector
 
 
 class BubbleDrawer(BubbleMed):
 
-    def __init__(self, *args, object_topic='estimated_object', drawing_frame='med_base', force_threshold=5., reactive=False, adjust_lift=False, compensate_xy_point=False, impedance_mode=True, **kwargs):
+    def __init__(self, *args, object_topic='estimated_object', drawing_frame='med_base', force_threshold=5., reactive=False, adjust_lift=False, compensate_xy_point=False, impedance_mode=True, wrench_buffer=True, contact_filter_size=3, contact_rate_threshold=None, **kwargs):
+        """
+        Args:
+            wrench_buffer: <bool> detect contacts on a buffer of the wrenches fed by the wrench subscriber, instead of
+                reading a single wrench on each motion feedback.
+            contact_filter_size: <int> number of buffered samples averaged for the force threshold.
+            contact_rate_threshold: <float> [N/s] if given, also stop when fz changes faster than this.
+        """
         self.object_topic = object_topic
         self.drawing_frame = drawing_frame
         self.reactive = reactive # adjust drawing at keypoints/
@@ -35,8 +43,18 @@ class BubbleDrawer(BubbleMed):
         self.marker_pose = None
         self.calibration_wrench = None
         self.compensate_xy_point = compensate_xy_point
+        self.contact_point_max_age = 1.0 # [s] older published contact points are ignored
+        self.wrench_buffer_max_age = 0.1 # [s] if the buffer has no newer samples, the wrench is read directly
+        self.wrench_buffer_subscriber = None
+        self.force_detector = FilteredThresholdDetector(self.force_threshold, axis='fz', num_samples=contact_filter_size)
+        self.contact_detectors = [self.force_detector]
+        if contact_rate_threshold is not None:
+            self.contact_detectors.append(RateOfChangeDetector(contact_rate_threshold, axis='fz'))
         super().__init__(*args, **kwargs)
+        if wrench_buffer:
+            self.wrench_buffer_subscriber = WrenchBufferSubscriber(wrench_topic='/med/wrench', frame=self.drawing_frame)
         self.pose_listener = Listener(self.object_topic, Marker, wait_for_data=False)
+        self.contact_point_listener = Listener('tool_contact_point', PointStamped, wait_for_data=False) # published by ToolContactPointPublisher
         self.tf_broadcaster = tf.TransformBroadcaster()
         self.contact_point_marker_publisher = ContactPointMarkerPublisher()
         self.setup()
@@ -46,9 +64,26 @@ class BubbleDrawer(BubbleMed):
 
     def setup(self):
         self.home_robot()
+        self.calibrate_wrench()
+
+    def calibrate_wrench(self):
         self.calibration_wrench = self.get_wrench()
+        if self.wrench_buffer_subscriber is not None:
+            self.wrench_buffer_subscriber.buffer.calibrate()
+
+    def _is_wrench_buffer_ready(self):
+        if self.wrench_buffer_subscriber is None:
+            return False
+        last_time = self.wrench_buffer_subscriber.buffer.get_last_time()
+        return last_time is not None and rospy.get_time() - last_time <= self.wrench_buffer_max_age
 
     def _stop_signal(self, feedback):
+        if self._is_wrench_buffer_ready():
+            self.force_detector.threshold = self.force_threshold
+            flag_force = any(detector(self.wrench_buffer_subscriber.buffer) for detector in self.contact_detectors)
+            if flag_force:
+                self.contact_point_marker_publisher.show = True
+            return flag_force
         wrench_stamped = self.get_wrench()
         measured_fz = wrench_stamped.wrench.force.z
         calibrated_fz = measured_fz-self.calibration_wrench.wrench.force.z
@@ -103,6 +138,10 @@ class BubbleDrawer(BubbleMed):
     def get_contact_point(self, ref_frame=None):
         if ref_frame is None:
             ref_frame = self.drawing_frame
+        contact_point_msg = self.contact_point_listener.get(block_until_data=False)
+        if contact_point_msg is not None and contact_point_msg.header.frame_id == ref_frame and (rospy.Time.now() - contact_point_msg.header.stamp).to_sec() < self.contact_point_max_age:
+            # computed with the last pose estimate, no tf lookup needed
+            return np.array([contact_point_msg.point.x, contact_point_msg.point.y, contact_point_msg.point.z])
         contact_point_tf = self.tf2_listener.get_transform(parent=ref_frame, child='tool_contact_point')
         contact_xyz = contact_point_tf[:3,3]
         return contact_xyz
@@ -112,7 +151,7 @@ class BubbleDrawer(BubbleMed):
             z_value = self.draw_height_limit
         # TODO: Consider entering on impedance mode
         self.force_threshold = 5.
-        self.calibration_wrench = self.get_wrench()
+        self.calibrate_wrench()
         self.set_xyz_cartesian(z_value=z_value, frame_id='grasp_frame', ref_frame=self.drawing_frame,
                                    stop_condition=self._stop_signal)
         rospy.sleep(.5)
@@ -1,25 +1,27 @@
 from gym import Env
 import os
+import numpy as np
 import threading
-import rospy
-import tf
-import tf2_ros as tf2
 import pandas as pd
 from collections import defaultdict
 from abc import abstractmethod
 
-from arm_robots.med import Med
-from arc_utilities.listener import Listener
-from arc_utilities.tf2wrapper import TF2Wrapper
+from bubble_control.aux.action_spaces import sample_batch, get_batch_element, get_batch_size
+from bubble_control.aux.tf_table import TfTable
+from bubble_control.aux.lazy_imports import lazy_import, lazy_import_from
 
-from mmint_camera_utils.point_cloud_parsers import PicoFlexxPointCloudParser
-from mmint_camera_utils.tf_recording import save_tfs, get_tfs
-from mmint_camera_utils.recorders.data_recording_wrappers import TFSelfSavedWrapper
-from mmint_camera_utils.recorders.data_recording_wrappers import DictSelfSavedWrapper
-from geometry_msgs.msg import WrenchStamped
-from bubble_utils.bubble_data_collection.data_collector_base import DataCollectorBase
-from bubble_utils.bubble_data_collection.wrench_recorder import WrenchRecorder
-from bubble_utils.bubble_med.bubble_med import BubbleMed
+# ROS, robot and camera dependencies are only needed by MedBaseEnv and BubbleBaseEnv, so BaseEnv (e.g. ReplayDrawingEnv)
+# can be used without them.
+rospy = lazy_import('rospy')
+tf2 = lazy_import('tf2_ros')
+geometry_msgs = lazy_import('geometry_msgs.msg')
+Listener = lazy_import_from('arc_utilities.listener', 'Listener')
+TF2Wrapper = lazy_import_from('arc_utilities.tf2wrapper', 'TF2Wrapper')
+PicoFlexxPointCloudParser = lazy_import_from('mmint_camera_utils.point_cloud_parsers', 'PicoFlexxPointCloudParser')
+get_tfs = lazy_import_from('mmint_camera_utils.tf_recording', 'get_tfs')
+TFSelfSavedWrapper, DictSelfSavedWrapper = lazy_import_from('mmint_camera_utils.recorders.data_recording_wrappers', 'TFSelfSavedWrapper', 'DictSelfSavedWrapper')
+WrenchRecorder = lazy_import_from('bubble_utils.bubble_data_collection.wrench_recorder', 'WrenchRecorder')
+BubbleMed = lazy_import_from('bubble_utils.bubble_med.bubble_med', 'BubbleMed')
 
 
 class BaseEnv(Env):
@@ -66,6 +68,27 @@ class BaseEnv(Env):
         # Override this method if some actions are not valid
         return True
 
+    def get_robot_state(self):
+        """
+        Snapshot of the robot state needed to check the action validity, so it is queried once per batch of actions.
+        Override this method if are_actions_valid depends on the robot state.
+        """
+        return None
+
+    def are_actions_valid(self, actions, state=None):
+        """
+        Vectorized validity check.
+        Args:
+            actions: batch of actions as returned by sample_batch(self.action_space, n)
+            state: robot state as returned by get_robot_state()
+        Returns:
+            - <np.ndarray> (n,) boolean array
+        By default, check them one by one with is_action_valid. Override it to do it vectorized.
+        """
+        num_actions = get_batch_size(actions)
+        valid_actions = np.array([self.is_action_valid(get_batch_element(actions, i)) for i in range(num_actions)], dtype=bool)
+        return valid_actions
+
     def _is_done(self, observation, a):
         return False
 
@@ -73,15 +96,20 @@ class BaseEnv(Env):
         obs = self._get_observation()
         return obs
 
-    def get_action(self):
-        valid_action = False
-        action = None
-        for i in range(1000):
-            action = self.action_space.sample()
-            valid_action = self.is_action_valid(action)
-            if valid_action:
-                break
-        return action, valid_action
+    def get_action(self, batch_size=100, max_num_batches=10):
+        # Rejection sampling in batches. The robot state is queried once for all the candidates.
+        if type(self).are_actions_valid is BaseEnv.are_actions_valid:
+            # no vectorized check, so check the candidates one at a time and stop at the first valid one
+            max_num_batches = batch_size * max_num_batches
+            batch_size = 1
+        state = self.get_robot_state()
+        actions = None
+        for i in range(max_num_batches):
+            actions = sample_batch(self.action_space, batch_size)
+            valid_actions = self.are_actions_valid(actions, state=state)
+            if np.any(valid_actions):
+                return get_batch_element(actions, int(np.argmax(valid_actions))), True
+        return get_batch_element(actions, 0), False
 
     def step(self, a):
         # This is just the basic layout. It can be extended on subclasses
@@ -121,7 +149,7 @@ class MedBaseEnv(BaseEnv):
         self.tf_buffer = tf2.Buffer()
         self.tf_listener = tf2.TransformListener(buffer=self.tf_buffer)
         self.tf2_listener = TF2Wrapper()
-        self.wrench_listener = Listener(self.wrench_topic, WrenchStamped, wait_for_data=True)
+        self.wrench_listener = Listener(self.wrench_topic, geometry_msgs.WrenchStamped, wait_for_data=True)
         self.med = self._get_med()
         self.wrench_recorder = WrenchRecorder(self.wrench_topic, scene_name=self.scene_name, save_path=self.save_path, wrap_data=self.wrap_data)
         super().__init__()
@@ -204,7 +232,10 @@ class MedBaseEnv(BaseEnv):
         parent_names = 'med_base'
         tfs = get_tfs(tf_frames, parent_names, verbose=self.verbose, tf_listener=self.tf_listener) # df of the frames
         if self.wrap_data:
+            # recorded as a DataFrame
             tfs = TFSelfSavedWrapper(tfs, data_params={'save_path': self.save_path, 'scene_name': self.scene_name})
+        else:
+            tfs = TfTable.from_dataframe(tfs)
         return tfs
 
     def get_observation(self):
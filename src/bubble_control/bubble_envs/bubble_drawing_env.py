@@ -121,6 +121,18 @@ class BubbleDrawingBaseEnv(BubbleBaseEnv):
         plane_pos_xy = plane_pose[:2]
         return plane_pos_xy
 
+    def get_robot_state(self):
+        # queried once per batch of candidate actions
+        state = {'plane_position': self._get_robot_plane_position()}
+        return state
+
+    def _are_points_in_drawing_area(self, points):
+        # points: (N, 2) array of plane positions. Returns a (N,) boolean array
+        drawing_area_center_point = np.asarray(self.drawing_area_center)
+        drawing_area_size = np.asarray(self.drawing_area_size)
+        in_area = np.all(points <= drawing_area_center_point + drawing_area_size, axis=-1) & np.all(points >= drawing_area_center_point - drawing_area_size, axis=-1)
+        return in_area
+
 
 class BubbleCartesianDrawingEnv(BubbleDrawingBaseEnv):
 
@@ -157,16 +169,20 @@ class BubbleCartesianDrawingEnv(BubbleDrawingBaseEnv):
         return action_space
 
     def is_action_valid(self, action):
-        direction_i = action['direction']
-        length_i = action['length']
-        drawing_area_center_point = np.asarray(self.drawing_area_center)
-        drawing_area_size = np.asarray(self.drawing_area_size)
-        current_point_i = self._get_robot_plane_position()
-        end_point_i = current_point_i + length_i * np.array([np.cos(direction_i), np.sin(direction_i)])
-        # Check if the end_point will be whitin the limits:
-        valid_action = np.all(end_point_i<=drawing_area_center_point + drawing_area_size) and np.all(end_point_i >= drawing_area_center_point - drawing_area_size)
+        actions = {k: np.asarray(v).reshape(1) for k, v in action.items()}
+        valid_action = self.are_actions_valid(actions, state=self.get_robot_state())[0]
         return valid_action
 
+    def are_actions_valid(self, actions, state=None):
+        if state is None:
+            state = self.get_robot_state()
+        directions = np.asarray(actions['direction'], dtype=np.float64).reshape(-1)
+        lengths = np.asarray(actions['length'], dtype=np.float64).reshape(-1)
+        current_point = state['plane_position']
+        end_points = current_point + lengths[:, None] * np.stack([np.cos(directions), np.sin(directions)], axis=-1)
+        valid_actions = self._are_points_in_drawing_area(end_points)
+        return valid_actions
+
     def _do_action(self, action):
         direction_i = action['direction']
         length_i = action['length']
@@ -242,16 +258,22 @@ class BubbleOneDirectionDrawingEnv(BubbleDrawingBaseEnv):
     def is_action_valid(self, action):
         if self.init_action is None:
             return True
-        direction_i = self.init_action['direction']
-        length_i = action['length']
-        drawing_area_center_point = np.asarray(self.drawing_area_center)
-        drawing_area_size = np.asarray(self.drawing_area_size)
-        current_point_i = self._get_robot_plane_position()
-        end_point_i = current_point_i + length_i * np.array([np.cos(direction_i), np.sin(direction_i)])
-        # Check if the end_point will be whitin the limits:
-        valid_action = np.all(end_point_i <= drawing_area_center_point + drawing_area_size) and np.all(end_point_i >= drawing_area_center_point - drawing_area_size)
+        actions = {k: np.asarray(v).reshape(1) for k, v in action.items()}
+        valid_action = self.are_actions_valid(actions, state=self.get_robot_state())[0]
         return valid_action
 
+    def are_actions_valid(self, actions, state=None):
+        lengths = np.asarray(actions['length'], dtype=np.float64).reshape(-1)
+        if self.init_action is None:
+            return np.ones(lengths.shape, dtype=bool)
+        if state is None:
+            state = self.get_robot_state()
+        direction = self.init_action['direction']
+        current_point = state['plane_position']
+        end_points = current_point + lengths[:, None] * np.array([np.cos(direction), np.sin(direction)])
+        valid_actions = self._are_points_in_drawing_area(end_points)
+        return valid_actions
+
     def _is_done(self, observation, a):
         # TODO: Use observation values instead of the current measures!
         current_plane_pose = self.med.get_plane_pose()
@@ -0,0 +1,199 @@
+import numpy as np
+import gym
+from types import SimpleNamespace
+from collections import OrderedDict
+from scipy.spatial import KDTree
+
+from bubble_control.bubble_envs.base_env import BaseEnv
+from bubble_control.aux.tf_table import as_tf_table
+
+
+def get_wrench_stamped(wrench, frame_id):
+    """
+    Lightweight stand-in of a geometry_msgs/WrenchStamped with the fields used by format_observation_sample.
+    Args:
+        wrench: <np.ndarray> (6,) as [fx, fy, fz, tx, ty, tz]
+        frame_id: <str>
+    """
+    force = SimpleNamespace(x=wrench[0], y=wrench[1], z=wrench[2])
+    torque = SimpleNamespace(x=wrench[3], y=wrench[4], z=wrench[5])
+    wrench_stamped = SimpleNamespace(header=SimpleNamespace(frame_id=frame_id), wrench=SimpleNamespace(force=force, torque=torque))
+    return wrench_stamped
+
+
+class ReplayDrawingEnv(BaseEnv):
+    """
+    Offline drawing environment that replays the recorded transitions of a processed drawing dataset.
+    No robot, cameras or ROS are required, so controllers can be run and timed at CPU speed.
+    Observations have the same raw format as the BubbleDrawingBaseEnv ones (the one expected by format_observation_sample).
+    On step, the next observation is the final state of the recorded transition nearest to the requested action
+    (and to the current grasp position if state_weight > 0). Alternatively, a transition_model can stand in for the next state.
+    """
+    def __init__(self, dataset, transition_model=None, state_weight=0., max_num_steps=None, wrench_frames=('grasp_frame', 'med_base'),
+                 rotation_limits=(-np.pi*5/180, np.pi*5/180), drawing_length_limits=(0.01, 0.15), grasp_width_limits=(15, 25),
+                 max_cached_frames=500, seed=None, verbose=False):
+        """
+        Args:
+            dataset: BubbleDrawingDataset (or any dataset with the same datalegend and loading methods)
+            transition_model: function returning the next raw observation as next_obs = transition_model(obs, action).
+                If None, the recorded transition nearest to the action is replayed.
+            state_weight: <float> weight of the grasp position distance [m] with respect to the normalized action distance
+                when looking for the nearest transition. If 0, only the action is taken into account.
+            max_num_steps: <int> number of steps before the episode is done. If None, it is never done.
+            wrench_frames: frames of the wrench observation
+            rotation_limits, drawing_length_limits, grasp_width_limits: action space limits (as in BubbleOneDirectionDrawingEnv)
+            max_cached_frames: <int> number of recorded frames kept in memory
+            seed: <int> seed for the initial state selection
+            verbose: <bool>
+        """
+        self.dataset = dataset
+        self.transition_model = transition_model
+        self.state_weight = state_weight
+        self.max_num_steps = max_num_steps
+        self.wrench_frames = list(wrench_frames)
+        self.rotation_limits = rotation_limits
+        self.drawing_length_limits = drawing_length_limits
+        self.grasp_width_limits = grasp_width_limits
+        self.max_cached_frames = max_cached_frames
+        self.verbose = verbose
+        self.rng = np.random.default_rng(seed)
+        self.frame_cache = OrderedDict()
+        self.object_models = {}
+        super().__init__()
+        self.action_keys = list(self.action_space.spaces.keys())
+        self.transitions = self._load_transitions()
+        self.transition_tree = KDTree(self._get_transition_features(self.transitions['action'], self.transitions['init_pos']))
+        self.current_transition = None # transition whose final state is the current state
+        self.observation = None
+        self.reset()
+
+    @classmethod
+    def get_name(cls):
+        return 'replay_drawing_env'
+
+    def _get_action_space(self):
+        action_space_dict = OrderedDict()
+        action_space_dict['rotation'] = gym.spaces.Box(low=self.rotation_limits[0], high=self.rotation_limits[1], shape=())
+        action_space_dict['length'] = gym.spaces.Box(low=self.drawing_length_limits[0], high=self.drawing_length_limits[1], shape=())
+        action_space_dict['grasp_width'] = gym.spaces.Box(low=self.grasp_width_limits[0], high=self.grasp_width_limits[1], shape=())
+        action_space = gym.spaces.Dict(action_space_dict)
+        return action_space
+
+    def _get_observation_space(self):
+        return None
+
+    def _load_transitions(self):
+        # Read the transition table (frames, actions and grasp positions) once, so step is a KDTree query.
+        dl = self.dataset.dl
+        transitions = {
+            'scene_name': dl['Scene'].values,
+            'undef_fc': dl['UndeformedFC'].values.astype(np.int64),
+            'init_fc': dl['InitialStateFC'].values.astype(np.int64),
+            'final_fc': dl['FinalStateFC'].values.astype(np.int64),
+            'object_code': dl['marker_init'].values,
+            'action': dl[self.action_keys].values.astype(np.float64),
+        }
+        if self.state_weight > 0:
+            transitions['init_pos'] = np.stack([self._get_grasp_pos(self.dataset._load_tfs(fc, scene_name)) for fc, scene_name in zip(transitions['init_fc'], transitions['scene_name'])], axis=0)
+        else:
+            transitions['init_pos'] = np.zeros((len(dl), 3))
+        return transitions
+
+    def _get_action_scale(self):
+        lows = np.array([self.action_space[k].low for k in self.action_keys], dtype=np.float64).reshape(-1)
+        highs = np.array([self.action_space[k].high for k in self.action_keys], dtype=np.float64).reshape(-1)
+        return lows, np.maximum(highs - lows, 1e-12)
+
+    def _get_transition_features(self, actions, positions):
+        lows, ranges = self._get_action_scale()
+        normalized_actions = (np.asarray(actions, dtype=np.float64) - lows) / ranges
+        features = np.concatenate([normalized_actions, self.state_weight * np.asarray(positions)], axis=-1)
+        return features
+
+    def _get_grasp_pos(self, tfs):
+        return as_tf_table(tfs).get_position('grasp_frame').copy()
+
+    def _action_to_array(self, action):
+        return np.array([action[k] for k in self.action_keys], dtype=np.float64).reshape(-1)
+
+    def _load_frame(self, scene_name, fc):
+        # Recorded data of a single frame. Frames are cached since consecutive transitions share them.
+        key = (scene_name, fc)
+        if key in self.frame_cache:
+            self.frame_cache.move_to_end(key)
+            return self.frame_cache[key]
+        frame = {'tfs': self.dataset._load_tfs(fc, scene_name)}
+        for camera_name in ['right', 'left']:
+            frame['bubble_depth_img_{}'.format(camera_name)] = self.dataset._load_depth_img(fc=fc, scene_name=scene_name, camera_name=camera_name)
+            frame['bubble_camera_info_depth_{}'.format(camera_name)] = self.dataset._load_camera_info_depth(scene_name=scene_name, camera_name=camera_name, fc=fc)
+        frame['wrench'] = [get_wrench_stamped(self.dataset._get_wrench(fc=fc, scene_name=scene_name, frame_id=frame_id).flatten(), frame_id) for frame_id in self.wrench_frames]
+        self.frame_cache[key] = frame
+        while len(self.frame_cache) > self.max_cached_frames:
+            self.frame_cache.popitem(last=False)
+        return frame
+
+    def _get_object_model(self, object_code):
+        if object_code not in self.object_models:
+            self.object_models[object_code] = self.dataset._get_object_model(object_code)
+        return self.object_models[object_code]
+
+    def _get_recorded_observation(self, transition_indx, time_key='final'):
+        scene_name = self.transitions['scene_name'][transition_indx]
+        fc = self.transitions['{}_fc'.format(time_key)][transition_indx]
+        undef_fc = self.transitions['undef_fc'][transition_indx]
+        object_code = self.transitions['object_code'][transition_indx]
+        obs = dict(self._load_frame(scene_name, fc)) # shallow copy so the cached frame is not modified
+        undef_frame = self._load_frame(scene_name, undef_fc)
+        for camera_name in ['right', 'left']:
+            obs['bubble_depth_img_{}_reference'.format(camera_name)] = undef_frame['bubble_depth_img_{}'.format(camera_name)]
+        obs['marker'] = object_code
+        obs['object_model'] = self._get_object_model(object_code)
+        return obs
+
+    def find_nearest_transition(self, action, position=None):
+        """
+        Index of the recorded transition whose action (and initial grasp position) is closest to the given ones.
+        """
+        if position is None:
+            position = np.zeros(3)
+        query = self._get_transition_features(self._action_to_array(action)[None, :], np.asarray(position).reshape(1, 3))
+        _, transition_indx = self.transition_tree.query(query[0])
+        return int(transition_indx)
+
+    def reset(self, transition_indx=None):
+        """
+        Start a new episode from the initial state of a recorded transition (random by default).
+        """
+        super().reset()
+        if transition_indx is None:
+            transition_indx = int(self.rng.integers(len(self.dataset.dl)))
+        self.current_transition = transition_indx
+        self.observation = self._get_recorded_observation(transition_indx, time_key='init')
+        return self.observation
+
+    def initialize(self):
+        pass
+
+    def _do_action(self, a):
+        if self.transition_model is not None:
+            self.observation = self.transition_model(self.observation, a)
+            return {'transition_model': True}
+        current_pos = self._get_grasp_pos(self.observation['tfs']) if self.state_weight > 0 else None
+        transition_indx = self.find_nearest_transition(a, position=current_pos)
+        self.current_transition = transition_indx
+        self.observation = self._get_recorded_observation(transition_indx, time_key='final')
+        action_feedback = {
+            'transition_indx': transition_indx,
+            'replayed_action': dict(zip(self.action_keys, self.transitions['action'][transition_indx])),
+        }
+        if self.verbose:
+            print('Replaying transition {} for action {}'.format(transition_indx, a))
+        return action_feedback
+
+    def _get_observation(self):
+        return self.observation
+
+    def _is_done(self, observation, a):
+        if self.max_num_steps is None:
+            return False
+        return self.num_steps + 1 >= self.max_num_steps
@@ -0,0 +1,145 @@
+import threading
+import queue
+import torch
+from bubble_control.aux.profiling import span
+
+
+class ImageLoggingPolicy(object):
+    """
+    Decide when images are logged.
+    Args:
+        every_n_steps: <int> log every n global steps. If None, it is not taken into account.
+        every_n_epochs: <int> log only on epochs multiple of n. If None, log on every epoch.
+        first_batch_only: <bool> log only on the first batch of the epoch.
+        first_epoch_only: <bool> log only during the first epoch (useful for ground truth images that do not change).
+    """
+    def __init__(self, every_n_steps=None, every_n_epochs=None, first_batch_only=False, first_epoch_only=False):
+        self.every_n_steps = every_n_steps
+        self.every_n_epochs = every_n_epochs
+        self.first_batch_only = first_batch_only
+        self.first_epoch_only = first_epoch_only
+
+    def should_log(self, batch_idx, epoch, global_step):
+        if self.first_epoch_only and epoch != 0:
+            return False
+        if self.every_n_epochs is not None and epoch % self.every_n_epochs != 0:
+            return False
+        if self.first_batch_only and batch_idx != 0:
+            return False
+        if self.every_n_steps is not None and global_step % self.every_n_steps != 0:
+            return False
+        return True
+
+
+def detach_to_cpu(x):
+    # copy so the rendering does not hold the graph or the device memory, and is not affected by in-place updates
+    if torch.is_tensor(x):
+        return x.detach().to('cpu', copy=True)
+    if isinstance(x, dict):
+        return {k: detach_to_cpu(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return type(x)(detach_to_cpu(v) for v in x)
+    return x
+
+
+class AsyncImageLogger(object):
+    """
+    Render and write image grids to the logger experiment (e.g. TensorBoard SummaryWriter) on a background thread.
+    The training step only pays for the policy check and a detached cpu copy of the tensors to log.
+    If the renderer falls behind, new requests are dropped instead of blocking the training.
+    """
+
+    def __init__(self, policies=None, default_policy=None, max_queue_size=20):
+        """
+        Args:
+            policies: <dict> mapping the image name to its ImageLoggingPolicy
+            default_policy: ImageLoggingPolicy used for the names not in policies. By default, first batch of every epoch.
+            max_queue_size: <int> maximum number of pending images
+        """
+        self.policies = {} if policies is None else dict(policies)
+        self.default_policy = ImageLoggingPolicy(first_batch_only=True) if default_policy is None else default_policy
+        self.max_queue_size = max_queue_size
+        self.num_dropped = 0
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # threads and queues can not be pickled (e.g. when the model is copied). They are restarted lazily.
+        state = self.__dict__.copy()
+        state['queue'] = None
+        state['thread'] = None
+        state['lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.queue = queue.Queue(maxsize=self.max_queue_size)
+                self.thread = threading.Thread(target=self._rendering_loop, daemon=True)
+                self.thread.start()
+
+    def get_policy(self, name):
+        return self.policies.get(name, self.default_policy)
+
+    def should_log(self, name, batch_idx, epoch, global_step):
+        return self.get_policy(name).should_log(batch_idx=batch_idx, epoch=epoch, global_step=global_step)
+
+    def log_image(self, experiment, tag, render_fn, render_args, global_step):
+        """
+        Queue an image to be rendered and logged.
+        Args:
+            experiment: logger experiment implementing add_image(tag, img, global_step)
+            tag: <str> image tag
+            render_fn: function returning the image (3, H, W) from render_args
+            render_args: <dict> keyword arguments for render_fn. Tensors are detached and copied to cpu.
+            global_step: <int>
+        """
+        if experiment is None:
+            return
+        self._start()
+        job = (experiment, tag, render_fn, detach_to_cpu(render_args), global_step)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self.num_dropped += 1
+
+    def log_model_image(self, model, name, phase, render_fn, render_args, batch_idx):
+        """
+        Queue an image from a LightningModule step if the policy for name allows it.
+        The image is logged with tag '{name}_{phase}'.
+        """
+        if self.should_log(name, batch_idx=batch_idx, epoch=model.current_epoch, global_step=model.global_step):
+            with span('logging/queue_image', name=name):
+                self.log_image(model.logger.experiment, '{}_{}'.format(name, phase), render_fn, render_args, model.global_step)
+
+    def _rendering_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            experiment, tag, render_fn, render_args, global_step = job
+            try:
+                with span('logging/render_image', tag=tag):
+                    img = render_fn(**render_args)
+                    experiment.add_image(tag, img, global_step)
+            except Exception as e:
+                print('Failed to log image {}: {}'.format(tag, e))
+            self.queue.task_done()
+
+    def flush(self):
+        if self.queue is not None:
+            self.queue.join()
+
+    def finish(self):
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
@@ -1,8 +1,18 @@
 import os
 
+from bubble_control.bubble_learning.aux.model_bundle import get_bundle_path, load_model_bundle, save_model_bundle
 
-def load_model_version(Model, data_name, load_version):
+
+def load_model_version(Model, data_name, load_version, use_bundle=True):
+    """
+    Load the model checkpoint of the given version.
+    If use_bundle and the version has been bundled (see bundle_model_version), the single-file bundle is loaded instead,
+    which does not read the checkpoints of its sub-models.
+    """
     model_name = Model.get_name()
+    bundle_path = get_bundle_path(data_name, model_name, load_version)
+    if use_bundle and os.path.isfile(bundle_path):
+        return load_model_bundle(bundle_path, hparams_update={'dataset_params': {'data_name': data_name}})
     version_chkp_path = os.path.join(data_name, 'tb_logs', '{}'.format(model_name),
                                      'version_{}'.format(load_version), 'checkpoints')
     checkpoints_fs = [f for f in os.listdir(version_chkp_path) if
@@ -10,4 +20,16 @@ def load_model_version(Model, data_name, load_version):
     checkpoint_path = os.path.join(version_chkp_path, checkpoints_fs[0])
 
     model = Model.load_from_checkpoint(checkpoint_path, dataset_params={'data_name': data_name})
-    return model
\ No newline at end of file
+    return model
+
+
+def bundle_model_version(Model, data_name, load_version):
+    """
+    Load the model checkpoint of the given version (with its sub-models) and save it as a single-file bundle.
+    Returns:
+        - <str> bundle path
+    """
+    model = load_model_version(Model, data_name, load_version, use_bundle=False)
+    bundle_path = get_bundle_path(data_name, Model.get_name(), load_version)
+    save_model_bundle(model, bundle_path)
+    return bundle_path
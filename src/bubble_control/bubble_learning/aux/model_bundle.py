@@ -0,0 +1,242 @@
+import os
+import hashlib
+import importlib
+import threading
+import weakref
+from contextlib import contextmanager
+import numpy as np
+import torch
+
+
+BUNDLE_FORMAT_VERSION = 1
+# Submodules loaded from their own checkpoints when building a model. Bundles store their hyperparameters so they can be
+# built without reading the checkpoints, and their weights are shared between the models loaded in the same process.
+bundled_submodule_names = ['autoencoder']
+shared_submodule_class_names = ['BubbleAutoEncoderModel', 'PointNetClassifier']
+
+_loading_state = threading.local()
+_loaded_bundles = {} # {(bundle_path, mtime): bundle} so each bundle file is mapped only once
+_shared_modules = weakref.WeakValueDictionary() # {content_hash: module}
+
+
+def get_bundle_path(data_name, model_name, load_version):
+    return os.path.join(data_name, 'bundles', '{}_version_{}.bundle.pt'.format(model_name, load_version))
+
+
+def get_class_path(obj):
+    cls = obj if isinstance(obj, type) else type(obj)
+    return '{}.{}'.format(cls.__module__, cls.__qualname__)
+
+
+def import_class(class_path):
+    module_name, class_name = class_path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def state_dict_content_hash(state_dict):
+    """
+    sha1 of the names, dtypes, shapes and values of all the tensors of the state_dict.
+    """
+    hasher = hashlib.sha1()
+    for name in sorted(state_dict.keys()):
+        tensor = state_dict[name]
+        hasher.update(name.encode())
+        if torch.is_tensor(tensor):
+            tensor = tensor.detach().cpu().contiguous()
+            hasher.update(str(tensor.dtype).encode())
+            hasher.update(str(tuple(tensor.shape)).encode())
+            hasher.update(tensor.view(-1).view(torch.uint8).numpy().tobytes() if tensor.numel() > 0 else b'')
+        else:
+            hasher.update(repr(tensor).encode())
+    return hasher.hexdigest()
+
+
+def _to_builtin(value):
+    # numpy values (e.g. the dataset derived input_sizes) as python types, so the hparams do not depend on numpy pickles
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _to_builtin(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_builtin(v) for v in value)
+    return value
+
+
+def _get_hparams(model):
+    hparams = getattr(model, 'hparams', None)
+    if hparams is None:
+        raise AttributeError('Model {} has no hparams. Only models calling save_hyperparameters() can be bundled'.format(model))
+    return _to_builtin(dict(hparams))
+
+
+def _get_shared_submodule_paths(model):
+    # outermost submodules of the shared classes (nested ones are shared with their parent)
+    paths = []
+    for name, module in model.named_modules():
+        if name == '' or any(name.startswith(p + '.') for p in paths):
+            continue
+        if type(module).__name__ in shared_submodule_class_names:
+            paths.append(name)
+    return paths
+
+
+def _get_submodule_state_dict(state_dict, path):
+    prefix = path + '.'
+    return {k[len(prefix):]: v for k, v in state_dict.items() if k.startswith(prefix)}
+
+
+def save_model_bundle(model, bundle_path):
+    """
+    Pack a model with its frozen sub-models, hyperparameters and content hashes into a single file.
+    Args:
+        model: LightningModule whose constructor arguments are saved with save_hyperparameters()
+        bundle_path: <str>
+    Returns:
+        - <str> content hash of the model weights
+    """
+    state_dict = {k: v.detach().cpu() for k, v in model.state_dict().items()}
+    submodels = {}
+    for name in bundled_submodule_names:
+        submodel = getattr(model, name, None)
+        if submodel is not None:
+            submodels[name] = {
+                'class': get_class_path(submodel),
+                'hparams': _get_hparams(submodel),
+                'content_hash': state_dict_content_hash(_get_submodule_state_dict(state_dict, name)),
+            }
+    shared_submodules = {path: state_dict_content_hash(_get_submodule_state_dict(state_dict, path)) for path in _get_shared_submodule_paths(model)}
+    bundle = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'class': get_class_path(model),
+        'hparams': _get_hparams(model),
+        'state_dict': state_dict,
+        'content_hash': state_dict_content_hash(state_dict),
+        'submodels': submodels,
+        'shared_submodules': shared_submodules,
+        'frozen_params': [name for name, param in model.named_parameters() if not param.requires_grad],
+    }
+    bundle_dir = os.path.dirname(os.path.abspath(bundle_path))
+    if not os.path.exists(bundle_dir):
+        os.makedirs(bundle_dir)
+    tmp_path = bundle_path + '.tmp'
+    torch.save(bundle, tmp_path)
+    os.replace(tmp_path, bundle_path)
+    return bundle['content_hash']
+
+
+def _load_bundle_file(bundle_path):
+    bundle_path = os.path.abspath(bundle_path)
+    key = (bundle_path, os.path.getmtime(bundle_path))
+    if key not in _loaded_bundles:
+        try:
+            # bundles are trusted local files. Their hparams may hold any python object, so weights_only can not be used.
+            bundle = torch.load(bundle_path, map_location='cpu', mmap=True, weights_only=False) # tensors are read on demand
+        except TypeError:
+            bundle = torch.load(bundle_path, map_location='cpu') # older torch without mmap
+        if bundle.get('format_version') != BUNDLE_FORMAT_VERSION:
+            raise AttributeError('Bundle {} has format version {}, expected {}'.format(bundle_path, bundle.get('format_version'), BUNDLE_FORMAT_VERSION))
+        _loaded_bundles[key] = bundle
+    return _loaded_bundles[key]
+
+
+@contextmanager
+def _loading_bundle(bundle_spec):
+    previous_spec = getattr(_loading_state, 'bundle_spec', None)
+    _loading_state.bundle_spec = bundle_spec
+    try:
+        yield
+    finally:
+        _loading_state.bundle_spec = previous_spec
+
+
+def is_loading_bundle():
+    """
+    True while a model is built from a bundle. Pretrained weights must not be read from their checkpoints then,
+    since they come with the bundle.
+    """
+    return getattr(_loading_state, 'bundle_spec', None) is not None
+
+
+def get_bundled_submodel(name):
+    """
+    Sub-model stored in the bundle being loaded, or None if no bundle is being loaded.
+    If a sub-model with the same weights has already been loaded in this process, that same instance is returned.
+    Otherwise, it is built from its hyperparameters. Its weights are loaded with the ones of the parent model.
+    """
+    bundle_spec = getattr(_loading_state, 'bundle_spec', None)
+    if bundle_spec is None:
+        return None
+    submodel_spec = bundle_spec['submodels'].get(name)
+    if submodel_spec is None:
+        raise KeyError('Sub-model {} not found in the bundle. Available: {}'.format(name, list(bundle_spec['submodels'].keys())))
+    shared_submodel = _shared_modules.get(submodel_spec['content_hash'])
+    if shared_submodel is not None:
+        return shared_submodel
+    Model = import_class(submodel_spec['class'])
+    nested_spec = {'submodels': {}} # bundled sub-models do not have bundled sub-models
+    with _loading_bundle(nested_spec):
+        submodel = Model(**submodel_spec['hparams'])
+    return submodel
+
+
+def _share_submodules(model, bundle):
+    # Replace the shared submodules by the instances already loaded with the same weights, or register them.
+    shared_paths = []
+    for path, content_hash in bundle['shared_submodules'].items():
+        module = model.get_submodule(path)
+        shared_module = _shared_modules.get(content_hash)
+        if shared_module is None:
+            _shared_modules[content_hash] = module
+        elif shared_module is not module:
+            parent_path, _, attr_name = path.rpartition('.')
+            parent = model.get_submodule(parent_path) if parent_path else model
+            setattr(parent, attr_name, shared_module)
+            shared_paths.append(path)
+        else:
+            shared_paths.append(path)
+    return shared_paths
+
+
+def load_model_bundle(bundle_path, map_location=None, verify=False, hparams_update=None):
+    """
+    Load a model saved with save_model_bundle. No other checkpoint or directory is read.
+    Args:
+        bundle_path: <str>
+        map_location: device to move the model to. If None, it stays on cpu.
+        verify: <bool> check the content hash of the loaded weights
+        hparams_update: <dict> hyperparameters to override (as the kwargs of load_from_checkpoint)
+    Returns:
+        - the loaded model
+    """
+    bundle = _load_bundle_file(bundle_path)
+    Model = import_class(bundle['class'])
+    hparams = dict(bundle['hparams'])
+    if hparams_update is not None:
+        hparams.update(hparams_update)
+    with _loading_bundle(bundle):
+        model = Model(**hparams)
+    # submodules reused from other models already have these weights, so they are not loaded again
+    reused_paths = [path for path, content_hash in bundle['shared_submodules'].items() if _shared_modules.get(content_hash) is model.get_submodule(path)]
+    state_dict = {k: v for k, v in bundle['state_dict'].items() if not any(k.startswith(p + '.') for p in reused_paths)}
+    model.load_state_dict(state_dict, strict=False)
+    missing_keys = [k for k in bundle['state_dict'].keys() if k not in model.state_dict()]
+    if len(missing_keys) > 0:
+        raise KeyError('Bundle {} weights do not match the model {}: {}'.format(bundle_path, bundle['class'], missing_keys[:10]))
+    _share_submodules(model, bundle)
+    frozen_params = set(bundle['frozen_params'])
+    for name, param in model.named_parameters():
+        param.requires_grad = name not in frozen_params
+    if verify:
+        content_hash = state_dict_content_hash(model.state_dict())
+        if content_hash != bundle['content_hash']:
+            raise ValueError('Bundle {} content hash mismatch: {} != {}'.format(bundle_path, content_hash, bundle['content_hash']))
+    if map_location is not None:
+        model = model.to(map_location)
+    return model
+
+
+def clear_shared_modules():
+    _shared_modules.clear()
+    _loaded_bundles.clear()
@@ -1,7 +1,9 @@
 import torch
 import numpy as np
-import tf.transformations as tr
 import pytorch3d.transforms as batched_trs
+from bubble_control.aux.lazy_imports import lazy_import
+
+tr = lazy_import('tf.transformations')
 
 
 class QuaternionToAxis(object):
@@ -2,15 +2,16 @@ import numpy as np
 import os
 import torch
 import torch.nn as nn
-import cv2
 import torch.nn.functional as F
 import pytorch_lightning as pl
 import abc
 import torchvision
 import pytorch3d.transforms as batched_trs
-from matplotlib import cm
-from PIL import Image
-import matplotlib.pyplot as plt
+from functools import lru_cache
+from bubble_control.aux.lazy_imports import lazy_import
+
+cm = lazy_import('matplotlib.cm')
+plt = lazy_import('matplotlib.pyplot')
 
 
 def get_imprint_grid(batched_imprints, cmap='jet', border_pixels=5, nrow=8):
@@ -43,7 +44,7 @@ def get_batched_image_grid(batched_img, cmap='jet', border_pixels=5, nrow=8):
 
     """
     # reshape the batched_img to have the same imprints one above the other
-    batched_img = batched_img.detach().cpu()
+    batched_img = batched_img.detach() # render on the same device as the batch
     # Add padding
     batched_img_padded = F.pad(input=batched_img,
                                pad=(border_pixels, border_pixels, border_pixels, border_pixels),
@@ -56,11 +57,23 @@ def get_batched_image_grid(batched_img, cmap='jet', border_pixels=5, nrow=8):
     return grid_img
 
 
-def cmap_tensor(img_tensor, cmap='jet'):
-    cmap = cm.get_cmap(cmap)
-    mapped_img_ar = cmap(img_tensor / torch.max(img_tensor))  # (..,w,h,4)
-    mapped_img_ar = mapped_img_ar[..., :3]  # (..,w,h,3) -- get rid of the alpha value
-    mapped_img = torch.tensor(mapped_img_ar, device=img_tensor.device)
+@lru_cache(maxsize=None)
+def _get_cmap_lut(cmap='jet', num_colors=256):
+    # (num_colors, 3) look up table with the colormap rgb values (no alpha)
+    lut = cm.get_cmap(cmap, num_colors)(np.arange(num_colors))[:, :3]
+    return torch.tensor(lut, dtype=torch.float32)
+
+
+def cmap_tensor(img_tensor, cmap='jet', num_colors=256):
+    """
+    Apply the colormap by indexing a look up table. It runs on the same device as img_tensor.
+    Returns: (..., w, h, 3) colored image
+    """
+    lut = _get_cmap_lut(cmap, num_colors).to(img_tensor.device)
+    norm_img = img_tensor / torch.max(img_tensor)
+    # same binning as matplotlib colormaps: values in [i/N, (i+1)/N) map to the color i
+    lut_indxs = torch.clamp((norm_img * num_colors).long(), 0, num_colors - 1)
+    mapped_img = lut[lut_indxs]
     return mapped_img
 
 
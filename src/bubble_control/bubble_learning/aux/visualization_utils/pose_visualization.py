@@ -2,13 +2,11 @@ import numpy as np
 import os
 import torch
 import torch.nn as nn
-import cv2
 import torch.nn.functional as F
 import pytorch_lightning as pl
 import abc
 import torchvision
 import pytorch3d.transforms as batched_trs
-from matplotlib import cm
 
 
 from bubble_control.bubble_learning.models.bubble_autoencoder import BubbleAutoEncoderModel
@@ -16,22 +14,25 @@ from bubble_control.bubble_learning.models.aux.fc_module import FCModule
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
 from bubble_control.aux.load_confs import load_object_models
 from bubble_control.bubble_learning.aux.pose_loss import PoseLoss
-
-
-def get_pose_images(trans_pred, rot_angle_pred, trans_gth, rot_angle_gth):
-    images = []
-    for i in range(len(trans_pred)):
-        img = np.zeros([100, 100, 3], dtype=np.uint8)
-        img.fill(100)
-        pred_param = find_rect_param(trans_pred[i], rot_angle_pred[i], img)
-        color_p = (255, 0, 0)
-        draw_angled_rec(*pred_param, color_p, img)
-        gth_param = find_rect_param(trans_gth[i], rot_angle_gth[i], img)
-        color_gth = (0, 0, 255)
-        draw_angled_rec(*gth_param, color_gth, img)
-        img = torch.tensor(img)
-        img = img.permute(2, 0, 1)
-        images.append(img)
+from bubble_control.aux.lazy_imports import lazy_import
+
+cv2 = lazy_import('cv2')
+
+
+def get_pose_images(trans_pred, rot_angle_pred, trans_gth, rot_angle_gth, img_size=100, thickness=3):
+    """
+    Render the predicted (red) and ground truth (blue) object poses as oriented rectangles.
+    All images are rasterized at once on the device of the inputs.
+    Returns: <torch.Tensor> (B, 3, img_size, img_size) uint8 images
+    """
+    device = trans_pred.device
+    num_imgs = trans_pred.shape[0]
+    images = torch.full((num_imgs, 3, img_size, img_size), 100, dtype=torch.uint8, device=device)
+    for trans, rot_angle, color in zip([trans_pred, trans_gth], [rot_angle_pred, rot_angle_gth], [(255, 0, 0), (0, 0, 255)]):
+        centers, width, height = find_rect_params_batched(trans, img_size)
+        outline_mask = rasterize_oriented_rectangles(centers, width, height, rot_angle.to(device), img_size, thickness=thickness)
+        color = torch.tensor(color, dtype=torch.uint8, device=device)
+        images = torch.where(outline_mask.unsqueeze(1), color.view(1, 3, 1, 1), images)
     return images
 
 
@@ -59,7 +60,7 @@ def get_object_pose_images_grid(obj_pose_pred, obj_pose_gth, plane_normal):
 def get_angle_from_axis_angle(orientation, plane_normal):
     if orientation.shape[-1] == 4:
         q_to_ax = QuaternionToAxis()
-        axis_angle = torch.from_numpy(q_to_ax._tr(orientation.detach().numpy()))
+        axis_angle = torch.from_numpy(q_to_ax._tr(orientation.detach().cpu().numpy())).to(orientation.device)
     else:
         axis_angle = orientation
     projection = torch.einsum('bi,i->b', axis_angle, plane_normal)
@@ -76,6 +77,44 @@ def find_rect_param(trans, rot, img):
     return center_x, center_y, width, height, rot.item()
 
 
+def find_rect_params_batched(trans, img_size):
+    # batched version of find_rect_param. Returns the centers (B, 2) as (x, y) pixel coordinates, width and height
+    height = 0.06 * 100 / 0.15
+    width = 0.015 * 100 / 0.15
+    centers = img_size / 2 + trans[..., :2] * 10 / 0.15
+    return centers, width, height
+
+
+def rasterize_oriented_rectangles(centers, width, height, angles, img_size, thickness=3):
+    """
+    Rasterize the outline of oriented rectangles (same geometry as draw_angled_rec) for all samples at once.
+    Each pixel is tested against the outer and inner rectangles of the outline in the rectangle local frame.
+    Args:
+        centers: <torch.Tensor> (B, 2) rectangle centers (x, y) in pixels
+        width: <float> rectangle width in pixels
+        height: <float> rectangle height in pixels
+        angles: <torch.Tensor> (B,) rectangle angles
+        img_size: <int> size of the square images
+        thickness: <int> outline thickness in pixels
+    Returns: <torch.Tensor> (B, img_size, img_size) boolean mask of the outline pixels
+    """
+    device = centers.device
+    pixel_coords = torch.arange(img_size, device=device, dtype=centers.dtype)
+    # pixel (row, col) has coordinates (x=col, y=row)
+    dx = pixel_coords.view(1, 1, -1) - centers[:, 0].view(-1, 1, 1)
+    dy = pixel_coords.view(1, -1, 1) - centers[:, 1].view(-1, 1, 1)
+    cos_a = torch.cos(angles).to(centers.dtype).view(-1, 1, 1)
+    sin_a = torch.sin(angles).to(centers.dtype).view(-1, 1, 1)
+    # coordinates along the width axis (cos, sin) and the height axis (sin, -cos)
+    local_w = torch.abs(dx * cos_a + dy * sin_a)
+    local_h = torch.abs(dx * sin_a - dy * cos_a)
+    half_t = 0.5 * (thickness + 1) # similar coverage to the cv2 thick lines
+    inside_outer = (local_w <= 0.5 * width + half_t) & (local_h <= 0.5 * height + half_t)
+    inside_inner = (local_w < 0.5 * width - half_t) & (local_h < 0.5 * height - half_t)
+    outline_mask = inside_outer & ~inside_inner
+    return outline_mask
+
+
 def draw_angled_rec(x0, y0, width, height, angle, color, img):
     b = np.cos(angle) * 0.5
     a = np.sin(angle) * 0.5
@@ -1,14 +1,21 @@
+import os
 import numpy as np
-import tf.transformations as tr
 
 from bubble_utils.bubble_datasets.bubble_dataset_base import BubbleDatasetBase
+from bubble_control.bubble_learning.datasets.parallel_processing import ChunkedSampleProcessingMixin, get_file_hash
 from bubble_control.bubble_learning.aux.img_trs.block_downsampling_tr import BlockDownSamplingTr
-from bubble_control.aux.load_confs import load_object_models
-from bubble_control.bubble_pose_estimation.bubble_pc_reconstruction import BubblePCReconstructorOfflineDepth
-from mmint_camera_utils.ros_utils.utils import matrix_to_pose, pose_to_matrix
+from bubble_control.aux.load_confs import load_object_models, package_path
+from bubble_control.aux.depth_chunk_storage import DepthChunkReader, get_depth_storage_path, has_depth_storage
+from bubble_control.aux.lazy_imports import lazy_import, lazy_import_from
+from bubble_control.aux.profiling import span, profiled
+from bubble_control.aux.tf_table import TfTable
 
+tr = lazy_import('tf.transformations')
+BubblePCReconstructorOfflineDepth = lazy_import_from('bubble_control.bubble_pose_estimation.bubble_pc_reconstruction', 'BubblePCReconstructorOfflineDepth')
+matrix_to_pose, pose_to_matrix = lazy_import_from('mmint_camera_utils.ros_utils.utils', 'matrix_to_pose', 'pose_to_matrix')
 
-class BubbleDrawingDataset(BubbleDatasetBase):
+
+class BubbleDrawingDataset(ChunkedSampleProcessingMixin, BubbleDatasetBase):
 
     def __init__(self, *args, wrench_frame=None, tf_frame='grasp_frame', view=False,  downsample_factor_x=1, downsample_factor_y=1, downsample_reduction='mean', **kwargs):
         self.downsample_factor_x = downsample_factor_x
@@ -23,13 +30,24 @@ class BubbleDrawingDataset(BubbleDatasetBase):
         self.wrench_frame = wrench_frame
         self.tf_frame = tf_frame
         self.view = view
+        self.depth_readers = {} # chunked depth storage readers by (scene_name, camera_name). None if not available.
         super().__init__(*args, **kwargs)
 
     @classmethod
     def get_name(self):
         return 'bubble_drawing_dataset'
 
-    def _get_sample(self, fc):
+    def _get_processing_params(self):
+        processing_params = {
+            'wrench_frame': self.wrench_frame,
+            'tf_frame': self.tf_frame,
+            'object_models': get_file_hash(os.path.join(package_path, 'config', 'object_models.npy')),
+        }
+        return processing_params
+
+    @profiled('dataset/get_sample')
+    def _compute_sample(self, fc):
+        # called by ChunkedSampleProcessingMixin._get_sample, directly or in the processing workers
         # fc: index of the line in the datalegend (self.dl) of the sample
         dl_line = self.dl.iloc[fc]
         scene_name = dl_line['Scene']
@@ -37,45 +55,46 @@ class BubbleDrawingDataset(BubbleDatasetBase):
         init_fc = int(dl_line['InitialStateFC'])
         final_fc = int(dl_line['FinalStateFC'])
         # Load initial state:
-        init_imprint_r = self._get_depth_imprint(undef_fc=undef_fc, def_fc=init_fc, scene_name=scene_name, camera_name='right')
-        init_imprint_l = self._get_depth_imprint(undef_fc=undef_fc, def_fc=init_fc, scene_name=scene_name, camera_name='left')
-        init_imprint = np.stack([init_imprint_r, init_imprint_l], axis=0)
-        init_wrench = self._get_wrench(fc=init_fc, scene_name=scene_name, frame_id=self.wrench_frame)
-        # Final State
-        final_imprint_r = self._get_depth_imprint(undef_fc=undef_fc, def_fc=final_fc, scene_name=scene_name, camera_name='right')
-        final_imprint_l = self._get_depth_imprint(undef_fc=undef_fc, def_fc=final_fc, scene_name=scene_name, camera_name='left')
-        final_imprint = np.stack([final_imprint_r, final_imprint_l], axis=0)
-        final_wrench = self._get_wrench(fc=final_fc, scene_name=scene_name, frame_id=self.wrench_frame)
-
-        init_tf = self._get_tfs(init_fc, scene_name=scene_name, frame_id=self.tf_frame)
-        final_tf = self._get_tfs(final_fc, scene_name=scene_name, frame_id=self.tf_frame)
+        with span('dataset/imprints'):
+            init_imprint_r = self._get_depth_imprint(undef_fc=undef_fc, def_fc=init_fc, scene_name=scene_name, camera_name='right')
+            init_imprint_l = self._get_depth_imprint(undef_fc=undef_fc, def_fc=init_fc, scene_name=scene_name, camera_name='left')
+            init_imprint = np.stack([init_imprint_r, init_imprint_l], axis=0)
+            # Final State
+            final_imprint_r = self._get_depth_imprint(undef_fc=undef_fc, def_fc=final_fc, scene_name=scene_name, camera_name='right')
+            final_imprint_l = self._get_depth_imprint(undef_fc=undef_fc, def_fc=final_fc, scene_name=scene_name, camera_name='left')
+            final_imprint = np.stack([final_imprint_r, final_imprint_l], axis=0)
+        with span('dataset/wrenches'):
+            init_wrench = self._get_wrench(fc=init_fc, scene_name=scene_name, frame_id=self.wrench_frame)
+            final_wrench = self._get_wrench(fc=final_fc, scene_name=scene_name, frame_id=self.wrench_frame)
+
+        with span('dataset/tfs'):
+            init_tf = self._get_tfs(init_fc, scene_name=scene_name, frame_id=self.tf_frame)
+            final_tf = self._get_tfs(final_fc, scene_name=scene_name, frame_id=self.tf_frame)
+            # load tf from cameras to grasp frame (should
+            all_tfs = TfTable.from_dataframe(self._load_tfs(init_fc, scene_name))
         init_pos = init_tf[..., :3]
         init_quat = init_tf[..., 3:]
         final_pos = final_tf[..., :3]
         final_quat = final_tf[..., 3:]
 
-        undef_depth_r = self._load_depth_img(fc=undef_fc, scene_name=scene_name, camera_name='right')
-        undef_depth_l = self._load_depth_img(fc=undef_fc, scene_name=scene_name, camera_name='left')
-        init_def_depth_r = self._load_depth_img(fc=init_fc, scene_name=scene_name, camera_name='right')
-        init_def_depth_l = self._load_depth_img(fc=init_fc, scene_name=scene_name, camera_name='left')
-        final_def_depth_r = self._load_depth_img(fc=final_fc, scene_name=scene_name, camera_name='right')
-        final_def_depth_l = self._load_depth_img(fc=final_fc, scene_name=scene_name, camera_name='left')
-
-        # load tf from cameras to grasp frame (should
-        all_tfs = self._load_tfs(init_fc, scene_name)
+        with span('dataset/depth_imgs'):
+            undef_depth_r, init_def_depth_r, final_def_depth_r = self._load_depth_imgs(fcs=[undef_fc, init_fc, final_fc], scene_name=scene_name, camera_name='right')
+            undef_depth_l, init_def_depth_l, final_def_depth_l = self._load_depth_imgs(fcs=[undef_fc, init_fc, final_fc], scene_name=scene_name, camera_name='left')
 
         # Action:
         action_fc = fc
         action = self._get_action(action_fc)
 
         # camera info
-        camera_info_r = self._load_camera_info_depth(scene_name=scene_name, camera_name='right', fc=undef_fc)
-        camera_info_l = self._load_camera_info_depth(scene_name=scene_name, camera_name='left', fc=undef_fc)
+        with span('dataset/camera_info'):
+            camera_info_r = self._load_camera_info_depth(scene_name=scene_name, camera_name='right', fc=undef_fc)
+            camera_info_l = self._load_camera_info_depth(scene_name=scene_name, camera_name='left', fc=undef_fc)
 
         object_code = self._get_object_code(fc)
         object_model = self._get_object_model(object_code)
-        init_object_pose = self._estimate_object_pose(init_def_depth_r, init_def_depth_l, undef_depth_r, undef_depth_l, camera_info_r, camera_info_l, all_tfs)
-        final_object_pose = self._estimate_object_pose(final_def_depth_r, final_def_depth_l, undef_depth_r, undef_depth_l, camera_info_r, camera_info_l, all_tfs)
+        with span('dataset/object_pose'):
+            init_object_pose = self._estimate_object_pose(init_def_depth_r, init_def_depth_l, undef_depth_r, undef_depth_l, camera_info_r, camera_info_l, all_tfs)
+            final_object_pose = self._estimate_object_pose(final_def_depth_r, final_def_depth_l, undef_depth_r, undef_depth_l, camera_info_r, camera_info_l, all_tfs)
         sample_simple = {
             'init_imprint': init_imprint,
             'init_wrench': init_wrench,
@@ -101,6 +120,29 @@ class BubbleDrawingDataset(BubbleDatasetBase):
 
         return sample
 
+    def _get_depth_reader(self, scene_name, camera_name):
+        key = (scene_name, camera_name)
+        if key not in self.depth_readers:
+            if has_depth_storage(self.data_path, scene_name, camera_name):
+                self.depth_readers[key] = DepthChunkReader(get_depth_storage_path(self.data_path, scene_name, camera_name))
+            else:
+                self.depth_readers[key] = None
+        return self.depth_readers[key]
+
+    def _load_depth_img(self, fc, scene_name, camera_name):
+        # Read from the chunked depth storage if the scene has been converted, otherwise from the per-filecode frames.
+        depth_reader = self._get_depth_reader(scene_name, camera_name)
+        if depth_reader is not None and fc in depth_reader:
+            return depth_reader.read(fc)
+        return super()._load_depth_img(fc=fc, scene_name=scene_name, camera_name=camera_name)
+
+    def _load_depth_imgs(self, fcs, scene_name, camera_name):
+        # Frames in the same chunk are read at once.
+        depth_reader = self._get_depth_reader(scene_name, camera_name)
+        if depth_reader is not None and all(fc in depth_reader for fc in fcs):
+            return depth_reader.read_many(fcs)
+        return [self._load_depth_img(fc=fc, scene_name=scene_name, camera_name=camera_name) for fc in fcs]
+
     def _get_action(self, fc):
         # TODO: Load from file instead of the logged values in the dl
         dl_line = self.dl.iloc[fc]
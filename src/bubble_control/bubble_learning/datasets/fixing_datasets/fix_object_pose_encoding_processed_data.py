@@ -85,6 +85,10 @@ class EncodeObjectPoseAsAxisAngleTr(object):
         sample = self.split_pose_tr.inverse(sample, replace=True) # restore the pose from pos and quat
         return sample
 
+    def is_encoded(self, sample):
+        # axis angle poses are [x, y, z, rx, ry, rz], while quaternion ones are [x, y, z, qx, qy, qz, qw]
+        return all(np.shape(sample[k])[-1] == 6 for k in self.keys_to_tr if k in sample)
+
     def inverse(self, sample):
         sample = self.split_pose_tr(sample) # split pose into pos and quat
         sample = self.quat_to_axis_tr.inverse(sample) # encode only the quaternion part
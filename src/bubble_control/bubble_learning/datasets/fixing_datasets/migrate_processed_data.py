@@ -0,0 +1,59 @@
+import torch
+import os
+import argparse
+from bubble_control.aux.load_confs import load_object_models as load_object_models_drawing
+from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
+from bubble_utils.bubble_datasets.data_transformations import TensorTypeTr
+from bubble_control.bubble_learning.datasets.fixing_datasets.migration_runner import Migration, MigrationRunner
+from bubble_control.bubble_learning.datasets.fixing_datasets.fix_object_model_processed_data import ReplaceObjectTr
+from bubble_control.bubble_learning.datasets.fixing_datasets.fix_object_pose_encoding_processed_data import EncodeObjectPoseAsAxisAngleTr
+from bubble_control.bubble_learning.datasets.fixing_datasets.fix_object_pose_nan_processed_data import FixNanObjectPoseTr
+
+
+def get_drawing_migrations():
+    """
+    Processed drawing data fixes, in the order they have to be applied.
+    The wrench fix (fix_wrench_and_ori_processed_data) is not included since it reloads the raw data instead of
+    transforming the processed samples.
+    The pose encoding is not idempotent, so it skips the samples whose poses are already encoded as axis angle.
+    """
+    tensor_type_tr = TensorTypeTr(dtype=torch.float32)
+    encode_object_pose_tr = EncodeObjectPoseAsAxisAngleTr()
+    migrations = [
+        Migration('replace_object_models', [ReplaceObjectTr(load_object_models_drawing()), tensor_type_tr]),
+        Migration('encode_object_pose_as_axis_angle', [encode_object_pose_tr], is_applied=encode_object_pose_tr.is_encoded),
+        Migration('fix_nan_object_pose', [FixNanObjectPoseTr()]),
+    ]
+    return migrations
+
+
+def migrate_drawing_data(data_name, num_workers=None, stamp=None):
+    """
+    Args:
+        data_name: <str>
+        num_workers: <int>
+        stamp: list of migration names to record as already applied before migrating. Empty list for all of them.
+    """
+    dataset = BubbleDrawingDataset(
+        data_name=data_name,
+        downsample_factor_x=7,
+        downsample_factor_y=7,
+        downsample_reduction='mean')
+    runner = MigrationRunner.from_dataset(dataset, get_drawing_migrations(), num_workers=num_workers)
+    if stamp is not None:
+        num_stamped = runner.stamp(migration_keys=stamp if len(stamp) > 0 else None)
+        print('{} samples stamped at {}'.format(num_stamped, dataset.processed_data_path))
+    num_migrated = runner.run()
+    print('{} samples migrated at {}'.format(num_migrated, dataset.processed_data_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Apply all the pending processed drawing data fixes in a single resumable pass')
+    parser.add_argument('--data_path', type=str, default='/home/mik/Datasets/bubble_datasets')
+    parser.add_argument('--data_names', type=str, nargs='+', default=['drawing_data_one_direction', 'drawing_data_line'])
+    parser.add_argument('--num_workers', type=int, default=None, help='number of processes. All cpus by default. 0 runs in the main process')
+    parser.add_argument('--stamp', type=str, nargs='*', default=None, help='record these migrations (all if none given) as already applied, e.g. for data fixed with the fix_* scripts')
+    args = parser.parse_args()
+
+    for data_name in args.data_names:
+        migrate_drawing_data(os.path.join(args.data_path, data_name), num_workers=args.num_workers, stamp=args.stamp)
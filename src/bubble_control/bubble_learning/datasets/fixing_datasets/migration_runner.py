@@ -0,0 +1,223 @@
+import os
+import re
+import torch
+from multiprocessing import Pool
+from tqdm import tqdm
+
+
+class Migration(object):
+    """
+    Versioned chain of sample transformations applied in place to the processed samples (data_{indx}.pt).
+    Bump the version when the transformations change, so samples migrated by the previous version are migrated again.
+    """
+    def __init__(self, name, trs, version=0, is_applied=None):
+        """
+        Args:
+            name: <str> migration name
+            trs: list of sample transformations applied in order as sample = tr(sample)
+            version: <int>
+            is_applied: function returning True if the sample is already migrated, as is_applied(sample). Those samples
+                are left as they are, e.g. for non-idempotent migrations on data fixed before the journal existed.
+        """
+        self.name = name
+        self.trs = list(trs)
+        self.version = version
+        self.is_applied = is_applied
+
+    @property
+    def key(self):
+        return '{}_v{}'.format(self.name, self.version)
+
+    def __call__(self, sample):
+        if self.is_applied is not None and self.is_applied(sample):
+            return sample
+        for tr in self.trs:
+            sample = tr(sample)
+        return sample
+
+
+def get_staged_sample_path(sample_path, migration_keys):
+    # the staged file name records the migrations it contains
+    return '{}.{}.migrating'.format(sample_path, '+'.join(migration_keys))
+
+
+# Worker state. It is set once per process by the pool initializer, so the migrations are not pickled with every sample.
+_worker_state = {}
+
+
+def _init_worker(migrations):
+    torch.set_num_threads(1)
+    _worker_state['migrations'] = {m.key: m for m in migrations}
+
+
+def _migrate_sample_worker(job):
+    # Write the migrated sample next to the original one. It replaces the original once the migration is journaled.
+    indx, sample_path, migration_keys = job
+    sample = torch.load(sample_path)
+    for key in migration_keys:
+        sample = _worker_state['migrations'][key](sample)
+    staged_path = get_staged_sample_path(sample_path, migration_keys)
+    torch.save(sample, staged_path)
+    return indx, migration_keys
+
+
+class MigrationRunner(object):
+    """
+    Apply several migrations to all the samples of a processed dataset in a single pass, using a process pool.
+    A journal (migration_journal.csv in the processed data directory) records the migrations applied to each sample:
+     - samples that already have a migration are skipped, so new migrations can be added and the runner run again.
+     - an interrupted run resumes where it stopped.
+    Every sample is first saved to a staged file (data_{indx}.pt.{migrations}.migrating), then journaled, then renamed
+    over the original file.
+    On resume, journaled staged files are renamed (roll forward) and not journaled ones are removed (roll back), so a
+    migration is never applied twice to the same sample, which matters for non-idempotent ones (e.g. pose encodings).
+    Migrations applied before the journal existed (e.g. by the fix_* scripts) have to be recorded with stamp first.
+    """
+    def __init__(self, processed_data_path, migrations, num_workers=None, journal_name='migration_journal.csv'):
+        """
+        Args:
+            processed_data_path: <str> directory containing the data_{indx}.pt processed samples
+            migrations: list of Migration, applied in order
+            num_workers: <int> number of processes. If None, use all cpus. If 0, run in the main process.
+            journal_name: <str>
+        """
+        migration_keys = [m.key for m in migrations]
+        if len(set(migration_keys)) != len(migration_keys):
+            raise AttributeError('Migrations must have unique name and version. Got {}'.format(migration_keys))
+        self.processed_data_path = processed_data_path
+        self.migrations = migrations
+        self.num_workers = num_workers
+        self.journal_path = os.path.join(self.processed_data_path, journal_name)
+
+    @classmethod
+    def from_dataset(cls, dataset, migrations, **kwargs):
+        return cls(dataset.processed_data_path, migrations, **kwargs)
+
+    def _get_sample_path(self, indx):
+        return os.path.join(self.processed_data_path, 'data_{}.pt'.format(indx))
+
+    def get_sample_indxs(self):
+        indxs = []
+        for file_name in os.listdir(self.processed_data_path):
+            match = re.fullmatch(r'data_(\d+)\.pt', file_name)
+            if match is not None:
+                indxs.append(int(match.group(1)))
+        return sorted(indxs)
+
+    def load_journal(self):
+        """
+        Returns:
+            - <dict> {sample_indx: set of applied migration keys}
+        """
+        applied_migrations = {}
+        if not os.path.isfile(self.journal_path):
+            return applied_migrations
+        with open(self.journal_path, 'r') as f:
+            lines = f.read().splitlines()
+        for line in lines[1:]:
+            if len(line) == 0 or ',' not in line:
+                continue # partially written line of an interrupted run
+            indx, keys = line.split(',', 1)
+            applied_migrations.setdefault(int(indx), set()).update(k for k in keys.split(';') if len(k) > 0)
+        return applied_migrations
+
+    def _journal(self, journal_file, indx, migration_keys):
+        journal_file.write('{},{}\n'.format(indx, ';'.join(migration_keys)))
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    def _recover_staged_samples(self, applied_migrations):
+        # Finish (or discard) the samples staged when the previous run was interrupted.
+        for file_name in os.listdir(self.processed_data_path):
+            match = re.fullmatch(r'data_(\d+)\.pt\.(.+)\.migrating', file_name)
+            if match is None:
+                continue
+            indx = int(match.group(1))
+            staged_keys = set(match.group(2).split('+'))
+            staged_path = os.path.join(self.processed_data_path, file_name)
+            # migrations are journaled only once, by the commit of the staged file containing them
+            if staged_keys.issubset(applied_migrations.get(indx, set())):
+                os.replace(staged_path, self._get_sample_path(indx))
+            else:
+                os.remove(staged_path)
+
+    def _init_journal(self, applied_migrations):
+        if os.path.isfile(self.journal_path):
+            self._recover_staged_samples(applied_migrations)
+        else:
+            with open(self.journal_path, 'w') as f:
+                f.write('SampleIndex,Migrations\n')
+
+    def stamp(self, migration_keys=None):
+        """
+        Record migrations as applied to all the samples without running them, for data that already has them.
+        Args:
+            migration_keys: list of migration names or keys to record. If None, all the migrations.
+        Returns:
+            - <int> number of samples stamped
+        """
+        if migration_keys is None:
+            migration_keys = [m.key for m in self.migrations]
+        else:
+            keys_by_name = {m.name: m.key for m in self.migrations}
+            keys_by_name.update({m.key: m.key for m in self.migrations})
+            unknown_keys = [k for k in migration_keys if k not in keys_by_name]
+            if len(unknown_keys) > 0:
+                raise AttributeError('Migrations {} not found. Available options: {}'.format(unknown_keys, list(keys_by_name.keys())))
+            migration_keys = [keys_by_name[k] for k in migration_keys]
+        applied_migrations = self.load_journal()
+        self._init_journal(applied_migrations)
+        num_stamped = 0
+        with open(self.journal_path, 'a') as journal_file:
+            for indx in self.get_sample_indxs():
+                stamp_keys = [k for k in migration_keys if k not in applied_migrations.get(indx, set())]
+                if len(stamp_keys) > 0:
+                    journal_file.write('{},{}\n'.format(indx, ';'.join(stamp_keys)))
+                    num_stamped += 1
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        return num_stamped
+
+    def get_pending_jobs(self, applied_migrations=None):
+        if applied_migrations is None:
+            applied_migrations = self.load_journal()
+        jobs = []
+        for indx in self.get_sample_indxs():
+            applied_keys = applied_migrations.get(indx, set())
+            pending_keys = [m.key for m in self.migrations if m.key not in applied_keys]
+            if len(pending_keys) > 0:
+                jobs.append((indx, self._get_sample_path(indx), pending_keys))
+        return jobs
+
+    def run(self):
+        """
+        Migrate all the samples that have pending migrations.
+        Returns:
+            - <int> number of samples migrated
+        """
+        applied_migrations = self.load_journal()
+        self._init_journal(applied_migrations)
+        jobs = self.get_pending_jobs(applied_migrations)
+        if len(jobs) == 0:
+            print('All samples at {} are already migrated'.format(self.processed_data_path))
+            return 0
+        num_migrated = 0
+        with open(self.journal_path, 'a') as journal_file:
+            if self.num_workers == 0:
+                _worker_state['migrations'] = {m.key: m for m in self.migrations}
+                results = map(_migrate_sample_worker, jobs)
+                num_migrated = self._commit_results(results, journal_file, len(jobs))
+            else:
+                with Pool(processes=self.num_workers, initializer=_init_worker, initargs=(self.migrations,)) as pool:
+                    results = pool.imap_unordered(_migrate_sample_worker, jobs, chunksize=4)
+                    num_migrated = self._commit_results(results, journal_file, len(jobs))
+        return num_migrated
+
+    def _commit_results(self, results, journal_file, num_jobs):
+        num_migrated = 0
+        for indx, migration_keys in tqdm(results, total=num_jobs):
+            sample_path = self._get_sample_path(indx)
+            self._journal(journal_file, indx, migration_keys)
+            os.replace(get_staged_sample_path(sample_path, migration_keys), sample_path)
+            num_migrated += 1
+        return num_migrated
@@ -0,0 +1,299 @@
+import os
+import queue
+import shutil
+import hashlib
+import torch
+import multiprocessing as mp
+from tqdm import tqdm
+
+
+class ProcessingProgress(object):
+    """
+    Progress bar with ETA over the samples processed by one or several datasets, identified by a key.
+    Totals can be added while processing, as each dataset learns how many samples it has.
+    """
+    def __init__(self, desc='processing'):
+        self.totals = {}
+        self.counts = {}
+        self.pbar = tqdm(total=0, unit='samples', desc=desc, dynamic_ncols=True)
+
+    def set_total(self, key, total):
+        self.totals[key] = total
+        self.pbar.total = sum(self.totals.values())
+        self.pbar.refresh()
+
+    def update(self, key, num_samples):
+        self.counts[key] = self.counts.get(key, 0) + num_samples
+        self.pbar.set_postfix_str('{} datasets done'.format(self.get_num_done()), refresh=False)
+        self.pbar.update(num_samples)
+
+    def get_num_done(self):
+        return len([k for k, total in self.totals.items() if self.counts.get(k, 0) >= total])
+
+    def read_queue(self, progress_queue, timeout=0.5):
+        # apply the messages sent by QueueProgress from other processes
+        try:
+            message = progress_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while message is not None:
+            action, key, value = message
+            getattr(self, action)(key, value)
+            try:
+                message = progress_queue.get_nowait()
+            except queue.Empty:
+                message = None
+
+    def close(self):
+        self.pbar.close()
+
+
+class QueueProgress(object):
+    """
+    ProcessingProgress interface for the processes building the datasets. Updates are sent to the main process.
+    """
+    def __init__(self, progress_queue):
+        self.progress_queue = progress_queue
+
+    def set_total(self, key, total):
+        self.progress_queue.put(('set_total', key, total))
+
+    def update(self, key, num_samples):
+        self.progress_queue.put(('update', key, num_samples))
+
+
+# Worker state. It is set once per process by the pool initializer, so the dataset is not pickled with every chunk.
+_worker_state = {}
+
+
+def get_file_hash(path):
+    # hash of the file contents, to identify the processing inputs (e.g. configuration and object model files)
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _init_worker(dataset):
+    torch.set_num_threads(1)
+    dataset.num_processing_workers = 0 # workers compute their samples serially
+    _worker_state['dataset'] = dataset
+
+
+def _process_chunk_worker(job):
+    # Compute the samples of the chunk and save them, so they are not computed again if processing is interrupted.
+    chunk_indx, fcs, chunk_path = job
+    dataset = _worker_state['dataset']
+    samples = [dataset._get_sample(fc) for fc in fcs]
+    tmp_path = '{}.tmp'.format(chunk_path)
+    torch.save({'fcs': fcs, 'samples': samples}, tmp_path)
+    os.replace(tmp_path, chunk_path)
+    return chunk_indx, samples
+
+
+class ChunkedSampleProcessingMixin(object):
+    """
+    Computes the samples (_get_sample) of a dataset in a process pool while the dataset is processed.
+    The base dataset processing still requests the samples one by one in the self.fcs order, but they are computed
+    ahead, in chunks of consecutive filecodes, by the workers.
+    Each chunk is saved to data_path/processing_chunks/<name>/chunk_{first_fc}_{num_fcs}.pt. Saved chunks are loaded instead of
+    computed, so an interrupted processing resumes where it stopped. Reprocessing the dataset (load_cache=False) removes
+    them and computes all the samples again.
+    The name includes processing_version and a hash of _get_processing_params, so chunks computed differently are not
+    reused. Bump processing_version when _compute_sample changes.
+    Datasets implement _compute_sample(fc), which computes one sample, instead of _get_sample.
+    Disabled by default (num_processing_workers=0).
+    """
+    processing_version = 1
+
+    def __init__(self, *args, num_processing_workers=0, processing_chunk_size=32, processing_progress=None, processing_start_method='fork', **kwargs):
+        """
+        Args:
+            num_processing_workers: <int> number of processes computing the samples. If 0, they are computed on demand.
+            processing_chunk_size: <int> number of samples per chunk.
+            processing_progress: ProcessingProgress (or QueueProgress) to report to. If None, a new one is created.
+            processing_start_method: <str> multiprocessing start method. With 'fork' the dataset is not pickled.
+        """
+        self.num_processing_workers = num_processing_workers
+        self.processing_chunk_size = processing_chunk_size
+        self.processing_progress = processing_progress
+        self.processing_start_method = processing_start_method
+        self._processing_pool = None
+        self._processing_chunks = None # iterator over the (fcs, samples) of the chunks
+        self._processed_samples = {} # samples already computed and not yet requested, by fc
+        self._pending_fcs = set() # filecodes that the chunks will provide
+        self._clear_processing_chunks = not kwargs.get('load_cache', True) # reprocessing from scratch
+        super().__init__(*args, **kwargs)
+
+    def _get_processing_params(self):
+        """
+        Override to add the dataset parameters and inputs (e.g. file hashes) that change the samples of _compute_sample.
+        Returns:
+            - <dict>
+        """
+        return {}
+
+    def _get_processing_chunks_name(self):
+        params_str = repr(sorted((str(k), repr(v)) for k, v in self._get_processing_params().items()))
+        params_hash = hashlib.sha1(params_str.encode()).hexdigest()[:12]
+        return '{}_v{}_{}'.format(self.get_name(), self.processing_version, params_hash)
+
+    def _get_processing_chunks_path(self):
+        return os.path.join(self.data_path, 'processing_chunks', self._get_processing_chunks_name())
+
+    def _get_sample(self, fc):
+        if self.num_processing_workers <= 0:
+            return self._compute_sample(fc)
+        if self._processing_chunks is None and fc not in self._processed_samples:
+            self._start_chunked_processing(fc)
+        while fc not in self._processed_samples and fc in self._pending_fcs:
+            self._read_next_chunk()
+        if fc in self._processed_samples:
+            return self._processed_samples.pop(fc)
+        # not provided by the chunks (requested out of order)
+        return self._compute_sample(fc)
+
+    def _start_chunked_processing(self, first_fc):
+        fcs = [int(fc) for fc in self.fcs]
+        if first_fc in fcs:
+            fcs = fcs[fcs.index(first_fc):]
+        chunks_path = self._get_processing_chunks_path()
+        if self._clear_processing_chunks and os.path.exists(chunks_path):
+            shutil.rmtree(chunks_path)
+        self._clear_processing_chunks = False
+        if not os.path.exists(chunks_path):
+            os.makedirs(chunks_path)
+        chunks = []
+        for chunk_indx, start in enumerate(range(0, len(fcs), self.processing_chunk_size)):
+            chunk_fcs = fcs[start:start + self.processing_chunk_size]
+            chunks.append((chunk_indx, chunk_fcs, os.path.join(chunks_path, 'chunk_{}_{}.pt'.format(chunk_fcs[0], len(chunk_fcs)))))
+        jobs = [chunk for chunk in chunks if not os.path.isfile(chunk[2])]
+        if self.processing_progress is None:
+            self.processing_progress = ProcessingProgress(desc=self.get_name())
+        self.processing_progress.set_total(self.data_path, len(fcs))
+        self._pending_fcs = set(fcs)
+        if len(jobs) > 0:
+            ctx = mp.get_context(self.processing_start_method)
+            self._processing_pool = ctx.Pool(processes=min(self.num_processing_workers, len(jobs)), initializer=_init_worker, initargs=(self,))
+            computed_chunks = self._processing_pool.imap(_process_chunk_worker, jobs)
+        else:
+            computed_chunks = iter([])
+        self._processing_chunks = self._iter_chunks(chunks, set(job[0] for job in jobs), computed_chunks)
+
+    def _load_chunk(self, chunk_fcs, chunk_path):
+        # Returns the saved samples of the chunk, or None if they have to be computed again
+        try:
+            chunk_data = torch.load(chunk_path)
+        except Exception:
+            return None # partially written or corrupted
+        if chunk_data['fcs'] != chunk_fcs:
+            return None
+        return chunk_data['samples']
+
+    def _compute_sample(self, fc):
+        # Override with the dataset sample computation. Defined here, it is the _get_sample of the next base class.
+        return super()._get_sample(fc)
+
+    def _iter_chunks(self, chunks, job_indxs, computed_chunks):
+        # chunks in order. imap returns the computed ones in submission order. Saved chunks are loaded when reached.
+        for chunk_indx, chunk_fcs, chunk_path in chunks:
+            if chunk_indx in job_indxs:
+                _, samples = next(computed_chunks)
+            else:
+                samples = self._load_chunk(chunk_fcs, chunk_path)
+                if samples is None:
+                    samples = [self._compute_sample(fc) for fc in chunk_fcs]
+            yield chunk_fcs, samples
+
+    def _read_next_chunk(self):
+        try:
+            chunk_fcs, samples = next(self._processing_chunks)
+        except StopIteration:
+            self._pending_fcs = set()
+            self._stop_chunked_processing()
+            return
+        except BaseException:
+            # the saved chunks are kept, so processing again resumes from them
+            self._pending_fcs = set()
+            self._stop_chunked_processing(terminate=True)
+            raise
+        for fc, sample in zip(chunk_fcs, samples):
+            self._processed_samples[fc] = sample
+            self._pending_fcs.discard(fc)
+        self.processing_progress.update(self.data_path, len(chunk_fcs))
+        if len(self._pending_fcs) == 0:
+            self._stop_chunked_processing()
+
+    def _stop_chunked_processing(self, terminate=False):
+        if self._processing_pool is not None:
+            if terminate:
+                self._processing_pool.terminate()
+            else:
+                self._processing_pool.close()
+            self._processing_pool.join()
+            self._processing_pool = None
+        if isinstance(self.processing_progress, ProcessingProgress):
+            self.processing_progress.close()
+        self.processing_progress = None
+        self._processing_chunks = None
+
+    def __getstate__(self):
+        # the pool and chunk iterator can not be pickled (e.g. with the 'spawn' start method)
+        state = self.__dict__.copy()
+        state['_processing_pool'] = None
+        state['_processing_chunks'] = None
+        state['processing_progress'] = None
+        state['_processed_samples'] = {}
+        return state
+
+
+def _build_dataset_process(dataset_cls, kwargs, progress_queue):
+    progress = QueueProgress(progress_queue)
+    if issubclass(dataset_cls, ChunkedSampleProcessingMixin):
+        dataset_cls(**dict(kwargs, processing_progress=progress))
+    else:
+        # datasets without chunked processing only report when they are done
+        dataset = dataset_cls(**kwargs)
+        progress.set_total(kwargs['data_name'], len(dataset))
+        progress.update(kwargs['data_name'], len(dataset))
+
+
+def build_datasets_in_parallel(dataset_specs, num_workers, processing_chunk_size=32, start_method='fork'):
+    """
+    Construct (and therefore process and cache) several datasets at the same time, each one in its own process,
+    reporting the progress and ETA of all of them together. The datasets are then loaded from their cache in this
+    process.
+    Datasets with ChunkedSampleProcessingMixin share the num_workers to also compute their samples in parallel.
+    Args:
+        dataset_specs: list of (dataset_class, kwargs)
+        num_workers: <int> total number of processes computing samples.
+        processing_chunk_size: <int>
+        start_method: <str> multiprocessing start method.
+    Returns:
+        - list of the constructed datasets, in the dataset_specs order
+    """
+    num_chunked = len([cls for cls, _ in dataset_specs if issubclass(cls, ChunkedSampleProcessingMixin)])
+    num_sample_workers = max(1, (num_workers - (len(dataset_specs) - num_chunked)) // max(num_chunked, 1))
+    ctx = mp.get_context(start_method)
+    progress_queue = ctx.Queue()
+    progress = ProcessingProgress(desc='processing {} datasets'.format(len(dataset_specs)))
+    processes = []
+    try:
+        for dataset_cls, kwargs in dataset_specs:
+            if issubclass(dataset_cls, ChunkedSampleProcessingMixin):
+                kwargs = dict(kwargs, num_processing_workers=num_sample_workers, processing_chunk_size=processing_chunk_size, processing_start_method=start_method)
+            process = ctx.Process(target=_build_dataset_process, args=(dataset_cls, kwargs, progress_queue))
+            process.start()
+            processes.append(process)
+        while any(p.is_alive() for p in processes):
+            progress.read_queue(progress_queue)
+        progress.read_queue(progress_queue, timeout=0.1)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        progress.close()
+    failed = [kwargs['data_name'] for (_, kwargs), p in zip(dataset_specs, processes) if p.exitcode != 0]
+    if len(failed) > 0:
+        raise RuntimeError('Processing the datasets {} failed. Processed samples are kept, run again to resume.'.format(failed))
+    # all datasets are processed and cached now
+    return [dataset_cls(**dict(kwargs, load_cache=True)) for dataset_cls, kwargs in dataset_specs]
@@ -4,6 +4,7 @@ from bubble_utils.bubble_datasets.combined_dataset import CombinedDataset
 from bubble_control.bubble_learning.datasets.bubble_drawing_dataset import BubbleDrawingDataset
 from bubble_pivoting.datasets.bubble_pivoting_dataset import BubblePivotingDataset, BubblePivotingDownsampledDataset
 from bubble_control.bubble_learning.datasets.dataset_wrappers import BubbleImprintCombinedDatasetWrapper
+from bubble_control.bubble_learning.datasets.parallel_processing import build_datasets_in_parallel
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
 from bubble_control.bubble_learning.datasets.fixing_datasets.fix_object_pose_encoding_processed_data import EncodeObjectPoseAsAxisAngleTr
 from bubble_utils.bubble_datasets.data_transformations import TensorTypeTr
@@ -11,7 +12,14 @@ from bubble_utils.bubble_datasets.data_transformations import TensorTypeTr
 
 class TaskCombinedDataset(CombinedDataset):
 
-    def __init__(self, data_name, downsample_factor_x=7, downsample_factor_y=7, wrench_frame='med_base', downsample_reduction='mean', transformation=None, dtype=None, load_cache=True, contribute_mode=False, clean_if_error=True, **kwargs):
+    def __init__(self, data_name, downsample_factor_x=7, downsample_factor_y=7, wrench_frame='med_base', downsample_reduction='mean', transformation=None, dtype=None, load_cache=True, contribute_mode=False, clean_if_error=True, num_workers=0, processing_chunk_size=32, **kwargs):
+        """
+        Args:
+            num_workers: <int> if > 0, the sub-datasets are constructed (and processed if not cached) in parallel
+                processes, and the drawing datasets also compute their samples with a pool, sharing num_workers.
+                Their samples are saved in chunks, so an interrupted processing resumes where it stopped.
+            processing_chunk_size: <int> number of samples per saved chunk.
+        """
         self.data_dir = data_name # it assumes that all datasets are found at the same directory called data_dir
         self.downsample_factor_x = downsample_factor_x
         self.downsample_factor_y = downsample_factor_y
@@ -24,6 +32,8 @@ class TaskCombinedDataset(CombinedDataset):
         self.load_cache = load_cache
         self.contribute_mode = contribute_mode
         self.clean_if_error = clean_if_error
+        self.num_workers = num_workers
+        self.processing_chunk_size = processing_chunk_size
         datasets = self._get_datasets()
         super().__init__(datasets, data_name=os.path.join(self.data_dir, 'task_combined_dataset'), **kwargs)
 
@@ -31,66 +41,42 @@ class TaskCombinedDataset(CombinedDataset):
     def get_name(self):
         return 'task_combined_dataset'
 
+    def _get_dataset_specs(self):
+        # (dataset_class, kwargs) of the sub-datasets
+        dataset_names = [
+            (BubbleDrawingDataset, 'drawing_data_one_direction'),
+            (BubbleDrawingDataset, 'drawing_data_line'),
+            (BubblePivotingDownsampledDataset, 'bubble_pivoting_data'),
+            (BubblePivotingDownsampledDataset, 'bubble_pivoting_data_wide_rotations'),
+        ]
+        dataset_specs = []
+        for dataset_cls, dataset_name in dataset_names:
+            dataset_kwargs = {
+                'data_name': os.path.join(self.data_dir, dataset_name),
+                'downsample_factor_x': self.downsample_factor_x,
+                'downsample_factor_y': self.downsample_factor_y,
+                'downsample_reduction': self.downsample_reduction,
+                'wrench_frame': self.wrench_frame,
+                'dtype': self.dtype,
+                'transformation': self.transformation,
+                'load_cache': self.load_cache,
+                'contribute_mode': self.contribute_mode,
+                'clean_if_error': self.clean_if_error,
+            }
+            dataset_specs.append((dataset_cls, dataset_kwargs))
+        return dataset_specs
+
     def _get_datasets(self):
-        datasets = []
-        drawing_dataset_line = BubbleDrawingDataset(
-            data_name=os.path.join(self.data_dir, 'drawing_data_one_direction'),
-            downsample_factor_x=self.downsample_factor_x,
-            downsample_factor_y=self.downsample_factor_y,
-            downsample_reduction=self.downsample_reduction,
-            wrench_frame=self.wrench_frame,
-            dtype=self.dtype,
-            transformation=self.transformation,
-            load_cache=self.load_cache,
-            contribute_mode=self.contribute_mode,
-            clean_if_error=self.clean_if_error,
-        )
-        datasets.append(drawing_dataset_line)
-        drawing_dataset_one_dir = BubbleDrawingDataset(
-            data_name=os.path.join(self.data_dir, 'drawing_data_line'),
-            downsample_factor_x=self.downsample_factor_x,
-            downsample_factor_y=self.downsample_factor_y,
-            downsample_reduction=self.downsample_reduction,
-            wrench_frame=self.wrench_frame,
-            dtype=self.dtype,
-            transformation=self.transformation,
-            load_cache=self.load_cache,
-            contribute_mode=self.contribute_mode,
-            clean_if_error=self.clean_if_error,
-        )
-        datasets.append(drawing_dataset_one_dir)
-        pivoting_dataset = BubblePivotingDownsampledDataset(
-            data_name=os.path.join(self.data_dir, 'bubble_pivoting_data'),
-            downsample_factor_x=self.downsample_factor_x,
-            downsample_factor_y=self.downsample_factor_y,
-            downsample_reduction=self.downsample_reduction,
-            wrench_frame=self.wrench_frame,
-            dtype=self.dtype,
-            transformation=self.transformation,
-            load_cache=self.load_cache,
-            contribute_mode=self.contribute_mode,
-            clean_if_error=self.clean_if_error,
-        )
-        datasets.append(pivoting_dataset)
-        pivoting_dataset_wide_rot = BubblePivotingDownsampledDataset(
-            data_name=os.path.join(self.data_dir, 'bubble_pivoting_data_wide_rotations'),
-            downsample_factor_x=self.downsample_factor_x,
-            downsample_factor_y=self.downsample_factor_y,
-            downsample_reduction=self.downsample_reduction,
-            wrench_frame=self.wrench_frame,
-            dtype=self.dtype,
-            transformation=self.transformation,
-            load_cache=self.load_cache,
-            contribute_mode=self.contribute_mode,
-            clean_if_error=self.clean_if_error,
-        )
-        datasets.append(pivoting_dataset_wide_rot)
+        dataset_specs = self._get_dataset_specs()
+        if self.num_workers > 0:
+            datasets = build_datasets_in_parallel(dataset_specs, num_workers=self.num_workers, processing_chunk_size=self.processing_chunk_size)
+        else:
+            datasets = [dataset_cls(**dataset_kwargs) for dataset_cls, dataset_kwargs in dataset_specs]
 
         # Make them combined datasets:
         combined_datasets = [BubbleImprintCombinedDatasetWrapper(dataset) for dataset in datasets]
         return combined_datasets
 
-
 if __name__ == '__main__':
     from collections import defaultdict
     from bubble_control.bubble_learning.aux.visualization_utils.image_grid import save_grid, get_imprint_grid, get_batched_image_grid
@@ -2,6 +2,9 @@ import torch
 import torch.nn as nn
 
 from bubble_control.bubble_learning.models.old.bubble_dynamics_residual_model import BubbleDynamicsResidualModel
+from bubble_control.bubble_learning.aux.async_image_logger import AsyncImageLogger, ImageLoggingPolicy
+from bubble_control.bubble_learning.aux.visualization_utils.image_grid import get_imprint_grid
+from bubble_control.aux.profiling import profiled
 
 
 class BubbleAutoEncoderModel(BubbleDynamicsResidualModel):
@@ -10,6 +13,7 @@ class BubbleAutoEncoderModel(BubbleDynamicsResidualModel):
         self.reconstruct_key = reconstruct_key
         super().__init__(*args, **kwargs)
         self.batch_norm = nn.BatchNorm2d(2)
+        self.image_logger = AsyncImageLogger(policies=self._get_image_logging_policies())
         self.save_hyperparameters() # Important! Every model extension must add this line!
 
     @classmethod
@@ -72,24 +76,46 @@ class BubbleAutoEncoderModel(BubbleDynamicsResidualModel):
         self.log('{}_batch'.format(phase), batch_idx)
         self.log('{}_loss'.format(phase), loss)
         # add image:
-        if batch_idx == 0:
-            reconstructed_grid = self._get_image_grid(imprint_rec*torch.max(imprint_rec)/torch.max(imprint_t))
-            gth_grid = self._get_image_grid(imprint_t)
-            self.logger.experiment.add_image('{}_reconstructed_{}'.format(self.reconstruct_key, phase), reconstructed_grid, self.global_step)
-            denorm_rec_imprint = self._denorm_imprint(imprint_rec)
-            denorm_rec_grid = self._get_image_grid(denorm_rec_imprint*torch.max(denorm_rec_imprint)/torch.max(imprint))
-            self.logger.experiment.add_image('{}_denorm_reconstructed_{}'.format(self.reconstruct_key, phase), denorm_rec_grid, self.global_step)
-            if self.current_epoch == 0:
-                self.logger.experiment.add_image('{}_gth_{}'.format(self.reconstruct_key, phase), gth_grid, self.global_step)
-                denorm_imprint = self._denorm_imprint(imprint_t)
-                self.logger.experiment.add_image('{}_unnorm_gth_{}'.format(self.reconstruct_key, phase), self._get_image_grid(denorm_imprint), self.global_step)
-                self.logger.experiment.add_image('{}_original_gth_{}'.format(self.reconstruct_key, phase), self._get_image_grid(imprint), self.global_step)
+        self._log_reconstruction_images(imprint, imprint_t, imprint_rec, batch_idx=batch_idx, phase=phase)
         return loss
 
+    def _get_image_logging_policies(self):
+        # ground truth images do not change, so log them only once
+        policies = {
+            '{}_reconstructed'.format(self.reconstruct_key): ImageLoggingPolicy(first_batch_only=True),
+            '{}_denorm_reconstructed'.format(self.reconstruct_key): ImageLoggingPolicy(first_batch_only=True),
+            '{}_gth'.format(self.reconstruct_key): ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+            '{}_unnorm_gth'.format(self.reconstruct_key): ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+            '{}_original_gth'.format(self.reconstruct_key): ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+        }
+        return policies
+
+    def _log_reconstruction_images(self, imprint, imprint_t, imprint_rec, batch_idx, phase):
+        if not self.image_logger.should_log('{}_reconstructed'.format(self.reconstruct_key), batch_idx=batch_idx, epoch=self.current_epoch, global_step=self.global_step):
+            return
+        with torch.no_grad():
+            # Rescale so they are in the same range. The grids are rendered on the background
+            images = {
+                'reconstructed': imprint_rec*torch.max(imprint_rec)/torch.max(imprint_t),
+                'gth': imprint_t,
+            }
+            denorm_rec_imprint = self._denorm_imprint(imprint_rec)
+            images['denorm_reconstructed'] = denorm_rec_imprint*torch.max(denorm_rec_imprint)/torch.max(imprint)
+            if self.image_logger.should_log('{}_gth'.format(self.reconstruct_key), batch_idx=batch_idx, epoch=self.current_epoch, global_step=self.global_step):
+                images['unnorm_gth'] = self._denorm_imprint(imprint_t)
+                images['original_gth'] = imprint
+        for image_name, image in images.items():
+            self.image_logger.log_model_image(self, '{}_{}'.format(self.reconstruct_key, image_name), phase, get_imprint_grid, {'batched_imprints': image}, batch_idx=batch_idx)
+
+    def on_fit_end(self):
+        self.image_logger.flush()
+
+    @profiled('train/training_step')
     def training_step(self, train_batch, batch_idx):
         loss = self._step(train_batch, batch_idx, phase='train')
         return loss
 
+    @profiled('train/validation_step')
     def validation_step(self, val_batch, batch_idx):
         loss = self._step(val_batch, batch_idx, phase='val')
         return loss
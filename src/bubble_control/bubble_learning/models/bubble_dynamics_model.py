@@ -2,8 +2,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import pytorch_lightning as pl
-import matplotlib.pyplot as plt
-from matplotlib import cm
 import torchvision
 import numpy as np
 import os
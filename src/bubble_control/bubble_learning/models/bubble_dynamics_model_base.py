@@ -5,8 +5,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import pytorch_lightning as pl
-import matplotlib.pyplot as plt
-from matplotlib import cm
 import torchvision
 import abc
 
@@ -15,10 +13,12 @@ from bubble_control.bubble_learning.models.aux.fc_module import FCModule
 from bubble_control.bubble_learning.models.aux.img_encoder import ImageEncoder
 from bubble_control.bubble_learning.models.aux.img_decoder import ImageDecoder
 from bubble_control.bubble_learning.models.bubble_autoencoder import BubbleAutoEncoderModel
+from bubble_control.bubble_learning.aux.model_bundle import get_bundled_submodel
 from bubble_control.bubble_learning.models.pointnet.pointnet_loading_utils import get_pretrained_pointnet2_object_embeding
 from bubble_control.bubble_learning.models.pointnet.pointnet_object_embedding import PointNetObjectEmbedding
 from bubble_control.bubble_learning.models.dynamics_model_base import DynamicsModelBase
 from bubble_control.bubble_learning.aux.visualization_utils.image_grid import get_batched_image_grid, get_imprint_grid
+from bubble_control.bubble_learning.aux.async_image_logger import ImageLoggingPolicy
 
 
 class BubbleDynamicsModelBase(DynamicsModelBase):
@@ -71,6 +71,10 @@ class BubbleDynamicsModelBase(DynamicsModelBase):
     # Loading Functionalities: -----------------------------------------------------------------------------------------
 
     def _load_autoencoder(self, load_version, data_path, load_epoch=None, load_step=None):
+        bundled_autoencoder = get_bundled_submodel('autoencoder')
+        if bundled_autoencoder is not None:
+            # loading from a model bundle, which already contains the autoencoder
+            return bundled_autoencoder
         Model = BubbleAutoEncoderModel
         model_name = Model.get_name()
         if load_epoch is None or load_step is None:
@@ -90,18 +94,23 @@ class BubbleDynamicsModelBase(DynamicsModelBase):
 
     # AUX Functions: ---------------------------------------------------------------------------------------------------
 
+    def _get_image_logging_policies(self):
+        # ground truth images do not change, so log them only once
+        policies = {
+            'init_imprint': ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+            'next_imprint_gt': ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+            'next_imprint_predicted': ImageLoggingPolicy(first_batch_only=True),
+        }
+        return policies
+
     def _log_imprints(self, batch, model_output, batch_idx, phase):
         imprint_t = batch['init_imprint'][:self.num_imprints_to_log]
         imprint_next = batch['final_imprint'][:self.num_imprints_to_log]
         imprint_indx = self.get_model_output_keys().index('init_imprint')
         imprint_next_rec = model_output[imprint_indx][:self.num_imprints_to_log]
-        predicted_grid = get_imprint_grid(imprint_next_rec * torch.max(imprint_next_rec) / torch.max(
-            imprint_next))  # trasform so they are in the same range
-        gth_grid = get_imprint_grid(imprint_next)
-        if batch_idx == 0:
-            if self.current_epoch == 0:
-                self.logger.experiment.add_image('init_imprint_{}'.format(phase), get_imprint_grid(imprint_t),
-                                                 self.global_step)
-                self.logger.experiment.add_image('next_imprint_gt_{}'.format(phase), gth_grid, self.global_step)
-            self.logger.experiment.add_image('next_imprint_predicted_{}'.format(phase), predicted_grid,
-                                             self.global_step)
+        self.image_logger.log_model_image(self, 'init_imprint', phase, get_imprint_grid, {'batched_imprints': imprint_t}, batch_idx=batch_idx)
+        self.image_logger.log_model_image(self, 'next_imprint_gt', phase, get_imprint_grid, {'batched_imprints': imprint_next}, batch_idx=batch_idx)
+        if self.image_logger.should_log('next_imprint_predicted', batch_idx=batch_idx, epoch=self.current_epoch, global_step=self.global_step):
+            # trasform so they are in the same range
+            imprint_next_rec_scaled = imprint_next_rec * torch.max(imprint_next_rec) / torch.max(imprint_next)
+            self.image_logger.log_model_image(self, 'next_imprint_predicted', phase, get_imprint_grid, {'batched_imprints': imprint_next_rec_scaled}, batch_idx=batch_idx)
@@ -5,8 +5,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import pytorch_lightning as pl
-import matplotlib.pyplot as plt
-from matplotlib import cm
 import torchvision
 import abc
 
@@ -17,12 +15,14 @@ from bubble_control.bubble_learning.models.bubble_autoencoder import BubbleAutoE
 from bubble_control.bubble_learning.models.pointnet.pointnet_loading_utils import \
     get_pretrained_pointnet2_object_embeding
 from bubble_control.bubble_learning.models.pointnet.pointnet_object_embedding import PointNetObjectEmbedding
+from bubble_control.bubble_learning.aux.async_image_logger import AsyncImageLogger
+from bubble_control.aux.profiling import profiled
 
 
 class DynamicsModelBase(pl.LightningModule):
     def __init__(self, input_sizes, object_embedding_size=10, num_fcs=2, fc_h_dim=100,
                  skip_layers=None, lr=1e-4, dataset_params=None, load_norm=False, activation='relu',
-                 freeze_object_module=True):
+                 freeze_object_module=True, cache_object_embedding=True):
         super().__init__()
         self.input_sizes = input_sizes
         self.object_embedding_size = object_embedding_size
@@ -34,11 +34,13 @@ class DynamicsModelBase(pl.LightningModule):
         self.activation = activation
         self.load_norm = load_norm
         self.freeze_object_module = freeze_object_module
+        self.cache_object_embedding = cache_object_embedding # reuse the frozen pointnet features of repeated object models
 
         self.object_embedding_module = self._load_object_embedding_module(
-            object_embedding_size=self.object_embedding_size, freeze=self.freeze_object_module)
+            object_embedding_size=self.object_embedding_size, freeze=self.freeze_object_module, cache=self.cache_object_embedding)
 
         self.mse_loss = nn.MSELoss()
+        self.image_logger = AsyncImageLogger(policies=self._get_image_logging_policies())
 
         self.save_hyperparameters()  # Important! Every model extension must add this line!
 
@@ -54,6 +56,13 @@ class DynamicsModelBase(pl.LightningModule):
     def forward(self, input):
         pass
 
+    def _get_image_logging_policies(self):
+        # Override to set when each logged image is rendered. By default, only on the first batch of each epoch.
+        return {}
+
+    def on_fit_end(self):
+        self.image_logger.flush()
+
     @abc.abstractmethod
     def _get_dyn_model(self):
         pass
@@ -89,10 +98,12 @@ class DynamicsModelBase(pl.LightningModule):
     def _get_dyn_output_size(self, sizes):
         pass
 
+    @profiled('train/training_step')
     def training_step(self, train_batch, batch_idx):
         loss = self._step(train_batch, batch_idx, phase='train')
         return loss
 
+    @profiled('train/validation_step')
     def validation_step(self, val_batch, batch_idx):
         loss = self._step(val_batch, batch_idx, phase='val')
         return loss
@@ -140,8 +151,8 @@ class DynamicsModelBase(pl.LightningModule):
 
     # Loading Functionalities: -----------------------------------------------------------------------------------------
 
-    def _load_object_embedding_module(self, object_embedding_size, freeze=True):
-        pointnet_model = PointNetObjectEmbedding(obj_embedding_size=object_embedding_size, freeze_pointnet=freeze)
+    def _load_object_embedding_module(self, object_embedding_size, freeze=True, cache=True):
+        pointnet_model = PointNetObjectEmbedding(obj_embedding_size=object_embedding_size, freeze_pointnet=freeze, cache_features=cache)
         # Expected input shape (BatchSize, NumPoints, NumChannels), where NumChannels=3 (xyz)
         return pointnet_model
 
@@ -2,23 +2,26 @@ import numpy as np
 import os
 import torch
 import torch.nn as nn
-import cv2
 import torch.nn.functional as F
 import pytorch_lightning as pl
 import abc
 import torchvision
 import pytorch3d.transforms as batched_trs
-import tf.transformations as tr
-from matplotlib import cm
 
 
 from bubble_control.bubble_learning.models.bubble_autoencoder import BubbleAutoEncoderModel
+from bubble_control.bubble_learning.aux.model_bundle import get_bundled_submodel
 from bubble_control.bubble_learning.models.aux.fc_module import FCModule
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
 from bubble_control.aux.load_confs import load_object_models
 from bubble_control.bubble_learning.aux.pose_loss import PoseLoss
 from bubble_control.bubble_learning.aux.visualization_utils.image_grid import get_imprint_grid, get_batched_image_grid
 from bubble_control.bubble_learning.aux.visualization_utils.pose_visualization import get_object_pose_images_grid
+from bubble_control.bubble_learning.aux.async_image_logger import AsyncImageLogger, ImageLoggingPolicy
+from bubble_control.aux.lazy_imports import lazy_import
+from bubble_control.aux.profiling import profiled
+
+tr = lazy_import('tf.transformations')
 
 
 class ICPApproximationModel(pl.LightningModule):
@@ -46,6 +49,7 @@ class ICPApproximationModel(pl.LightningModule):
         self.autoencoder.freeze()
         self.img_embedding_size = self.autoencoder.img_embedding_size  # load it from the autoencoder
         self.pose_estimation_network = self._get_pose_estimation_network()
+        self.image_logger = AsyncImageLogger(policies=self._get_image_logging_policies())
 
         self.save_hyperparameters()  # Important! Every model extension must add this line!
 
@@ -97,7 +101,7 @@ class ICPApproximationModel(pl.LightningModule):
         if self.autoencoder_augmentation:
             augmented_model_output = self.augmented_forward(*model_input)
             self._log_object_pose_images(obj_pose_pred=augmented_model_output[:self.num_to_log],
-                                         obj_pose_gth=ground_truth[0][:self.num_to_log], phase='augmented_{}'.format(phase))
+                                         obj_pose_gth=ground_truth[0][:self.num_to_log], phase='augmented_{}'.format(phase), batch_idx=batch_idx)
             augmented_loss = self._compute_loss(augmented_model_output, *ground_truth)
             self.log('{}_loss_original'.format(phase), loss)
             self.log('{}_loss_augmented'.format(phase), augmented_loss)
@@ -106,7 +110,7 @@ class ICPApproximationModel(pl.LightningModule):
         # Log the results: -------------------------
         self.log('{}_batch'.format(phase), batch_idx)
         self.log('{}_loss'.format(phase), loss)
-        self._log_object_pose_images(obj_pose_pred=model_output[:self.num_to_log], obj_pose_gth=ground_truth[0][:self.num_to_log], phase=phase)
+        self._log_object_pose_images(obj_pose_pred=model_output[:self.num_to_log], obj_pose_gth=ground_truth[0][:self.num_to_log], phase=phase, batch_idx=batch_idx)
         self._log_imprint(batch, batch_idx=batch_idx, phase=phase)
         return loss
 
@@ -126,10 +130,12 @@ class ICPApproximationModel(pl.LightningModule):
         output_keys = ['object_pose']
         return output_keys
 
+    @profiled('train/training_step')
     def training_step(self, train_batch, batch_idx):
         loss = self._step(train_batch, batch_idx, phase='train')
         return loss
 
+    @profiled('train/validation_step')
     def validation_step(self, val_batch, batch_idx):
         loss = self._step(val_batch, batch_idx, phase='val')
         return loss
@@ -170,6 +176,10 @@ class ICPApproximationModel(pl.LightningModule):
     # AUX FUCTIONS -----------------------------------------------------------------------------------------------------
 
     def _load_autoencoder(self, load_version, data_path, load_epoch=None, load_step=None):
+        bundled_autoencoder = get_bundled_submodel('autoencoder')
+        if bundled_autoencoder is not None:
+            # loading from a model bundle, which already contains the autoencoder
+            return bundled_autoencoder
         Model = BubbleAutoEncoderModel
         model_name = Model.get_name()
         if load_epoch is None or load_step is None:
@@ -186,19 +196,28 @@ class ICPApproximationModel(pl.LightningModule):
 
         return model
 
+    def _get_image_logging_policies(self):
+        policies = {
+            'imprint': ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+            'imprint_reconstructed': ImageLoggingPolicy(first_batch_only=True, first_epoch_only=True),
+            'pose_estimation': ImageLoggingPolicy(first_batch_only=True),
+        }
+        return policies
+
     def _log_imprint(self, batch, batch_idx, phase):
-        if self.current_epoch == 0 and batch_idx == 0:
-            imprint_t = batch['imprint'][:self.num_to_log]
-            self.logger.experiment.add_image('imprint_{}'.format(phase), get_imprint_grid(imprint_t),
-                                             self.global_step)
-            if self.autoencoder_augmentation:
+        imprint_t = batch['imprint'][:self.num_to_log]
+        self.image_logger.log_model_image(self, 'imprint', phase, get_imprint_grid, {'batched_imprints': imprint_t}, batch_idx=batch_idx)
+        if self.autoencoder_augmentation and self.image_logger.should_log('imprint_reconstructed', batch_idx=batch_idx, epoch=self.current_epoch, global_step=self.global_step):
+            with torch.no_grad():
                 reconstructed_imprint_t = self.autoencoder.decode(self.autoencoder.encode(imprint_t))
-                self.logger.experiment.add_image('imprint_reconstructed_{}'.format(phase),
-                                                 get_imprint_grid(reconstructed_imprint_t), self.global_step)
+            self.image_logger.log_model_image(self, 'imprint_reconstructed', phase, get_imprint_grid, {'batched_imprints': reconstructed_imprint_t}, batch_idx=batch_idx)
+
+    def _log_object_pose_images(self, obj_pose_pred, obj_pose_gth, phase, batch_idx=0):
+        render_args = {'obj_pose_pred': obj_pose_pred, 'obj_pose_gth': obj_pose_gth, 'plane_normal': self.plane_normal}
+        self.image_logger.log_model_image(self, 'pose_estimation', phase, get_object_pose_images_grid, render_args, batch_idx=batch_idx)
 
-    def _log_object_pose_images(self, obj_pose_pred, obj_pose_gth, phase):
-        grid = get_object_pose_images_grid(obj_pose_pred, obj_pose_gth, self.plane_normal)
-        self.logger.experiment.add_image('pose_estimation_{}'.format(phase), grid, self.global_step)
+    def on_fit_end(self):
+        self.image_logger.flush()
 
 
 class FakeICPApproximationModel(nn.Module):
@@ -2,13 +2,10 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import pytorch_lightning as pl
-import matplotlib.pyplot as plt
-from matplotlib import cm
 import torchvision
 import numpy as np
 import os
 import sys
-import cv2
 import pytorch3d.transforms as batched_trs
 
 from bubble_control.bubble_learning.models.aux.fc_module import FCModule
@@ -19,6 +16,7 @@ from bubble_control.bubble_learning.models.dynamics_model_base import DynamicsMo
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
 from bubble_control.bubble_learning.aux.pose_loss import ModelPoseLoss
 from bubble_control.bubble_learning.aux.visualization_utils.pose_visualization import get_object_pose_images_grid, get_angle_from_axis_angle
+from bubble_control.bubble_learning.aux.async_image_logger import ImageLoggingPolicy
 
 
 class ObjectPoseDynamicsModel(DynamicsModelBase):
@@ -128,10 +126,16 @@ class ObjectPoseDynamicsModel(DynamicsModelBase):
         self.log('{}_batch'.format(phase), batch_idx)
         self.log('{}_loss'.format(phase), loss)
         # Log the images: -------------------------
-        self._log_object_pose_images(obj_pose_pred=model_output[0][:self.num_to_log], obj_pose_gth=ground_truth[0][:self.num_to_log], phase=phase)
+        self._log_object_pose_images(obj_pose_pred=model_output[0][:self.num_to_log], obj_pose_gth=ground_truth[0][:self.num_to_log], phase=phase, batch_idx=batch_idx)
         return loss
 
-    def _log_object_pose_images(self, obj_pose_pred, obj_pose_gth, phase):
-        grid = get_object_pose_images_grid(obj_pose_pred, obj_pose_gth, self.plane_normal)
-        self.logger.experiment.add_image('pose_estimation_{}'.format(phase), grid, self.global_step)
+    def _get_image_logging_policies(self):
+        policies = {
+            'pose_estimation': ImageLoggingPolicy(first_batch_only=True),
+        }
+        return policies
+
+    def _log_object_pose_images(self, obj_pose_pred, obj_pose_gth, phase, batch_idx=0):
+        render_args = {'obj_pose_pred': obj_pose_pred, 'obj_pose_gth': obj_pose_gth, 'plane_normal': self.plane_normal}
+        self.image_logger.log_model_image(self, 'pose_estimation', phase, get_object_pose_images_grid, render_args, batch_idx=batch_idx)
 
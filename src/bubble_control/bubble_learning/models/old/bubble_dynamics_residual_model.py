@@ -1,11 +1,7 @@
-import pdb
-
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import pytorch_lightning as pl
-import matplotlib.pyplot as plt
-from matplotlib import cm
 import torchvision
 import numpy as np
 import os
@@ -14,6 +10,9 @@ import sys
 from bubble_control.bubble_learning.models.aux.fc_module import FCModule
 from bubble_control.bubble_learning.models.aux.img_encoder import ImageEncoder
 from bubble_control.bubble_learning.models.aux.img_decoder import ImageDecoder
+from bubble_control.aux.lazy_imports import lazy_import
+
+cm = lazy_import('matplotlib.cm')
 
 
 class BubbleDynamicsResidualModel(pl.LightningModule):
@@ -2,21 +2,28 @@
 import torch.nn as nn
 import torch.nn.functional as F
 from bubble_control.bubble_learning.models.pointnet.pointnet2_utils import PointNetSetAbstractionMsg, PointNetSetAbstraction
+from bubble_control.bubble_learning.models.pointnet.pointnet_cache import ContentHashCache
 
 class PointNet2ClsBase(nn.Module):
 
-    def __init__(self, normal_channel=True):
+    def __init__(self, normal_channel=True, deterministic_fps=False, cache_sampling=False):
         """
         NOTE: The input pointcloud must have more than 128 points.
         Args:
             normal_channel:
+            deterministic_fps: <bool> use deterministic farthest point sampling, so the same cloud is always grouped the same way.
+            cache_sampling: <bool> reuse the sampling and grouping indices of the clouds already seen (keyed by the cloud content).
+                Useful for static object models that are repeated across batches. It implies deterministic_fps.
         """
         super().__init__()
         in_channel = 3 if normal_channel else 0
         self.normal_channel = normal_channel
+        self.deterministic_fps = deterministic_fps or cache_sampling
+        self.sampling_cache = ContentHashCache() if cache_sampling else None
+        sa_kwargs = {'deterministic_fps': self.deterministic_fps, 'sampling_cache': self.sampling_cache}
         #  npoint, radius_list, nsample_list, in_channel, mlp_list
-        self.sa1 = PointNetSetAbstractionMsg(512, [0.1, 0.2, 0.4], [16, 32, 128], in_channel, [[32, 32, 64], [64, 64, 128], [64, 96, 128]])
-        self.sa2 = PointNetSetAbstractionMsg(128, [0.2, 0.4, 0.8], [32, 64, 128], 320, [[64, 64, 128], [128, 128, 256], [128, 128, 256]])
+        self.sa1 = PointNetSetAbstractionMsg(512, [0.1, 0.2, 0.4], [16, 32, 128], in_channel, [[32, 32, 64], [64, 64, 128], [64, 96, 128]], **sa_kwargs)
+        self.sa2 = PointNetSetAbstractionMsg(128, [0.2, 0.4, 0.8], [32, 64, 128], 320, [[64, 64, 128], [128, 128, 256], [128, 128, 256]], **sa_kwargs)
         self.sa3 = PointNetSetAbstraction(None, None, None, 640 + 3, [256, 512, 1024], True)
         self.fc1 = nn.Linear(1024, 512)
         self.bn1 = nn.BatchNorm1d(512)
@@ -51,8 +58,8 @@ class PointNet2ClsBase(nn.Module):
 
 
 class PointNet2ClsMsg(PointNet2ClsBase):
-    def __init__(self, num_class, normal_channel=True):
-        super().__init__(normal_channel=normal_channel)
+    def __init__(self, num_class, normal_channel=True, deterministic_fps=False, cache_sampling=False):
+        super().__init__(normal_channel=normal_channel, deterministic_fps=deterministic_fps, cache_sampling=cache_sampling)
         self.fc3 = nn.Linear(256, num_class)
 
     def forward(self, xyz):
@@ -67,9 +74,9 @@ class PointNet2ClsMsg(PointNet2ClsBase):
 
 
 class PointNet2ObjectEmbedding(PointNet2ClsBase):
-    def __init__(self, obj_embedding_size, normal_channel=True):
+    def __init__(self, obj_embedding_size, normal_channel=True, deterministic_fps=False, cache_sampling=False):
         self.obj_embedding_size = obj_embedding_size
-        super().__init__(normal_channel=normal_channel)
+        super().__init__(normal_channel=normal_channel, deterministic_fps=deterministic_fps, cache_sampling=cache_sampling)
         self.embedding_fc = nn.Linear(256, self.obj_embedding_size)
 
     def forward(self, xyz):
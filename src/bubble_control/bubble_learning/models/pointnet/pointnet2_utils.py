@@ -61,11 +61,13 @@ def index_points(points, idx):
     return new_points
 
 
-def farthest_point_sample(xyz, npoint):
+def farthest_point_sample(xyz, npoint, deterministic=False):
     """
     Input:
         xyz: pointcloud data, [B, N, 3]
         npoint: number of samples
+        deterministic: if True, start from the point farthest from the centroid instead of a random point,
+            so the same cloud always gets the same samples (required to cache them).
     Return:
         centroids: sampled pointcloud index, [B, npoint]
     """
@@ -73,7 +75,10 @@ def farthest_point_sample(xyz, npoint):
     B, N, C = xyz.shape
     centroids = torch.zeros(B, npoint, dtype=torch.long).to(device)
     distance = torch.ones(B, N).to(device) * 1e10
-    farthest = torch.randint(0, N, (B,), dtype=torch.long).to(device)
+    if deterministic:
+        farthest = torch.max(torch.sum((xyz - xyz.mean(dim=1, keepdim=True)) ** 2, -1), -1)[1]
+    else:
+        farthest = torch.randint(0, N, (B,), dtype=torch.long).to(device)
     batch_indices = torch.arange(B, dtype=torch.long).to(device)
     for i in range(npoint):
         centroids[:, i] = farthest
@@ -108,7 +113,34 @@ def query_ball_point(radius, nsample, xyz, new_xyz):
     return group_idx
 
 
-def sample_and_group(npoint, radius, nsample, xyz, points, returnfps=False):
+def cached_farthest_point_sample(xyz, npoint, cache=None, deterministic=False):
+    """
+    Farthest point sampling reusing the indices of the clouds already sampled (e.g. static object models).
+    Input:
+        xyz: pointcloud data, [B, N, 3]
+        npoint: number of samples
+        cache: ContentHashCache. If None, no caching is done.
+        deterministic: see farthest_point_sample. Caching implies deterministic sampling.
+    Return:
+        centroids: sampled pointcloud index, [B, npoint]
+    """
+    if cache is None:
+        return farthest_point_sample(xyz, npoint, deterministic=deterministic)
+    fps_fn = lambda xyz_i: farthest_point_sample(xyz_i, npoint, deterministic=True)
+    return cache.batched_call(fps_fn, xyz, key_prefix=('fps', npoint))
+
+
+def cached_query_ball_point(radius, nsample, xyz, new_xyz, cache=None):
+    """
+    Same as query_ball_point, reusing the groupings of the (xyz, new_xyz) pairs already queried.
+    """
+    if cache is None:
+        return query_ball_point(radius, nsample, xyz, new_xyz)
+    query_fn = lambda xyz_i, new_xyz_i: query_ball_point(radius, nsample, xyz_i, new_xyz_i)
+    return cache.batched_call(query_fn, xyz, new_xyz, key_prefix=('ball', radius, nsample))
+
+
+def sample_and_group(npoint, radius, nsample, xyz, points, returnfps=False, deterministic=False, cache=None):
     """
     Input:
         npoint:
@@ -116,15 +148,17 @@ def sample_and_group(npoint, radius, nsample, xyz, points, returnfps=False):
         nsample:
         xyz: input points position data, [B, N, 3]
         points: input points data, [B, N, D]
+        deterministic: use deterministic farthest point sampling
+        cache: ContentHashCache to reuse the sampling and grouping indices. If None, no caching is done.
     Return:
         new_xyz: sampled points position data, [B, npoint, nsample, 3]
         new_points: sampled points data, [B, npoint, nsample, 3+D]
     """
     B, N, C = xyz.shape
     S = npoint
-    fps_idx = farthest_point_sample(xyz, npoint) # [B, npoint, C]
+    fps_idx = cached_farthest_point_sample(xyz, npoint, cache=cache, deterministic=deterministic) # [B, npoint, C]
     new_xyz = index_points(xyz, fps_idx)
-    idx = query_ball_point(radius, nsample, xyz, new_xyz)
+    idx = cached_query_ball_point(radius, nsample, xyz, new_xyz, cache=cache)
     grouped_xyz = index_points(xyz, idx) # [B, npoint, nsample, C]
     grouped_xyz_norm = grouped_xyz - new_xyz.view(B, S, 1, C)
 
@@ -160,11 +194,13 @@ def sample_and_group_all(xyz, points):
 
 
 class PointNetSetAbstraction(nn.Module):
-    def __init__(self, npoint, radius, nsample, in_channel, mlp, group_all):
+    def __init__(self, npoint, radius, nsample, in_channel, mlp, group_all, deterministic_fps=False, sampling_cache=None):
         super(PointNetSetAbstraction, self).__init__()
         self.npoint = npoint
         self.radius = radius
         self.nsample = nsample
+        self.deterministic_fps = deterministic_fps
+        self.sampling_cache = sampling_cache # ContentHashCache shared for the sampling and grouping indices
         self.mlp_convs = nn.ModuleList()
         self.mlp_bns = nn.ModuleList()
         last_channel = in_channel
@@ -190,7 +226,8 @@ class PointNetSetAbstraction(nn.Module):
         if self.group_all:
             new_xyz, new_points = sample_and_group_all(xyz, points)
         else:
-            new_xyz, new_points = sample_and_group(self.npoint, self.radius, self.nsample, xyz, points)
+            new_xyz, new_points = sample_and_group(self.npoint, self.radius, self.nsample, xyz, points,
+                                                   deterministic=self.deterministic_fps, cache=self.sampling_cache)
         # new_xyz: sampled points position data, [B, npoint, C]
         # new_points: sampled points data, [B, npoint, nsample, C+D]
         new_points = new_points.permute(0, 3, 2, 1) # [B, C+D, nsample,npoint]
@@ -204,11 +241,13 @@ class PointNetSetAbstraction(nn.Module):
 
 
 class PointNetSetAbstractionMsg(nn.Module):
-    def __init__(self, npoint, radius_list, nsample_list, in_channel, mlp_list):
+    def __init__(self, npoint, radius_list, nsample_list, in_channel, mlp_list, deterministic_fps=False, sampling_cache=None):
         super(PointNetSetAbstractionMsg, self).__init__()
         self.npoint = npoint
         self.radius_list = radius_list
         self.nsample_list = nsample_list
+        self.deterministic_fps = deterministic_fps
+        self.sampling_cache = sampling_cache # ContentHashCache shared for the sampling and grouping indices
         self.conv_blocks = nn.ModuleList()
         self.bn_blocks = nn.ModuleList()
         for i in range(len(mlp_list)):
@@ -237,11 +276,11 @@ class PointNetSetAbstractionMsg(nn.Module):
 
         B, N, C = xyz.shape
         S = self.npoint
-        new_xyz = index_points(xyz, farthest_point_sample(xyz, S))
+        new_xyz = index_points(xyz, cached_farthest_point_sample(xyz, S, cache=self.sampling_cache, deterministic=self.deterministic_fps))
         new_points_list = []
         for i, radius in enumerate(self.radius_list):
             K = self.nsample_list[i]
-            group_idx = query_ball_point(radius, K, xyz, new_xyz)
+            group_idx = cached_query_ball_point(radius, K, xyz, new_xyz, cache=self.sampling_cache)
             grouped_xyz = index_points(xyz, group_idx)
             grouped_xyz -= new_xyz.view(B, S, 1, C)
             if points is not None:
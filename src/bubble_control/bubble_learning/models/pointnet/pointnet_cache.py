@@ -0,0 +1,95 @@
+import hashlib
+from collections import OrderedDict
+import torch
+
+
+def tensor_content_hash(x):
+    """
+    Hash of the tensor values (and shape and dtype). Identical point clouds get the same key.
+    """
+    x_np = x.detach().cpu().contiguous().numpy()
+    hasher = hashlib.sha1()
+    hasher.update(str((tuple(x_np.shape), str(x_np.dtype))).encode())
+    hasher.update(x_np.tobytes())
+    return hasher.hexdigest()
+
+
+def unique_batch_elements(x):
+    """
+    Find the identical elements along the batch dimension (e.g. the same object model repeated across the batch).
+    Args:
+        x: <torch.Tensor> (B, ...)
+    Returns:
+        - unique_x: <torch.Tensor> (U, ...) unique elements
+        - inverse_indxs: <torch.Tensor> (B,) so that unique_x[inverse_indxs] == x
+    """
+    x_flat = x.reshape(x.shape[0], -1)
+    unique_x_flat, inverse_indxs = torch.unique(x_flat, dim=0, return_inverse=True)
+    unique_x = unique_x_flat.reshape(-1, *x.shape[1:])
+    return unique_x, inverse_indxs
+
+
+class ContentHashCache(object):
+    """
+    LRU cache of per-sample results keyed by the content hash of the sample.
+    """
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        self.cache.clear()
+
+    def get(self, key):
+        value = self.cache.get(key, None)
+        if value is None:
+            self.num_misses += 1
+        else:
+            self.num_hits += 1
+            self.cache.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def batched_call(self, fn, x, *other_inputs, key_prefix=()):
+        """
+        Apply fn to the batch x reusing the cached results of the samples already seen.
+        Repeated samples within the batch are only computed once.
+        Args:
+            fn: function taking a batch (U, ...) (and the other_inputs batches) and returning a tensor (U, ...)
+                The result for each sample must only depend on that sample.
+            x: <torch.Tensor> (B, ...) batch used to compute the keys
+            other_inputs: <torch.Tensor> (B, ...) other batched inputs for fn, also part of the key
+            key_prefix: <tuple> additional parameters identifying the call (e.g. the number of points)
+        Returns:
+            - <torch.Tensor> (B, ...) results
+        """
+        if len(other_inputs) > 0:
+            key_input = torch.cat([x.reshape(x.shape[0], -1)] + [oi.reshape(oi.shape[0], -1).to(x.dtype) for oi in other_inputs], dim=-1)
+        else:
+            key_input = x
+        unique_key_input, inverse_indxs = unique_batch_elements(key_input)
+        # representative batch index for each unique element (any of the repeated ones is valid)
+        first_indxs = torch.zeros(unique_key_input.shape[0], dtype=torch.long, device=x.device)
+        first_indxs.scatter_(0, inverse_indxs, torch.arange(x.shape[0], device=x.device))
+        keys = [key_prefix + (tensor_content_hash(uki),) for uki in unique_key_input]
+        results = [self.get(key) for key in keys]
+        missing_indxs = [i for i, r in enumerate(results) if r is None]
+        if len(missing_indxs) > 0:
+            missing_batch_indxs = first_indxs[missing_indxs]
+            missing_results = fn(x[missing_batch_indxs], *[oi[missing_batch_indxs] for oi in other_inputs])
+            for i, result_i in zip(missing_indxs, missing_results):
+                result_i = result_i.detach()
+                self.put(keys[i], result_i)
+                results[i] = result_i
+        unique_results = torch.stack([r.to(x.device) for r in results], dim=0)
+        return unique_results[inverse_indxs]
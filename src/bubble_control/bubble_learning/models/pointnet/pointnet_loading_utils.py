@@ -5,6 +5,7 @@ import torch
 import bubble_control.bubble_learning.models.pointnet as pointnet_pkg
 from bubble_control.bubble_learning.models.pointnet.pointnet2_cls_msg import PointNet2ClsMsg, PointNet2ObjectEmbedding
 from bubble_control.bubble_learning.models.pointnet.pointnet_classifier import PointNetClassifier
+from bubble_control.bubble_learning.aux.model_bundle import is_loading_bundle
 
 
 pointnet_pkg_path = os.path.dirname(os.path.abspath(pointnet_pkg.__file__))
@@ -18,6 +19,9 @@ def get_checkpoints_path():
 def load_pointnet_model(pointnet_model, freeze=False, partial_load=False, pretrained_model_name=None):
     if pretrained_model_name is None:
         pretrained_model_name = pointnet_model.name
+    if is_loading_bundle():
+        # the weights (and which ones are frozen) come with the model bundle
+        return pointnet_model
     checkpoint_name = '{}_best_model.pth'.format(pretrained_model_name)
     checkpoint_path = os.path.join(get_checkpoints_path(), checkpoint_name)
     checkpoint = torch.load(checkpoint_path)
@@ -47,8 +51,8 @@ def get_pretrained_pointnet2_cls_msg_best_model(freeze=False, partial_load=False
     return model
 
 
-def get_pretrained_pointnet2_object_embeding(obj_embedding_size=10, freeze=False):
-    model = PointNet2ObjectEmbedding(obj_embedding_size=obj_embedding_size, normal_channel=False)
+def get_pretrained_pointnet2_object_embeding(obj_embedding_size=10, freeze=False, cache_sampling=False):
+    model = PointNet2ObjectEmbedding(obj_embedding_size=obj_embedding_size, normal_channel=False, cache_sampling=cache_sampling)
     model = load_pointnet_model(model, freeze=freeze, partial_load=True, pretrained_model_name=PointNet2ClsMsg.get_name())
     return model
 
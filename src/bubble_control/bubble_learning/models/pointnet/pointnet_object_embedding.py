@@ -3,23 +3,58 @@ import torch.nn as nn
 
 from bubble_control.bubble_learning.models.pointnet.pointnet_classifier import PointNetClassifier
 from bubble_control.bubble_learning.models.pointnet.pointnet_loading_utils import get_pretrained_pointnet_classifier
+from bubble_control.bubble_learning.models.pointnet.pointnet_cache import ContentHashCache
 
 
 class PointNetObjectEmbedding(nn.Module):
-    def __init__(self, obj_embedding_size, freeze_pointnet=True):
+    def __init__(self, obj_embedding_size, freeze_pointnet=True, cache_features=True):
+        """
+        Args:
+            obj_embedding_size: <int>
+            freeze_pointnet: <bool> do not train the pretrained pointnet
+            cache_features: <bool> reuse the pointnet features of the object models already seen (keyed by the cloud content).
+                The features are only cached while the pointnet is frozen, since otherwise they change. A frozen
+                pointnet is kept in eval mode (also while training), so its features are fixed.
+                The embedding_fc is always applied, so it can still be trained.
+        """
         super().__init__()
         self.obj_embedding_size = obj_embedding_size
         self.pointnet_classifier = get_pretrained_pointnet_classifier(freeze=freeze_pointnet)
         self.embedding_fc = nn.Linear(256, self.obj_embedding_size)
+        self.cache_features = cache_features
+        self.features_cache = ContentHashCache()
 
     def forward(self, x):
+        if self._can_cache_features():
+            x = self.features_cache.batched_call(self._compute_features, x, key_prefix=('pointnet_features',))
+        else:
+            x = self._compute_features(x)
+        out = self.embedding_fc(x)  # Returns a B x 40
+        return out
+
+    def _compute_features(self, x):
         x = x.transpose(-2, -1)  # reshape to (B, K, N)
         x, _, _ = self.pointnet_classifier.base(x)
         # apply cassifier except last linear layer and dropout:
         for i, layer_i in enumerate(self.pointnet_classifier.classifier[:-2]):
             x = layer_i(x)
-        out = self.embedding_fc(x)  # Returns a B x 40
-        return out
+        return x
+
+    def _is_pointnet_frozen(self):
+        return not any(param.requires_grad for param in self.pointnet_classifier.parameters())
+
+    def _can_cache_features(self):
+        return self.cache_features and self._is_pointnet_frozen()
+
+    def train(self, mode=True):
+        super().train(mode)
+        if self._is_pointnet_frozen():
+            # no batchnorm statistics updates nor dropout on the frozen pointnet
+            self.pointnet_classifier.eval()
+        return self
+
+    def clear_cache(self):
+        self.features_cache.clear()
 
 
 # Debug:
@@ -2,27 +2,20 @@ import abc
 import torch
 import numpy as np
 import copy
-import tf.transformations as tr
 import pytorch3d.transforms as batched_trs
+from bubble_control.aux.tf_table import as_tf_table
 
 
 def convert_all_tfs_to_tensors(all_tfs):
     """
-    Convert a DataFrame object containing the tfs with respect a common frame into a dictionary of tensor transformation matrices
-    :param all_tfs: DataFrame
-    :return:
+    Convert the tfs with respect a common frame into a dictionary of transformation matrices
+    :param all_tfs: TfTable or DataFrame. Already converted dicts are returned as a new dict.
+    :return: dict {frame_name: (4, 4) np.ndarray}. The common frame is the identity.
     """
-    # Transform a DF into a dictionary of homogeneous transformations matrices (4x4)
-    converted_all_tfs = {}
-    parent_frame = all_tfs['parent_frame'][0] # Assume that are all teh same
-    child_frames = all_tfs['child_frame']
-    converted_all_tfs[parent_frame] = np.eye(4) # Transformation to itself is the identity
-    all_poses = all_tfs[['x', 'y', 'z', 'qx', 'qy', 'qz', 'qw']]
-    for i, child_frame_i in enumerate(child_frames):
-        pose_i = all_poses.iloc[i]
-        X_i = tr.quaternion_matrix(pose_i[3:])
-        X_i[:3, 3] = pose_i[:3]
-        converted_all_tfs[child_frame_i] = X_i
+    if isinstance(all_tfs, dict):
+        return dict(all_tfs)
+    # The TfTable computes (and keeps) all the matrices at once, so converting the same table again is cheap
+    converted_all_tfs = as_tf_table(all_tfs).to_matrix_dict()
     return converted_all_tfs
 
 
@@ -1,7 +1,12 @@
 import numpy as np
-from bubble_utils.bubble_tools.bubble_img_tools import process_bubble_img
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
+from bubble_control.aux.lazy_imports import lazy_import_from
+from bubble_control.aux.profiling import profiled
+from bubble_control.aux.tf_table import as_tf_table
 
+process_bubble_img = lazy_import_from('bubble_utils.bubble_tools.bubble_img_tools', 'process_bubble_img')
+
+@profiled('control/format_observation_sample')
 def format_observation_sample(obs_sample):
     formatted_obs_sample = {}
     # add imprints: -------
@@ -16,8 +21,9 @@ def format_observation_sample(obs_sample):
                                             obs_sample['wrench'][wrench_indx].wrench.torque.x,
                                             obs_sample['wrench'][wrench_indx].wrench.torque.y,
                                             obs_sample['wrench'][wrench_indx].wrench.torque.z])
-    formatted_obs_sample['init_pos'] = obs_sample['tfs'][obs_sample['tfs']['child_frame'] == 'grasp_frame'][['x','y','z']].values[0]
-    quaternion = obs_sample['tfs'][obs_sample['tfs']['child_frame'] == 'grasp_frame'][['qx','qy','qz','qw']].values[0]
+    tfs = as_tf_table(obs_sample['tfs'])
+    formatted_obs_sample['init_pos'] = tfs.get_position('grasp_frame').copy()
+    quaternion = tfs.get_quat('grasp_frame').copy()
     quat_to_axis = QuaternionToAxis()
     formatted_obs_sample['init_quat'] = quat_to_axis._tr(quaternion)
     formatted_obs_sample['init_object_pose'] = np.array([0, 0, 0, 0, 0, 0])
@@ -31,6 +37,7 @@ def format_observation_sample(obs_sample):
     }
     for k_old, k_new in key_map.items():
         formatted_obs_sample[k_new] = obs_sample[k_old]
+    formatted_obs_sample['all_tfs'] = tfs
     
     # apply the key_map
     return formatted_obs_sample
\ No newline at end of file
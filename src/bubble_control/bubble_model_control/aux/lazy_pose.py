@@ -0,0 +1,163 @@
+import torch
+import pytorch3d.transforms as batched_trs
+
+from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
+
+
+class LazyPose(object):
+    """
+    Batched SE(3) poses that compute each representation only when first accessed and cache it.
+    Representations:
+     - matrix: (..., 4, 4) homogeneous transformation
+     - rotation_matrix: (..., 3, 3)
+     - position: (..., 3)
+     - quat: (..., 4) as [qx, qy, qz, qw]
+     - axis_angle: (..., 3) axis scaled by the angle (same convention as QuaternionToAxis)
+     - pose: (..., 7) as [x, y, z, qx, qy, qz, qw]
+     - axis_angle_pose: (..., 6) as [x, y, z, ax, ay, az]
+    For backward compatibility, indexing and torch functions act on the pose (..., 7) tensor, so code expecting the
+    [x, y, z, qx, qy, qz, qw] tensors keeps working.
+    """
+    def __init__(self, matrix=None, position=None, rotation_matrix=None, quat=None, axis_angle=None):
+        self._matrix = matrix
+        self._position = position
+        self._rotation_matrix = rotation_matrix
+        self._quat = quat
+        self._axis_angle = axis_angle
+        self._pose = None
+        self._axis_angle_pose = None
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        return cls(matrix=matrix)
+
+    @classmethod
+    def from_pose(cls, pose):
+        # pose: (..., 7) as [x, y, z, qx, qy, qz, qw]
+        lazy_pose = cls(position=pose[..., :3], quat=pose[..., 3:])
+        lazy_pose._pose = pose
+        return lazy_pose
+
+    @classmethod
+    def from_axis_angle_pose(cls, axis_angle_pose):
+        # axis_angle_pose: (..., 6) as [x, y, z, ax, ay, az]
+        lazy_pose = cls(position=axis_angle_pose[..., :3], axis_angle=axis_angle_pose[..., 3:])
+        lazy_pose._axis_angle_pose = axis_angle_pose
+        return lazy_pose
+
+    @property
+    def position(self):
+        if self._position is None:
+            self._position = self.matrix[..., :3, 3]
+        return self._position
+
+    @property
+    def rotation_matrix(self):
+        if self._rotation_matrix is None:
+            if self._matrix is not None:
+                self._rotation_matrix = self._matrix[..., :3, :3]
+            else:
+                self._rotation_matrix = batched_trs.quaternion_to_matrix(torch.roll(self.quat, 1, dims=-1)) # batched_trs quat is [qw, qx, qy, qz]
+        return self._rotation_matrix
+
+    @property
+    def quat(self):
+        if self._quat is None:
+            if self._axis_angle is not None:
+                self._quat = QuaternionToAxis._tr_inv(self._axis_angle)
+            else:
+                self._quat = torch.roll(batched_trs.matrix_to_quaternion(self.rotation_matrix), -1, dims=-1) # (qw, qx, qy, qz) -> (qx, qy, qz, qw)
+        return self._quat
+
+    @property
+    def axis_angle(self):
+        if self._axis_angle is None:
+            self._axis_angle = QuaternionToAxis._tr(self.quat)
+        return self._axis_angle
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            rotation_matrix = self.rotation_matrix
+            matrix = torch.zeros(rotation_matrix.shape[:-2] + (4, 4), dtype=rotation_matrix.dtype, device=rotation_matrix.device)
+            matrix[..., :3, :3] = rotation_matrix
+            matrix[..., :3, 3] = self.position
+            matrix[..., 3, 3] = 1
+            self._matrix = matrix
+        return self._matrix
+
+    @property
+    def pose(self):
+        if self._pose is None:
+            self._pose = torch.cat([self.position, self.quat], dim=-1)
+        return self._pose
+
+    @property
+    def axis_angle_pose(self):
+        if self._axis_angle_pose is None:
+            self._axis_angle_pose = torch.cat([self.position, self.axis_angle], dim=-1)
+        return self._axis_angle_pose
+
+    def _any_representation(self):
+        for value in [self._matrix, self._position, self._rotation_matrix, self._quat, self._axis_angle]:
+            if value is not None:
+                return value
+
+    @property
+    def dtype(self):
+        return self._any_representation().dtype
+
+    @property
+    def device(self):
+        return self._any_representation().device
+
+    @property
+    def batch_shape(self):
+        if self._matrix is not None:
+            return self._matrix.shape[:-2]
+        return self._any_representation().shape[:-1]
+
+    # Backward compatibility with the [x, y, z, qx, qy, qz, qw] tensors:
+    @property
+    def shape(self):
+        return self.batch_shape + (7,)
+
+    def __len__(self):
+        return self.batch_shape[0]
+
+    def __getitem__(self, item):
+        return self.pose[item]
+
+    def detach(self):
+        return self.pose.detach()
+
+    def cpu(self):
+        return self.pose.cpu()
+
+    def numpy(self):
+        return self.pose.numpy()
+
+    @classmethod
+    def __torch_function__(cls, func, types, args=(), kwargs=None):
+        if kwargs is None:
+            kwargs = {}
+        args = [_unwrap_lazy_poses(a) for a in args]
+        kwargs = {k: _unwrap_lazy_poses(v) for k, v in kwargs.items()}
+        return func(*args, **kwargs)
+
+
+def _unwrap_lazy_poses(x):
+    if isinstance(x, LazyPose):
+        return x.pose
+    if isinstance(x, (list, tuple)):
+        return type(x)(_unwrap_lazy_poses(xi) for xi in x)
+    return x
+
+
+def as_lazy_pose(poses):
+    """
+    Wrap [x, y, z, qx, qy, qz, qw] pose tensors as a LazyPose. LazyPoses are returned as they are.
+    """
+    if isinstance(poses, LazyPose):
+        return poses
+    return LazyPose.from_pose(poses)
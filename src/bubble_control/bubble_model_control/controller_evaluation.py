@@ -0,0 +1,247 @@
+import time
+import itertools
+import numpy as np
+import pandas as pd
+import torch
+import torch.multiprocessing as mp
+
+from bubble_control.bubble_learning.aux.img_trs.block_downsampling_tr import BlockDownSamplingTr
+from bubble_control.bubble_learning.models.bubble_dynamics_model import BubbleDynamicsModel
+from bubble_control.bubble_learning.models.bubble_linear_dynamics_model import BubbleLinearDynamicsModel
+from bubble_control.bubble_learning.models.object_pose_dynamics_model import ObjectPoseDynamicsModel
+from bubble_control.bubble_learning.aux.load_model import load_model_version
+from bubble_control.bubble_model_control.aux.bubble_dynamics_fixed_model import BubbleDynamicsFixedModel
+from bubble_control.bubble_model_control.aux.format_observation import format_observation_sample
+from bubble_control.bubble_model_control.aux.bubble_model_control_utils import batched_tensor_sample, convert_all_tfs_to_tensors
+from bubble_control.bubble_model_control.model_output_object_pose_estimaton import \
+    BatchedModelOutputObjectPoseEstimation, End2EndModelOutputObjectPoseEstimation, ICPApproximationModelOutputObjectPoseEstimation, homogeneous_pose_to_axis_angle
+from bubble_control.bubble_model_control.controllers.bubble_model_mppi_controler import BubbleModelMPPIController
+from bubble_control.bubble_model_control.drawing_action_models import drawing_action_model_one_dir, drawing_one_dir_grasp_pose_correction
+from bubble_control.bubble_model_control.cost_functions import vertical_tool_cost_function
+
+
+config_keys = ['model_name', 'load_version', 'ope', 'num_samples', 'horizon', 'seed']
+
+
+def get_evaluation_configs(model_names, load_versions, opes, num_samples, horizons, seeds):
+    """
+    Grid of evaluation configurations (one per episode).
+    Args:
+        model_names: list of model names (or 'fixed_model')
+        load_versions: list of checkpoint versions
+        opes: list of object pose estimator names ('icp', 'icp_approx')
+        num_samples: list of MPPI number of samples
+        horizons: list of MPPI horizons
+        seeds: list of seeds. Each seed is a different episode.
+    Returns:
+        - list of dicts with the config_keys
+    """
+    configs = [dict(zip(config_keys, values)) for values in itertools.product(model_names, load_versions, opes, num_samples, horizons, seeds)]
+    return configs
+
+
+def summarize_evaluations(evaluations_df):
+    """
+    Aggregate the episode results over the seeds of each configuration.
+    """
+    group_keys = [k for k in config_keys if k != 'seed']
+    metric_keys = ['Score', 'MeanStepCost', 'MeanStepLatency', 'MaxStepLatency', 'NumSteps']
+    summary = evaluations_df.groupby(group_keys)[metric_keys].agg(['mean', 'std'])
+    summary['NumEpisodes'] = evaluations_df.groupby(group_keys).size()
+    return summary
+
+
+# Worker state. It is set once per process by the pool initializer, so the models are not pickled with every episode.
+_worker_state = {}
+
+
+def _init_worker(harness):
+    torch.set_num_threads(harness.num_threads_per_worker)
+    _worker_state['harness'] = harness
+
+
+def _run_episode_worker(config):
+    harness = _worker_state['harness']
+    return harness.run_episode(config)
+
+
+class ControllerEvaluationHarness(object):
+    """
+    Evaluate a grid of controller configurations on replay (or model-based) environments using a process pool.
+    Models and object pose estimators are loaded once in the main process. Their weights are moved to shared memory,
+    so all workers read the same tensors instead of loading one copy each.
+    Each episode reports the per-step controller latency and cost, and a final score. The score is the cost_function
+    evaluated on the object pose estimated from the final observation (the lower, the better).
+    """
+    def __init__(self, env_fn, model_data_path, max_num_steps=40, num_workers=None, num_threads_per_worker=1,
+                 device='cpu', object_name='marker', imprint_selection='percentile', imprint_percentile=0.005,
+                 noise_sigma_value=.3, cost_function=None, start_method='fork'):
+        """
+        Args:
+            env_fn: picklable function returning a new environment for the given config as env = env_fn(config) (e.g. a ReplayDrawingEnv)
+            model_data_path: <str> path containing tb_logs/{model_name}/version_{version}/...
+            max_num_steps: <int> maximum number of steps per episode
+            num_workers: <int> number of processes. If None, use all cpus. If 0, run the episodes in the main process.
+            num_threads_per_worker: <int> torch threads per worker, to avoid oversubscription
+            device: <str> device for the models. Workers share the models, so 'cpu' is recommended.
+            object_name: <str>
+            imprint_selection, imprint_percentile: parameters for the icp object pose estimation
+            noise_sigma_value: <float> MPPI noise
+            cost_function: controller cost function. By default, the vertical_tool_cost_function.
+            start_method: <str> multiprocessing start method ('fork' or 'spawn')
+        """
+        self.env_fn = env_fn
+        self.model_data_path = model_data_path
+        self.max_num_steps = max_num_steps
+        self.num_workers = num_workers
+        self.num_threads_per_worker = num_threads_per_worker
+        self.device = torch.device(device)
+        self.object_name = object_name
+        self.imprint_selection = imprint_selection
+        self.imprint_percentile = imprint_percentile
+        self.noise_sigma_value = noise_sigma_value
+        self.cost_function = vertical_tool_cost_function if cost_function is None else cost_function
+        self.start_method = start_method
+        self.block_downsample_tr = BlockDownSamplingTr(factor_x=7, factor_y=7, reduction='mean', keys_to_tr=['init_imprint'])
+        self.models = {}
+        self.opes = {}
+
+    def _load_model(self, model_name, load_version):
+        models = [BubbleDynamicsModel, BubbleLinearDynamicsModel, ObjectPoseDynamicsModel]
+        model_names = [m.get_name() for m in models]
+        if model_name in model_names:
+            Model = models[model_names.index(model_name)]
+            model = load_model_version(Model, self.model_data_path, load_version)
+        elif model_name == 'fixed_model':
+            model = BubbleDynamicsFixedModel()
+        else:
+            raise AttributeError('Model name provided {} not supported. We currently support {}. We also support "fixed_model"'.format(model_name, model_names))
+        model.to(self.device)
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad = False
+        model.share_memory()
+        return model
+
+    def _load_ope(self, ope_name):
+        ope_names = ['icp', 'icp_approx']
+        if ope_name == 'icp':
+            ope = BatchedModelOutputObjectPoseEstimation(object_name=self.object_name, factor_x=7, factor_y=7, method='bilinear',
+                                                         device=self.device, imprint_selection=self.imprint_selection,
+                                                         imprint_percentile=self.imprint_percentile)
+        elif ope_name == 'icp_approx':
+            ope = ICPApproximationModelOutputObjectPoseEstimation(model_name='icp_approximation_model', load_version=9, model_data_path=self.model_data_path)
+        else:
+            raise NotImplementedError('Object pose estimation with name key {} NOT implemented yet. Available options: {}'.format(ope_name, ope_names))
+        return ope
+
+    def load(self, configs):
+        # Load every model and object pose estimator once before starting the workers.
+        for config in configs:
+            model_key = (config['model_name'], config['load_version'])
+            if model_key not in self.models:
+                self.models[model_key] = self._load_model(*model_key)
+            if config['ope'] not in self.opes:
+                self.opes[config['ope']] = self._load_ope(config['ope'])
+
+    def _get_controller(self, config, env):
+        model = self.models[(config['model_name'], config['load_version'])]
+        if isinstance(model, ObjectPoseDynamicsModel):
+            # the model predicts directly the object pose, so we do not need to estimate it from the imprints nor correct the grasp pose
+            grasp_pose_correction = None
+            ope = End2EndModelOutputObjectPoseEstimation()
+        else:
+            grasp_pose_correction = drawing_one_dir_grasp_pose_correction
+            ope = self.opes[config['ope']]
+        controller = BubbleModelMPPIController(model, env, ope, self.cost_function,
+                                               action_model=drawing_action_model_one_dir,
+                                               grasp_pose_correction=grasp_pose_correction,
+                                               num_samples=config['num_samples'], horizon=config['horizon'], noise_sigma=None,
+                                               _noise_sigma_value=self.noise_sigma_value)
+        return controller
+
+    def format_raw_observation(self, obs_sample_raw):
+        format_obs = format_observation_sample(obs_sample_raw)
+        downsampled_obs = self.block_downsample_tr(format_obs)
+        return downsampled_obs
+
+    def _estimate_init_object_pose(self, config, obs_sample):
+        # models predicting the object pose need the initial one, estimated from the imprints
+        batched_obs_sample = obs_sample.copy()
+        batched_obs_sample['all_tfs'] = convert_all_tfs_to_tensors(batched_obs_sample['all_tfs'])
+        batched_obs_sample = batched_tensor_sample(batched_obs_sample, batch_size=1)
+        batched_obs_sample['final_imprint'] = batched_obs_sample['init_imprint']
+        gf_X_objpose = self.opes[config['ope']]._estimate_object_pose(batched_obs_sample)
+        init_object_pose = homogeneous_pose_to_axis_angle(gf_X_objpose)[0].detach().cpu().numpy()
+        return init_object_pose
+
+    def _score_observation(self, config, controller, obs_sample_raw):
+        # the object pose is always estimated from the imprints (the end2end estimation needs the model prediction)
+        obs_sample = controller.format_sample_for_pose_estimation(self.format_raw_observation(obs_sample_raw))
+        estimated_pose = self.opes[config['ope']].estimate_pose(obs_sample)
+        actions = torch.zeros((estimated_pose.shape[0], controller.u_max.shape[0]))
+        score = self.cost_function(estimated_pose, obs_sample, obs_sample, actions)
+        return float(torch.as_tensor(score).flatten()[0])
+
+    def run_episode(self, config):
+        """
+        Run a single episode for the given config.
+        Returns:
+            - <dict> config values and the episode metrics
+        """
+        np.random.seed(config['seed'])
+        torch.manual_seed(config['seed'])
+        episode_start_time = time.time()
+        env = self.env_fn(config)
+        controller = self._get_controller(config, env)
+        obs_sample_raw = env.get_observation()
+        step_latencies = []
+        step_costs = []
+        num_steps = 0
+        for step_i in range(self.max_num_steps):
+            obs_sample = self.format_raw_observation(obs_sample_raw)
+            if config['model_name'] == ObjectPoseDynamicsModel.get_name():
+                with torch.no_grad():
+                    obs_sample['init_object_pose'] = self._estimate_init_object_pose(config, obs_sample)
+            controller.actions = None # only keep the rollouts of this step
+            controller.costs = None
+            step_start_time = time.time()
+            with torch.no_grad():
+                action = controller.control(obs_sample)
+            step_latencies.append(time.time() - step_start_time)
+            if controller.costs is not None:
+                step_costs.append(float(torch.min(torch.as_tensor(controller.costs))))
+            obs_sample_raw, reward, done, info = env.step(dict(action))
+            num_steps += 1
+            if done:
+                break
+        with torch.no_grad():
+            score = self._score_observation(config, controller, obs_sample_raw)
+        result = dict(config)
+        result.update({
+            'Score': score,
+            'NumSteps': num_steps,
+            'MeanStepLatency': np.mean(step_latencies),
+            'MaxStepLatency': np.max(step_latencies),
+            'MeanStepCost': np.mean(step_costs) if len(step_costs) > 0 else np.nan,
+            'FinalStepCost': step_costs[-1] if len(step_costs) > 0 else np.nan,
+            'EpisodeTime': time.time() - episode_start_time,
+        })
+        return result
+
+    def run(self, configs):
+        """
+        Run one episode per config in a process pool.
+        Returns:
+            - <pd.DataFrame> one row per episode with the config values and metrics
+        """
+        self.load(configs)
+        if self.num_workers == 0:
+            _init_worker(self)
+            results = [_run_episode_worker(config) for config in configs]
+        else:
+            ctx = mp.get_context(self.start_method)
+            with ctx.Pool(processes=self.num_workers, initializer=_init_worker, initargs=(self,)) as pool:
+                results = pool.map(_run_episode_worker, configs, chunksize=1)
+        evaluations_df = pd.DataFrame(results)
+        return evaluations_df
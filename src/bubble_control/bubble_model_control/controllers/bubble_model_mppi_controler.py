@@ -2,17 +2,15 @@ import abc
 import torch
 import numpy as np
 import copy
-import tf.transformations as tr
-from pytorch_mppi import mppi
 import pytorch3d.transforms as batched_trs
-import matplotlib
-matplotlib.use('Qt5Agg')
-import matplotlib.pyplot as plt
 from bubble_control.bubble_model_control.controllers.bubble_controller_base import BubbleModelController
 from bubble_control.bubble_model_control.aux.bubble_model_control_utils import batched_tensor_sample, get_transformation_matrix, tr_frame, convert_all_tfs_to_tensors
-from bubble_pivoting.pivoting_model_control.aux.pivoting_geometry import get_angle_difference, check_goal_position, get_tool_axis, get_tool_angle_gf
 from bubble_control.bubble_model_control.aux.format_observation import format_observation_sample
-import pdb
+from bubble_control.aux.lazy_imports import lazy_import_from
+from bubble_control.aux.profiling import span, profiled
+
+get_tool_angle_gf = lazy_import_from('bubble_pivoting.pivoting_model_control.aux.pivoting_geometry', 'get_tool_angle_gf') # only used for debugging
+
 
 def to_tensor(x, **kwargs):
     if not torch.is_tensor(x):
@@ -73,6 +71,7 @@ class BubbleModelMPPIController(BubbleModelController):
         self.actions = None
         self.costs = None
         
+    @profiled('mppi/cost')
     def compute_cost(self, state_t, action_t):
         """
         Compute the dynamics
@@ -86,8 +85,10 @@ class BubbleModelMPPIController(BubbleModelController):
         state_samples = self._pack_state_to_sample(states, self.sample)
         prev_state_samples = {'all_tfs': copy.deepcopy(state_samples['all_tfs'])}
         state_samples = self._action_correction(state_samples, actions) # apply the action model
-        estimated_poses = self._estimate_poses(state_samples, actions)
-        costs = self.cost_function(estimated_poses, state_samples, prev_state_samples, actions)
+        with span('mppi/cost/pose_estimation', num_samples=actions.shape[0]):
+            estimated_poses = self._estimate_poses(state_samples, actions)
+        with span('mppi/cost/cost_function'):
+            costs = self.cost_function(estimated_poses, state_samples, prev_state_samples, actions)
         if self.actions is None:
             self.actions = actions
             self.costs = costs
@@ -215,6 +216,7 @@ class BubbleModelMPPIController(BubbleModelController):
                 break
         return self.action_container
 
+    @profiled('mppi/dynamics')
     def dynamics(self, state_t, action_t):
         """
         Compute the dynamics by querying the model
@@ -225,7 +227,8 @@ class BubbleModelMPPIController(BubbleModelController):
         state = self._unpack_state_tensor(state_t)
         action = self._unpack_action_tensor(action_t)
         model_input = self._extract_input_from_state(state)
-        output = self.model(*model_input, action)
+        with span('mppi/dynamics/model', num_samples=action.shape[0]):
+            output = self.model(*model_input, action)
         if self.debug and action.shape[0] < 2:
             self.state_prev = state
             self.prediction = copy.deepcopy([o.detach() for o in output])
@@ -266,6 +269,7 @@ class BubbleModelMPPIController(BubbleModelController):
             self.U_init = self.u_mu.unsqueeze(0).repeat_interleave(self.horizon, dim=0)
 
     def _get_controller(self):
+        from pytorch_mppi import mppi # only required by this controller
         self._init_params()
         controller = mppi.MPPI(self.dynamics, self.compute_cost, self.state_size, self.noise_sigma,
                                lambda_=self.lambda_, device=self.model.device,
@@ -281,7 +285,8 @@ class BubbleModelMPPIController(BubbleModelController):
         self.sample = state_sample
         state = self._unpack_state_sample(state_sample)
         state_t = self._pack_state_to_tensor(state)
-        action = self.controller.command(state_t)
+        with span('mppi/command'):
+            action = self.controller.command(state_t)
         if self.debug:
             self._check_prediction(state_t, action)
         return action
@@ -302,6 +307,9 @@ class BubbleModelMPPIController(BubbleModelController):
         print("Cost of action: ", action_cost)
 
     def visualize_prediction(self, obs_sample_next):
+        import matplotlib
+        matplotlib.use('Qt5Agg') # interactive backend, only needed for this debug visualization
+        import matplotlib.pyplot as plt
         obs_sample_next = self.format_sample_for_pose_estimation(obs_sample_next)
         estimated_pose = self.object_pose_estimator.estimate_pose(obs_sample_next)
         tool_angle_gf = get_tool_angle_gf(estimated_pose, obs_sample_next)
@@ -339,7 +347,7 @@ class BubbleModelMPPIController(BubbleModelController):
 
     def _convert_all_tfs_to_tensors(self, all_tfs):
         """
-        :param all_tfs: DataFrame
+        :param all_tfs: TfTable or DataFrame
         :return:
         """
         converted_all_tfs = convert_all_tfs_to_tensors(all_tfs)
@@ -0,0 +1,34 @@
+from bubble_control.bubble_model_control.controllers.bubble_model_mppi_controler import BubbleModelMPPIController
+from bubble_control.bubble_model_control.controllers.sampling_optimizers import SamplingOptimizer
+
+
+class BubbleModelSamplingController(BubbleModelMPPIController):
+    """
+    Same as BubbleModelMPPIController, but using the in-package SamplingOptimizer instead of pytorch_mppi.
+    It has the same control(state_sample) API, so both can be compared directly.
+    """
+    def __init__(self, *args, method='mppi', num_iterations=1, elite_fraction=1., cem_smoothing=0., time_budget=None, **kwargs):
+        """
+        Args:
+            method: <str> 'mppi' or 'cem'
+            num_iterations: <int> maximum number of refinement iterations per control step
+            elite_fraction: <float> fraction of the best rollouts used in the update
+            cem_smoothing: <float> weight of the previous mean and std in the CEM update
+            time_budget: <float> maximum optimization time [s] per control step. If None, all iterations are done.
+        """
+        self.method = method
+        self.num_iterations = num_iterations
+        self.elite_fraction = elite_fraction
+        self.cem_smoothing = cem_smoothing
+        self.time_budget = time_budget
+        super().__init__(*args, **kwargs)
+
+    def _get_controller(self):
+        self._init_params()
+        controller = SamplingOptimizer(self.dynamics, self.compute_cost, self.state_size, self.noise_sigma,
+                                       lambda_=self.lambda_, device=self.model.device, num_samples=self.num_samples,
+                                       horizon=self.horizon, u_min=self.u_min, u_max=self.u_max, u_init=self.u_mu,
+                                       U_init=self.U_init, method=self.method, num_iterations=self.num_iterations,
+                                       elite_fraction=self.elite_fraction, cem_smoothing=self.cem_smoothing,
+                                       time_budget=self.time_budget, noise_abs_cost=True)
+        return controller
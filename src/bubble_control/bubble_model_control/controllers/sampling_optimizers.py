@@ -0,0 +1,190 @@
+import time
+import torch
+
+
+optimization_methods = ['mppi', 'cem']
+
+
+class SamplingOptimizer(object):
+    """
+    Batched sampling-based trajectory optimizer with MPPI and CEM updates.
+    It follows the pytorch_mppi.MPPI interface (dynamics(state, action), running_cost(state, action) and command(state)),
+    so it can replace it, and adds:
+     - Several refinement iterations per command, optionally using only the elite fraction of the rollouts.
+     - Noise for all the iterations sampled at once into preallocated buffers.
+     - A time budget: no new iteration is started if it would not finish before the deadline.
+     - Static context passed to the dynamics and cost as dynamics(state, action, context), running_cost(state, action, context).
+     - Warm start: the nominal trajectory is shifted one step after each command.
+    """
+    def __init__(self, dynamics, running_cost, nx, noise_sigma, num_samples=100, horizon=15, device='cpu', lambda_=1.,
+                 u_min=None, u_max=None, u_init=None, U_init=None, method='mppi', num_iterations=1, elite_fraction=1.,
+                 cem_smoothing=0., cem_min_std=1e-3, time_budget=None, noise_abs_cost=False, dtype=torch.float32):
+        """
+        Args:
+            dynamics: function returning the next state (K, nx) as dynamics(state (K, nx), action (K, nu)[, context])
+            running_cost: function returning the cost (K,) as running_cost(next_state (K, nx), action (K, nu)[, context])
+            nx: <int> state size
+            noise_sigma: (nu, nu) noise covariance
+            num_samples: <int> number of rollouts (K)
+            horizon: <int> number of steps (T)
+            device: torch device
+            lambda_: <float> MPPI temperature
+            u_min, u_max: (nu,) action limits
+            u_init: (nu,) action used to fill the end of the nominal trajectory after shifting
+            U_init: (T, nu) initial nominal trajectory
+            method: <str> 'mppi' (cost weighted average) or 'cem' (elite mean and std)
+            num_iterations: <int> maximum number of refinement iterations per command
+            elite_fraction: <float> fraction of the best rollouts used in the update. For MPPI, 1 uses all of them.
+            cem_smoothing: <float> in [0, 1). Weight of the previous mean and std in the CEM update.
+            cem_min_std: <float> minimum CEM std to avoid collapsing
+            time_budget: <float> maximum time [s] per command. If None, all iterations are done.
+            noise_abs_cost: <bool> use the absolute value of the noise for the MPPI perturbation cost (as pytorch_mppi)
+            dtype: torch dtype
+        """
+        if method not in optimization_methods:
+            raise NotImplementedError('Optimization method {} not implemented yet. Available options: {}'.format(method, optimization_methods))
+        self.dynamics = dynamics
+        self.running_cost = running_cost
+        self.nx = nx
+        self.device = torch.device(device) if device is not None else torch.device('cpu')
+        self.dtype = dtype
+        self.noise_sigma = torch.as_tensor(noise_sigma, device=self.device, dtype=self.dtype)
+        self.nu = self.noise_sigma.shape[0]
+        self.noise_sigma_inv = torch.inverse(self.noise_sigma)
+        self.noise_scale_tril = torch.linalg.cholesky(self.noise_sigma)
+        self.num_samples = num_samples
+        self.horizon = horizon
+        self.lambda_ = lambda_
+        self.u_min = self._to_tensor(u_min)
+        self.u_max = self._to_tensor(u_max)
+        self.u_init = self._to_tensor(u_init) if u_init is not None else torch.zeros(self.nu, device=self.device, dtype=self.dtype)
+        self.U_init = self._to_tensor(U_init)
+        self.method = method
+        self.num_iterations = num_iterations
+        self.elite_fraction = elite_fraction
+        self.num_elites = max(1, int(round(self.elite_fraction * self.num_samples)))
+        self.cem_smoothing = cem_smoothing
+        self.cem_min_std = cem_min_std
+        self.time_budget = time_budget
+        self.noise_abs_cost = noise_abs_cost
+        # preallocated buffers
+        self._eps = torch.empty((self.num_iterations, self.num_samples, self.horizon, self.nu), device=self.device, dtype=self.dtype)
+        self._noise = torch.empty_like(self._eps)
+        self._perturbed_actions = torch.empty((self.num_samples, self.horizon, self.nu), device=self.device, dtype=self.dtype)
+        self._costs = torch.empty((self.num_samples,), device=self.device, dtype=self.dtype)
+        self.U = None
+        self.cem_std = None
+        self.last_num_iterations = 0
+        self.last_costs = None
+        self.reset()
+
+    def _to_tensor(self, x):
+        if x is None:
+            return None
+        return torch.as_tensor(x, device=self.device, dtype=self.dtype)
+
+    def reset(self):
+        if self.U_init is not None:
+            self.U = self.U_init.clone()
+        else:
+            self.U = self.u_init.unsqueeze(0).repeat(self.horizon, 1)
+        self.cem_std = torch.sqrt(torch.diagonal(self.noise_sigma)).unsqueeze(0).repeat(self.horizon, 1)
+
+    def shift(self):
+        # warm start: drop the executed action and repeat u_init at the end
+        self.U = torch.roll(self.U, -1, dims=0)
+        self.U[-1] = self.u_init
+        if self.method == 'cem':
+            self.cem_std = torch.sqrt(torch.diagonal(self.noise_sigma)).unsqueeze(0).repeat(self.horizon, 1)
+
+    def _sample_noise(self):
+        # sample the noise of all iterations at once into the preallocated buffers
+        torch.randn(self._eps.shape, out=self._eps)
+        if self.method == 'mppi':
+            torch.matmul(self._eps, self.noise_scale_tril.T, out=self._noise)
+
+    def _bound_actions(self, actions):
+        if self.u_min is not None or self.u_max is not None:
+            actions = torch.clamp(actions, min=self.u_min, max=self.u_max)
+        return actions
+
+    def _call(self, fn, state, action, context):
+        if context is None:
+            return fn(state, action)
+        return fn(state, action, context)
+
+    def _compute_rollout_costs(self, state, perturbed_actions, context=None):
+        self._costs.zero_()
+        state_t = state
+        for t in range(self.horizon):
+            action_t = perturbed_actions[:, t]
+            state_t = self._call(self.dynamics, state_t, action_t, context)
+            cost_t = self._call(self.running_cost, state_t, action_t, context)
+            self._costs += torch.as_tensor(cost_t, device=self.device, dtype=self.dtype).flatten()
+        return self._costs
+
+    def _mppi_iteration(self, state, noise, context=None):
+        torch.add(self.U.unsqueeze(0), noise, out=self._perturbed_actions)
+        perturbed_actions = self._bound_actions(self._perturbed_actions)
+        noise = perturbed_actions - self.U # effective noise after bounding
+        costs = self._compute_rollout_costs(state, perturbed_actions, context=context)
+        perturbation = torch.abs(noise) if self.noise_abs_cost else noise
+        action_cost = self.lambda_ * perturbation @ self.noise_sigma_inv # (K, T, nu)
+        perturbation_cost = torch.sum(self.U * action_cost, dim=(1, 2))
+        total_costs = costs + perturbation_cost
+        weights = torch.zeros_like(total_costs)
+        elite_indxs = torch.topk(total_costs, self.num_elites, largest=False).indices
+        elite_costs = total_costs[elite_indxs]
+        weights[elite_indxs] = torch.softmax(-(elite_costs - elite_costs.min()) / self.lambda_, dim=0)
+        self.U = self.U + torch.einsum('k,kti->ti', weights, noise)
+        return total_costs
+
+    def _cem_iteration(self, state, eps, context=None):
+        torch.addcmul(self.U.unsqueeze(0), eps, self.cem_std.unsqueeze(0), out=self._perturbed_actions)
+        perturbed_actions = self._bound_actions(self._perturbed_actions)
+        costs = self._compute_rollout_costs(state, perturbed_actions, context=context)
+        elite_indxs = torch.topk(costs, self.num_elites, largest=False).indices
+        elite_actions = perturbed_actions[elite_indxs]
+        elite_mean = elite_actions.mean(dim=0)
+        elite_std = elite_actions.std(dim=0, unbiased=False) if self.num_elites > 1 else torch.zeros_like(elite_mean)
+        self.U = self.cem_smoothing * self.U + (1 - self.cem_smoothing) * elite_mean
+        self.cem_std = torch.clamp(self.cem_smoothing * self.cem_std + (1 - self.cem_smoothing) * elite_std, min=self.cem_min_std)
+        return costs.clone()
+
+    def optimize(self, state, context=None):
+        """
+        Refine the nominal trajectory self.U from the given state.
+        Returns:
+            - (T, nu) optimized trajectory
+        """
+        if not torch.is_tensor(state):
+            state = torch.as_tensor(state)
+        state = state.to(device=self.device, dtype=self.dtype).reshape(-1, self.nx)
+        state = state.expand(self.num_samples, self.nx)
+        start_time = time.time()
+        self._sample_noise()
+        num_iterations = 0
+        for i in range(self.num_iterations):
+            iteration_start_time = time.time()
+            if self.method == 'mppi':
+                self.last_costs = self._mppi_iteration(state, self._noise[i], context=context)
+            else:
+                self.last_costs = self._cem_iteration(state, self._eps[i], context=context)
+            num_iterations += 1
+            if self.time_budget is not None:
+                # stop if another iteration would not finish before the deadline
+                now = time.time()
+                if now + (now - iteration_start_time) > start_time + self.time_budget:
+                    break
+        self.U = self._bound_actions(self.U)
+        self.last_num_iterations = num_iterations
+        return self.U
+
+    def command(self, state, context=None):
+        """
+        Optimize and return the first action (nu,) of the trajectory. The trajectory is shifted for the next command.
+        """
+        U = self.optimize(state, context=context)
+        action = U[0].clone()
+        self.shift()
+        return action
@@ -1,13 +1,30 @@
 import numpy as np
 import torch
-import rospy
 import pytorch3d.transforms as batched_tr
 
+from bubble_control.bubble_model_control.aux.lazy_pose import as_lazy_pose
+from bubble_control.bubble_contact_point_estimation.contact_point_geometry import get_batched_contact_points
+
+
+def get_tool_contact_points(estimated_poses, plane_pose=None):
+    """
+    Contact points of the estimated tool poses (tool axis z) with the plane, for cost functions.
+    Args:
+        estimated_poses: batched tool poses on the world frame (LazyPose or (K, 7) tensor)
+        plane_pose: <torch.Tensor> (4, 4) plane frame on the world frame. If None, the plane is z=0 on the world frame.
+    Returns:
+        - <torch.Tensor> (K, 3) contact points on the plane frame
+    """
+    tool_poses = as_lazy_pose(estimated_poses).matrix
+    if plane_pose is not None:
+        tool_poses = torch.linalg.inv(plane_pose.type(tool_poses.dtype)) @ tool_poses
+    return get_batched_contact_points(tool_poses)
+
 
 def only_position_cost_function(estimated_poses, states, prev_states, actions):
     # Only position ----------------------------------------
     goal_xyz = torch.zeros(3)
-    estimated_xyz = estimated_poses[:, :3]
+    estimated_xyz = as_lazy_pose(estimated_poses).position
     cost = torch.linalg.norm(estimated_xyz-goal_xyz, axis=1)
     return cost
 
@@ -20,11 +37,9 @@ def vertical_tool_cost_function(estimated_poses, states, prev_states, actions):
 
     # Only orientation, using model points ------------
     # tool axis is z, so we want tool frame z axis to be aligned with the world z axis
-    estimated_pos = estimated_poses[:, :3]  # (x, y, z)
-    estimated_q = estimated_poses[:, 3:]  # (qx,qy,qz,qw)
-    estimated_qwxyz = torch.index_select(estimated_q, dim=-1, index=torch.LongTensor([3, 0, 1, 2]))  # (qw, qx,qy,qz)
-    estimated_R = batched_tr.quaternion_to_matrix(
-        estimated_qwxyz)  # careful! batched_tr quat is [qw,qx,qy,qz], we work as [qx,qy,qz,qw]
+    estimated_poses = as_lazy_pose(estimated_poses) # no conversion if the estimator already provides the matrices
+    estimated_pos = estimated_poses.position  # (x, y, z)
+    estimated_R = estimated_poses.rotation_matrix
     z_axis = torch.tensor([0., 0, 1.]).unsqueeze(0).repeat_interleave(estimated_R.shape[0], dim=0).float()
     tool_z_axis_wf = torch.einsum('kij,kj->ki', estimated_R, z_axis)
     ori_cost = 1 - torch.abs(torch.einsum('ki,ki->k', z_axis,
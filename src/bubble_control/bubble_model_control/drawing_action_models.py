@@ -2,13 +2,18 @@ import abc
 import torch
 import numpy as np
 import copy
-import tf.transformations as tr
 import pytorch3d.transforms as batched_trs
 
 from bubble_control.bubble_model_control.aux.bubble_model_control_utils import batched_tensor_sample, get_transformation_matrix, tr_frame, convert_all_tfs_to_tensors
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
+from bubble_control.bubble_model_control.aux.lazy_pose import LazyPose
+from bubble_control.aux.lazy_imports import lazy_import
+from bubble_control.aux.profiling import profiled
 
+tr = lazy_import('tf.transformations')
 
+
+@profiled('action_model/grasp_pose_correction')
 def drawing_one_dir_grasp_pose_correction(position, orientation, action):
     # NOTE: Orientations can either be quaternions or axis-angle
     # position: 3d position with reference on the med_base of the grasp_frame
@@ -18,7 +23,8 @@ def drawing_one_dir_grasp_pose_correction(position, orientation, action):
     #   - length: movement along the drawing direction (intersection of the med_base_pane and the plane perpendicular to the grasp_frame x_axis.
     #   - grasp_width: adjustement of the grasp width (no needed here)
     action_names = ['rotation', 'length', 'grasp_width']
-    ori_quat = QuaternionToAxis._tr_inv(orientation)
+    w_pose_gf = LazyPose(position=position, axis_angle=orientation) # the quaternion is reused for the rotation matrix
+    ori_quat = w_pose_gf.quat
     x_axis = torch.tensor([1,0,0], dtype=orientation.dtype, device=orientation.device).unsqueeze(0).repeat_interleave(orientation.shape[0], dim=0)
     axis_rot = x_axis
     axis_angle_rot = action[..., 0].unsqueeze(-1).repeat_interleave(3,dim=-1)*axis_rot
@@ -26,7 +32,7 @@ def drawing_one_dir_grasp_pose_correction(position, orientation, action):
     q_next = batched_trs.quaternion_multiply(q_rot, ori_quat)
     orientation_next = QuaternionToAxis._tr(q_next)
     z_axis = torch.tensor([0,0,1], dtype=orientation.dtype, device=orientation.device).unsqueeze(0).repeat_interleave(orientation.shape[0], dim=0)
-    w_R_gf = batched_trs.axis_angle_to_matrix(orientation)
+    w_R_gf = w_pose_gf.rotation_matrix
     grasp_plane_normal_wf = torch.einsum('kij,kj->ki', w_R_gf, x_axis)
     moving_axis = torch.cross(z_axis, grasp_plane_normal_wf)
     position_delta = action[..., 1:2] * moving_axis
@@ -34,6 +40,7 @@ def drawing_one_dir_grasp_pose_correction(position, orientation, action):
     return position_next, orientation_next
 
 
+@profiled('action_model/drawing_one_dir')
 def drawing_action_model_one_dir(state_samples, actions):
     """
     ACTION MODEL FOR BubbleOneDirectionDrawingEnv.
@@ -3,20 +3,21 @@ import torch
 import pytorch3d.transforms as batched_trs
 import einops
 from abc import abstractmethod
-import tf.transformations as tr
 
 from bubble_control.bubble_learning.aux.img_trs.block_upsampling_tr import BlockUpSamplingTr
 from bubble_control.aux.load_confs import load_bubble_reconstruction_params, load_object_models
-from bubble_control.bubble_pose_estimation.bubble_pc_reconstruction import BubblePCReconstructorOfflineDepth
-from bubble_utils.bubble_tools.bubble_img_tools import unprocess_bubble_img
-
-from bubble_control.bubble_pose_estimation.batched_pytorch_icp import icp_2d_masked, pc_batched_tr
-from mmint_camera_utils.camera_utils import project_depth_image
-from mmint_camera_utils.point_cloud_utils import project_pc, get_projection_tr
-from bubble_utils.bubble_tools.bubble_pc_tools import get_imprint_mask
+from bubble_control.bubble_pose_estimation.batched_pytorch_icp import icp_2d_masked, pc_batched_tr, get_padded_model_table
 from bubble_control.bubble_learning.aux.load_model import load_model_version
 from bubble_control.bubble_learning.models.icp_approximation_model import ICPApproximationModel, FakeICPApproximationModel
 from bubble_control.bubble_learning.aux.orientation_trs import QuaternionToAxis
+from bubble_control.bubble_model_control.aux.lazy_pose import LazyPose
+from bubble_control.aux.lazy_imports import lazy_import_from
+from bubble_control.aux.profiling import span
+
+unprocess_bubble_img = lazy_import_from('bubble_utils.bubble_tools.bubble_img_tools', 'unprocess_bubble_img')
+get_imprint_mask = lazy_import_from('bubble_utils.bubble_tools.bubble_pc_tools', 'get_imprint_mask')
+project_depth_image = lazy_import_from('mmint_camera_utils.camera_utils', 'project_depth_image')
+project_pc, get_projection_tr = lazy_import_from('mmint_camera_utils.point_cloud_utils', 'project_pc', 'get_projection_tr')
 
 
 class ModelOutputObjectPoseEstimationBase(object):
@@ -49,11 +50,8 @@ class BatchedModelOutputObjectPoseEstimationBase(ModelOutputObjectPoseEstimation
         wf_X_gf = self._get_transformation_matrix(all_tfs, 'med_base', 'grasp_frame').type(gf_X_objpose.dtype)
         wf_X_objpose = wf_X_gf @ gf_X_objpose
 
-        # convert it to pose format [xs, ys, zs, qxs, qyx, qzs, qws]
-        estimated_pos = wf_X_objpose[..., :3, 3]
-        _estimated_quat = batched_trs.matrix_to_quaternion(wf_X_objpose[..., :3, :3]) # (qw,qx,qy,qz)
-        estimated_quat = torch.index_select(_estimated_quat, dim=-1, index=torch.LongTensor([1, 2, 3, 0]))# (qx,qy,qz,qw)
-        estimated_poses = torch.cat([estimated_pos, estimated_quat], dim=-1)
+        # Keep the homogeneous matrix. Other formats (e.g. [xs, ys, zs, qxs, qyx, qzs, qws]) are computed only if accessed.
+        estimated_poses = LazyPose.from_matrix(wf_X_objpose)
         return estimated_poses
 
     def _get_transformation_matrix(self, all_tfs, source_frame, target_frame):
@@ -79,11 +77,7 @@ def axis_angle_pose_to_homogeneous_pose(axis_angle_pose):
     return hom_pos
 
 def homogeneous_pose_to_axis_angle(homogeneous_pose):
-    pos = homogeneous_pose[..., :3, 3]
-    quat_wxyz = batched_trs.matrix_to_quaternion(homogeneous_pose[..., :3, :3])
-    quat_xyzw = torch.index_select(quat_wxyz, dim=-1, index=torch.LongTensor([1, 2, 3, 0]))
-    axis_angle = QuaternionToAxis._tr(quat_xyzw)
-    axis_angle_pose = torch.cat([pos, axis_angle], dim=-1)
+    axis_angle_pose = LazyPose.from_matrix(homogeneous_pose).axis_angle_pose
     return axis_angle_pose
 
 class End2EndModelOutputObjectPoseEstimation(BatchedModelOutputObjectPoseEstimationBase):
@@ -132,8 +126,14 @@ class ICPApproximationModelOutputObjectPoseEstimation(BatchedModelOutputObjectPo
 
 
 class BatchedModelOutputObjectPoseEstimation(BatchedModelOutputObjectPoseEstimationBase):
-    """ ICP POSE ESTIMATION. Work with pytorch tensors"""
-    def __init__(self, *args, device=None, imprint_selection='threshold', imprint_percentile=0.1, object_name='marker', factor_x=1, factor_y=1, method='bilinear', **kwargs):
+    """
+    ICP POSE ESTIMATION. Work with pytorch tensors
+    Batches can mix objects: the object of each sample is given by batched_sample['object_code'] (object names, or
+    indxs into self.object_names), and object_name is used for the samples without it.
+    The projected 2D model point clouds of the object_names are computed once, stored on the device as a padded
+    (num_objects, max_model_points, 2) table with its mask, and gathered by object indx for each batch.
+    """
+    def __init__(self, *args, device=None, imprint_selection='threshold', imprint_percentile=0.1, object_name='marker', object_names=None, factor_x=1, factor_y=1, method='bilinear', **kwargs):
         self.imprint_selection = imprint_selection
         self.imprint_percentile = imprint_percentile
         if device is None:
@@ -148,10 +148,67 @@ class BatchedModelOutputObjectPoseEstimation(BatchedModelOutputObjectPoseEstimat
                                                    keys_to_tr=['final_imprint'])
         super().__init__(*args, **kwargs)
         self.model_pcs = load_object_models()
+        self.projection_axis = (1, 0, 0)
+        if object_names is None:
+            object_names = [self.object_name] + [name for name in self.model_pcs.keys() if name != self.object_name]
+        self.object_names = list(object_names)
+        self.object_indxs = {name: i for i, name in enumerate(self.object_names)}
+        self.model_table, self.model_table_mask = self._get_model_table()
+        self.model_num_points = self.model_table_mask.sum(dim=-1).cpu() # (num_objects,) kept on cpu to size the batches
+
+    def _get_model_table(self):
+        # projected 2d model point clouds, filtered. Returns the (num_objects, max_model_points, 2) table and its mask
+        model_pcs_2d = []
+        for object_name in self.object_names:
+            model_pc = torch.tensor(np.asarray(self.model_pcs[object_name].points))
+            model_pc_2d = project_pc(model_pc, self.projection_axis)[..., :2]
+            model_pc_2d = self._filter_model_pc(model_pc_2d.unsqueeze(0))[0]
+            model_pcs_2d.append(model_pc_2d.type(torch.float).to(self.device))
+        model_table, model_table_mask = get_padded_model_table(model_pcs_2d)
+        return model_table, model_table_mask
+
+    def _get_object_indxs(self, batched_sample, batch_size):
+        """
+        Returns:
+            - object_indxs: <torch.Tensor> (batch_size,) indxs of the sample objects in self.object_names
+        """
+        object_codes = batched_sample.get('object_code', None)
+        if object_codes is None:
+            object_codes = self.object_name
+        if isinstance(object_codes, str):
+            object_codes = [object_codes] * batch_size
+        if torch.is_tensor(object_codes):
+            return object_codes.to(dtype=torch.long, device=self.device).reshape(batch_size)
+        unknown_codes = set(object_codes) - set(self.object_indxs.keys())
+        if len(unknown_codes) > 0:
+            raise AttributeError('Objects {} not in the estimator object_names {}'.format(sorted(unknown_codes), self.object_names))
+        return torch.tensor([self.object_indxs[code] for code in object_codes], dtype=torch.long, device=self.device)
+
+    def _get_batch_models(self, object_indxs):
+        """
+        Gather the sample models from the model table (already on the device), trimmed to the largest model of the
+        batch, so single object batches do not compute distances to the padding of larger models.
+        Returns:
+            - pc_model: <torch.Tensor> (N, num_model_points, 2)
+            - pc_model_mask: <torch.Tensor> (N, num_model_points) bool, or None if the batch has no padding points
+        """
+        batch_num_points = self.model_num_points[object_indxs.cpu()]
+        num_model_points = int(batch_num_points.max())
+        pc_model = self.model_table[object_indxs, :num_model_points]
+        pc_model_mask = None
+        if bool((batch_num_points < num_model_points).any()):
+            pc_model_mask = self.model_table_mask[object_indxs, :num_model_points]
+        return pc_model, pc_model_mask
+
+    def _get_imprint_threshold(self, object_name):
+        if object_name not in self.reconstruction_params:
+            return self.imprint_threshold
+        return self.reconstruction_params[object_name]['imprint_th']['depth']
 
     def _upsample_sample(self, sample):
         # Upsample output
-        sample_up = self.block_upsample_tr(sample)
+        with span('pose_estimation/upsample'):
+            sample_up = self.block_upsample_tr(sample)
         return sample_up
 
     def _estimate_object_pose(self, batched_sample_raw):
@@ -174,55 +231,52 @@ class BatchedModelOutputObjectPoseEstimation(BatchedModelOutputObjectPoseEstimat
         depth_def_r = depth_ref_r - imprint_pred_r  # CAREFUL: Imprint is defined as undef_depth_img - def_depth_img
         depth_def_l = depth_ref_l - imprint_pred_l  # CAREFUL: Imprint is defined as undef_depth_img - def_depth_img
 
-        # Project imprints to get point coordinates
-        Ks_r = batched_sample['camera_info_r']['K']
-        Ks_l = batched_sample['camera_info_l']['K']
-        pc_r = project_depth_image(depth_def_r, Ks_r)  # (N, w, h, n_coords) -- n_coords=3
-        pc_l = project_depth_image(depth_def_l, Ks_l)  # (N, w, h, n_coords) -- n_coords=3
-
-        # Convert imprint point coordinates to grasp frame
-        gf_X_ifr = self._get_transformation_matrix(all_tfs, 'grasp_frame', imprint_frame_r)
-        gf_X_ifl = self._get_transformation_matrix(all_tfs, 'grasp_frame', imprint_frame_l)
-        pc_shape = pc_r.shape
-        pc_r_gf = pc_batched_tr(pc_r.view((pc_shape[0], -1, pc_shape[-1])), gf_X_ifr[..., :3, :3],
-                                gf_X_ifr[..., :3, 3]).view(pc_shape)
-        pc_l_gf = pc_batched_tr(pc_l.view((pc_shape[0], -1, pc_shape[-1])), gf_X_ifl[..., :3, :3],
-                                gf_X_ifl[..., :3, 3]).view(pc_shape)
-        pc_gf = torch.stack([pc_r_gf, pc_l_gf], dim=1)  # (N, n_impr, w, h, n_coords)
-
-        # Load object model model
-        model_pc = np.asarray(self.model_pcs[self.object_name].points)
-        model_pc = torch.tensor(model_pc).to(predicted_imprint.device)
-
-        # Project points to 2d
-        projection_axis = (1, 0, 0)
-        projection_tr = torch.tensor(get_projection_tr(projection_axis))  # (4,4)
-        pc_gf_projected = project_pc(pc_gf, projection_axis)  # (N, n_impr, w, h, n_coords)
-        pc_gf_2d = pc_gf_projected[..., :2]  # only 2d coordinates
-        pc_model_projected = project_pc(model_pc, projection_axis).unsqueeze(0).repeat_interleave(pc_gf.shape[0], dim=0)
+        with span('pose_estimation/projection'):
+            # Project imprints to get point coordinates
+            Ks_r = batched_sample['camera_info_r']['K']
+            Ks_l = batched_sample['camera_info_l']['K']
+            pc_r = project_depth_image(depth_def_r, Ks_r)  # (N, w, h, n_coords) -- n_coords=3
+            pc_l = project_depth_image(depth_def_l, Ks_l)  # (N, w, h, n_coords) -- n_coords=3
+
+            # Convert imprint point coordinates to grasp frame
+            gf_X_ifr = self._get_transformation_matrix(all_tfs, 'grasp_frame', imprint_frame_r)
+            gf_X_ifl = self._get_transformation_matrix(all_tfs, 'grasp_frame', imprint_frame_l)
+            pc_shape = pc_r.shape
+            pc_r_gf = pc_batched_tr(pc_r.view((pc_shape[0], -1, pc_shape[-1])), gf_X_ifr[..., :3, :3],
+                                    gf_X_ifr[..., :3, 3]).view(pc_shape)
+            pc_l_gf = pc_batched_tr(pc_l.view((pc_shape[0], -1, pc_shape[-1])), gf_X_ifl[..., :3, :3],
+                                    gf_X_ifl[..., :3, 3]).view(pc_shape)
+            pc_gf = torch.stack([pc_r_gf, pc_l_gf], dim=1)  # (N, n_impr, w, h, n_coords)
+
+            # Project points to 2d
+            projection_tr = torch.tensor(get_projection_tr(self.projection_axis))  # (4,4)
+            pc_gf_projected = project_pc(pc_gf, self.projection_axis)  # (N, n_impr, w, h, n_coords)
+            pc_gf_2d = pc_gf_projected[..., :2]  # only 2d coordinates
 
         # Apply ICP 2d
         num_iterations = 20
         pc_scene = pc_gf_2d  # pc_scene: (N, n_impr, w, h, n_coords)
-        # Compute mask -- filter out points
-        depth_ref = torch.stack([depth_ref_r, depth_ref_l], dim=1)  # (N, n_impr, w, h)
-        depth_def = torch.stack([depth_def_r, depth_def_l], dim=1)  # (N, n_impr, w, h)
-        pc_scene_mask = self._get_pc_mask(depth_def, depth_ref)
-        pc_scene_mask = pc_scene_mask.unsqueeze(-1).repeat_interleave(2, dim=-1)  # (N, n_impr, w, h, n_coords)
-        pc_model_projected_2d = pc_model_projected[..., :2]  # pc_model: (N, n_model_points, n_coords)
+        with span('pose_estimation/masking'):
+            # Compute mask -- filter out points
+            depth_ref = torch.stack([depth_ref_r, depth_ref_l], dim=1)  # (N, n_impr, w, h)
+            depth_def = torch.stack([depth_def_r, depth_def_l], dim=1)  # (N, n_impr, w, h)
+            object_indxs = self._get_object_indxs(batched_sample, pc_gf.shape[0])
+            pc_scene_mask = self._get_pc_mask(depth_def, depth_ref, object_indxs=object_indxs)
+            pc_scene_mask = pc_scene_mask.unsqueeze(-1).repeat_interleave(2, dim=-1)  # (N, n_impr, w, h, n_coords)
+            pc_scene, pc_scene_mask = self._filter_scene_pc(pc_scene, pc_scene_mask)
+            pc_model_projected_2d, pc_model_mask = self._get_batch_models(object_indxs)
 
         # Apply ICP:
         device = self.device
-        pc_model_projected_2d = self._filter_model_pc(pc_model_projected_2d)
-        pc_scene, pc_scene_mask = self._filter_scene_pc(pc_scene, pc_scene_mask)
         # print(torch.sum(pc_scene_mask.reshape(pc_scene_mask.shape[0], -1), dim=1)) # report number of points per scene
-        pc_model_projected_2d = pc_model_projected_2d.type(torch.float).to(device)  # This call takes almost 2 sec
-        pc_scene = pc_scene.type(torch.float).to(device)
-        pc_scene_mask = pc_scene_mask.to(device)
-
-        Rs, ts = icp_2d_masked(pc_model_projected_2d, pc_scene, pc_scene_mask, num_iter=num_iterations)
-        Rs = Rs.cpu()
-        ts = ts.cpu()
+        with span('pose_estimation/to_device'):
+            pc_scene = pc_scene.type(torch.float).to(device)
+            pc_scene_mask = pc_scene_mask.to(device)
+
+        with span('pose_estimation/icp', num_iterations=num_iterations):
+            Rs, ts = icp_2d_masked(pc_model_projected_2d, pc_scene, pc_scene_mask, num_iter=num_iterations, pc_model_mask=pc_model_mask)
+            Rs = Rs.cpu()
+            ts = ts.cpu()
         # Obtain object pose in grasp frame
         projected_ic_tr = torch.zeros(ts.shape[:-1] + (4, 4))
         projected_ic_tr[..., :2, :2] = Rs
@@ -260,12 +314,28 @@ class BatchedModelOutputObjectPoseEstimation(BatchedModelOutputObjectPoseEstimat
 
         return pc_scene, pc_scene_mask
 
-    def _get_pc_mask(self, depth_def, depth_ref):
+    def _get_pc_mask(self, depth_def, depth_ref, object_indxs=None):
         # depth_def: (N, n_impr, w, h)
         # depth_ref: (N, n_impr, w, h)
+        # object_indxs: (N,) objects of the samples, for their imprint thresholds. None uses the object_name threshold.
         if self.imprint_selection == 'threshold':
-            imprint_threshold = self.imprint_threshold
-            pc_scene_mask = torch.tensor(get_imprint_mask(depth_ref, depth_def, imprint_threshold))
+            if object_indxs is None:
+                object_indxs = torch.zeros(depth_def.shape[0], dtype=torch.long) + self.object_indxs.get(self.object_name, 0)
+            object_indxs = object_indxs.cpu()
+            batch_objects = torch.unique(object_indxs)
+            if len(batch_objects) == 1:
+                imprint_threshold = self._get_imprint_threshold(self.object_names[int(batch_objects[0])])
+                pc_scene_mask = torch.as_tensor(get_imprint_mask(depth_ref, depth_def, imprint_threshold))
+            else:
+                # mixed objects: mask the samples of each object with its imprint threshold
+                pc_scene_mask = None
+                for object_indx in batch_objects:
+                    imprint_threshold = self._get_imprint_threshold(self.object_names[int(object_indx)])
+                    sample_indxs = torch.where(object_indxs == object_indx)[0]
+                    object_mask = torch.as_tensor(get_imprint_mask(depth_ref[sample_indxs], depth_def[sample_indxs], imprint_threshold))
+                    if pc_scene_mask is None:
+                        pc_scene_mask = torch.zeros(depth_def.shape, dtype=object_mask.dtype, device=object_mask.device)
+                    pc_scene_mask[sample_indxs.to(object_mask.device)] = object_mask
         elif self.imprint_selection == 'percentile':
             # select the points with larger deformation. In total will select top self.imprint_percentile*100%
             delta_depth = einops.rearrange(depth_ref - depth_def, 'N n w h -> N (n w h)')
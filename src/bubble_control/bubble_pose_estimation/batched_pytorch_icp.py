@@ -1,13 +1,34 @@
 import torch
 import numpy as np
 from tqdm import tqdm
+from bubble_control.aux.profiling import span
 
 
-def icp_2d_masked(pc_model, pc_scene, pc_scene_mask, num_iter=30):
+def get_padded_model_table(model_pcs):
+    """
+    Stack model point clouds with different number of points into a single padded table, so the models of a batch
+    can be gathered by index.
+    :param model_pcs: list of num_objects tensors (n_model_points_i, n_coords)
+    :return:
+        - model_table: (num_objects, max_model_points, n_coords), padded with zeros
+        - model_table_mask: (num_objects, max_model_points) bool, True for the model points
+    """
+    max_points = max(pc.shape[0] for pc in model_pcs)
+    n_coords = model_pcs[0].shape[-1]
+    model_table = torch.zeros((len(model_pcs), max_points, n_coords), dtype=model_pcs[0].dtype, device=model_pcs[0].device)
+    model_table_mask = torch.zeros((len(model_pcs), max_points), dtype=torch.bool, device=model_pcs[0].device)
+    for i, pc in enumerate(model_pcs):
+        model_table[i, :pc.shape[0]] = pc
+        model_table_mask[i, :pc.shape[0]] = True
+    return model_table, model_table_mask
+
+
+def icp_2d_masked(pc_model, pc_scene, pc_scene_mask, num_iter=30, pc_model_mask=None):
     # ICP 2D:
     # pc_scene: (N, n_points, n_coords)
     # pc_scene_mask: (N, n_points, n_coords)
     # pc_model: (N, n_model_points, n_coords)
+    # pc_model_mask: (N, n_model_points) bool, False for the padding points of padded models. None if all are model points.
 
     N, n_points, n_coords = pc_scene.shape
     if len(pc_scene_mask.shape) == len(pc_scene_mask.shape)-1:
@@ -19,7 +40,8 @@ def icp_2d_masked(pc_model, pc_scene, pc_scene_mask, num_iter=30):
 
     R, t = R_init, t_init
     for i in range(num_iter):
-        R, t = icp_2d_maksed_step(pc_model, pc_scene, pc_scene_mask, R_init, t_init)
+        with span('icp/iteration', iteration=i):
+            R, t = icp_2d_maksed_step(pc_model, pc_scene, pc_scene_mask, R_init, t_init, pc_model_mask=pc_model_mask)
 
         R_init = R
         t_init = t
@@ -44,19 +66,20 @@ def icp_2d_masked_imprints(pc_model, pc_scene, pc_scene_mask, num_iter=30):
     return R, t
 
 
-def icp_2d_maksed_step(pc_model, pc_scene, pc_scene_mask, R_init, t_init):
+def icp_2d_maksed_step(pc_model, pc_scene, pc_scene_mask, R_init, t_init, pc_model_mask=None):
     # pc_model, shape (N, n_model_points, n_coords)
     # pc_scene, shape (N, n_scene_points, n_coords)
     # pc_scene_mask, shape (N, n_scene_points, n_coords) *** Here n_coords dimension is just repeated
     # t_init: (N, n_coords)
     # R_init: (N, n_coords, n_coords)
+    # pc_model_mask: (N, n_model_points) bool or None
     # -------------------
     # transform init:
     pc_model_tr = pc_batched_tr(pc_model, R_init, t_init)
 
     # Estimate correspondences (only masked):
     # compute distances and get minimums
-    batch_idxs, corr_indxs = estimate_correspondences_batched(pc_model_tr, pc_scene, pc_scene_mask)
+    batch_idxs, corr_indxs = estimate_correspondences_batched(pc_model_tr, pc_scene, pc_scene_mask, a1_mask=pc_model_mask)
     pc_model_selected = pc_model[batch_idxs, corr_indxs, :]
 
     # Compute new transform
@@ -93,12 +116,13 @@ def reshape_pc(pc):
     return pc_r
 
 
-def estimate_correspondences_batched(a1, a2, a2_mask):
+def estimate_correspondences_batched(a1, a2, a2_mask, a1_mask=None):
     """
     Return for each point in the scene (a2) the closest point in the model (a1)
     :param a1: (N, n_1_points, n_coords) -- model
     :param a2: (N, n_2_points, n_coords) -- scene
     :param a2_mask: (N, n_2_points, n_coords)
+    :param a1_mask: (N, n_1_points) bool -- model points that can be matched (padded models). None for all.
     :return: tensor containing the correspndent model points for each scene points (N, n_2_points, n_coords)
     """
     # Compute distances
@@ -108,6 +132,8 @@ def estimate_correspondences_batched(a1, a2, a2_mask):
     dists = (torch.sum((a1 ** 2), dim=-1).unsqueeze(-1) -
              torch.bmm(a1, a2.transpose(1, 2)) * 2 +
              torch.sum((a2 ** 2), dim=-1).unsqueeze(-2)).transpose(1, 2)
+    if a1_mask is not None:
+        dists = dists.masked_fill(~a1_mask.unsqueeze(1), float('inf')) # padding points are never the closest
 
     # Get clossest point indxs
     corr_indxs = torch.argmin(dists, axis=-1)  # get a1 index that minimizes distance to a2
@@ -2,35 +2,74 @@
 
 import sys
 import os
-import rospy
 import numpy as np
-import ros_numpy as rn
-import cv2
-import ctypes
-import struct
-from PIL import Image as imm
-import open3d as o3d
 from scipy.spatial import KDTree
-import copy
-import tf.transformations as tr
-import tf2_ros as tf2
-from functools import reduce
-from sklearn.cluster import DBSCAN
+from functools import reduce, lru_cache
 import abc
 
-import sensor_msgs.point_cloud2 as pc2
-from std_msgs.msg import String, Header, Bool
-from sensor_msgs.msg import Image, CompressedImage, CameraInfo, PointCloud2, PointField
-from geometry_msgs.msg import TransformStamped, Pose
-from visualization_msgs.msg import Marker, MarkerArray
-
-from mmint_camera_utils.point_cloud_utils import pack_o3d_pcd, view_pointcloud, tr_pointcloud
-from mmint_camera_utils.point_cloud_parsers import PicoFlexxPointCloudParser
-from bubble_utils.bubble_tools.bubble_pc_tools import get_imprint_pc
-from bubble_control.bubble_pose_estimation.pose_estimators import ICP3DPoseEstimator, ICP2DPoseEstimator
-from mmint_camera_utils.ros_utils.publisher_wrapper import PublisherWrapper
+from bubble_control.bubble_pose_estimation.pose_estimators import ICP3DPoseEstimator, ICP2DPoseEstimator, ICP2DTrackerPoseEstimator
+from bubble_control.bubble_pose_estimation.far_points_detection import get_far_points_mask_ball, get_far_points_mask_nn, get_far_points_mask_depth
 from mmint_utils.terminal_colors import term_colors
 from bubble_control.aux.load_confs import load_object_models
+from bubble_control.aux.lazy_imports import lazy_import, lazy_import_from
+from bubble_control.aux.tf_table import as_tf_table
+
+# ROS is only needed by the online reconstructors (and the offline tf buffer), so it is imported on first use.
+rospy = lazy_import('rospy')
+tr = lazy_import('tf.transformations')
+tf2 = lazy_import('tf2_ros')
+pc2 = lazy_import('sensor_msgs.point_cloud2')
+std_msgs = lazy_import('std_msgs.msg')
+sensor_msgs = lazy_import('sensor_msgs.msg')
+geometry_msgs = lazy_import('geometry_msgs.msg')
+pack_o3d_pcd, view_pointcloud, tr_pointcloud = lazy_import_from('mmint_camera_utils.point_cloud_utils', 'pack_o3d_pcd', 'view_pointcloud', 'tr_pointcloud')
+PicoFlexxPointCloudParser = lazy_import_from('mmint_camera_utils.point_cloud_parsers', 'PicoFlexxPointCloudParser')
+project_depth_image = lazy_import_from('mmint_camera_utils.camera_utils', 'project_depth_image')
+PublisherWrapper = lazy_import_from('mmint_camera_utils.ros_utils.publisher_wrapper', 'PublisherWrapper')
+get_imprint_pc = lazy_import_from('bubble_utils.bubble_tools.bubble_pc_tools', 'get_imprint_pc')
+
+
+@lru_cache(maxsize=None)
+def get_cone_normals():
+    """
+    Normals (4, 3) of the half-spaces that define the bubble cone on the camera frame.
+    They only depend on the camera mounting, so they are computed only once.
+    """
+    angles = [10, -25, 20, -20]
+    angles = [np.deg2rad(a) for a in angles]
+    vectors = [np.array([0, 1, 0]), np.array([0, 1, 0]), np.array([1, 0, 0]), np.array([1, 0, 0])]
+    view_vector = np.array([0, 0, 1])
+    normals = []
+    for angle_i, vector_i in zip(angles, vectors):
+        q_i = tr.quaternion_about_axis(angle_i, axis=vector_i)
+        R = tr.quaternion_matrix(q_i)[:3, :3]
+        v_i = R @ view_vector
+        q_perp = tr.quaternion_about_axis(-np.pi*0.5*np.sign(angle_i), axis=vector_i)
+        R_perp = tr.quaternion_matrix(q_perp)[:3, :3]
+        normal_i = R_perp @ v_i
+        normals.append(normal_i)
+    normals = np.stack(normals, axis=0)
+    normals.setflags(write=False)
+    return normals
+
+
+def get_cone_mask(pc):
+    """
+    Returns a boolean mask (N,) with the points of pc (N, 6) that lay inside the bubble cone
+    """
+    good_mask = np.all(pc[:, :3] @ get_cone_normals().T >= 0, axis=-1)
+    return good_mask
+
+
+def get_cone_pixel_mask(K, img_shape):
+    """
+    For points in front of the camera (z>0), the cone test only depends on the pixel ray, not on the depth.
+    Returns the flattened (w*h,) boolean mask of the pixels inside the cone, with the same ordering as organized point clouds.
+    """
+    rays = project_depth_image(np.ones(img_shape[:2]), K).reshape(-1, 3)
+    pixel_mask = get_cone_mask(rays)
+    pixel_mask.setflags(write=False)
+    return pixel_mask
 
 
 class BubblePCReconstructorBase(abc.ABC):
@@ -38,7 +77,13 @@ class BubblePCReconstructorBase(abc.ABC):
     Gets Imprint and estimates the object pose from it
     """
 
-    def __init__(self, reconstruction_frame='grasp_frame', threshold=0.005, percentile=None, object_name='allen', estimation_type='icp3d', view=False, verbose=False):
+    def __init__(self, reconstruction_frame='grasp_frame', threshold=0.005, percentile=None, object_name='allen', estimation_type='icp3d', view=False, verbose=False, publish=True):
+        """
+        Args:
+            publish: <bool> publish the tool detection (and the imprints for the ROS reconstructors). If False, no ROS
+                publishers are created, so it can run offline without a roscore.
+        """
+        self.publish = publish
         self.object_name = object_name
         self.estimation_type = estimation_type
         self.reconstruction_frame = reconstruction_frame
@@ -54,11 +99,16 @@ class BubblePCReconstructorBase(abc.ABC):
         }
         self.radius = 0.005
         self.height = 0.12
+        self.cone_pixel_masks = {}
         self.object_model = self._get_object_model()
         self.pose_estimator = self._get_pose_estimator()
-        self.tool_detected_publisher = PublisherWrapper(topic_name='tool_detected', msg_type=Bool)
+        self.tool_detected_publisher = PublisherWrapper(topic_name='tool_detected', msg_type=std_msgs.Bool) if self.publish else None
         self.last_tr = None
 
+    def publish_tool_detected(self, tool_detected):
+        if self.tool_detected_publisher is not None:
+            self.tool_detected_publisher.data = tool_detected
+
     @abc.abstractmethod
     def reference(self):
         # save the reference state
@@ -76,80 +126,93 @@ class BubblePCReconstructorBase(abc.ABC):
 
     def _get_pose_estimator(self):
         pose_estimator = None
-        available_esttimation_types = ['icp3d', 'icp2d']
+        available_esttimation_types = ['icp3d', 'icp2d', 'icp2d_tracker']
         if self.estimation_type == 'icp3d':
             pose_estimator = ICP3DPoseEstimator(obj_model=self.object_model, view=self.view)
         elif self.estimation_type == 'icp2d':
             pose_estimator = ICP2DPoseEstimator(obj_model=self.object_model, projection_axis=(1,0,0), max_num_iterations=20, view=self.view)
+        elif self.estimation_type == 'icp2d_tracker':
+            pose_estimator = ICP2DTrackerPoseEstimator(obj_model=self.object_model, projection_axis=(1,0,0), max_num_iterations=20, view=self.view)
         else:
             raise NotImplementedError('pose estimation algorithm named "{}" not implemented yet. Available options: {}'.format(self.estimation_type, available_esttimation_types))
         return pose_estimator
 
-    def filter_pc(self, pc):
+    def filter_pc(self, pc, camera_key=None):
         # Fiter the raw pointcloud from the bubbles to remove the noisy limits. We obtain a kind of a cone
-        angles = [10, -25, 20, -20]
-        angles = [np.deg2rad(a) for a in angles]
-        vectors = [np.array([0, 1, 0]), np.array([0, 1, 0]), np.array([1, 0, 0]), np.array([1, 0, 0])]
-        view_vector = np.array([0, 0, 1])
-        conditions = []
-        for angle_i, vector_i in zip(angles, vectors):
-            q_i = tr.quaternion_about_axis(angle_i, axis=vector_i)
-            R = tr.quaternion_matrix(q_i)[:3, :3]
-            v_i = R @ view_vector
-            q_perp = tr.quaternion_about_axis(-np.pi*0.5*np.sign(angle_i), axis=vector_i)
-            R_perp = tr.quaternion_matrix(q_perp)[:3, :3]
-            normal_i = R_perp @ v_i
-            condition_i = np.dot(pc[:, :3], normal_i) >= 0
-            conditions.append(condition_i)
-        good_indxs = np.where(reduce((lambda x, y: x & y), conditions)) # aggregate all conditions
-        filtered_pc = pc[good_indxs]
+        filtered_pc = pc[self.filter_mask(pc, camera_key=camera_key)]
         return filtered_pc
 
+    def filter_mask(self, pc, camera_key=None):
+        """
+        Returns a boolean mask (N,) with the points of pc (N, 6) that lay inside the bubble cone.
+        If the camera pixel mask is available and pc is an organized cloud, the precomputed pixel mask is used.
+        """
+        pixel_mask = self.cone_pixel_masks.get(camera_key, None)
+        if pixel_mask is not None and pixel_mask.shape[0] == pc.shape[0]:
+            # invalid (nan) points fail the cone test
+            good_mask = pixel_mask & np.isfinite(pc[:, 2])
+        else:
+            good_mask = get_cone_mask(pc)
+        return good_mask
+
+    def _compute_cone_pixel_mask(self, camera_key, K, img_shape):
+        # The cameras are rigidly mounted, so the pixel mask only has to be computed once per camera
+        self.cone_pixel_masks[camera_key] = get_cone_pixel_mask(K, img_shape)
+
     def estimate_pose(self, threshold, view=False, verbose=False, tool_detection=True):
         if tool_detection:
             imprint, imprint_r, imprint_l = self.get_imprint(view=view, separate=True)
-            imprint_pcd_r = pack_o3d_pcd(imprint_r)
-            imprint_pcd_l = pack_o3d_pcd(imprint_l)
-            distance_bubbles = None
-            # Detect tool:
-            if len(imprint_pcd_r.points) < 5 or len(imprint_pcd_l.points) < 5:
-                # No tool detected
-                if verbose:
-                    print(f"{term_colors.WARNING}Warning: Not enough scene points provided (r: {len(imprint_pcd_r.points)}, l:{len(imprint_pcd_l.points)}){term_colors.ENDC}")
-                self.tool_detected_publisher.data = False
-            else:
-                tree = KDTree(imprint_pcd_r.points)
-                corr_distances, _ = tree.query(imprint_pcd_l.points)
-                distance_bubbles = np.max(corr_distances)
-                
-                imprint_pcd_l.paint_uniform_color(np.array([1,0,0]))
-                imprint_r_array = np.asarray(imprint_pcd_r.points)
-                imprint_l_array = np.asarray(imprint_pcd_l.points)
-                # Filter out outliers
-                imprint_r_array = imprint_r_array[np.where(np.abs(imprint_r_array[:, 0]) < 0.02)]
-                imprint_l_array = imprint_l_array[np.where(np.abs(imprint_l_array[:, 0]) < 0.02)]
-                if imprint_r_array.shape[0] == 0 or imprint_l_array.shape[0] == 0:
-                    if verbose:
-                        print(f"{term_colors.WARNING}Warning: No scene points after filtering out outliers (r: {imprint_r_array.shape[0]}, l:{imprint_l_array.shape[0]}){term_colors.ENDC}")
-                    self.tool_detected_publisher.data = False   
-                else:
-                    # Find the two points further apart in the x axis                 
-                    x_max_r = np.max(imprint_r_array[:, 0])
-                    x_min_l = np.min(imprint_l_array[:, 0])
-                    distance_bubbles_x = np.abs(x_max_r - x_min_l)
-                    
-                    #view_pointcloud([imprint_pcd_l,imprint_pcd_r], frame=True)
-                    if (distance_bubbles is not None and distance_bubbles_x < 0.01):
-                        if verbose:
-                            print(f"{term_colors.WARNING}Warning: No tool detected{term_colors.ENDC}")
-                        self.tool_detected_publisher.data = False
-                    else:
-                        self.tool_detected_publisher.data = True
+            self.publish_tool_detected(self.detect_tool(imprint_r, imprint_l, verbose=verbose))
         else:
             imprint = self.get_imprint(view=view)
         estimated_pose = self._estimate_pose(imprint, threshold, verbose=verbose)
         return estimated_pose
 
+    def detect_tool(self, imprint_r, imprint_l, verbose=False):
+        """
+        Check whether the two bubble imprints correspond to a grasped tool.
+        Args:
+            imprint_r: <np.ndarray> (N, 6) right imprint on the reconstruction frame
+            imprint_l: <np.ndarray> (M, 6) left imprint on the reconstruction frame
+            verbose: <bool>
+        Returns:
+            - <bool> True if a tool is detected
+        """
+        imprint_pcd_r = pack_o3d_pcd(imprint_r)
+        imprint_pcd_l = pack_o3d_pcd(imprint_l)
+        distance_bubbles = None
+        # Detect tool:
+        if len(imprint_pcd_r.points) < 5 or len(imprint_pcd_l.points) < 5:
+            # No tool detected
+            if verbose:
+                print(f"{term_colors.WARNING}Warning: Not enough scene points provided (r: {len(imprint_pcd_r.points)}, l:{len(imprint_pcd_l.points)}){term_colors.ENDC}")
+            return False
+        tree = KDTree(imprint_pcd_r.points)
+        corr_distances, _ = tree.query(imprint_pcd_l.points)
+        distance_bubbles = np.max(corr_distances)
+
+        imprint_pcd_l.paint_uniform_color(np.array([1,0,0]))
+        imprint_r_array = np.asarray(imprint_pcd_r.points)
+        imprint_l_array = np.asarray(imprint_pcd_l.points)
+        # Filter out outliers
+        imprint_r_array = imprint_r_array[np.where(np.abs(imprint_r_array[:, 0]) < 0.02)]
+        imprint_l_array = imprint_l_array[np.where(np.abs(imprint_l_array[:, 0]) < 0.02)]
+        if imprint_r_array.shape[0] == 0 or imprint_l_array.shape[0] == 0:
+            if verbose:
+                print(f"{term_colors.WARNING}Warning: No scene points after filtering out outliers (r: {imprint_r_array.shape[0]}, l:{imprint_l_array.shape[0]}){term_colors.ENDC}")
+            return False
+        # Find the two points further apart in the x axis
+        x_max_r = np.max(imprint_r_array[:, 0])
+        x_min_l = np.min(imprint_l_array[:, 0])
+        distance_bubbles_x = np.abs(x_max_r - x_min_l)
+
+        #view_pointcloud([imprint_pcd_l,imprint_pcd_r], frame=True)
+        if (distance_bubbles is not None and distance_bubbles_x < 0.01):
+            if verbose:
+                print(f"{term_colors.WARNING}Warning: No tool detected{term_colors.ENDC}")
+            return False
+        return True
+
     def _estimate_pose(self, imprint, threshold, verbose=False):
         self.pose_estimator.threshold = threshold
         self.pose_estimator.verbose = verbose
@@ -162,41 +225,91 @@ class BubblePCReconstructorROSBase(BubblePCReconstructorBase):
     It adds the broadcasting and reading from ROS network.
     """
 
-    def __init__(self, *args, broadcast_imprint=False, verbose=False, **kwargs):
+    def __init__(self, *args, broadcast_imprint=False, verbose=False, left_parser=None, right_parser=None, publish=True, **kwargs):
+        """
+        Args:
+            left_parser: camera parser for the left bubble. If None, it reads from the pico_flexx_left camera.
+                It can be replaced by a RecordedFrameParser to run offline.
+            right_parser: camera parser for the right bubble. If None, it reads from the pico_flexx_right camera.
+        """
         self.broadcast_imprint = broadcast_imprint
         self.verbose = verbose
-        self.left_parser = PicoFlexxPointCloudParser(camera_name='pico_flexx_left', verbose=self.verbose)
-        self.right_parser = PicoFlexxPointCloudParser(camera_name='pico_flexx_right', verbose=self.verbose)
-        self.imprint_broadcaster = rospy.Publisher('imprint_pc', PointCloud2)
-        super().__init__(*args, verbose=verbose, **kwargs)
+        if left_parser is None:
+            left_parser = PicoFlexxPointCloudParser(camera_name='pico_flexx_left', verbose=self.verbose)
+        if right_parser is None:
+            right_parser = PicoFlexxPointCloudParser(camera_name='pico_flexx_right', verbose=self.verbose)
+        self.left_parser = left_parser
+        self.right_parser = right_parser
+        self.imprint_broadcaster = rospy.Publisher('imprint_pc', sensor_msgs.PointCloud2) if publish else None
+        super().__init__(*args, verbose=verbose, publish=publish, **kwargs)
 
     def _broadcast_imprint(self, imprint):
-        header = Header()
+        header = std_msgs.Header()
         header.frame_id = self.reconstruction_frame
         xyz_points = imprint[:, :3].astype(np.float32)
         pc2_msg = pc2.create_cloud_xyz32(header, xyz_points)
         self.imprint_broadcaster.publish(pc2_msg)
 
     def _estimate_pose(self, imprint, threshold, verbose=False):
-        if self.broadcast_imprint:
+        if self.broadcast_imprint and self.imprint_broadcaster is not None:
             self._broadcast_imprint(imprint)
         return super()._estimate_pose(imprint, threshold, verbose=verbose)
 
+    @abc.abstractmethod
+    def read_frame(self):
+        """
+        Read the raw camera data needed to compute one imprint.
+        Returns:
+            - <dict> containing the raw readings from both bubbles
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_imprint_from_frame(self, frame, view=False, separate=False):
+        # return the contact imprint from the data returned by read_frame
+        pass
+
+    def get_imprint(self, view=False, separate=False):
+        frame = self.read_frame()
+        return self.get_imprint_from_frame(frame, view=view, separate=separate)
+
 
 class BubblePCReconsturctorTreeSearch(BubblePCReconstructorROSBase):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, far_points_method='nn', **kwargs):
+        """
+        Args:
+            far_points_method: <str> algorithm used to detect the contact points. Possible values:
+                * 'nn': nearest neighbour distance to the reference with an upper bound (default)
+                * 'ball': neighbours within the threshold ball (reference implementation, slow)
+                * 'depth': per-pixel depth comparison. Only valid for organized point clouds.
+        """
+        self.far_points_method = far_points_method
+        available_methods = ['nn', 'ball', 'depth']
+        if self.far_points_method not in available_methods:
+            raise NotImplementedError('Far points method named "{}" not implemented yet. Available options: {}'.format(self.far_points_method, available_methods))
         super().__init__(*args, **kwargs)
         self.trees = {
             'right': None,
             'left': None,
         }
+        self.raw_references = {
+            'right': None,
+            'left': None,
+        }
 
     def reference(self):
+        for key, parser in zip(['right', 'left'], [self.right_parser, self.left_parser]):
+            if key not in self.cone_pixel_masks:
+                # the image shape comes from the camera info, so no depth frame is consumed
+                camera_info = parser.get_camera_info_depth()
+                self._compute_cone_pixel_mask(key, camera_info['K'], (camera_info['height'], camera_info['width']))
         pc_r, frame_r = self.right_parser.get_point_cloud(return_ref_frame=True)
         pc_l, frame_l = self.left_parser.get_point_cloud(return_ref_frame=True)
-        pc_r_filtered = self.filter_pc(pc_r)
-        pc_l_filtered = self.filter_pc(pc_l)
+        self.raw_references['right'] = pc_r
+        self.raw_references['left'] = pc_l
+        pc_r_filtered = self.filter_pc(pc_r, camera_key='right')
+        pc_l_filtered = self.filter_pc(pc_l, camera_key='left')
         self.references['left'] = pc_l_filtered
         self.references['right'] = pc_r_filtered
         self.references['left_frame'] = frame_l
@@ -205,28 +318,37 @@ class BubblePCReconsturctorTreeSearch(BubblePCReconstructorROSBase):
         self.trees['right'] = KDTree(self.references['right'][:, :3])
         self.trees['left'] = KDTree(self.references['left'][:, :3])
         self.last_tr = None
+        self.pose_estimator.last_tr = None
 
-    def get_imprint(self, view=False, separate=False):
+    def read_frame(self):
         pc_r, frame_r = self.right_parser.get_point_cloud(return_ref_frame=True, ref_frame=self.references['right_frame'])
         pc_l, frame_l = self.left_parser.get_point_cloud(return_ref_frame=True, ref_frame=self.references['left_frame'])
-        pc_r = self.filter_pc(pc_r)
-        pc_l = self.filter_pc(pc_l)
-        pc_r_contact_indxs = self._get_far_points_indxs(pc_r, d_threshold=self.threshold, key='right')
-        pc_l_contact_indxs = self._get_far_points_indxs(pc_l, d_threshold=self.threshold, key='left')
-        # pc_l_contact_indxs = get_far_points_indxs(self.reference_pcs['left'], pc_l, d_threshold=self.threshold)
+        frame = {
+            'pc_r': pc_r,
+            'pc_l': pc_l,
+            'frame_r': frame_r,
+            'frame_l': frame_l,
+        }
+        return frame
+
+    def get_imprint_from_frame(self, frame, view=False, separate=False):
+        pc_r, pc_r_contact_mask = self._get_filtered_contact_mask(frame['pc_r'], key='right')
+        pc_l, pc_l_contact_mask = self._get_filtered_contact_mask(frame['pc_l'], key='left')
+        frame_r = frame['frame_r']
+        frame_l = frame['frame_l']
         pc_r_tr = self.right_parser.transform_pc(pc_r, origin_frame=frame_r, target_frame=self.reconstruction_frame)
         pc_l_tr = self.left_parser.transform_pc(pc_l, origin_frame=frame_l, target_frame=self.reconstruction_frame)
         # view
         pc_r_tr[:, 3] = 1 # paint it red
         pc_l_tr[:, 5] = 1 # paint it blue
-        pc_r_tr[pc_r_contact_indxs, 3:6] = np.array([0, 1, 0]) # green
-        pc_l_tr[pc_l_contact_indxs, 3:6] = np.array([0, 1, 0]) # green
+        pc_r_tr[pc_r_contact_mask, 3:6] = np.array([0, 1, 0]) # green
+        pc_l_tr[pc_l_contact_mask, 3:6] = np.array([0, 1, 0]) # green
         if view:
             print('visualizing the bubbles with the imprint on green')
             view_pointcloud([pc_r_tr, pc_l_tr], frame=True)
 
-        imprint_r = pc_r_tr[pc_r_contact_indxs]
-        imprint_l = pc_l_tr[pc_l_contact_indxs]
+        imprint_r = pc_r_tr[pc_r_contact_mask]
+        imprint_l = pc_l_tr[pc_l_contact_mask]
         if view:
             print('visualizing the imprint on green')
             view_pointcloud([imprint_r, imprint_l], frame=True)
@@ -235,24 +357,45 @@ class BubblePCReconsturctorTreeSearch(BubblePCReconstructorROSBase):
             return imprint, imprint_r, imprint_l
         return imprint
 
-    def _get_far_points_indxs(self, query_pc, d_threshold, key):
+    def _get_filtered_contact_mask(self, pc, key):
+        """
+        Filter the raw point cloud and detect the contact points on it.
+        Returns:
+            - filtered_pc: <np.ndarray> (K, 6) point cloud inside the bubble cone
+            - contact_mask: <np.ndarray> (K,) boolean mask of the points in filtered_pc that are in contact
+        """
+        filter_mask = self.filter_mask(pc, camera_key=key)
+        filtered_pc = pc[filter_mask]
+        if self.far_points_method == 'depth':
+            # compare the organized clouds pixel by pixel before filtering
+            contact_mask = get_far_points_mask_depth(self.raw_references[key], pc, d_threshold=self.threshold)[filter_mask]
+        else:
+            contact_mask = self._get_far_points_mask(filtered_pc, d_threshold=self.threshold, key=key)
+        return filtered_pc, contact_mask
+
+    def _get_far_points_mask(self, query_pc, d_threshold, key):
         """
-        Compare the query_pc with the ref_pc and return the points in query_pc that are farther than d_threshold from ref_pc
+        Compare the query_pc with the reference and return the points in query_pc that are farther than d_threshold from it
         Args:
-            ref_pc: <np.ndarray> (N,6)  reference point cloud
             query_pc: <np.ndarray> (N,6) query point cloud,
             d_threshold: <float> threshold distance to consider far if d>d_threshold
+            key: <str> 'right' or 'left'
         Returns:
-            - list of points indxs in query_pc that are far from ref_pc
+            - <np.ndarray> (N,) boolean mask of the points in query_pc that are far from the reference
         """
         tree = self.trees[key]
         if tree is None:
             print('tree not initialized yet')
-            self.trees[key] = KDTree(self.references['{}_pc'.format(key)][:, :3])
+            self.trees[key] = KDTree(self.references[key][:, :3])
             tree = self.trees[key]
-        qry_xyz = query_pc[:, :3]
-        near_qry_indxs = tree.query_ball_point(qry_xyz, d_threshold)
-        far_qry_indxs = [i for i, x in enumerate(near_qry_indxs) if len(x) == 0]
+        if self.far_points_method == 'ball':
+            far_mask = get_far_points_mask_ball(tree, query_pc, d_threshold)
+        else:
+            far_mask = get_far_points_mask_nn(tree, query_pc, d_threshold)
+        return far_mask
+
+    def _get_far_points_indxs(self, query_pc, d_threshold, key):
+        far_qry_indxs = np.where(self._get_far_points_mask(query_pc, d_threshold, key))[0]
         return far_qry_indxs
 
 
@@ -273,14 +416,22 @@ class BubblePCReconsturctorDepth(BubblePCReconstructorROSBase):
         self.references['left_frame'] = self.right_parser.optical_frame['depth']
         self.references['right_frame'] = self.left_parser.optical_frame['depth']
         self.last_tr = None
+        self.pose_estimator.last_tr = None
+
+    def read_frame(self):
+        frame = {
+            'depth_r': self.right_parser.get_image_depth(),
+            'depth_l': self.left_parser.get_image_depth(),
+            'frame_r': self.right_parser.optical_frame['depth'],
+            'frame_l': self.left_parser.optical_frame['depth'],
+        }
+        return frame
 
-    def get_imprint(self, view=False, separate=False):
-        depth_r = self.right_parser.get_image_depth()
-        depth_l = self.left_parser.get_image_depth()
+    def get_imprint_from_frame(self, frame, view=False, separate=False):
+        depth_r, frame_r = frame['depth_r'], frame['frame_r']
+        depth_l, frame_l = frame['depth_l'], frame['frame_l']
         imprint_r = get_imprint_pc(self.references['right'].squeeze(-1), depth_r.squeeze(-1), threshold=self.threshold, K=self.camera_info['right']['K'], percentile=self.percentile)
         imprint_l = get_imprint_pc(self.references['left'].squeeze(-1), depth_l.squeeze(-1), threshold=self.threshold, K=self.camera_info['left']['K'], percentile=self.percentile)
-        frame_r = self.right_parser.optical_frame['depth']
-        frame_l = self.left_parser.optical_frame['depth']
 
         filtered_imprint_r = self.filter_pc(imprint_r)
         filtered_imprint_l = self.filter_pc(imprint_l)
@@ -332,14 +483,12 @@ class BubblePCReconstructorOfflineDepth(BubblePCReconstructorBase):
     def reference(self):
         pass
 
-    def add_tfs(self, tfs_df):
-        for indx, row in tfs_df.iterrows():
+    def add_tfs(self, tfs):
+        # tfs: TfTable or tfs DataFrame
+        tf_table = as_tf_table(tfs)
+        for child_frame_id, pose_i in zip(tf_table.frame_names, tf_table.poses):
             # pack the tf into a TrasformStamped message
-            q_i = [row['qx'], row['qy'], row['qz'], row['qw']]
-            t_i = [row['x'], row['y'], row['z']]
-            parent_frame_id = row['parent_frame']
-            child_frame_id = row['child_frame']
-            ts_msg_i = self._pack_transform_stamped_msg(q_i, t_i, parent_frame_id=parent_frame_id, child_frame_id=child_frame_id)
+            ts_msg_i = self._pack_transform_stamped_msg(pose_i[3:], pose_i[:3], parent_frame_id=tf_table.parent_frame, child_frame_id=child_frame_id)
             self.buffer.set_transform(ts_msg_i, 'default_authority')
 
     def _tr_pc(self, pc, origin_frame, target_frame):
@@ -362,7 +511,7 @@ class BubblePCReconstructorOfflineDepth(BubblePCReconstructorBase):
         return t, R
 
     def _pack_transform_stamped_msg(self, q, t, parent_frame_id, child_frame_id):
-        ts_msg = TransformStamped()
+        ts_msg = geometry_msgs.TransformStamped()
         ts_msg.header.stamp = rospy.Time(0)
         ts_msg.header.frame_id = parent_frame_id
         ts_msg.child_frame_id = child_frame_id
@@ -30,6 +30,8 @@ from mmint_camera_utils.point_cloud_parsers import PicoFlexxPointCloudParser
 from wsg_50_utils.wsg_50_gripper import WSG50Gripper
 
 from bubble_control.bubble_pose_estimation.bubble_pc_reconstruction import BubblePCReconsturctorDepth, BubblePCReconsturctorTreeSearch
+from bubble_control.bubble_pose_estimation.pose_estimation_pipeline import BubblePoseEstimationPipeline
+from bubble_control.bubble_contact_point_estimation.tool_contact_point_publisher import ToolContactPointPublisher
 
 
 class BubblePoseEstimator(object):
@@ -37,7 +39,7 @@ class BubblePoseEstimator(object):
     BubblePoseEstimation > BubblePCReconstructor > PoseEstimators
     """
 
-    def __init__(self, imprint_th=0.005, icp_th=0.01, rate=5.0, percentile=None, view=False, verbose=False, broadcast_imprint=False, object_name='allen', estimation_type='icp3d', reconstruction='depth', gripper_width=None):
+    def __init__(self, imprint_th=0.005, icp_th=0.01, rate=5.0, percentile=None, view=False, verbose=False, broadcast_imprint=False, object_name='allen', estimation_type='icp3d', reconstruction='depth', gripper_width=None, pipelined=False, report_period=None, contact_point_plane_frame=None):
         self.object_name = object_name
         self.imprint_th = imprint_th
         self.icp_th = icp_th
@@ -48,6 +50,10 @@ class BubblePoseEstimator(object):
         self.broadcast_imprint = broadcast_imprint
         self.estimation_type = estimation_type
         self.gripper_width = gripper_width
+        self.pipelined = pipelined
+        self.report_period = report_period # seconds between pipeline stats reports (only for pipelined)
+        self.contact_point_plane_frame = contact_point_plane_frame # if given, the tool contact point is computed from every pose estimate
+        self.pipeline = None
         try:
             rospy.init_node('bubble_pose_estimator')
         except (rospy.exceptions.ROSInitException, rospy.exceptions.ROSException):
@@ -57,12 +63,19 @@ class BubblePoseEstimator(object):
         self.marker_publisher = rospy.Publisher('estimated_object', Marker, queue_size=100)
         self.tf_broadcaster = tf.TransformBroadcaster()
         self.tool_estimated_pose = None
+        self.tool_estimated_pose_time = None
+        self.contact_point_publisher = None
+        if self.contact_point_plane_frame is not None:
+            self.contact_point_publisher = ToolContactPointPublisher(pose_frame=self.reconstructor.reconstruction_frame, plane_frame=self.contact_point_plane_frame)
         self.alive = True
         self.calibrate()
         self.lock = threading.Lock()
         self.publisher_thread = threading.Thread(target=self._marker_publishing_loop)
         self.publisher_thread.start()
-        self.estimate_pose(verbose=self.verbose)
+        if self.pipelined:
+            self.estimate_pose_pipelined(verbose=self.verbose)
+        else:
+            self.estimate_pose(verbose=self.verbose)
         rospy.spin()
 
     def _get_reconstructor(self, reconstruction_key):
@@ -99,33 +112,63 @@ class BubblePoseEstimator(object):
         rate = rospy.Rate(self.rate)
         while not rospy.is_shutdown():
             try:
+                frame_time = rospy.get_time()
                 icp_tr = self.reconstructor.estimate_pose(threshold=self.icp_th, view=self.view, verbose=verbose)
-                with self.lock:
-                    # update the tool_estimated_pose
-                    t = icp_tr[:3, 3]
-                    q = tr.quaternion_from_matrix(icp_tr)
-                    self.tool_estimated_pose = np.concatenate([t, q])
+                self._update_tool_pose(icp_tr, frame_time=frame_time)
             except rospy.ROSInterruptException:
                 self.finish()
                 break
             rate.sleep()
 
+    def estimate_pose_pipelined(self, verbose=False):
+        # Acquisition, imprint extraction and pose estimation run on separate stages. Slow stages drop stale frames.
+        # frame times follow the ROS clock (also sim time), as in estimate_pose
+        self.pipeline = BubblePoseEstimationPipeline(self.reconstructor, icp_th=self.icp_th, pose_callback=self._update_tool_pose, rate=self.rate,
+                                                     verbose=verbose, clock=rospy.get_time, log_fn=rospy.logwarn)
+        self.pipeline.start()
+        last_report_time = rospy.get_time()
+        rate = rospy.Rate(self.rate)
+        while not rospy.is_shutdown():
+            try:
+                if self.report_period is not None and rospy.get_time() - last_report_time >= self.report_period:
+                    print(self.pipeline.report())
+                    last_report_time = rospy.get_time()
+                rate.sleep()
+            except rospy.ROSInterruptException:
+                break
+        self.finish()
+
+    def _update_tool_pose(self, icp_tr, frame_time):
+        stamp = rospy.Time.from_sec(frame_time) if frame_time is not None else rospy.Time.now()
+        with self.lock:
+            # update the tool_estimated_pose
+            t = icp_tr[:3, 3]
+            q = tr.quaternion_from_matrix(icp_tr)
+            self.tool_estimated_pose = np.concatenate([t, q])
+            self.tool_estimated_pose_time = stamp
+        if self.contact_point_publisher is not None:
+            # same timestamp as the pose, without waiting for the marker and tf round trips
+            self.contact_point_publisher.publish(icp_tr, stamp=stamp)
+
     def _marker_publishing_loop(self):
         publish_rate = rospy.Rate(self.rate)
         while not rospy.is_shutdown():
             with self.lock:
                 current_tool_pose = copy.deepcopy(self.tool_estimated_pose)
+                current_tool_pose_time = self.tool_estimated_pose_time
             if current_tool_pose is not None:
-                marker_i = self._create_marker(current_tool_pose[:3], current_tool_pose[3:])
+                marker_i = self._create_marker(current_tool_pose[:3], current_tool_pose[3:], stamp=current_tool_pose_time)
                 self.marker_publisher.publish(marker_i)
             publish_rate.sleep()
             with self.lock:
                 if not self.alive:
                     return
 
-    def _create_marker(self, t, q):
+    def _create_marker(self, t, q, stamp=None):
         mk = Marker()
         mk.header.frame_id = self.reconstructor.reconstruction_frame
+        if stamp is not None:
+            mk.header.stamp = stamp
         mk.type = Marker.CYLINDER
         mk.scale.x = 2*self.reconstructor.radius
         mk.scale.y = 2*self.reconstructor.radius
@@ -146,6 +189,9 @@ class BubblePoseEstimator(object):
         return mk
 
     def finish(self):
+        if self.pipeline is not None:
+            self.pipeline.finish()
+            print(self.pipeline.report())
         with self.lock:
             self.alive = False
         self.publisher_thread.join()
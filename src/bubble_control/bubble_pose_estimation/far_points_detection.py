@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def get_far_points_mask_ball(tree, query_pc, d_threshold):
+    """
+    Reference implementation. Queries the neighbours of each point within d_threshold and marks as far the ones without neighbours.
+    Args:
+        tree: <scipy.spatial.KDTree> built on the reference point cloud xyz
+        query_pc: <np.ndarray> (N, 6) query point cloud
+        d_threshold: <float> threshold distance to consider far if d>d_threshold
+    Returns:
+        - <np.ndarray> (N,) boolean mask of the points in query_pc that are far from the reference
+    """
+    near_qry_indxs = tree.query_ball_point(query_pc[:, :3], d_threshold)
+    far_mask = np.array([len(x) == 0 for x in near_qry_indxs], dtype=bool)
+    return far_mask
+
+
+def get_far_points_mask_nn(tree, query_pc, d_threshold):
+    """
+    Single nearest-neighbour query with an upper bound on the distance.
+    The tree stops searching as soon as no point can be closer than d_threshold, and points without any neighbour
+    within the bound get an infinite distance. No python lists are created.
+    Args:
+        tree: <scipy.spatial.KDTree> built on the reference point cloud xyz
+        query_pc: <np.ndarray> (N, 6) query point cloud
+        d_threshold: <float> threshold distance to consider far if d>d_threshold
+    Returns:
+        - <np.ndarray> (N,) boolean mask of the points in query_pc that are far from the reference
+    """
+    # distance_upper_bound is exclusive, so nudge it to match the inclusive query_ball_point criteria
+    nn_dists, _ = tree.query(query_pc[:, :3], k=1, distance_upper_bound=np.nextafter(d_threshold, np.inf))
+    far_mask = np.isinf(nn_dists)
+    return far_mask
+
+
+def get_far_points_mask_depth(ref_pc, query_pc, d_threshold):
+    """
+    Per-pixel comparison for organized point clouds (both clouds come from the same camera and have the same pixel ordering).
+    A point is far if its depth differs from the reference depth at the same pixel more than d_threshold.
+    Pixels with invalid (nan) depth in either cloud are never considered far.
+    Args:
+        ref_pc: <np.ndarray> (N, 6) organized reference point cloud
+        query_pc: <np.ndarray> (N, 6) organized query point cloud
+        d_threshold: <float>
+    Returns:
+        - <np.ndarray> (N,) boolean mask of the points in query_pc that are far from the reference
+    """
+    if ref_pc.shape[0] != query_pc.shape[0]:
+        raise ValueError('Depth far points detection requires organized point clouds of the same size. Got {} and {} points'.format(ref_pc.shape[0], query_pc.shape[0]))
+    with np.errstate(invalid='ignore'):
+        far_mask = np.abs(query_pc[:, 2] - ref_pc[:, 2]) > d_threshold
+    return far_mask
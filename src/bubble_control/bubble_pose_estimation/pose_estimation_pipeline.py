@@ -0,0 +1,245 @@
+import time
+import threading
+import numpy as np
+
+
+class LatestFrameSlot(object):
+    """
+    Single-slot queue where the newest item always wins.
+    Putting an item while the slot is full replaces (drops) the stale one, so slow consumers never accumulate latency.
+    """
+
+    def __init__(self):
+        self.item = None
+        self.has_item = False
+        self.num_dropped = 0
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        with self.condition:
+            if self.has_item:
+                self.num_dropped += 1
+            self.item = item
+            self.has_item = True
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Returns the latest item, or None if no item arrived before the timeout.
+        """
+        with self.condition:
+            if not self.has_item:
+                self.condition.wait(timeout=timeout)
+            if not self.has_item:
+                return None
+            item = self.item
+            self.item = None
+            self.has_item = False
+        return item
+
+    def wake_up(self):
+        with self.condition:
+            self.condition.notify_all()
+
+
+class StageStats(object):
+    """
+    Running latency and rate statistics of a pipeline stage.
+    """
+
+    def __init__(self, name, window_size=100):
+        self.name = name
+        self.window_size = window_size
+        self.latencies = []
+        self.timestamps = []
+        self.num_processed = 0
+        self.num_errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency):
+        with self.lock:
+            self.num_processed += 1
+            self.latencies.append(latency)
+            self.timestamps.append(time.time())
+            self.latencies = self.latencies[-self.window_size:]
+            self.timestamps = self.timestamps[-self.window_size:]
+
+    def record_error(self):
+        with self.lock:
+            self.num_errors += 1
+
+    def summary(self):
+        with self.lock:
+            latencies = np.asarray(self.latencies)
+            timestamps = np.asarray(self.timestamps)
+            num_processed = self.num_processed
+            num_errors = self.num_errors
+        summary = {
+            'stage': self.name,
+            'num_processed': num_processed,
+            'num_errors': num_errors,
+            'mean_latency': np.nan,
+            'max_latency': np.nan,
+            'rate': np.nan,
+        }
+        if len(latencies) > 0:
+            summary['mean_latency'] = np.mean(latencies)
+            summary['max_latency'] = np.max(latencies)
+        if len(timestamps) > 1:
+            summary['rate'] = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+        return summary
+
+
+class PipelineStage(object):
+    """
+    Thread that reads from an input slot, processes the item and writes the result to an output slot.
+    If process_fn returns None, nothing is forwarded to the next stage.
+    Errors are counted and the item is skipped. The first one is always logged with log_fn, the rest only if verbose.
+    """
+
+    def __init__(self, name, process_fn, input_slot=None, output_slot=None, timeout=0.1, verbose=False, log_fn=print):
+        self.name = name
+        self.process_fn = process_fn
+        self.input_slot = input_slot
+        self.output_slot = output_slot
+        self.timeout = timeout
+        self.verbose = verbose
+        self.log_fn = log_fn
+        self.stats = StageStats(name)
+        self.alive = False
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            self.alive = True
+        self.thread = threading.Thread(target=self._stage_loop)
+        self.thread.start()
+
+    def is_alive(self):
+        with self.lock:
+            return self.alive
+
+    def _stage_loop(self):
+        while self.is_alive():
+            item = None
+            if self.input_slot is not None:
+                item = self.input_slot.get(timeout=self.timeout)
+                if item is None:
+                    continue
+            start_time = time.time()
+            try:
+                output = self.process_fn(item)
+            except StopIteration:
+                # source exhausted (e.g. recorded frames consumed)
+                with self.lock:
+                    self.alive = False
+                break
+            except Exception as e:
+                self.stats.record_error()
+                if self.verbose or self.stats.num_errors == 1:
+                    self.log_fn('Pipeline stage {} failed ({} errors so far): {!r}'.format(self.name, self.stats.num_errors, e))
+                continue
+            self.stats.record(time.time() - start_time)
+            if output is not None and self.output_slot is not None:
+                self.output_slot.put(output)
+
+    def finish(self):
+        with self.lock:
+            self.alive = False
+        if self.input_slot is not None:
+            self.input_slot.wake_up()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class BubblePoseEstimationPipeline(object):
+    """
+    Staged pose estimation: acquisition -> imprint extraction -> pose estimation.
+    Stages run on separate threads connected by single-slot LatestFrameSlot queues, so a slow stage works always on
+    the most recent frame and stale frames are dropped.
+    """
+
+    def __init__(self, reconstructor, icp_th, pose_callback=None, tool_detection=True, rate=None, verbose=False, clock=time.time, log_fn=print):
+        """
+        Args:
+            reconstructor: BubblePCReconstructorROSBase instance (must implement read_frame and get_imprint_from_frame)
+            icp_th: <float> icp threshold used by the pose estimator
+            pose_callback: function called with (icp_tr, frame_time) every time a new pose is estimated
+            tool_detection: <bool> whether to run the tool detection on every imprint
+            rate: <float> upper bound on the acquisition rate. If None, acquire as fast as the cameras provide.
+            verbose: <bool>
+            clock: function returning the frame_time [s] of the acquired frames, e.g. rospy.get_time so they follow the
+                ROS (sim) time. Latencies and the rate are measured in wall time.
+            log_fn: function used by the stages to log their errors, e.g. rospy.logwarn
+        """
+        self.reconstructor = reconstructor
+        self.icp_th = icp_th
+        self.pose_callback = pose_callback
+        self.tool_detection = tool_detection
+        self.rate = rate
+        self.verbose = verbose
+        self.clock = clock
+        self.last_acquisition_time = None
+        self.end_to_end_stats = StageStats('end_to_end')
+        self.imprint_slot = LatestFrameSlot()
+        self.pose_slot = LatestFrameSlot()
+        self.stages = [
+            PipelineStage('acquisition', self._acquire, input_slot=None, output_slot=self.imprint_slot, verbose=verbose, log_fn=log_fn),
+            PipelineStage('imprint', self._extract_imprint, input_slot=self.imprint_slot, output_slot=self.pose_slot, verbose=verbose, log_fn=log_fn),
+            PipelineStage('pose', self._estimate_pose, input_slot=self.pose_slot, output_slot=None, verbose=verbose, log_fn=log_fn),
+        ]
+
+    def _acquire(self, _):
+        if self.rate is not None and self.last_acquisition_time is not None:
+            time_to_wait = 1. / self.rate - (time.time() - self.last_acquisition_time)
+            if time_to_wait > 0:
+                time.sleep(time_to_wait)
+        self.last_acquisition_time = time.time()
+        frame_time = self.clock()
+        frame = self.reconstructor.read_frame()
+        return {'frame': frame, 'frame_time': frame_time, 'acquisition_time': self.last_acquisition_time}
+
+    def _extract_imprint(self, item):
+        imprint, imprint_r, imprint_l = self.reconstructor.get_imprint_from_frame(item['frame'], separate=True)
+        if self.tool_detection:
+            self.reconstructor.publish_tool_detected(self.reconstructor.detect_tool(imprint_r, imprint_l, verbose=self.verbose))
+        return {'imprint': imprint, 'frame_time': item['frame_time'], 'acquisition_time': item['acquisition_time']}
+
+    def _estimate_pose(self, item):
+        icp_tr = self.reconstructor._estimate_pose(item['imprint'], self.icp_th, verbose=self.verbose)
+        self.end_to_end_stats.record(time.time() - item['acquisition_time'])
+        if self.pose_callback is not None:
+            self.pose_callback(icp_tr, item['frame_time'])
+        return icp_tr
+
+    def start(self):
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def is_alive(self):
+        return all([stage.is_alive() for stage in self.stages])
+
+    def finish(self):
+        for stage in self.stages:
+            stage.finish()
+
+    def get_stats(self):
+        stats = [stage.stats.summary() for stage in self.stages]
+        stats.append(self.end_to_end_stats.summary())
+        stats[1]['num_dropped'] = self.imprint_slot.num_dropped
+        stats[2]['num_dropped'] = self.pose_slot.num_dropped
+        return stats
+
+    def report(self):
+        report_lines = ['{:<12} {:>8} {:>8} {:>8} {:>12} {:>12} {:>10}'.format('stage', 'done', 'errors', 'dropped', 'latency[ms]', 'max[ms]', 'rate[Hz]')]
+        for stats_i in self.get_stats():
+            report_lines.append('{:<12} {:>8} {:>8} {:>8} {:>12.2f} {:>12.2f} {:>10.2f}'.format(stats_i['stage'],
+                                                                                           stats_i['num_processed'],
+                                                                                           stats_i['num_errors'],
+                                                                                           stats_i.get('num_dropped', 0),
+                                                                                           1000 * stats_i['mean_latency'],
+                                                                                           1000 * stats_i['max_latency'],
+                                                                                           stats_i['rate']))
+        report = '\n'.join(report_lines)
+        return report
@@ -1,12 +1,14 @@
 import numpy as np
 import abc
-from mmint_camera_utils.point_cloud_utils import pack_o3d_pcd, view_pointcloud
-import open3d as o3d
 import copy
-import tf.transformations as tr
 from scipy.spatial import KDTree
 from tqdm import tqdm
 from mmint_utils.terminal_colors import term_colors
+from bubble_control.aux.lazy_imports import lazy_import, lazy_import_from
+
+o3d = lazy_import('open3d')
+tr = lazy_import('tf.transformations')
+pack_o3d_pcd, view_pointcloud = lazy_import_from('mmint_camera_utils.point_cloud_utils', 'pack_o3d_pcd', 'view_pointcloud')
 
 
 class PCPoseEstimatorBase(abc.ABC):
@@ -244,6 +246,95 @@ class ICP2DPoseEstimator(ICPPoseEstimator):
         filtered_input = input_pc[np.where(dists <= d_th)]
         return filtered_input
 
+class ICP2DTrackerPoseEstimator(ICP2DPoseEstimator):
+    """
+    Real-time variant of the ICP2DPoseEstimator.
+    The projected object model is indexed only once and, at each iteration, the scene points are transformed into the
+    fixed model frame instead of re-indexing the transformed model. The 2D rotation is solved in closed form and the
+    iterations stop once the update is below the tolerances. The previous estimate is used as initial guess.
+    """
+    def __init__(self, *args, angle_tolerance=1e-4, translation_tolerance=1e-5, max_warm_start_distance=0.02, **kwargs):
+        """
+        Args:
+            angle_tolerance: <float> convergence tolerance on the rotation update (rad)
+            translation_tolerance: <float> convergence tolerance on the translation update (m)
+            max_warm_start_distance: <float> if the scene mean is farther than this from the previous estimate, the
+                previous estimate is discarded and the estimation is reinitialized.
+        """
+        self.angle_tolerance = angle_tolerance
+        self.translation_tolerance = translation_tolerance
+        self.max_warm_start_distance = max_warm_start_distance
+        self.num_iterations = 0
+        super().__init__(*args, **kwargs)
+        self.model_points = None
+        self.model_tree = None
+        self.indexed_model = None
+        self._index_model(self.object_model)
+
+    def _index_model(self, model_pcd):
+        # project and index the model only once per object
+        self.model_points = self._project_pc(np.asarray(model_pcd.points))[:, :2]
+        self.model_tree = KDTree(self.model_points)
+        self.indexed_model = model_pcd
+
+    def reset(self):
+        self.last_tr = None
+
+    def _get_init_tr(self, target_pcd):
+        init_tr = super()._get_init_tr(target_pcd) # centered at the scene mean
+        if self.last_tr is not None:
+            projected_last_tr = self.projection_tr @ self.last_tr @ tr.inverse_matrix(self.projection_tr)
+            if np.linalg.norm(projected_last_tr[:2, 3] - init_tr[:2, 3]) <= self.max_warm_start_distance:
+                init_tr = projected_last_tr
+        return init_tr
+
+    def _icp(self, source_pcd, target_pcd, threshold, init_tr):
+        if source_pcd is not self.indexed_model:
+            self._index_model(source_pcd)
+        target_points = self._project_pc(np.asarray(target_pcd.points))
+        if len(target_points) < 4:
+            print(f"{term_colors.WARNING}Warning: No scene points provided (we only have {len(target_points)} points){term_colors.ENDC}")
+            if self.last_tr is not None:
+                return self.last_tr
+            return init_tr
+        scene_points = target_points[:, :2]
+        mu_s = np.mean(scene_points, axis=0)
+        ps = scene_points - mu_s
+        # model to scene transformation: s = R(angle) @ m + t
+        angle = np.arctan2(init_tr[1, 0], init_tr[0, 0])
+        t = init_tr[:2, 3].copy()
+        for i in range(self.max_num_iterations):
+            c, s = np.cos(angle), np.sin(angle)
+            # Scene points on the model frame: m = R^T @ (s - t)
+            d = scene_points - t
+            scene_on_model = np.stack([c * d[:, 0] + s * d[:, 1], -s * d[:, 0] + c * d[:, 1]], axis=-1)
+            # Estimate Correspondences
+            _, cp_indxs = self.model_tree.query(scene_on_model)
+            model_points_corr = self.model_points[cp_indxs]
+            # Closed form 2D rotation and translation
+            mu_m = np.mean(model_points_corr, axis=0)
+            pm = model_points_corr - mu_m
+            sin_term = np.sum(pm[:, 0] * ps[:, 1] - pm[:, 1] * ps[:, 0])
+            cos_term = np.sum(pm[:, 0] * ps[:, 0] + pm[:, 1] * ps[:, 1])
+            new_angle = np.arctan2(sin_term, cos_term)
+            c, s = np.cos(new_angle), np.sin(new_angle)
+            new_t = mu_s - np.array([c * mu_m[0] - s * mu_m[1], s * mu_m[0] + c * mu_m[1]])
+            delta_angle = np.abs(np.arctan2(np.sin(new_angle - angle), np.cos(new_angle - angle)))
+            delta_t = np.linalg.norm(new_t - t)
+            angle, t = new_angle, new_t
+            if delta_angle < self.angle_tolerance and delta_t < self.translation_tolerance:
+                break
+        self.num_iterations = i + 1
+        if self.verbose:
+            print('ICP 2D tracker converged in {} iterations'.format(self.num_iterations))
+        icp_tr = np.eye(4)
+        icp_tr[:2, :2] = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        icp_tr[:2, 3] = t
+        unproject_tr = tr.inverse_matrix(self.projection_tr)
+        unprojected_icp_tr = unproject_tr @ icp_tr @ self.projection_tr
+        return unprojected_icp_tr
+
+
 # Debug 2D version:
 if __name__ == '__main__':
     # basic test with no projection required
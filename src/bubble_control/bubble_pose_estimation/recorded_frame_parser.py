@@ -0,0 +1,88 @@
+import time
+import threading
+import numpy as np
+
+from mmint_camera_utils.point_cloud_utils import tr_pointcloud
+
+
+class RecordedFrameParser(object):
+    """
+    Stand-in for PicoFlexxPointCloudParser that replays recorded frames instead of reading from the ROS network.
+    It implements the subset of the parser API used by the bubble reconstructors so they can run (and be benchmarked) offline.
+    """
+
+    def __init__(self, frames, camera_info_depth, optical_frame='pico_flexx_optical_frame', transforms=None, rate=None, loop=True):
+        """
+        Args:
+            frames: list of dicts with the recorded data. Each frame may contain the keys 'depth' <np.ndarray> (w, h, 1)
+                and 'point_cloud' <np.ndarray> (N, 6).
+            camera_info_depth: <dict> camera info for the depth camera (must contain 'K', 'height' and 'width')
+            optical_frame: <str> name of the camera optical frame
+            transforms: <dict> mapping (target_frame, origin_frame) to a <np.ndarray> (4, 4) homogeneous transformation.
+            rate: <float> emulated camera rate in Hz. If None, frames are returned as fast as requested.
+            loop: <bool> if True, restart from the first frame once all frames have been consumed.
+        """
+        self.frames = list(frames)
+        self.camera_info_depth = camera_info_depth
+        self.optical_frame = {'depth': optical_frame, 'color': optical_frame}
+        self.transforms = {} if transforms is None else dict(transforms)
+        self.rate = rate
+        self.loop = loop
+        self.frame_indx = 0
+        self.last_read_time = None
+        self.lock = threading.Lock()
+
+    @property
+    def num_frames(self):
+        return len(self.frames)
+
+    def reset(self):
+        with self.lock:
+            self.frame_indx = 0
+            self.last_read_time = None
+
+    def _next_frame(self):
+        with self.lock:
+            if self.frame_indx >= len(self.frames):
+                if not self.loop:
+                    raise StopIteration('No more recorded frames')
+                self.frame_indx = 0
+            frame = self.frames[self.frame_indx]
+            self.frame_indx += 1
+            # emulate the camera frame rate
+            if self.rate is not None and self.last_read_time is not None:
+                time_to_wait = 1. / self.rate - (time.time() - self.last_read_time)
+                if time_to_wait > 0:
+                    time.sleep(time_to_wait)
+            self.last_read_time = time.time()
+        return frame
+
+    def get_camera_info_depth(self):
+        return self.camera_info_depth
+
+    def get_image_depth(self):
+        frame = self._next_frame()
+        return frame['depth'].copy()
+
+    def get_point_cloud(self, return_ref_frame=False, ref_frame=None):
+        frame = self._next_frame()
+        pc = frame['point_cloud'].copy()
+        pc_frame = self.optical_frame['depth']
+        if ref_frame is not None and ref_frame != pc_frame:
+            pc = self.transform_pc(pc, origin_frame=pc_frame, target_frame=ref_frame)
+            pc_frame = ref_frame
+        if return_ref_frame:
+            return pc, pc_frame
+        return pc
+
+    def transform_pc(self, pc, origin_frame, target_frame):
+        if origin_frame == target_frame:
+            return pc.copy()
+        if (target_frame, origin_frame) in self.transforms:
+            X = self.transforms[(target_frame, origin_frame)]
+        elif (origin_frame, target_frame) in self.transforms:
+            X = np.linalg.inv(self.transforms[(origin_frame, target_frame)])
+        else:
+            raise KeyError('No recorded transform from {} to {}'.format(origin_frame, target_frame))
+        pc_tr = tr_pointcloud(pc, X[:3, :3], X[:3, 3])
+        return pc_tr
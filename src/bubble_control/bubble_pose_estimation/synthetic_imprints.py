@@ -0,0 +1,240 @@
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from bubble_control.aux.load_confs import load_object_models
+from bubble_control.aux.tf_table import as_tf_table
+
+
+camera_names = ['right', 'left']
+
+
+def get_optical_frame_name(camera_name):
+    return 'pico_flexx_{}_optical_frame'.format(camera_name)
+
+
+def get_tf_matrices(tfs):
+    """
+    Args:
+        tfs: TfTable or tfs DataFrame as loaded by the datasets (_load_tfs), all with respect to the same parent frame
+    Returns:
+        - <dict> {frame_name: (4, 4) homogeneous transformation from the parent frame to the frame}.
+          The parent frame is included as the identity.
+    """
+    return {k: X.copy() for k, X in as_tf_table(tfs).to_matrix_dict().items()}
+
+
+def pose_error(X_est, X_gth, projection_axis=(1, 0, 0)):
+    """
+    Error between estimated and ground truth poses.
+    Args:
+        X_est: <np.ndarray> (..., 4, 4) estimated poses
+        X_gth: <np.ndarray> (..., 4, 4) ground truth poses
+        projection_axis: axis normal to the plane the 2D estimators work on
+    Returns:
+        - <dict> of (...,) arrays:
+            'trans_error': translation error norm [m]
+            'plane_trans_error': translation error norm on the projection plane [m]
+            'angle_error': absolute rotation error about the projection axis [rad]
+            'rot_error': geodesic rotation error [rad]
+    """
+    projection_axis = np.asarray(projection_axis, dtype=np.float64)
+    projection_axis = projection_axis / np.linalg.norm(projection_axis)
+    delta_t = X_est[..., :3, 3] - X_gth[..., :3, 3]
+    plane_delta_t = delta_t - np.einsum('...i,i->...', delta_t, projection_axis)[..., None] * projection_axis
+    delta_R = np.swapaxes(X_gth[..., :3, :3], -1, -2) @ X_est[..., :3, :3]
+    cos_rot = np.clip((np.trace(delta_R, axis1=-2, axis2=-1) - 1) * 0.5, -1., 1.)
+    # rotation about the projection axis: angle of the rotated in-plane axes
+    in_plane_axis = np.cross(projection_axis, [0., 0., 1.] if abs(projection_axis[2]) < 0.9 else [1., 0., 0.])
+    in_plane_axis = in_plane_axis / np.linalg.norm(in_plane_axis)
+    rotated_axis = delta_R @ in_plane_axis
+    sin_angle = np.einsum('...i,i->...', np.cross(in_plane_axis, rotated_axis), projection_axis)
+    cos_angle = np.einsum('...i,i->...', rotated_axis, in_plane_axis)
+    errors = {
+        'trans_error': np.linalg.norm(delta_t, axis=-1),
+        'plane_trans_error': np.linalg.norm(plane_delta_t, axis=-1),
+        'angle_error': np.abs(np.arctan2(sin_angle, cos_angle)),
+        'rot_error': np.arccos(cos_rot),
+    }
+    return errors
+
+
+class SyntheticBubbleLayout(object):
+    """
+    Camera setup of the two bubbles: depth intrinsics, undeformed (reference) depth images and the tfs of all frames
+    with respect to the world frame (med_base), as found in a recorded sample.
+    It can be saved to a small file, so the synthetic data can be generated without the recorded dataset.
+    """
+    def __init__(self, Ks, reference_depths, tf_matrices):
+        """
+        Args:
+            Ks: <dict> {camera_name: (3, 3) depth camera intrinsics}
+            reference_depths: <dict> {camera_name: (w, h) undeformed depth image [m]}
+            tf_matrices: <dict> {frame_name: (4, 4) world_X_frame}. It must contain the grasp_frame and the optical frames.
+        """
+        self.Ks = {k: np.asarray(v, dtype=np.float64) for k, v in Ks.items()}
+        self.reference_depths = {k: np.asarray(v, dtype=np.float64).squeeze() for k, v in reference_depths.items()}
+        self.tf_matrices = {k: np.asarray(v, dtype=np.float64) for k, v in tf_matrices.items()}
+
+    @classmethod
+    def from_dataset(cls, dataset, fc=0):
+        """
+        Use the undeformed depth images, camera info and tfs of the sample fc of a drawing dataset.
+        """
+        dl_line = dataset.dl.iloc[fc]
+        scene_name = dl_line['Scene']
+        undef_fc = int(dl_line['UndeformedFC'])
+        Ks = {}
+        reference_depths = {}
+        for camera_name in camera_names:
+            Ks[camera_name] = dataset._load_camera_info_depth(scene_name=scene_name, camera_name=camera_name, fc=undef_fc)['K']
+            reference_depths[camera_name] = dataset._load_depth_img(fc=undef_fc, scene_name=scene_name, camera_name=camera_name)
+        tf_matrices = get_tf_matrices(dataset._load_tfs(undef_fc, scene_name))
+        return cls(Ks, reference_depths, tf_matrices)
+
+    def save(self, path):
+        arrays = {}
+        for camera_name in camera_names:
+            arrays['K_{}'.format(camera_name)] = self.Ks[camera_name]
+            arrays['reference_depth_{}'.format(camera_name)] = self.reference_depths[camera_name]
+        frame_names = list(self.tf_matrices.keys())
+        arrays['frame_names'] = np.array(frame_names)
+        arrays['tf_matrices'] = np.stack([self.tf_matrices[f] for f in frame_names], axis=0)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(path)
+        Ks = {camera_name: arrays['K_{}'.format(camera_name)] for camera_name in camera_names}
+        reference_depths = {camera_name: arrays['reference_depth_{}'.format(camera_name)] for camera_name in camera_names}
+        tf_matrices = dict(zip([str(f) for f in arrays['frame_names']], arrays['tf_matrices']))
+        return cls(Ks, reference_depths, tf_matrices)
+
+    def get_transformation_matrix(self, source_frame, target_frame):
+        # source_frame_X_target_frame
+        return np.linalg.inv(self.tf_matrices[source_frame]) @ self.tf_matrices[target_frame]
+
+
+class SyntheticImprintGenerator(object):
+    """
+    Render the deformed depth images of both bubbles for an object at a known pose with respect to the grasp frame.
+    The object model points are splatted on the depth images of each camera, and the membrane takes the object depth
+    where the object is in front of the undeformed membrane (depth_def = min(depth_ref, depth_object)).
+    Images follow the depth image convention depth[v, u] (rows are the image y axis).
+    """
+    def __init__(self, layout, object_model, point_radius=0.001, penetration=0., noise_std=0., grasp_frame='grasp_frame'):
+        """
+        Args:
+            layout: SyntheticBubbleLayout
+            object_model: <np.ndarray> (N, 3+) object model points in the object frame, as in object_models.npy
+            point_radius: <float> radius [m] of the surface patch rendered around each model point. It should be about
+                the model point spacing, so the rendered surface has no holes.
+            penetration: <float> extra depth [m] the object is pressed into the membranes (grasp squeeze)
+            noise_std: <float> standard deviation [m] of the gaussian depth noise added to the deformed images
+            grasp_frame: <str>
+        """
+        self.layout = layout
+        self.object_points = np.asarray(object_model, dtype=np.float64)[:, :3]
+        self.point_radius = point_radius
+        self.penetration = penetration
+        self.noise_std = noise_std
+        self.grasp_frame = grasp_frame
+
+    @classmethod
+    def from_object_name(cls, layout, object_name, **kwargs):
+        object_model = np.asarray(load_object_models()[object_name].points)
+        return cls(layout, object_model, **kwargs)
+
+    def render_object_depth(self, gf_X_obj, camera_name):
+        """
+        Depth image of the object model seen from the camera. Pixels not covered by the object are inf.
+        Args:
+            gf_X_obj: <np.ndarray> (4, 4) object pose with respect to the grasp frame
+            camera_name: <str> 'right' or 'left'
+        Returns:
+            - <np.ndarray> (w, h) object depth [m]
+        """
+        K = self.layout.Ks[camera_name]
+        img_shape = self.layout.reference_depths[camera_name].shape
+        cam_X_gf = self.layout.get_transformation_matrix(get_optical_frame_name(camera_name), self.grasp_frame)
+        cam_X_obj = cam_X_gf @ gf_X_obj
+        points = self.object_points @ cam_X_obj[:3, :3].T + cam_X_obj[:3, 3]
+        points = points[points[:, 2] > 1e-6]
+        object_depth = np.full(img_shape, np.inf)
+        if len(points) == 0:
+            return object_depth
+        z = points[:, 2]
+        u = K[0, 0] * points[:, 0] / z + K[0, 2]
+        v = K[1, 1] * points[:, 1] / z + K[1, 2]
+        radius_px = np.ceil(self.point_radius * K[0, 0] / z).astype(np.int64) # (N,)
+        u_i = np.round(u).astype(np.int64)
+        v_i = np.round(v).astype(np.int64)
+        max_radius = int(radius_px.max())
+        flat_depth = object_depth.reshape(-1)
+        # splat all the points at once for each pixel offset of the largest patch
+        for du in range(-max_radius, max_radius + 1):
+            for dv in range(-max_radius, max_radius + 1):
+                u_d = u_i + du
+                v_d = v_i + dv
+                valid = (np.abs(du) <= radius_px) & (np.abs(dv) <= radius_px) & (u_d >= 0) & (u_d < img_shape[1]) & (v_d >= 0) & (v_d < img_shape[0])
+                np.minimum.at(flat_depth, v_d[valid] * img_shape[1] + u_d[valid], z[valid])
+        return object_depth
+
+    def render_depth(self, gf_X_obj, camera_name, rng=None):
+        """
+        Returns:
+            - <np.ndarray> (w, h) deformed depth image [m] of the camera bubble
+        """
+        depth_ref = self.layout.reference_depths[camera_name]
+        object_depth = self.render_object_depth(gf_X_obj, camera_name) - self.penetration
+        depth_def = np.where(object_depth < depth_ref, object_depth, depth_ref)
+        if self.noise_std > 0:
+            rng = np.random.default_rng() if rng is None else rng
+            depth_def = depth_def + rng.normal(0, self.noise_std, size=depth_def.shape)
+        return depth_def
+
+    def get_sample(self, gf_X_obj, rng=None):
+        """
+        Args:
+            gf_X_obj: <np.ndarray> (4, 4) object pose with respect to the grasp frame
+        Returns:
+            - <dict> with the undeformed and deformed depth images (w, h, 1) of both bubbles ('undef_depth_r',
+              'def_depth_r', ...), their imprints (undeformed - deformed), camera intrinsics, the tfs and the ground truth
+              pose 'gf_X_obj' (4, 4).
+        """
+        sample = {'gf_X_obj': np.asarray(gf_X_obj, dtype=np.float64), 'all_tfs': self.layout.tf_matrices}
+        for camera_name in camera_names:
+            key = camera_name[0]
+            depth_ref = self.layout.reference_depths[camera_name]
+            depth_def = self.render_depth(gf_X_obj, camera_name, rng=rng)
+            sample['undef_depth_{}'.format(key)] = depth_ref[..., None]
+            sample['def_depth_{}'.format(key)] = depth_def[..., None]
+            sample['imprint_{}'.format(key)] = (depth_ref - depth_def)[..., None]
+            sample['camera_info_{}'.format(key)] = {'K': self.layout.Ks[camera_name]}
+        return sample
+
+    def sample_poses(self, num_poses, max_translation=0.005, max_angle=np.pi/6, rotation_axis=(1, 0, 0), nominal_pose=None, rng=None):
+        """
+        Random object poses with respect to the grasp frame, around the nominal pose. The object is rotated about
+        rotation_axis and translated on the plane normal to it, which is how a grasped tool moves between the bubbles.
+        Returns:
+            - <np.ndarray> (num_poses, 4, 4)
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        rotation_axis = np.asarray(rotation_axis, dtype=np.float64)
+        rotation_axis = rotation_axis / np.linalg.norm(rotation_axis)
+        nominal_pose = np.eye(4) if nominal_pose is None else np.asarray(nominal_pose)
+        angles = rng.uniform(-max_angle, max_angle, size=num_poses)
+        translations = rng.uniform(-max_translation, max_translation, size=(num_poses, 3))
+        translations = translations - np.outer(translations @ rotation_axis, rotation_axis) # on the plane
+        poses = np.tile(np.eye(4), (num_poses, 1, 1))
+        poses[:, :3, :3] = Rotation.from_rotvec(angles[:, None] * rotation_axis).as_matrix()
+        poses[:, :3, 3] = translations
+        return poses @ nominal_pose
+
+    def get_samples(self, num_samples, rng=None, **kwargs):
+        """
+        Samples for random poses (see sample_poses for the kwargs).
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        poses = self.sample_poses(num_samples, rng=rng, **kwargs)
+        return [self.get_sample(pose, rng=rng) for pose in poses]
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+"""
+Check that recording through AsyncRecorder with snapshot_recorders writes the same files as recording inline, even if
+the sensors receive new data before the writer threads run.
+Fake camera parsers replace the ROS ones: a subscriber callback replaces their last message and record(fc) saves it.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import filecmp
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.aux.async_recorder import AsyncRecorder, get_recorders, snapshot_recorders
+
+
+class FakeCameraParser(object):
+    def __init__(self, camera_name, save_path, write_event=None):
+        self.camera_name = camera_name
+        self.save_path = save_path
+        self.write_event = write_event
+        self.last_depth = None
+
+    def _depth_callback(self, depth_img):
+        self.last_depth = depth_img
+
+    def get_image_depth(self):
+        return self.last_depth
+
+    def record(self, fc=None):
+        if self.write_event is not None:
+            self.write_event.wait() # the writer threads run after the sensors have been updated
+        np.save(os.path.join(self.save_path, '{}_depth_{:06d}.npy'.format(self.camera_name, fc)), self.last_depth)
+
+
+class FakeCollector(object):
+    def __init__(self, save_path, async_recording=False, write_event=None):
+        self.camera_parser_right = FakeCameraParser('pico_flexx_right', save_path, write_event=write_event)
+        self.camera_parser_left = FakeCameraParser('pico_flexx_left', save_path, write_event=write_event)
+        self.recorder = AsyncRecorder(num_workers=2, max_queue_size=3) if async_recording else None
+
+    def _record_inline(self, fc=None):
+        self.camera_parser_right.record(fc=fc)
+        self.camera_parser_left.record(fc=fc)
+
+    def _record(self, fc=None):
+        if self.recorder is None:
+            return self._record_inline(fc=fc)
+        self.recorder.submit(snapshot_recorders(self)._record_inline, fc)
+
+
+def collect(collector, num_samples=3):
+    for fc in range(num_samples):
+        collector.camera_parser_right._depth_callback(np.full((4, 5), fc, dtype=np.float32))
+        collector.camera_parser_left._depth_callback(np.full((4, 5), -fc, dtype=np.float32))
+        collector._record(fc=fc)
+    # new data arrives while the recordings are pending
+    collector.camera_parser_right._depth_callback(np.full((4, 5), np.nan, dtype=np.float32))
+    collector.camera_parser_left._depth_callback(np.full((4, 5), np.nan, dtype=np.float32))
+
+
+def test_get_recorders():
+    collector = FakeCollector(tempfile.gettempdir(), async_recording=True)
+    assert sorted(get_recorders(collector)) == ['camera_parser_left', 'camera_parser_right']
+    collector.recorder.finish()
+
+
+def test_async_recording_matches_inline():
+    inline_path = tempfile.mkdtemp()
+    async_path = tempfile.mkdtemp()
+    try:
+        collect(FakeCollector(inline_path))
+        write_event = threading.Event()
+        collector = FakeCollector(async_path, async_recording=True, write_event=write_event)
+        collect(collector, num_samples=3)
+        assert collector.recorder.num_pending() > 0
+        write_event.set()
+        collector.recorder.flush()
+        collector.recorder.finish()
+        file_names = sorted(os.listdir(inline_path))
+        assert len(file_names) == 6
+        assert sorted(os.listdir(async_path)) == file_names
+        _, mismatch, errors = filecmp.cmpfiles(inline_path, async_path, file_names, shallow=False)
+        assert mismatch == [] and errors == []
+    finally:
+        shutil.rmtree(inline_path)
+        shutil.rmtree(async_path)
+
+
+if __name__ == '__main__':
+    test_get_recorders()
+    test_async_recording_matches_inline()
+    print('OK')
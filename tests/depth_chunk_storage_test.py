@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+"""
+Check that the chunked depth storage returns the original depth frames up to the quantization, with the invalid (NaN)
+pixels kept, and that the conversion of per-filecode frames verifies against the raw frames.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.aux.depth_chunk_storage import DEFAULT_DEPTH_SCALE, encode_depth, decode_depth, depths_match, \
+    DepthChunkWriter, DepthChunkReader, get_depth_storage_path, convert_depth_frames_to_chunks
+
+
+def get_depth_img(seed, shape=(172, 224, 1), nan_fraction=0.1):
+    rng = np.random.default_rng(seed)
+    depth_img = rng.uniform(0.05, 0.2, size=shape).astype(np.float32)
+    depth_img[rng.random(shape) < nan_fraction] = np.nan
+    depth_img[0, 0] = 0. # zero depths are not invalid
+    return depth_img
+
+
+def check_depth(depth_img, stored_depth_img):
+    assert stored_depth_img.shape == depth_img.shape
+    assert np.array_equal(np.isnan(stored_depth_img), np.isnan(depth_img))
+    assert stored_depth_img[0, 0] == 0.
+    assert np.nanmax(np.abs(stored_depth_img - depth_img)) <= DEFAULT_DEPTH_SCALE
+    assert depths_match(depth_img, stored_depth_img)
+
+
+def test_encode_decode_keeps_nans():
+    depth_img = get_depth_img(0)
+    stored_depth_img = decode_depth(encode_depth(depth_img), depth_img.shape)
+    check_depth(depth_img, stored_depth_img)
+    # the same values with the NaNs replaced by 0 do not match
+    assert not depths_match(np.nan_to_num(depth_img, nan=0.), stored_depth_img)
+
+
+def test_out_of_range_depth_raises():
+    for depth_value in [-0.01, 1.0, np.inf]:
+        try:
+            encode_depth(np.full((2, 2), depth_value))
+        except ValueError:
+            continue
+        raise AssertionError('Depth {} should be out of the storable range'.format(depth_value))
+
+
+def test_chunk_round_trip():
+    data_path = tempfile.mkdtemp()
+    try:
+        depth_imgs = {fc: get_depth_img(fc) for fc in range(7)}
+        writer = DepthChunkWriter(get_depth_storage_path(data_path, 'scene', 'right'), frames_per_chunk=3)
+        for fc, depth_img in depth_imgs.items():
+            writer.write(fc, depth_img)
+        reader = DepthChunkReader(writer.storage_path)
+        for fc, stored_depth_img in zip(depth_imgs, reader.read_many(list(depth_imgs))):
+            check_depth(depth_imgs[fc], stored_depth_img)
+        check_depth(depth_imgs[4], reader.read(4))
+
+        def load_depth_fn(fc, scene_name, camera_name):
+            return depth_imgs[fc]
+        num_converted = convert_depth_frames_to_chunks(data_path, 'scene', 'left', list(depth_imgs), load_depth_fn, frames_per_chunk=3)
+        assert num_converted == len(depth_imgs)
+        reader = DepthChunkReader(get_depth_storage_path(data_path, 'scene', 'left'))
+        for fc, depth_img in depth_imgs.items():
+            check_depth(depth_img, reader.read(fc))
+    finally:
+        shutil.rmtree(data_path)
+
+
+if __name__ == '__main__':
+    test_encode_decode_keeps_nans()
+    test_out_of_range_depth_raises()
+    test_chunk_round_trip()
+    print('OK')
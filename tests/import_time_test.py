@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+"""
+Check that the core modules (batched ICP, transforms, datasets, models and controllers) import without ROS,
+visualization or hardware packages, and within a time budget.
+Each module is imported in a fresh interpreter where the heavy packages can not be imported.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import json
+import subprocess
+import argparse
+
+
+HEAVY_MODULES = ['rospy', 'tf', 'tf2_ros', 'sensor_msgs', 'geometry_msgs', 'std_msgs', 'visualization_msgs', 'ros_numpy',
+                 'open3d', 'sklearn', 'cv2', 'matplotlib', 'pytorch_mppi', 'bubble_pivoting']
+
+CORE_MODULES = [
+    'bubble_control.bubble_pose_estimation.batched_pytorch_icp',
+    'bubble_control.bubble_learning.aux.orientation_trs',
+    'bubble_control.aux.tf_table',
+    'bubble_control.aux.action_spaces',
+    'bubble_control.bubble_model_control.aux.bubble_model_control_utils',
+    'bubble_control.bubble_model_control.aux.lazy_pose',
+    'bubble_control.bubble_model_control.aux.format_observation',
+    'bubble_control.bubble_model_control.controllers.sampling_optimizers',
+    'bubble_control.bubble_model_control.controllers.bubble_model_sampling_controller',
+    'bubble_control.bubble_model_control.cost_functions',
+    'bubble_control.bubble_model_control.drawing_action_models',
+    'bubble_control.bubble_model_control.controllers.bubble_model_mppi_controler',
+    'bubble_control.bubble_model_control.model_output_object_pose_estimaton',
+    'bubble_control.bubble_pose_estimation.bubble_pc_reconstruction',
+    'bubble_control.bubble_learning.models.bubble_dynamics_model',
+    'bubble_control.bubble_learning.models.object_pose_dynamics_model',
+    'bubble_control.bubble_learning.models.icp_approximation_model',
+    'bubble_control.bubble_learning.datasets.bubble_drawing_dataset',
+    'bubble_control.bubble_envs.replay_drawing_env',
+    'bubble_control.bubble_model_control.controller_evaluation',
+]
+
+IMPORT_TIME_BUDGET = 10. # [s] per module, including torch
+
+# Run in the subprocess: block the heavy modules and report which one was requested and from where.
+_IMPORT_SCRIPT = """
+import sys, json, time, traceback, importlib.abc
+heavy_modules = {heavy_modules}
+class HeavyImportBlocker(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        if fullname.split('.')[0] in heavy_modules:
+            raise ImportError('heavy module ' + fullname + ' imported', name=fullname)
+        return None
+sys.meta_path.insert(0, HeavyImportBlocker())
+start_time = time.time()
+result = {{'status': 'ok'}}
+try:
+    importlib.import_module({module_name!r})
+except ImportError as e:
+    frames = traceback.extract_tb(e.__traceback__)
+    importer = [f.filename for f in frames if not f.filename.startswith('<')][-1]
+    missing = (e.name or '').split('.')[0]
+    if missing in heavy_modules:
+        result = {{'status': 'heavy', 'module': e.name, 'importer': importer}}
+    else:
+        result = {{'status': 'missing', 'module': e.name, 'importer': importer}}
+result['time'] = time.time() - start_time
+print(json.dumps(result))
+"""
+
+
+def get_src_path():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def import_module_isolated(module_name):
+    """
+    Import the module in a new interpreter where the HEAVY_MODULES can not be imported.
+    Returns:
+        - <dict> with 'status' ('ok', 'heavy' or 'missing'), 'time' and, if not 'ok', the 'module' that failed
+          and the 'importer' file that imported it.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([get_src_path()] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if len(p) > 0])
+    script = _IMPORT_SCRIPT.format(heavy_modules=repr(set(HEAVY_MODULES)), module_name=module_name)
+    output = subprocess.run([sys.executable, '-c', script], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return json.loads(output.stdout.decode().strip().splitlines()[-1])
+
+
+def check_module_import(module_name, time_budget=IMPORT_TIME_BUDGET):
+    """
+    Returns:
+        - <str> failure message, or None if the module imports fine.
+    Raises:
+        - ImportError if the module can not be checked here: it depends on a non-heavy package that is not installed,
+          or the heavy import comes from an external package.
+    """
+    result = import_module_isolated(module_name)
+    if result['status'] == 'missing':
+        raise ImportError('{} requires {}, which is not installed (imported from {})'.format(module_name, result['module'], result['importer']))
+    if result['status'] == 'heavy':
+        if '{0}bubble_control{0}'.format(os.sep) not in result['importer']:
+            raise ImportError('{} imports {} through an external package ({})'.format(module_name, result['module'], result['importer']))
+        return '{} imports {} at load time ({})'.format(module_name, result['module'], result['importer'])
+    if result['time'] > time_budget:
+        return '{} took {:.2f}s to import (budget {:.2f}s)'.format(module_name, result['time'], time_budget)
+    return None
+
+
+def _pytest_params():
+    try:
+        import pytest
+    except ImportError:
+        return lambda f: f
+    return pytest.mark.parametrize('module_name', CORE_MODULES)
+
+
+@_pytest_params()
+def test_core_module_import(module_name):
+    import pytest
+    try:
+        failure = check_module_import(module_name)
+    except ImportError as e:
+        pytest.skip(str(e))
+    assert failure is None, failure
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Check that the core modules import without ROS, visualization or hardware packages')
+    parser.add_argument('--time_budget', type=float, default=IMPORT_TIME_BUDGET)
+    args = parser.parse_args()
+
+    failures = []
+    for module_name in CORE_MODULES:
+        try:
+            failure = check_module_import(module_name, time_budget=args.time_budget)
+        except ImportError as e:
+            print('SKIP {}: {}'.format(module_name, e))
+            continue
+        print('{} {}'.format('FAIL' if failure is not None else 'OK', failure if failure is not None else module_name))
+        if failure is not None:
+            failures.append(failure)
+    sys.exit(1 if len(failures) > 0 else 0)
@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+"""
+Check that a model saved with save_model_bundle loads back with the same weights, hyperparameters and frozen
+parameters, also when the hyperparameters hold numpy values (e.g. dataset derived input sizes).
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import torch
+import torch.nn as nn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.bubble_learning.aux.model_bundle import save_model_bundle, load_model_bundle, clear_shared_modules
+
+
+class ToyModel(nn.Module):
+    # Minimal model with the LightningModule hparams interface
+    def __init__(self, input_sizes, hidden_size=8, lr=1e-4):
+        super().__init__()
+        self.hparams = {'input_sizes': input_sizes, 'hidden_size': hidden_size, 'lr': lr}
+        self.encoder = nn.Linear(input_sizes['x'], hidden_size)
+        self.decoder = nn.Linear(hidden_size, input_sizes['y'])
+        for param in self.encoder.parameters():
+            param.requires_grad = False
+
+
+def test_bundle_round_trip():
+    clear_shared_modules()
+    bundle_dir = tempfile.mkdtemp()
+    try:
+        model = ToyModel(input_sizes={'x': np.int64(5), 'y': np.int64(3)}, hidden_size=np.int64(8), lr=np.float64(1e-3))
+        bundle_path = os.path.join(bundle_dir, 'toy_model.bundle.pt')
+        content_hash = save_model_bundle(model, bundle_path)
+        loaded_model = load_model_bundle(bundle_path, verify=True)
+        assert type(loaded_model).__name__ == 'ToyModel'
+        assert loaded_model.hparams == {'input_sizes': {'x': 5, 'y': 3}, 'hidden_size': 8, 'lr': 1e-3}
+        assert type(loaded_model.hparams['input_sizes']['x']) is int
+        for k, v in model.state_dict().items():
+            assert torch.equal(v, loaded_model.state_dict()[k])
+        assert [p.requires_grad for p in loaded_model.parameters()] == [p.requires_grad for p in model.parameters()]
+        x = torch.rand(4, 5)
+        assert torch.equal(model.decoder(model.encoder(x)), loaded_model.decoder(loaded_model.encoder(x)))
+        assert content_hash == save_model_bundle(loaded_model, os.path.join(bundle_dir, 'toy_model_2.bundle.pt'))
+    finally:
+        clear_shared_modules()
+        shutil.rmtree(bundle_dir)
+
+
+if __name__ == '__main__':
+    test_bundle_round_trip()
+    print('OK')
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+"""
+Check that ChunkedSampleProcessingMixin computes the dataset samples in the processing workers, saves them in chunks
+and, when processing again, only computes the chunks that were not saved. Reprocessing (load_cache=False) and changes
+in the processing parameters compute all of them again.
+A minimal dataset base replaces BubbleDatasetBase, which requests the samples one by one while processing.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.bubble_learning.datasets.parallel_processing import ChunkedSampleProcessingMixin
+
+
+class FakeDatasetBase(object):
+    def __init__(self, data_path, num_samples=10, load_cache=True):
+        self.data_path = data_path
+        self.fcs = list(range(num_samples))
+        self.samples = [self._get_sample(fc) for fc in self.fcs]
+
+    @classmethod
+    def get_name(cls):
+        return 'fake_dataset'
+
+    def _get_sample(self, fc):
+        raise NotImplementedError('Datasets must implement _get_sample')
+
+
+class FakeChunkedDataset(ChunkedSampleProcessingMixin, FakeDatasetBase):
+    def __init__(self, *args, offset=0, **kwargs):
+        self.offset = offset
+        super().__init__(*args, **kwargs)
+
+    def _get_processing_params(self):
+        return {'offset': self.offset}
+
+    def _compute_sample(self, fc):
+        # log the computed samples. Workers are other processes, so they append to a file.
+        with open(os.path.join(self.data_path, 'computed_fcs.txt'), 'a') as f:
+            f.write('{}\n'.format(fc))
+        return {'fc': fc, 'value': fc ** 2 + self.offset}
+
+
+def get_computed_fcs(data_path):
+    log_path = os.path.join(data_path, 'computed_fcs.txt')
+    if not os.path.isfile(log_path):
+        return []
+    with open(log_path) as f:
+        computed_fcs = sorted(int(line) for line in f.read().split())
+    os.remove(log_path)
+    return computed_fcs
+
+
+def check_chunked_processing(data_path, num_samples=10, chunk_size=3):
+    dataset = FakeChunkedDataset(data_path, num_samples=num_samples, num_processing_workers=2, processing_chunk_size=chunk_size)
+    assert [s['value'] for s in dataset.samples] == [fc ** 2 for fc in range(num_samples)]
+    assert get_computed_fcs(data_path) == list(range(num_samples))
+    chunks_path = dataset._get_processing_chunks_path()
+    chunk_files = sorted(os.listdir(chunks_path))
+    assert chunk_files == sorted('chunk_{}_{}.pt'.format(fc, min(chunk_size, num_samples - fc)) for fc in range(0, num_samples, chunk_size))
+
+    # interrupted processing: only the chunk that was not saved is computed again
+    os.remove(os.path.join(chunks_path, 'chunk_3_3.pt'))
+    dataset = FakeChunkedDataset(data_path, num_samples=num_samples, num_processing_workers=2, processing_chunk_size=chunk_size)
+    assert [s['value'] for s in dataset.samples] == [fc ** 2 for fc in range(num_samples)]
+    assert get_computed_fcs(data_path) == [3, 4, 5]
+
+    # reprocessing does not reuse the saved chunks
+    dataset = FakeChunkedDataset(data_path, num_samples=num_samples, num_processing_workers=2, processing_chunk_size=chunk_size, load_cache=False)
+    assert get_computed_fcs(data_path) == list(range(num_samples))
+    assert dataset._get_processing_chunks_path() == chunks_path
+
+    # samples computed with other parameters are saved in other chunks
+    dataset = FakeChunkedDataset(data_path, num_samples=num_samples, num_processing_workers=2, processing_chunk_size=chunk_size, offset=1)
+    assert dataset._get_processing_chunks_path() != chunks_path
+    assert [s['value'] for s in dataset.samples] == [fc ** 2 + 1 for fc in range(num_samples)]
+    assert get_computed_fcs(data_path) == list(range(num_samples))
+
+    # serial processing computes the samples on demand
+    dataset = FakeChunkedDataset(data_path, num_samples=num_samples, num_processing_workers=0)
+    assert get_computed_fcs(data_path) == list(range(num_samples))
+
+
+def test_chunked_processing():
+    data_path = tempfile.mkdtemp()
+    try:
+        check_chunked_processing(data_path)
+    finally:
+        shutil.rmtree(data_path)
+
+
+if __name__ == '__main__':
+    test_chunked_processing()
+    print('OK')
@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+"""
+Check that PointNetObjectEmbedding reuses the features of a repeated object cloud while its pointnet is frozen, also
+in train mode, and that the cached outputs are identical to the computed ones.
+The pretrained pointnet checkpoint is replaced by a randomly initialized frozen classifier.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import bubble_control.bubble_learning.models.pointnet.pointnet_object_embedding as pointnet_object_embedding
+from bubble_control.bubble_learning.models.pointnet.pointnet_classifier import PointNetClassifier
+
+
+def get_random_pointnet_classifier(freeze=False, partial_load=True):
+    torch.manual_seed(0)
+    model = PointNetClassifier()
+    if freeze:
+        for param in model.parameters():
+            param.requires_grad = False
+        model.eval()
+    return model
+
+
+def get_object_embedding(freeze_pointnet=True, cache_features=True):
+    load_pretrained = pointnet_object_embedding.get_pretrained_pointnet_classifier
+    pointnet_object_embedding.get_pretrained_pointnet_classifier = get_random_pointnet_classifier
+    try:
+        return pointnet_object_embedding.PointNetObjectEmbedding(10, freeze_pointnet=freeze_pointnet, cache_features=cache_features)
+    finally:
+        pointnet_object_embedding.get_pretrained_pointnet_classifier = load_pretrained
+
+
+def test_repeated_cloud_hits_cache():
+    torch.manual_seed(1)
+    cloud = torch.rand(100, 3)
+    other_cloud = torch.rand(100, 3)
+    batch = torch.stack([cloud, other_cloud, cloud, cloud], dim=0)
+    model = get_object_embedding()
+    reference_model = get_object_embedding(cache_features=False)
+    reference_model.load_state_dict(model.state_dict())
+    for mode in [True, False]:
+        model.train(mode)
+        reference_model.train(mode)
+        assert not model.pointnet_classifier.training # the frozen pointnet stays in eval mode
+        model.clear_cache()
+        out_1 = model(batch)
+        assert len(model.features_cache) == 2 # computed once per unique cloud
+        num_hits = model.features_cache.num_hits
+        out_2 = model(batch)
+        assert model.features_cache.num_hits == num_hits + 2
+        assert torch.equal(out_1, out_2)
+        assert torch.equal(out_1[0], out_1[2])
+        assert torch.allclose(out_1, reference_model(batch), atol=1e-6)
+
+
+def test_trainable_pointnet_is_not_cached():
+    model = get_object_embedding(freeze_pointnet=False)
+    model.train()
+    model(torch.rand(2, 100, 3))
+    assert len(model.features_cache) == 0
+
+
+if __name__ == '__main__':
+    test_repeated_cloud_hits_cache()
+    test_trainable_pointnet_is_not_cached()
+    print('OK')
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+"""
+Check the SamplingOptimizer on a toy quadratic problem: a point x moved by the actions (x' = x + u) that has to
+reach a goal. MPPI and CEM have to converge, the time budget has to stop the refinement early, shift has to
+warm start the next command, and the closed loop result has to be comparable to pytorch_mppi.MPPI (if installed).
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import time
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.bubble_model_control.controllers.sampling_optimizers import SamplingOptimizer
+
+try:
+    from pytorch_mppi import mppi
+except ImportError:
+    mppi = None
+
+GOAL = torch.tensor([1., -0.5])
+NOISE_SIGMA = 0.1 * torch.eye(2)
+U_MIN = -0.5 * torch.ones(2)
+U_MAX = 0.5 * torch.ones(2)
+
+
+def dynamics(state, action):
+    return state + action
+
+
+def running_cost(state, action):
+    return torch.sum((state - GOAL) ** 2, dim=-1) + 0.01 * torch.sum(action ** 2, dim=-1)
+
+
+def get_optimizer(method='mppi', **kwargs):
+    kwargs = dict(dict(num_samples=200, horizon=5, lambda_=0.1, u_min=U_MIN, u_max=U_MAX, method=method), **kwargs)
+    return SamplingOptimizer(dynamics, running_cost, 2, NOISE_SIGMA, **kwargs)
+
+
+def run_closed_loop(controller, num_steps=15):
+    state = torch.zeros(2)
+    for _ in range(num_steps):
+        action = controller.command(state)
+        state = dynamics(state, action)
+    return state
+
+
+def test_mppi_converges():
+    torch.manual_seed(0)
+    state = run_closed_loop(get_optimizer('mppi'))
+    assert torch.norm(state - GOAL) < 0.1
+
+
+def test_cem_converges():
+    torch.manual_seed(0)
+    state = run_closed_loop(get_optimizer('cem', num_iterations=3, elite_fraction=0.1))
+    assert torch.norm(state - GOAL) < 0.1
+
+
+def test_iterations_refine_the_trajectory():
+    torch.manual_seed(0)
+    state = torch.zeros(2)
+    costs = {}
+    for num_iterations in [1, 10]:
+        optimizer = get_optimizer('cem', num_iterations=num_iterations, elite_fraction=0.1)
+        U = optimizer.optimize(state)
+        states = state + torch.cumsum(U, dim=0)
+        costs[num_iterations] = running_cost(states, U).sum()
+    assert costs[10] < costs[1]
+
+
+def test_time_budget_stops_early():
+    def slow_dynamics(state, action):
+        time.sleep(0.002)
+        return dynamics(state, action)
+    for time_budget, num_iterations in [(0.05, 100), (None, 3)]:
+        optimizer = SamplingOptimizer(slow_dynamics, running_cost, 2, NOISE_SIGMA, num_samples=20, horizon=5,
+                                      num_iterations=num_iterations, time_budget=time_budget)
+        start_time = time.time()
+        optimizer.optimize(torch.zeros(2))
+        if time_budget is None:
+            assert optimizer.last_num_iterations == num_iterations
+        else:
+            assert time.time() - start_time < 0.5
+            assert 1 <= optimizer.last_num_iterations < num_iterations
+
+
+def test_shift_warm_starts():
+    torch.manual_seed(0)
+    for method in ['mppi', 'cem']:
+        optimizer = get_optimizer(method, u_init=torch.tensor([0.1, 0.2]))
+        U = optimizer.optimize(torch.zeros(2)).clone()
+        optimizer.shift()
+        # the next command starts from the rest of the optimized trajectory
+        assert torch.equal(optimizer.U[:-1], U[1:])
+        assert torch.equal(optimizer.U[-1], torch.tensor([0.1, 0.2]))
+    # commands return the first action and leave the shifted trajectory
+    optimizer = get_optimizer('mppi')
+    U = optimizer.optimize(torch.zeros(2)).clone()
+    optimizer.U = U.clone()
+    optimizer.optimize = lambda state, context=None: optimizer.U
+    action = optimizer.command(torch.zeros(2))
+    assert torch.equal(action, U[0])
+    assert torch.equal(optimizer.U[:-1], U[1:])
+
+
+def test_comparable_to_pytorch_mppi():
+    if mppi is None:
+        import pytest
+        pytest.skip('pytorch_mppi is not installed')
+    torch.manual_seed(0)
+    reference = mppi.MPPI(dynamics, running_cost, 2, NOISE_SIGMA, num_samples=200, horizon=5, lambda_=0.1, u_min=U_MIN, u_max=U_MAX)
+    reference_error = torch.norm(run_closed_loop(reference) - GOAL)
+    torch.manual_seed(0)
+    error = torch.norm(run_closed_loop(get_optimizer('mppi')) - GOAL)
+    assert error < max(2 * reference_error, 0.1)
+
+
+if __name__ == '__main__':
+    test_mppi_converges()
+    test_cem_converges()
+    test_iterations_refine_the_trajectory()
+    test_time_budget_stops_early()
+    test_shift_warm_starts()
+    if mppi is not None:
+        test_comparable_to_pytorch_mppi()
+    print('OK')
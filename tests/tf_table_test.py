@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+"""
+Check the vectorized transformations of TfTable against scipy.spatial.transform.Rotation: quaternions_to_matrices
+for random and near-zero quaternions, TfTable.from_matrices, and the from_dataframe -> to_dataframe round trip.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.aux.tf_table import TfTable, quaternions_to_matrices, as_tf_table
+
+
+def get_random_poses(num_poses, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-1, 1, size=(num_poses, 3))
+    quats = rng.normal(size=(num_poses, 4)) * rng.uniform(0.1, 10., size=(num_poses, 1)) # not normalized
+    return np.concatenate([positions, quats], axis=-1)
+
+
+def test_quaternions_to_matrices():
+    poses = get_random_poses(100)
+    X = quaternions_to_matrices(poses)
+    assert X.shape == (100, 4, 4)
+    assert np.allclose(X[:, :3, :3], Rotation.from_quat(poses[:, 3:]).as_matrix()) # from_quat normalizes
+    assert np.allclose(X[:, :3, 3], poses[:, :3])
+    assert np.allclose(X[:, 3], [0, 0, 0, 1])
+    # batch dimensions are kept
+    assert np.allclose(quaternions_to_matrices(poses.reshape(10, 10, 7)), X.reshape(10, 10, 4, 4))
+
+
+def test_near_zero_quaternions_are_identity():
+    poses = get_random_poses(4)
+    poses[:, 3:] = [[0., 0., 0., 0.], [1e-10, 0., 0., 0.], [0., -1e-12, 1e-12, 0.], [0., 0., 0., 1e-9]]
+    X = quaternions_to_matrices(poses)
+    assert np.allclose(X[:, :3, :3], np.eye(3))
+    assert np.allclose(X[:, :3, 3], poses[:, :3])
+    # small but valid quaternions are normalized
+    poses[:, 3:] = [0., 0., 1e-3, 1e-3]
+    assert np.allclose(quaternions_to_matrices(poses)[:, :3, :3], Rotation.from_euler('z', np.pi / 2).as_matrix())
+
+
+def test_from_matrices():
+    poses = get_random_poses(5, seed=1)
+    matrices = {'frame_{}'.format(i): np.eye(4) for i in range(len(poses))}
+    for i, frame_name in enumerate(matrices):
+        matrices[frame_name][:3, :3] = Rotation.from_quat(poses[i, 3:]).as_matrix()
+        matrices[frame_name][:3, 3] = poses[i, :3]
+    matrices['med_base'] = np.eye(4) # the parent frame is not a row
+    tf_table = TfTable.from_matrices(matrices, parent_frame='med_base')
+    assert tf_table.frame_names == ['frame_{}'.format(i) for i in range(len(poses))]
+    for i, frame_name in enumerate(tf_table.frame_names):
+        quat = tf_table.get_quat(frame_name)
+        assert np.isclose(np.linalg.norm(quat), 1.)
+        # same rotation as scipy, up to the quaternion sign
+        scipy_quat = Rotation.from_quat(poses[i, 3:]).as_quat()
+        assert np.allclose(quat, scipy_quat) or np.allclose(quat, -scipy_quat)
+        assert np.allclose(tf_table.get_position(frame_name), poses[i, :3])
+        assert np.allclose(tf_table.get_matrix(frame_name), matrices[frame_name])
+    # the matrices recomputed from the stored quaternions match the original ones
+    assert np.allclose(quaternions_to_matrices(tf_table.poses), np.asarray([matrices[k] for k in tf_table.frame_names]))
+    assert np.array_equal(tf_table.get_matrix('med_base'), np.eye(4))
+
+
+def test_dataframe_round_trip():
+    poses = get_random_poses(6, seed=2)
+    poses[:, 3:] /= np.linalg.norm(poses[:, 3:], axis=-1, keepdims=True)
+    tfs_df = pd.DataFrame(poses, columns=TfTable.pose_columns)
+    tfs_df.insert(0, 'child_frame', ['frame_{}'.format(i) for i in range(len(poses))])
+    tfs_df.insert(0, 'parent_frame', 'med_base')
+    tf_table = as_tf_table(tfs_df)
+    assert tf_table.parent_frame == 'med_base'
+    pd.testing.assert_frame_equal(tf_table.to_dataframe(), tfs_df)
+    for i, row in tfs_df.iterrows():
+        X = tf_table[row['child_frame']]
+        assert np.allclose(X[:3, :3], Rotation.from_quat(row[['qx', 'qy', 'qz', 'qw']].values.astype(np.float64)).as_matrix())
+        assert np.allclose(X[:3, 3], row[['x', 'y', 'z']].values.astype(np.float64))
+    # several parent frames are not supported
+    tfs_df.loc[0, 'parent_frame'] = 'world'
+    try:
+        TfTable.from_dataframe(tfs_df)
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError('TfTable.from_dataframe should fail for several parent frames')
+
+
+if __name__ == '__main__':
+    test_quaternions_to_matrices()
+    test_near_zero_quaternions_are_identity()
+    test_from_matrices()
+    test_dataframe_round_trip()
+    print('OK')
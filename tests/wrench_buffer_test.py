@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+"""
+Check the WrenchRingBuffer (wraparound and calibration) and the detection delay of the contact detectors on a
+synthetic wrench stream: a biased sensor and a contact ramping up fz.
+It can be run with pytest or as a script.
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bubble_control.aux.wrench_buffer import WrenchRingBuffer, FilteredThresholdDetector, RateOfChangeDetector, get_detection_time
+
+
+RATE = 500. # [Hz]
+CONTACT_TIME = 1.
+RAMP_RATE = 200. # [N/s]
+BIAS = np.array([0.5, -1., -3., 0.1, 0., -0.2])
+
+
+def get_ramp_stream(noise_scale=0., seed=0):
+    times = np.arange(0, 2., 1 / RATE)
+    wrenches = np.random.default_rng(seed).normal(scale=noise_scale, size=(len(times), 6)) + BIAS
+    wrenches[:, 2] += -np.clip(times - CONTACT_TIME, 0, None) * RAMP_RATE
+    return times, wrenches
+
+
+def get_calibrated_buffer(times, wrenches, num_calibration_samples=50, capacity=256):
+    wrench_buffer = WrenchRingBuffer(capacity=capacity)
+    wrench_buffer.extend(times[:num_calibration_samples], wrenches[:num_calibration_samples])
+    wrench_buffer.calibrate(num_samples=num_calibration_samples)
+    return wrench_buffer
+
+
+def test_ring_wraparound():
+    wrench_buffer = WrenchRingBuffer(capacity=8)
+    times = np.arange(20, dtype=np.float64)
+    wrenches = np.arange(20 * 6, dtype=np.float64).reshape(20, 6)
+    wrench_buffer.extend(times[:5], wrenches[:5])
+    assert len(wrench_buffer) == 5
+    last_times, last_wrenches = wrench_buffer.get_last()
+    assert np.array_equal(last_times, times[:5]) and np.array_equal(last_wrenches, wrenches[:5])
+    wrench_buffer.extend(times[5:], wrenches[5:])
+    assert len(wrench_buffer) == 8
+    assert wrench_buffer.get_last_time() == 19
+    last_times, last_wrenches = wrench_buffer.get_last() # oldest first across the wraparound
+    assert np.array_equal(last_times, times[-8:]) and np.array_equal(last_wrenches, wrenches[-8:])
+    last_times, last_wrenches = wrench_buffer.get_last(3)
+    assert np.array_equal(last_times, times[-3:]) and np.array_equal(last_wrenches, wrenches[-3:])
+    window_times, _ = wrench_buffer.get_window(2.5)
+    assert np.array_equal(window_times, times[-3:])
+
+
+def test_calibrate_rezeroes_buffered_samples():
+    wrench_buffer = WrenchRingBuffer(capacity=8)
+    wrench_buffer.extend(np.arange(12), np.tile(BIAS, (12, 1))) # wrapped around
+    calibration = wrench_buffer.calibrate(num_samples=4)
+    assert np.allclose(calibration, BIAS)
+    _, wrenches = wrench_buffer.get_last()
+    assert np.allclose(wrenches, 0.)
+    wrench_buffer.add(12, BIAS + np.array([0, 0, 2., 0, 0, 0]))
+    _, wrenches = wrench_buffer.get_last(1)
+    assert np.allclose(wrenches[0], [0, 0, 2., 0, 0, 0])
+    # calibrating again accumulates the calibration
+    calibration = wrench_buffer.calibrate(num_samples=1)
+    assert np.allclose(calibration, BIAS + np.array([0, 0, 2., 0, 0, 0]))
+    _, wrenches = wrench_buffer.get_last(1)
+    assert np.allclose(wrenches, 0.)
+
+
+def test_detection_delay_on_ramp():
+    times, wrenches = get_ramp_stream()
+    threshold = 5.
+    threshold_delay = threshold / RAMP_RATE # the first calibrated sample reaching the threshold
+    detection_times = {}
+    for name, detector in [('single_sample', FilteredThresholdDetector(threshold, num_samples=1)),
+                           ('filtered_threshold', FilteredThresholdDetector(threshold, num_samples=5)),
+                           ('rate_of_change', RateOfChangeDetector(100., window=0.02))]:
+        wrench_buffer = get_calibrated_buffer(times, wrenches)
+        detection_times[name], _ = get_detection_time(detector, wrench_buffer, times[50:], wrenches[50:])
+        assert detection_times[name] is not None
+    dt = 1 / RATE
+    assert abs(detection_times['single_sample'] - (CONTACT_TIME + threshold_delay)) <= dt + 1e-9
+    # the 5 sample mean lags the ramp by 2 samples
+    assert abs(detection_times['filtered_threshold'] - (CONTACT_TIME + threshold_delay + 2 * dt)) <= dt + 1e-9
+    # the rate of change fires before the force builds up to the threshold
+    assert CONTACT_TIME < detection_times['rate_of_change'] < detection_times['single_sample']
+
+
+def test_no_detection_without_contact():
+    times, wrenches = get_ramp_stream(noise_scale=0.5)
+    no_contact = times < CONTACT_TIME
+    for detector in [FilteredThresholdDetector(5., num_samples=5), RateOfChangeDetector(200., window=0.02)]:
+        wrench_buffer = get_calibrated_buffer(times, wrenches)
+        detection_time, _ = get_detection_time(detector, wrench_buffer, times[50:][no_contact[50:]], wrenches[50:][no_contact[50:]])
+        assert detection_time is None
+
+
+if __name__ == '__main__':
+    test_ring_wraparound()
+    test_calibrate_rezeroes_buffered_samples()
+    test_detection_delay_on_ramp()
+    test_no_detection_without_contact()
+    print('OK')